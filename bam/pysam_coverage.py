@@ -1,174 +1,590 @@
 import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
 import pysam
 import numpy as np
 import pandas as pd
-import multiprocessing
 import collections
+import multiprocessing
+from ngs_python.bed import covtrack
+
+# Flags of unmapped and QC failed reads, always skipped
+FILTER_FLAG = 516
+
+def filter_flag(remove_dup = False, remove_secondary = False):
+    ''' Function returns the flag of reads to skip.
+
+    Args:
+        remove_dup (bool)- Skip duplicate reads.
+        remove_secondary (bool)- Skip secondary alignments.
+
+    Returns:
+        flag (int)- Bitwise flag of reads to skip.
+
+    '''
+    flag = FILTER_FLAG
+    if remove_dup:
+        flag |= 1024
+    if remove_secondary:
+        flag |= 256
+    return(flag)
+
+def _check_filters(map_quality, remove_dup, remove_secondary, processes):
+    ''' Function to check read filter and process arguments '''
+    if not isinstance(map_quality, int):
+        raise TypeError('map_quality must be integer')
+    if map_quality < 0:
+        raise ValueError('map_quality must be non-negative')
+    if not isinstance(remove_dup, bool):
+        raise TypeError('remove_dup must be a bool')
+    if not isinstance(remove_secondary, bool):
+        raise TypeError('remove_secondary must be a bool')
+    if not isinstance(processes, int) or processes < 1:
+        raise ValueError('processes must be a positive integer')
+
+def read_blocks(bamFile, chrom, start, end, map_quality = 0,
+        flag = FILTER_FLAG
+    ):
+    ''' Function to extract the aligned blocks of reads overlapping an
+    interval. Blocks, and the flag and mapping quality of each read, are
+    collected into preallocated numpy arrays, which are enlarged as
+    required, and reads are then filtered by numpy operations.
+
+    Args:
+        bamFile - Open pysam.AlignmentFile.
+        chrom (str)- Chromosome name.
+        start (int)- Start of interval.
+        end (int)- End of interval.
+        map_quality (int)- Minimum mapping quality of reads.
+        flag (int)- Bitwise flag of reads to skip.
+
+    Returns:
+        starts (numpy.array)- Start of each block.
+        ends (numpy.array)- End of each block.
+
+    '''
+    blocks = np.empty((1024, 3), np.int64)
+    reads = np.empty((256, 2), np.int64)
+    blockCount = readCount = 0
+    for read in bamFile.fetch(chrom, start, end):
+        # Enlarge arrays
+        if readCount == len(reads):
+            reads = np.resize(reads, (2 * len(reads), 2))
+        readBlocks = read.get_blocks()
+        if blockCount + len(readBlocks) > len(blocks):
+            blocks = np.resize(blocks, (2 * len(blocks) +
+                len(readBlocks), 3))
+        # Store read flag and mapping quality and read blocks
+        reads[readCount] = read.flag, read.mapping_quality
+        for blockStart, blockEnd in readBlocks:
+            blocks[blockCount] = blockStart, blockEnd, readCount
+            blockCount += 1
+        readCount += 1
+    # Filter blocks by read flag and mapping quality
+    reads, blocks = reads[:readCount], blocks[:blockCount]
+    keep = ((reads[:, 0] & flag) == 0) & (reads[:, 1] >= map_quality)
+    blocks = blocks[keep[blocks[:, 2]]]
+    return(blocks[:, 0], blocks[:, 1])
+
+def coverage_runs(starts, ends, interval_start, interval_end):
+    ''' Function to calculate the coverage of an interval by blocks as
+    runs of constant coverage. A difference array holding the change in
+    coverage at each block start and end is built with numpy.add.at and
+    converted to coverage by numpy.cumsum.
+
+    Args:
+        starts (numpy.array)- Start of each block.
+        ends (numpy.array)- End of each block.
+        interval_start (int)- Start of interval.
+        interval_end (int)- End of interval.
+
+    Returns:
+        positions (numpy.array)- Boundaries of the runs, from the start to
+            the end of the interval.
+        coverage (numpy.array)- Coverage of each run, with adjacent runs of
+            differing coverage.
+
+    '''
+    # Clip blocks to the interval
+    starts = np.maximum(starts, interval_start)
+    ends = np.minimum(ends, interval_end)
+    overlap = starts < ends
+    starts, ends = starts[overlap], ends[overlap]
+    # Build difference array of unique positions
+    positions, inverse = np.unique(np.concatenate(([interval_start,
+        interval_end], starts, ends)), return_inverse = True)
+    change = np.zeros(len(positions), np.int64)
+    np.add.at(change, inverse[2:], np.repeat([1, -1], len(starts)))
+    # Remove positions at which coverage is unchanged
+    keep = change != 0
+    keep[0] = keep[-1] = True
+    positions = positions[keep]
+    coverage = np.cumsum(change[keep])[:-1]
+    return(positions, coverage)
+
+def _add_counts(counts, coverage, lengths):
+    ''' Function returns an array of the number of bases at each coverage
+    with the lengths of runs of coverage added.
+    '''
+    runCounts = np.bincount(coverage, lengths).astype(np.int64)
+    if len(runCounts) > len(counts):
+        runCounts[:len(counts)] += counts
+        return(runCounts)
+    counts[:len(runCounts)] += runCounts
+    return(counts)
+
+def plan_interval_shards(intervals, shards):
+    ''' Function to split intervals into shards of similar total span.
+    Intervals longer than the target span of a shard are split into pieces
+    so that a few huge intervals are spread across shards. Pieces are
+    assigned to shards in order, so each shard holds nearby pieces.
+
+    Args:
+        intervals (list)- Intervals, each a tuple of chromosome name, start
+            and end.
+        shards (int)- Number of shards.
+
+    Returns:
+        shards (list)- Shards, each a tuple of a list of chromosome names
+            and numpy arrays of the starts and ends of its pieces and of
+            the index of the interval of each piece.
+
+    '''
+    starts = np.array([interval[1] for interval in intervals], np.int64)
+    ends = np.array([interval[2] for interval in intervals], np.int64)
+    target = max(1, -(-int((ends - starts).sum()) // shards))
+    # Split long intervals into pieces of at most the target span
+    pieces = -(-(ends - starts) // target)
+    index = np.repeat(np.arange(len(intervals)), pieces)
+    offset = np.arange(len(index)) - np.repeat(np.cumsum(pieces) - pieces,
+        pieces)
+    pieceStarts = starts[index] + offset * target
+    pieceEnds = np.minimum(pieceStarts + target, ends[index])
+    # Assign pieces to shards by the midpoint of their cumulative span
+    span = np.cumsum(pieceEnds - pieceStarts)
+    number = (span - (pieceEnds - pieceStarts) // 2) // target
+    output = []
+    for shard in np.unique(number):
+        select = np.flatnonzero(number == shard)
+        output.append(([intervals[interval][0] for interval in
+            index[select]], pieceStarts[select], pieceEnds[select],
+            index[select]))
+    return(output)
+
+def _coverage_shard(arguments):
+    ''' Function to calculate the coverage of the pieces of a shard in a
+    pool process, opening the BAM file once.
+
+    Args:
+        arguments (tuple)- Full path to BAM file, shard generated by
+            plan_interval_shards, minimum mapping quality and flag of reads
+            to skip.
+
+    Returns:
+        sums (numpy.array)- Sum of the coverage of the bases of each piece.
+        counts (numpy.array)- Number of bases of the pieces at each
+            coverage.
+        seconds (float)- Time taken.
+
+    '''
+    bam, (chroms, starts, ends, index), map_quality, flag = arguments
+    start = time.time()
+    sums = np.zeros(len(starts), np.int64)
+    counts = np.zeros(1, np.int64)
+    bamFile = pysam.AlignmentFile(bam)
+    try:
+        for number, chrom in enumerate(chroms):
+            blockStarts, blockEnds = read_blocks(bamFile, chrom,
+                int(starts[number]), int(ends[number]), map_quality, flag)
+            positions, coverage = coverage_runs(blockStarts, blockEnds,
+                starts[number], ends[number])
+            lengths = np.diff(positions)
+            sums[number] = np.dot(lengths, coverage)
+            counts = _add_counts(counts, coverage, lengths)
+    finally:
+        bamFile.close()
+    return(sums, counts, time.time() - start)
+
+def _map_coverage(arguments, processes):
+    ''' Function to apply _coverage_shard to a list of arguments in a
+    pool of processes, returning the results in order.
+    '''
+    if processes == 1 or len(arguments) == 1:
+        return(map(_coverage_shard, arguments))
+    pool = multiprocessing.Pool(min(processes, len(arguments)))
+    try:
+        return(pool.map(_coverage_shard, arguments, chunksize = 1))
+    finally:
+        pool.terminate()
+        pool.join()
+
+def parallel_coverage(
+        bam, intervals, processes = 2, shards = None, map_quality = 0,
+        flag = FILTER_FLAG
+    ):
+    ''' Function to calculate the coverage of intervals in a pool of
+    processes. Intervals are split into shards of similar total span by
+    plan_interval_shards and each shard is processed by _coverage_shard,
+    returning compact numpy arrays that are combined in interval order.
+
+    Args:
+        bam (str)- Full path to BAM file.
+        intervals (list)- Intervals, each a tuple of chromosome name, start
+            and end.
+        processes (int)- Number of processes.
+        shards (int)- Number of shards. Defaults to four per process.
+        map_quality (int)- Minimum mapping quality of reads.
+        flag (int)- Bitwise flag of reads to skip.
+
+    Returns:
+        sums (numpy.array)- Sum of the coverage of the bases of each
+            interval.
+        counts (numpy.array)- Number of bases of the intervals at each
+            coverage.
+        metrics (list)- Number of pieces, number of bases and time taken in
+            seconds of each shard.
+
+    '''
+    shards = plan_interval_shards(intervals, shards or processes * 4)
+    results = _map_coverage([(bam, shard, map_quality, flag) for shard in
+        shards], processes)
+    # Combine results in interval order
+    sums = np.zeros(len(intervals), np.int64)
+    counts = np.zeros(max(len(result[1]) for result in results), np.int64)
+    metrics = []
+    for (chroms, starts, ends, index), (shardSums, shardCounts,
+            seconds) in zip(shards, results):
+        np.add.at(sums, index, shardSums)
+        counts[:len(shardCounts)] += shardCounts
+        metrics.append({'pieces': len(index),
+            'bases': int((ends - starts).sum()), 'seconds': seconds})
+    return(sums, counts, metrics)
+
+def depth_runs(depth, start = 0):
+    ''' Function to run-length encode per base coverage with
+    covtrack.run_length.
+
+    Args:
+        depth (numpy.array)- Coverage of each base.
+        start (int)- Position of the first base.
+
+    Returns:
+        positions (numpy.array)- Boundaries of runs of constant coverage.
+        coverage (numpy.array)- Coverage of each run.
+
+    '''
+    positions, coverage = covtrack.run_length(depth, start)
+    return(positions, coverage.astype(np.int64))
+
+def _build_depth(arguments):
+    ''' Function to write the per base coverage of a chromosome to a
+    numpy file, calculated in windows by read_blocks and coverage_runs.
+    Coverage is stored as uint16 unless it exceeds 65535, in which case the
+    chromosome is stored as uint32.
+
+    Args:
+        arguments (tuple)- Full path to BAM file, chromosome name and
+            length, full path to output file, minimum mapping quality, flag
+            of reads to skip and window size.
+
+    Returns:
+        dtype (str)- Data type of the array.
+
+    '''
+    bam, chrom, length, path, map_quality, flag, window = arguments
+    bamFile = pysam.AlignmentFile(bam)
+    try:
+        for dtype in (np.uint16, np.uint32):
+            depth = np.lib.format.open_memmap(path, 'w+', dtype, (length,))
+            maximum = np.iinfo(dtype).max
+            for start in range(0, length, window):
+                end = min(start + window, length)
+                positions, coverage = coverage_runs(*(read_blocks(bamFile,
+                    chrom, start, end, map_quality, flag) + (start, end)))
+                if len(coverage) and coverage.max() > maximum:
+                    break
+                depth[start:end] = np.repeat(coverage, np.diff(positions))
+            else:
+                depth.flush()
+                return(np.dtype(dtype).name)
+            del depth
+    finally:
+        bamFile.close()
+    raise ValueError('Coverage of {} exceeds {}'.format(chrom, maximum))
+
+class coverageCache(object):
+    ''' Class stores the per base coverage of each chromosome of a BAM
+    file as uint16, or uint32, numpy arrays in a cache directory, by
+    default next to the BAM file, which are memory-mapped for queries.
+    Each cache is keyed by the path of the BAM file and the read filters,
+    and records the modification time and size of the BAM file in a
+    manifest. A cache is built when first opened and rebuilt when the BAM
+    file changes.
+    '''
+    
+    def __init__(
+            self, bam, map_quality = 0, remove_dup = False,
+            remove_secondary = False, directory = None, processes = 1,
+            window = 10000000
+        ):
+        ''' Function to initialise coverageCache object, building the
+        cache if it is absent or invalid.
+        
+        Args:
+            bam (str)- Full path to BAM file.
+            map_quality (int)- Minimum mapping quality of reads.
+            remove_dup (bool)- Skip duplicate reads.
+            remove_secondary (bool)- Skip secondary alignments.
+            directory (str)- Directory in which to store caches. Defaults to
+                the BAM file with a '.cache' suffix.
+            processes (int)- Number of processes building chromosomes.
+            window (int)- Number of bases of each read_blocks query while
+                building.
+        
+        '''
+        _check_filters(map_quality, remove_dup, remove_secondary, processes)
+        self.bam = os.path.abspath(bam)
+        self.filters = {'map_quality': map_quality, 'remove_dup': remove_dup,
+            'remove_secondary': remove_secondary}
+        key = hashlib.md5(json.dumps([self.bam, map_quality, remove_dup,
+            remove_secondary])).hexdigest()
+        self.directory = directory or self.bam + '.cache'
+        self.path = os.path.join(self.directory, key)
+        self.arrays = {}
+        self.manifest = self.__load_manifest()
+        if self.manifest is None:
+            self.build(processes, window)
+    
+    def __stat(self):
+        ''' Function returns the modification time and size of the BAM '''
+        stat = os.stat(self.bam)
+        return({'mtime': stat.st_mtime, 'size': stat.st_size})
+    
+    def __load_manifest(self):
+        ''' Function returns the manifest of a valid cache, or None '''
+        try:
+            with open(os.path.join(self.path, 'manifest.json')) as inFile:
+                manifest = json.load(inFile)
+        except (IOError, ValueError):
+            return(None)
+        if (manifest.get('bam') != self.bam or
+                manifest.get('filters') != self.filters or
+                manifest.get('stat') != self.__stat()):
+            return(None)
+        return(manifest)
+    
+    def build(self, processes = 1, window = 10000000):
+        ''' Function to build the cache, replacing any existing cache.
+        
+        Args:
+            processes (int)- Number of processes building chromosomes.
+            window (int)- Number of bases of each read_blocks query.
+        
+        '''
+        stat = self.__stat()
+        bamFile = pysam.AlignmentFile(self.bam)
+        lengths = collections.OrderedDict(zip(bamFile.references,
+            bamFile.lengths))
+        bamFile.close()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # Build chromosome arrays in a temporary directory
+        temp = tempfile.mkdtemp(dir = self.directory)
+        try:
+            flag = filter_flag(self.filters['remove_dup'],
+                self.filters['remove_secondary'])
+            files = ['{}.npy'.format(number) for number in range(len(
+                lengths))]
+            arguments = [(self.bam, chrom, length, os.path.join(temp, name),
+                self.filters['map_quality'], flag, window) for (chrom,
+                length), name in zip(lengths.items(), files)]
+            if processes == 1 or len(arguments) == 1:
+                dtypes = map(_build_depth, arguments)
+            else:
+                pool = multiprocessing.Pool(min(processes, len(arguments)))
+                try:
+                    dtypes = pool.map(_build_depth, arguments, chunksize = 1)
+                finally:
+                    pool.terminate()
+                    pool.join()
+            manifest = {'bam': self.bam, 'filters': self.filters,
+                'stat': stat, 'chromosomes': collections.OrderedDict(
+                (chrom, {'length': length, 'file': name, 'dtype': dtype})
+                for (chrom, length), name, dtype in zip(lengths.items(),
+                files, dtypes))}
+            with open(os.path.join(temp, 'manifest.json'), 'w') as outFile:
+                json.dump(manifest, outFile, indent = 1)
+            # Replace existing cache
+            self.arrays = {}
+            if os.path.isdir(self.path):
+                shutil.rmtree(self.path)
+            os.rename(temp, self.path)
+        except:
+            shutil.rmtree(temp, ignore_errors = True)
+            raise
+        self.manifest = self.__load_manifest()
+    
+    def valid(self):
+        ''' Function returns whether the BAM file is unchanged '''
+        return(self.manifest.get('stat') == self.__stat())
+    
+    def depth(self, chrom, start = 0, end = None):
+        ''' Function returns the per base coverage of a region as a slice
+        of a memory-mapped array.
+        
+        Args:
+            chrom (str)- Chromosome name.
+            start (int)- Start of region.
+            end (int)- End of region. Defaults to the chromosome end.
+        
+        Returns:
+            depth (numpy.array)- Coverage of each base.
+        
+        Raises:
+            IOError - If the BAM file has changed since the cache was built.
+        
+        '''
+        if chrom not in self.arrays:
+            if not self.valid():
+                raise IOError('BAM file changed since cache was built')
+            self.arrays[chrom] = np.load(os.path.join(self.path,
+                self.manifest['chromosomes'][chrom]['file']), mmap_mode = 'r')
+        return(self.arrays[chrom][start:end])
+    
+    def bin_means(self, binDict):
+        ''' Function to add the mean coverage of each bin, generated by
+        single_coverage.create_bins, to the bin dictionary as 'mean'. Bins
+        are summed from the memory-mapped array by numpy.add.reduceat,
+        without copying the chromosome.
+        
+        Args:
+            binDict (dict)- Dictionary of bins of each chromosome.
+        
+        Returns:
+            binDict (dict)- Bin dictionary.
+        
+        '''
+        for chrom, bins in binDict.items():
+            depth = self.depth(chrom)
+            starts = bins['start'].astype(np.int64)
+            ends = bins['end'].astype(np.int64)
+            sums = np.zeros(len(starts), np.int64)
+            # Sum bins ending within the chromosome with numpy.add.reduceat
+            # over alternating start and end offsets
+            inner = (starts < ends) & (ends < len(depth))
+            if inner.any():
+                offsets = np.column_stack((starts[inner], ends[inner]))
+                sums[inner] = np.add.reduceat(depth, offsets.ravel(),
+                    dtype = np.int64)[::2]
+            # Sum bins ending at the chromosome end
+            for index in np.flatnonzero((starts < ends) & ~inner):
+                sums[index] = depth[starts[index]:ends[index]].sum(
+                    dtype = np.int64)
+            bins['mean'] = sums / np.maximum(ends - starts, 1).astype(
+                np.float64)
+        return(binDict)
 
 class single_coverage(object):
     
-    def __init__(self, bam):
+    def __init__(self, bam, cache = False, cache_dir = None):
+        ''' Function to initialise single_coverage object.
+        
+        Args:
+            bam (str)- Full path to BAM file.
+            cache (bool)- Calculate coverage from a coverageCache, built
+                for each combination of read filters when first required.
+            cache_dir (str)- Directory in which to store caches.
+        
+        '''
         self.bam = bam
         bamFile = pysam.AlignmentFile(bam)
         self.length = collections.OrderedDict(
             zip(bamFile.references, bamFile.lengths))
         bamFile.close()
+        self.shard_metrics = []
+        self.cache = cache
+        self.cache_dir = cache_dir
+        self.caches = {}
     
-    def __extract_intervals(
-            self, intervals, conn_out, map_quality, remove_dup,
-            remove_secondary
+    def __check_arguments(self, intervals, map_quality, remove_dup,
+            remove_secondary, processes = 1
         ):
-        # Process connections
-        conn_out[0].close()
-        # Set filter flag to skip unwanted reads
-        filter_flag = 516
-        if remove_dup:
-            filter_flag += 1024
-        if remove_secondary:
-            filter_flag += 256
-        # Open bam file and loop through intervals
-        bamFile = pysam.AlignmentFile(self.bam)
-        for interval in intervals:
-            # Send and extract interval data
-            conn_out[1].send(interval)
-            chrom, start, end = interval
-            # Extract reads for interval
-            for read in bamFile.fetch(chrom, start, end):
-                # Skip unmapped, failed, duplicate and secondary reads
-                if read.flag & filter_flag:
-                    continue
-                # Skip reads below specified mapping quality
-                if read.mapping_quality < map_quality:
-                    continue
-                # Extract blocks for read
-                conn_out[1].send(read.get_blocks())
-        # Tidy up
-        bamFile.close()
-        conn_out[1].close()
+        # Check intervals and other arguments
+        self.check_intervals(intervals)
+        _check_filters(map_quality, remove_dup, remove_secondary, processes)
     
-    def __coverage_change(
-            self, intervals, conn_out, map_quality, remove_dup,
-            remove_secondary
+    def __parallel_coverage(
+            self, intervals, map_quality, remove_dup, remove_secondary,
+            processes
         ):
-        # Process output connection and create input connection
-        conn_out[0].close()
-        conn_in = multiprocessing.Pipe(False)
-        # Start process extracting intervals
-        process = multiprocessing.Process(
-            target = self.__extract_intervals,
-            args = (intervals, conn_in, map_quality, remove_dup,
-                remove_secondary)
-        )
-        process.start()
-        conn_in[1].close()
-        # Process initial interval
-        cov_change = collections.defaultdict(int)
-        interval = conn_in[0].recv()
-        interval_start, interval_end = interval[1:]
-        conn_out[1].send(interval)
-        current_end = 0
-        # Loop through remaining intervals
-        while True:
-            # Extract data or return final coverage dictionary and break
-            try:
-                data = conn_in[0].recv()
-            except EOFError:
-                conn_out[1].send(cov_change)
-                break
-            # Process read blocks
-            if isinstance(data[0][0], int):
-                # Send coverage change if new read is non-overlapping
-                if current_end and data[0][0] > current_end:
-                    conn_out[1].send(cov_change)
-                    cov_change = collections.defaultdict(int)
-                current_end = max(current_end, data[-1][-1])
-                # Add data to coverage change object
-                for block_start, block_end in data:
-                    if block_end <= interval_start:
-                        continue
-                    if block_start >= interval_end:
-                        continue
-                    cov_change[max(interval_start, block_start)] += 1
-                    cov_change[min(interval_end, block_end)] -= 1
-            # Process new interval
-            else:
-                # Process coverage change object
-                conn_out[1].send(cov_change)
-                cov_change = collections.defaultdict(int)
-                interval = data
-                interval_start, interval_end = interval[1:]
-                conn_out[1].send(interval)
-                current_end = 0
-        # Clean up processes and pipes
-        conn_in[0].close()
-        process.join()
-        conn_out[1].close()
-    
-    def __coverage_array(
-            self, intervals, conn_out, map_quality, remove_dup,
-            remove_secondary
+        ''' Function to calculate coverage with parallel_coverage, storing
+        the metrics of each shard in self.shard_metrics.
+        '''
+        self.__check_arguments(intervals, map_quality, remove_dup,
+            remove_secondary, processes)
+        sums, counts, self.shard_metrics = parallel_coverage(self.bam,
+            intervals, processes, map_quality = map_quality,
+            flag = filter_flag(remove_dup, remove_secondary))
+        return(sums, counts)
+    
+    def coverage_cache(
+            self, map_quality = 0, remove_dup = False,
+            remove_secondary = False, processes = 1
         ):
-        # Proces output connection and create input connection
-        conn_out[0].close()
-        conn_in = multiprocessing.Pipe(False)
-        # Start process extracting coverage change
-        process = multiprocessing.Process(
-            target = self.__coverage_change,
-            args = (intervals, conn_in, map_quality, remove_dup,
-                remove_secondary)
-        )
-        process.start()
-        conn_in[1].close()
-        # Extract data from pipe
-        while True:
-            # Extract data or break
-            try:
-                data = conn_in[0].recv()
-            except EOFError:
-                break
-            # Calculate coverage intervals or break
-            try:
-                cov_change = {k:v for k,v in data.items() if v}
-            except AttributeError:
-                conn_out[1].send(data)
-                continue
-            # Convert to numpy array, sort, calculate coverage and send
-            cov_array = np.array(cov_change.items(),
-                dtype=[('pos', np.int32),( 'cov', np.int32)])
-            if cov_array.size:
-                cov_array = cov_array[cov_array['pos'].argsort()]
-                cov_array['cov'] = np.cumsum(cov_array['cov'])
-                conn_out[1].send(cov_array)
-        # Clean up pipes and processes
-        conn_in[0].close()
-        process.join()
-        conn_out[1].close()
-    
-    def __start_coverage_processes(
-            self, intervals, map_quality, remove_dup, remove_secondary
+        ''' Function returns the coverageCache of the BAM file for a
+        combination of read filters, building it if required.
+        '''
+        key = (map_quality, remove_dup, remove_secondary)
+        if key not in self.caches or not self.caches[key].valid():
+            self.caches[key] = coverageCache(self.bam, map_quality,
+                remove_dup, remove_secondary, self.cache_dir, processes)
+        return(self.caches[key])
+    
+    def interval_coverage(
+            self, intervals, map_quality = 0, remove_dup = False,
+            remove_secondary = False
         ):
-        # Check intervals
-        self.check_intervals(intervals)
-        # Check other arguments
-        if not isinstance(map_quality, int):
-            raise TypeError('map_quality must be integer')
-        if map_quality < 0:
-            raise ValueError('map_quality must be non-negative')
-        if not isinstance(remove_dup, bool):
-            raise TypeError('remove_dup must be a bool')
-        if not isinstance(remove_secondary, bool):
-            raise TypeError('remove_secondary must be a bool')
-        # Start process building coverage
-        conn_in = multiprocessing.Pipe(False)
-        process = multiprocessing.Process(
-            target = self.__coverage_array,
-            args = (intervals, conn_in, map_quality, remove_dup,
+        ''' Generator returning the coverage of each interval as runs of
+        constant coverage, generated by coverage_runs.
+        
+        Args:
+            intervals (list)- Intervals, each a tuple of chromosome name,
+                start and end.
+            map_quality (int)- Minimum mapping quality of reads.
+            remove_dup (bool)- Skip duplicate reads.
+            remove_secondary (bool)- Skip secondary alignments.
+        
+        Yields:
+            interval (tuple)- Chromosome name, start and end of interval.
+            positions (numpy.array)- Boundaries of the runs.
+            coverage (numpy.array)- Coverage of each run.
+        
+        '''
+        self.__check_arguments(intervals, map_quality, remove_dup,
+            remove_secondary)
+        # Extract runs from cached coverage
+        if self.cache:
+            cache = self.coverage_cache(map_quality, remove_dup,
                 remove_secondary)
-        )
-        process.start()
-        conn_in[1].close()
-        # Return process and pipe
-        return((process, conn_in[0]))
+            for interval in intervals:
+                positions, coverage = depth_runs(cache.depth(*interval),
+                    interval[1])
+                yield((interval, positions, coverage))
+            return
+        flag = filter_flag(remove_dup, remove_secondary)
+        bamFile = pysam.AlignmentFile(self.bam)
+        try:
+            for interval in intervals:
+                starts, ends = read_blocks(bamFile, interval[0], interval[1],
+                    interval[2], map_quality, flag)
+                positions, coverage = coverage_runs(starts, ends,
+                    interval[1], interval[2])
+                yield((interval, positions, coverage))
+        finally:
+            bamFile.close()
     
     def check_intervals(self, intervals):
         # Check intervals is a list/tuple of length > 0
@@ -201,102 +617,124 @@ class single_coverage(object):
     
     def mean_coverage_each(
             self, intervals, map_quality = 0, remove_dup = False,
-            remove_secondary = False
+            remove_secondary = False, processes = 1
         ):
-        # Start processes to calculate coverage arrays
-        process, pipe = self.__start_coverage_processes(
-            intervals=intervals, map_quality=map_quality,
-            remove_dup=remove_dup, remove_secondary=remove_secondary)
-        # Create output series
+        ''' Function returns the mean coverage of each interval.
+        
+        Args:
+            intervals (list)- Intervals, each a tuple of chromosome name,
+                start and end.
+            map_quality (int)- Minimum mapping quality of reads.
+            remove_dup (bool)- Skip duplicate reads.
+            remove_secondary (bool)- Skip secondary alignments.
+            processes (int)- Number of processes. If greater than one,
+                intervals are processed in shards by parallel_coverage.
+        
+        Returns:
+            outArray (numpy.array)- Mean coverage of each interval.
+        
+        '''
+        if processes > 1 and not self.cache:
+            sums = self.__parallel_coverage(intervals, map_quality,
+                remove_dup, remove_secondary, processes)[0]
+            return(sums / np.array([end - start for chrom, start, end in
+                intervals], np.float64))
+        # Sum slices of cached coverage
+        if self.cache:
+            self.__check_arguments(intervals, map_quality, remove_dup,
+                remove_secondary)
+            cache = self.coverage_cache(map_quality, remove_dup,
+                remove_secondary, processes)
+            return(np.array([cache.depth(*interval).sum(dtype=np.int64) for
+                interval in intervals]) / np.array([end - start for chrom,
+                start, end in intervals], np.float64))
         outArray = np.zeros(len(intervals), dtype=np.float64)
-        # Sequentially extract data from pipe
-        count = 0
-        data = pipe.recv()
-        covDict = collections.defaultdict(int)
-        covDict[0] = data[2] - data[1]
-        while True:
-            # Extract data from pipe or terminate loop
-            try:
-                data = pipe.recv()
-            except EOFError:
-                covArray = np.array(covDict.items(), dtype=np.int32)
-                meanCov = np.average(covArray[:,0], weights=covArray[:,1])
-                outArray[count] = meanCov
-                break
-            # Extract lengths
-            try:
-                lengths = np.diff(data['pos'])
-            # Or process old interval
-            except TypeError:
-                # Calculate mean coverage
-                covArray = np.array(covDict.items(), dtype=np.int32)
-                meanCov = np.average(covArray[:,0], weights=covArray[:,1])
-                outArray[count] = meanCov
-                # Set parameters for new interval
-                count += 1
-                covDict = collections.defaultdict(int)
-                covDict[0] = data[2] - data[1]
-                continue
-            # Add lengths and coverage to output
-            for length, coverage in zip(lengths, data['cov']):
-                covDict[coverage] += length
-                covDict[0] -= length
-        # Clean up processes and pipes
-        pipe.close()
-        process.join()
+        for count, (interval, positions, coverage) in enumerate(
+                self.interval_coverage(intervals, map_quality, remove_dup,
+                remove_secondary)):
+            outArray[count] = np.dot(np.diff(positions), coverage) / float(
+                interval[2] - interval[1])
         return(outArray)
     
     def coverage_count_all(
             self, intervals, map_quality = 0, remove_dup = False,
-            remove_secondary = False, max_cov = np.inf
+            remove_secondary = False, max_cov = np.inf, processes = 1
     ):
+        ''' Function returns the number of bases of the intervals at each
+        coverage.
+        
+        Args:
+            intervals (list)- Intervals, each a tuple of chromosome name,
+                start and end.
+            map_quality (int)- Minimum mapping quality of reads.
+            remove_dup (bool)- Skip duplicate reads.
+            remove_secondary (bool)- Skip secondary alignments.
+            max_cov (int)- Coverage at which greater coverage is counted.
+            processes (int)- Number of processes.
+        
+        Returns:
+            covCount (dict)- Default dictionary of the number of bases at
+                each coverage.
+        
+        '''
         # Check argument
         if not np.isinf(max_cov) and not isinstance(max_cov, int):
             raise TypeError('max_cov must be infinite or integer')
         if not max_cov > 0:
             raise ValueError('max_cov > 0')
-        # Start processes to calculate coverage arrays
-        process, pipe = self.__start_coverage_processes(
-            intervals=intervals, map_quality=map_quality,
-            remove_dup=remove_dup, remove_secondary=remove_secondary)
-        # Extract data
-        covCount = collections.defaultdict(np.int32)
-        while True:
-            # Extract data from pipe or terminate loop
-            try:
-                data = pipe.recv()
-            except EOFError:
-                break
-            # Extract lengths
-            try:
-                lengths = np.diff(data['pos'])
-            # Or process old interval
-            except TypeError:
-                covCount[0] += (data[2] - data[1])
-                continue
-            # Add lengths and coverage to output
-            for length, coverage in zip(lengths, data['cov']):
-                covCount[min(coverage, max_cov)] += length
-                covCount[0] -= length
-        # Clean up processes and pipes and return data
-        pipe.close()
-        process.join()
+        # Count bases at each coverage
+        if processes > 1 and not self.cache:
+            counts = self.__parallel_coverage(intervals, map_quality,
+                remove_dup, remove_secondary, processes)[1]
+        else:
+            if self.cache:
+                self.coverage_cache(map_quality, remove_dup, remove_secondary,
+                    processes)
+            counts = np.zeros(1, np.int64)
+            for interval, positions, coverage in self.interval_coverage(
+                    intervals, map_quality, remove_dup, remove_secondary):
+                counts = _add_counts(counts, coverage, np.diff(positions))
+        # Count bases above max_cov at max_cov
+        if len(counts) > max_cov + 1:
+            counts[max_cov] = counts[max_cov:].sum()
+            counts = counts[:max_cov + 1]
+        covCount = collections.defaultdict(int)
+        covCount[0] = int(counts[0])
+        for coverage in np.flatnonzero(counts):
+            covCount[int(coverage)] = int(counts[coverage])
         return(covCount)
     
     def coverage_histogram(
             self, intervals, max_cov = 1000, map_quality = 0,
-            remove_dup = False, remove_secondary = False
+            remove_dup = False, remove_secondary = False, processes = 1
         ):
+        ''' Function returns the fraction of bases of the intervals with
+        at least each coverage from 0 to max_cov.
+        
+        Args:
+            intervals (list)- Intervals, each a tuple of chromosome name,
+                start and end.
+            max_cov (int)- Maximum coverage.
+            map_quality (int)- Minimum mapping quality of reads.
+            remove_dup (bool)- Skip duplicate reads.
+            remove_secondary (bool)- Skip secondary alignments.
+            processes (int)- Number of processes.
+        
+        Returns:
+            covHist (numpy.array)- Fraction of bases with at least each
+                coverage.
+        
+        '''
         # Extract coverage count dictionary
         covCount = self.coverage_count_all(
             intervals=intervals, map_quality=map_quality,
             remove_dup=remove_dup, remove_secondary=remove_secondary,
-            max_cov=max_cov
+            max_cov=max_cov, processes=processes
         )
         # Calculate histogram
-        counts = np.zeros(max_cov + 1, dtype=np.int32)
-        for c in xrange(max_cov + 1):
-            counts[c] = covCount[c]
+        counts = np.zeros(max_cov + 1, dtype=np.int64)
+        for coverage, count in covCount.items():
+            counts[coverage] = count
         revCumSum = counts[::-1].cumsum()
         totalBases = counts.sum(dtype=np.float64)
         covHist = revCumSum[::-1] / totalBases
@@ -304,75 +742,102 @@ class single_coverage(object):
     
     def mean_coverage_all(
             self, intervals, map_quality = 0, remove_dup = False,
-            remove_secondary = False
+            remove_secondary = False, processes = 1
         ):
+        ''' Function returns the mean coverage across all intervals.
+        
+        Args:
+            intervals (list)- Intervals, each a tuple of chromosome name,
+                start and end.
+            map_quality (int)- Minimum mapping quality of reads.
+            remove_dup (bool)- Skip duplicate reads.
+            remove_secondary (bool)- Skip secondary alignments.
+            processes (int)- Number of processes.
+        
+        Returns:
+            meanCov (float)- Mean coverage.
+        
+        '''
         # Extract coverage count dictionary
         covCount = self.coverage_count_all(
             intervals=intervals, map_quality=map_quality,
             remove_dup=remove_dup, remove_secondary=remove_secondary,
-            max_cov=np.inf
+            max_cov=np.inf, processes=processes
         )
-        # Calculate histogram
-        covCounts = np.array(covDict.items(), dtype=np.int32)
-        meanCov = np.average(covCounts)
-        totalBases = covArray[:,1].sum(dtype=np.float64)
-        covHist = revCumSum / totalBases
-        return(covHist)
+        # Calculate mean coverage
+        totalBases = float(sum(covCount.values()))
+        meanCov = sum(coverage * count for coverage, count in
+            covCount.items()) / totalBases
+        return(meanCov)
     
     def bedgraph_file(
             self, bedgraph, intervals, min_cov = 0, map_quality = 0,
             remove_dup = False, remove_secondary = False
         ):
+        ''' Function to write the coverage of intervals to a bedgraph
+        file, with a line for each run of constant coverage, using a
+        covtrack.bedgraphWriter.
+        
+        Args:
+            bedgraph (str)- Full path to output bedgraph file.
+            intervals (list)- Intervals, each a tuple of chromosome name,
+                start and end.
+            min_cov (int)- Minimum coverage of written runs.
+            map_quality (int)- Minimum mapping quality of reads.
+            remove_dup (bool)- Skip duplicate reads.
+            remove_secondary (bool)- Skip secondary alignments.
+        
+        '''
         # Check argument
         if not isinstance(min_cov, int):
             raise TypeError('min_cov must be integer')
         if min_cov < 0:
             raise ValueError('min_cov cannot be negative')
-        # Open output file
-        outFile = open(bedgraph, 'w')
-        # Start processes to calculate coverage arrays
-        process, pipe = self.__start_coverage_processes(
-            intervals=intervals, map_quality=map_quality,
-            remove_dup=remove_dup, remove_secondary=remove_secondary)
-        # Extract data
-        interval_end = current_end = 0
-        while True:
-            # Extract data from pipe or terminate loop
-            try:
-                data = pipe.recv()
-            except EOFError:
-                if interval_end > current_end and min_cov == 0:
-                    outFile.write('{}\t{}\t{}\t0\n'.format(
-                        chrom, current_end, interval_end))
-                break
-            # Generate an array of the coverage
-            try:
-                covArray = np.array(
-                    zip(data['pos'][:-1], data['pos'][1:], data['cov'][:-1]),
-                    dtype = [('start', np.int32), ('end', np.int32),
-                        ('cov', np.int32)])
-            # Or process old interval
-            except TypeError:
-                if interval_end > current_end and min_cov == 0:
-                    outFile.write('{}\t{}\t{}\t0\n'.format(
-                        chrom, current_end, interval_end))
-                chrom, current_end, interval_end = data
-                continue
-            # Add zero-coverage gaps to output
-            if covArray['start'][0] > current_end and min_cov == 0:
-                outFile.write('{}\t{}\t{}\t0\n'.format(
-                    chrom, current_end, covArray['start'][0]))
-            # Add coverage to output
-            for start, end, cov in covArray:
-                if cov >= min_cov:
-                    outFile.write('{}\t{}\t{}\t{}\n'.format(
-                        chrom, start, end, cov))
-            # Set current end
-            current_end = covArray['end'].max()
-        # Clean up processes and pipes and files
-        outFile.close()
-        pipe.close()
-        process.join()
+        # Write runs of each interval
+        with covtrack.bedgraphWriter(bedgraph) as outFile:
+            for interval, positions, coverage in self.interval_coverage(
+                    intervals, map_quality, remove_dup, remove_secondary):
+                keep = coverage >= min_cov
+                outFile.add(interval[0], positions[:-1][keep],
+                    positions[1:][keep], coverage[keep])
+    
+    def coverage_track(
+            self, track, intervals = None, min_cov = 0, map_quality = 0,
+            remove_dup = False, remove_secondary = False,
+            zooms = (1000, 10000, 100000)
+        ):
+        ''' Function to write the coverage of intervals to an indexed
+        binary track, read by covtrack.coverageTrack, with a run for each
+        run of constant coverage.
+        
+        Args:
+            track (str)- Full path to output track file.
+            intervals (list)- Sorted and non-overlapping intervals, each a
+                tuple of chromosome name, start and end. Defaults to all
+                chromosomes.
+            min_cov (int)- Minimum coverage of written runs.
+            map_quality (int)- Minimum mapping quality of reads.
+            remove_dup (bool)- Skip duplicate reads.
+            remove_secondary (bool)- Skip secondary alignments.
+            zooms (tuple)- Bin size of each zoom level.
+        
+        '''
+        # Check argument
+        if not isinstance(min_cov, int):
+            raise TypeError('min_cov must be integer')
+        if min_cov < 0:
+            raise ValueError('min_cov cannot be negative')
+        if intervals is None:
+            intervals = [(chrom, 0, length) for chrom, length in
+                self.length.items()]
+        # Write runs of each interval
+        with covtrack.trackWriter(track, self.length, zooms,
+                dtype = 'uint32') as outFile:
+            for interval, positions, coverage in self.interval_coverage(
+                    intervals, map_quality, remove_dup, remove_secondary):
+                keep = coverage >= min_cov
+                outFile.add(interval[0], positions[:-1][keep],
+                    positions[1:][keep], coverage[keep])
     
     # Function to create genome bins
     def create_bins(self, binSize, binEqual):
@@ -436,6 +901,31 @@ class single_coverage(object):
         # Return dataframe
         return(binDict)
         
+    def mean_coverage_bins(
+            self, binSize, binEqual, map_quality = 0, remove_dup = False,
+            remove_secondary = False, processes = 1
+        ):
+        ''' Function returns the mean coverage of genome bins, generated
+        by self.create_bins, calculated from the coverageCache.
+        
+        Args:
+            binSize (int)- Maximum size of bins.
+            binEqual (bool)- Whether bins should be equally sized.
+            map_quality (int)- Minimum mapping quality of reads.
+            remove_dup (bool)- Skip duplicate reads.
+            remove_secondary (bool)- Skip secondary alignments.
+            processes (int)- Number of processes building the cache.
+        
+        Returns:
+            binDict (dict)- Bin dictionary with the mean coverage of each
+                bin as 'mean'.
+        
+        '''
+        _check_filters(map_quality, remove_dup, remove_secondary, processes)
+        cache = self.coverage_cache(map_quality, remove_dup,
+            remove_secondary, processes)
+        return(cache.bin_means(self.create_bins(binSize, binEqual)))
+    
     def add_bin_count(self, binDict, chrom, position):
         ''' Return index of bin of specified chromosme position.
         
@@ -528,9 +1018,157 @@ class single_coverage(object):
         # Return data
         return(binDict)
 
+def interval_names(intervals):
+    ''' Function returns the names of intervals as 'chrom:start-end' '''
+    return(['{}:{}-{}'.format(*interval) for interval in intervals])
+
+class coverageMatrix(object):
+    ''' Class stores the mean coverage of intervals in samples as a numpy
+    array with a row for each interval and a column for each sample, with
+    interval and sample labels. Matrices are saved as compressed numpy
+    .npz files, loaded by load_matrix, and summarised, normalised and
+    correlated by numpy operations.
+    '''
+    
+    def __init__(self, values, intervals, samples):
+        ''' Function to initialise coverageMatrix object.
+        
+        Args:
+            values (numpy.array)- Mean coverage with a row for each interval
+                and a column for each sample.
+            intervals (list)- Intervals, each a tuple of chromosome name,
+                start and end.
+            samples (list)- Sample names.
+        
+        Raises:
+            ValueError - If the shape of values does not match the labels.
+        
+        '''
+        self.values = np.asarray(values, np.float64)
+        self.intervals = [(str(chrom), int(start), int(end)) for chrom,
+            start, end in intervals]
+        self.samples = [str(sample) for sample in samples]
+        if self.values.shape != (len(self.intervals), len(self.samples)):
+            raise ValueError('Matrix shape does not match labels')
+    
+    def dataframe(self):
+        ''' Function returns the matrix as a pandas DataFrame indexed by
+        interval names.
+        '''
+        return(pd.DataFrame(self.values, index=interval_names(
+            self.intervals), columns=self.samples))
+    
+    def save(self, path):
+        ''' Function to save the matrix as a compressed numpy .npz file.
+        
+        Args:
+            path (str)- Full path to output file.
+        
+        '''
+        chroms, starts, ends = zip(*self.intervals) if self.intervals else (
+            [], [], [])
+        with open(path, 'wb') as outFile:
+            np.savez_compressed(outFile, values=self.values,
+                chroms=np.array(chroms, dtype=str),
+                starts=np.array(starts, np.int64),
+                ends=np.array(ends, np.int64),
+                samples=np.array(self.samples, dtype=str))
+    
+    def filter(self, min_coverage):
+        ''' Function returns a coverageMatrix of the intervals with at
+        least min_coverage in every sample.
+        '''
+        keep = self.values.min(axis=1) >= min_coverage
+        return(coverageMatrix(self.values[keep], [interval for interval,
+            selected in zip(self.intervals, keep) if selected],
+            self.samples))
+    
+    def normalise(self, method = 'mean'):
+        ''' Function returns a coverageMatrix normalised between samples.
+        
+        Args:
+            method (str)- 'mean' scales each sample to the mean coverage of
+                all samples. 'median' divides each sample by the median of
+                its ratios to the geometric mean across samples of each
+                interval covered in all samples.
+        
+        Returns:
+            matrix - Normalised coverageMatrix.
+        
+        Raises:
+            ValueError - If method is not recognised or no interval is
+                covered in all samples.
+        
+        '''
+        if method == 'mean':
+            means = self.values.mean(axis=0)
+            factors = means / means.mean()
+        elif method == 'median':
+            covered = self.values[(self.values > 0).all(axis=1)]
+            if not len(covered):
+                raise ValueError('No interval covered in all samples')
+            logs = np.log(covered)
+            factors = np.exp(np.median(logs - logs.mean(axis=1)[:, None],
+                axis=0))
+        else:
+            raise ValueError('method must be mean or median')
+        values = self.values / np.where(factors > 0, factors, 1)
+        return(coverageMatrix(values, self.intervals, self.samples))
+    
+    def correlation(self, method = 'pearson', log = False):
+        ''' Function returns the correlation between samples.
+        
+        Args:
+            method (str)- 'pearson', 'spearman' or 'kendall'.
+            log (bool)- Correlate log2 of coverage plus one.
+        
+        Returns:
+            cor - pandas DataFrame of correlations.
+        
+        '''
+        methods = ('pearson', 'kendall', 'spearman')
+        if method not in methods:
+            raise ValueError('method but be one of: {}.'.format(
+                ', '.join(methods)))
+        values = np.log2(self.values + 1) if log else self.values
+        if method == 'kendall':
+            cor = pd.DataFrame(values).corr(method).values
+        else:
+            if method == 'spearman':
+                values = pd.DataFrame(values).rank().values
+            cor = np.corrcoef(values, rowvar=False)
+        return(pd.DataFrame(np.atleast_2d(cor), index=self.samples,
+            columns=self.samples))
+    
+    def summary(self):
+        ''' Function returns a pandas DataFrame of the mean, median,
+        standard deviation, minimum and maximum of the mean coverage of
+        intervals and the fraction of intervals without coverage, for each
+        sample.
+        '''
+        values = self.values
+        return(pd.DataFrame({
+            'mean': values.mean(axis=0),
+            'median': np.median(values, axis=0),
+            'std': values.std(axis=0),
+            'min': values.min(axis=0),
+            'max': values.max(axis=0),
+            'zero': (values == 0).mean(axis=0)
+        }, index=self.samples, columns=['mean', 'median', 'std', 'min',
+            'max', 'zero']))
+
+def load_matrix(path):
+    ''' Function returns a coverageMatrix saved by coverageMatrix.save '''
+    data = np.load(path)
+    try:
+        return(coverageMatrix(data['values'], zip(data['chroms'],
+            data['starts'], data['ends']), data['samples']))
+    finally:
+        data.close()
+
 class multiple_coverage(object):
     
-    def __init__(self, bamList):
+    def __init__(self, bamList, cache = False, cache_dir = None):
         ''' Function to initialise multiple_coverage object. Object
         functions to perform coverage calculations across BAM files.
         All BAM files must have reference sequences of the same name
@@ -538,13 +1176,19 @@ class multiple_coverage(object):
         
         Args:
             bamList (iter)- Iterable returning path to BAM file.
+            cache (bool)- Calculate coverage from the coverageCache of
+                each BAM file.
+            cache_dir (str)- Directory in which to store caches.
         
         Raises:
-            ValueError - If reference sequences within BAM files
-                do not have the same names and lengths.
+            ValueError - If bamList is empty or reference sequences within
+                BAM files do not have the same names and lengths.
         
         '''
         # Check bams contain identical reference sequence
+        bamList = list(bamList)
+        if not bamList:
+            raise ValueError('bamList must contain at least one BAM file')
         for count, bam in enumerate(bamList):
             bamCov = single_coverage(bam)
             if count:
@@ -555,9 +1199,75 @@ class multiple_coverage(object):
         # Store bam list and lengths
         self.length = reference
         self.bamList = bamList
+        self.shard_metrics = []
+        self.cache = cache
+        self.cache_dir = cache_dir
+    
+    def coverage_matrix(
+        self, intervals, map_quality=0, remove_dup=False,
+        remove_secondary=False, processes=1, shards=None
+    ):
+        ''' Function to calculate the mean coverage of intervals in all BAM
+        files as a coverageMatrix. Intervals are split into shards by
+        plan_interval_shards and every pair of BAM file and shard is
+        processed by a pool process, so that many BAM files and intervals
+        are processed in a single pass. The metrics of each pair are
+        stored in self.shard_metrics. If self.cache is True coverage is
+        instead summed from the coverageCache of each BAM file, built by
+        a pool of processes if required.
+        
+        Args:
+            intervals - Iterable of intervals where each element consists
+                of a string and two integers specifying chromosome name and
+                chromosome start and end, respectively.
+            map_quality (int)- Minimum mapping quality for reads.
+            remove_dup (bool)- Remove duplicate reads.
+            remove_secondary (bool)- Remove secondary alignments.
+            processes (int)- Number of processes.
+            shards (int)- Number of shards of intervals. Defaults to enough
+                shards for four pairs of BAM file and shard per process.
+        
+        Returns:
+            matrix - coverageMatrix with a column for each BAM file.
+        
+        '''
+        # Check arguments
+        intervals = list(intervals)
+        single_coverage(self.bamList[0]).check_intervals(intervals)
+        _check_filters(map_quality, remove_dup, remove_secondary, processes)
+        # Calculate coverage from caches
+        if self.cache:
+            values = np.zeros((len(intervals), len(self.bamList)))
+            for column, bam in enumerate(self.bamList):
+                bamCov = single_coverage(bam, True, self.cache_dir)
+                values[:, column] = bamCov.mean_coverage_each(intervals,
+                    map_quality, remove_dup, remove_secondary, processes)
+            return(coverageMatrix(values, intervals, self.bamList))
+        if shards is None:
+            shards = max(1, -(-processes * 4 // len(self.bamList)))
+        shards = plan_interval_shards(intervals, shards)
+        flag = filter_flag(remove_dup, remove_secondary)
+        # Calculate coverage of every pair of BAM file and shard
+        pairs = [(column, shard) for column in range(len(self.bamList)) for
+            shard in shards]
+        results = _map_coverage([(self.bamList[column], shard, map_quality,
+            flag) for column, shard in pairs], processes)
+        # Combine results into matrix
+        sums = np.zeros((len(intervals), len(self.bamList)), np.int64)
+        self.shard_metrics = []
+        for (column, (chroms, starts, ends, index)), (shardSums, counts,
+                seconds) in zip(pairs, results):
+            np.add.at(sums[:, column], index, shardSums)
+            bam = self.bamList[column]
+            self.shard_metrics.append({'bam': bam, 'pieces': len(index),
+                'bases': int((ends - starts).sum()), 'seconds': seconds})
+        lengths = np.array([end - start for chrom, start, end in intervals],
+            np.float64)
+        return(coverageMatrix(sums / lengths[:, None], intervals,
+            self.bamList))
     
     def mean_coverage(
-        self, intervals, map_quality=0, remove_dup=False
+        self, intervals, map_quality=0, remove_dup=False, processes=1
     ):
         ''' Function to return mean coverage across all intervals
         within matched BAM files.
@@ -568,30 +1278,19 @@ class multiple_coverage(object):
                 chromosome start and end, respectively.
             map_quality (int)- Minimum mapping quality for reads.
             remove_dup (bool)- Remove duplicate reads.
+            processes (int)- Number of processes.
         
         Returns:
             outDF - Mean coverage of all intervals in all BAM files.
         
         '''
-        # Check intervals
-        for count, bam in enumerate(self.bamList):
-            # Generate single coverage object
-            bamCov = single_coverage(bam)
-            # Check intervals for first bam and build output
-            if count == 0:
-                bamCov.check_intervals(intervals)
-                names = ['{}:{}-{}'.format(*x) for x in intervals]
-                outDF = pd.DataFrame(index=names, columns=self.bamList)
-            # Add coverage to output
-            outDF[bam] = bamCov.mean_coverage(
-                intervals=intervals, map_quality=map_quality,
-                remove_dup=remove_dup, check_intervals=False)
-        # Return data
-        return(outDF)
+        return(self.coverage_matrix(intervals=intervals,
+            map_quality=map_quality, remove_dup=remove_dup,
+            processes=processes).dataframe())
     
     def mean_coverage_cor(
         self, intervals, map_quality=0, remove_dup=False, method='pearson',
-        min_coverage=0
+        min_coverage=0, processes=1
     ):
         ''' Function to calculate correlation between mean coverage of
         intervals within BAM files.
@@ -605,6 +1304,7 @@ class multiple_coverage(object):
             method (str)- Method for correlation calculation.
             min_coverage (int)- Minimum coverage of interval, across all BAM
                 files, for inclusion in correlation calculation.
+            processes (int)- Number of processes.
         
         Returns:
             cor - Correlation matrix for bamFiles.
@@ -612,16 +1312,13 @@ class multiple_coverage(object):
         
         '''
         # Check arguments
-        if not isinstance(return_filtered, bool):
-            raise TypeError('return_filtered must be bool')
         methods = ('pearson', 'kendall', 'spearman')
         if method not in methods:
             raise ValueError('method but be one of: {}.'.format(
                 ', '.join(methods)))
-        # Extract mean coverage and remove low rows
-        meanCov = self.mean_coverage(
-            intervals=intervals, map_quality=map_quality,
-            remove_dup=remove_dup)
-        # Perform correlation between remaining points and return
-        cor = filtCov.corr(method)
-        return((cor, meanCov))
+        # Extract mean coverage and correlate intervals above min_coverage
+        matrix = self.coverage_matrix(intervals=intervals,
+            map_quality=map_quality, remove_dup=remove_dup,
+            processes=processes)
+        cor = matrix.filter(min_coverage).correlation(method)
+        return((cor, matrix.dataframe()))
@@ -150,6 +150,42 @@ def sort(
     # Return command
     return(outputCommand)
     
+def sortStream(
+        outFile, name = False, threads = 1, memory = 2, path = 'samtools',
+        tempPrefix = None
+    ):
+    ''' Function to generate a command to sort SAM/BAM data read from stdin
+    using samtools, such as the output of an aligner, without an
+    intermediate file.
+
+    Args:
+        outFile (str)- Full path to output BAM file.
+        name (bool)- Sort by read name rather than coordinate.
+        threads (int)- Number of threads to use in sort.
+        memory - Memory to use in each thread, in gigabytes or as a string
+            accepted by samtools, such as '768M'.
+        path (str)- Path to samtools executable.
+        tempPrefix (str)- Prefix of temporary files. Defaults to outFile
+            without the '.bam' suffix.
+
+    Returns:
+        sortCommand (list)- Command as a list of arguments.
+
+    Raises:
+        ValueError - If outFile does not end '.bam'.
+
+    '''
+    if not outFile.endswith('.bam'):
+        raise ValueError("Output file %s does not end '.bam'" %(outFile))
+    memory = str(memory)
+    if memory.isdigit():
+        memory += 'G'
+    sortCommand = [path, 'sort', '-m', memory, '-@', str(threads),
+        '-T', tempPrefix or outFile[:-4], '-O', 'bam', '-o', outFile, '-']
+    if name:
+        sortCommand.insert(2, '-n')
+    return(sortCommand)
+
 def mpileup(
         inBam, outFile, reference = '', minMapQ = 20, minBaseQ = 20,
         countOrphans = False, countDup = False, disableBAQ = True,
@@ -202,15 +238,33 @@ def mpileup(
     return(finalCommand)
 
 def merge(
-        inBamList, outBam, delete = False, path = 'samtools'
+        inBamList, outBam, delete = False, path = 'samtools', name = False,
+        threads = 1
     ):
+    ''' Function to generate a command to merge sorted BAM files using
+    samtools, performing a k-way merge of the sorted inputs. Identical read
+    group and program headers of the inputs are combined.
+
+    Args:
+        inBamList (list)- Full paths to sorted input BAM files.
+        outBam (str)- Full path to output BAM file.
+        delete (bool)- Delete input files after merging.
+        path (str)- Path to samtools executable.
+        name (bool)- Inputs are sorted by read name rather than coordinate.
+        threads (int)- Number of compression threads.
+
+    Returns:
+        command (str)- Command to merge BAM files.
+
+    '''
     # Check arguments
     if not isinstance(inBamList, list):
         raise TypeError('inBamList must be list')
     if not isinstance(delete, bool):
         raise TypeError('delete must be boolean')
     # Create and return command
-    command = '{} merge -f {} {}'.format(path, outBam, ' '.join(inBamList))
+    command = '{} merge -f -c -p {}-@ {} {} {}'.format(path,
+        '-n ' if name else '', threads, outBam, ' '.join(inBamList))
     if delete:
-        command += ' && rm {}'.format()
+        command += ' && rm {}'.format(' '.join(inBamList))
     return(command)
@@ -1,7 +1,11 @@
 import numpy as np
 import os
+import pysam
+import shutil
+import tempfile
 import unittest
 from ngs_python.bam import pysam_coverage
+from ngs_python.bed import bedgraph, covtrack
 
 class test_mean_coverage_each(unittest.TestCase):
     
@@ -45,6 +49,14 @@ class test_mean_coverage_each(unittest.TestCase):
         meancov = self.cov.mean_coverage_each(self.intervals, map_quality=10)
         exptcov = np.array([0, 1.25, 2, 2.5, 2.333, 0.25, 0, 0])
         self.assertTrue(np.allclose(meancov, exptcov, rtol=0, atol=0.001))
+    
+    def test_parallel(self):
+        meancov = self.cov.mean_coverage_each(self.intervals, remove_dup=True,
+            processes=3)
+        exptcov = np.array([0, 1.25, 2, 2.25, 2, 0.5, 0, 0])
+        self.assertTrue(np.allclose(meancov, exptcov, rtol=0, atol=0.001))
+        self.assertEqual(sum(shard['bases'] for shard in
+            self.cov.shard_metrics), 42)
 
 class test_coverage_count_all(unittest.TestCase):
     
@@ -98,6 +110,12 @@ class test_coverage_count_all(unittest.TestCase):
             ('ref', 30, 40), ('ref', 50, 60)])
         expDict = {0:4, 1:6, 2:2, 3:13, 4:5}
         self.assertTrue(covDict == expDict)
+    
+    def test_parallel(self):
+        covDict = self.cov.coverage_count_all([('ref', 0, 70)],
+            remove_dup=True, processes=2)
+        expDict = {0:12, 1:20, 2:19, 3:19}
+        self.assertTrue(covDict == expDict)
 
 class test_coverage_histogram(unittest.TestCase):
     
@@ -122,6 +140,178 @@ class test_coverage_histogram(unittest.TestCase):
         exphist = np.array([1, 0.828, 0.542, 0.4])
         self.assertTrue(np.allclose(covhist, exphist, rtol=0, atol=0.001))
 
+class test_coverage_runs(unittest.TestCase):
+    
+    def setUp(self):
+        dirpath = os.path.dirname(os.path.realpath(__file__))
+        bamfile = os.path.join(dirpath, 'test_coverage.bam')
+        self.cov = pysam_coverage.single_coverage(bamfile)
+    
+    def test_runs(self):
+        positions, coverage = pysam_coverage.coverage_runs(
+            np.array([2, 4, 4, 12, 14]), np.array([6, 8, 6, 14, 30]), 0, 20)
+        self.assertTrue(np.all(positions == [0, 2, 4, 6, 8, 12, 20]))
+        self.assertTrue(np.all(coverage == [0, 1, 3, 1, 0, 1]))
+    
+    def test_plan_shards(self):
+        shards = pysam_coverage.plan_interval_shards([('ref', 0, 10),
+            ('ref', 0, 1000), ('ref', 20, 25)], 4)
+        self.assertEqual(len(shards), 4)
+        for chroms, starts, ends, index in shards:
+            self.assertTrue(np.all(ends - starts <= 254))
+        index = np.concatenate([shard[3] for shard in shards])
+        self.assertTrue(np.all(index == [0, 1, 1, 1, 1, 2]))
+    
+    def test_bam2bg(self):
+        # Runs joined across windows match runs of the whole reference
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'coverage.bg')
+            bedgraph.bam2bg(self.cov.bam, path, window=7)
+            with open(path) as inFile:
+                lines = inFile.read()
+        finally:
+            shutil.rmtree(directory)
+        bamFile = pysam.AlignmentFile(self.cov.bam)
+        positions, coverage = pysam_coverage.coverage_runs(*(
+            pysam_coverage.read_blocks(bamFile, 'ref', 0, 70, flag=4) +
+            (0, 70)))
+        bamFile.close()
+        self.assertEqual(lines, ''.join('ref\t%d\t%d\t%d\n' %(run) for run
+            in zip(positions[:-1], positions[1:], coverage) if run[2]))
+    
+    def test_mean_coverage_all(self):
+        meancov = self.cov.mean_coverage_all([('ref', 0, 70)])
+        self.assertAlmostEqual(meancov, 135 / 70.0)
+
+class test_multiple_coverage(unittest.TestCase):
+    
+    def setUp(self):
+        dirpath = os.path.dirname(os.path.realpath(__file__))
+        bamfile = os.path.join(dirpath, 'test_coverage.bam')
+        self.cov = pysam_coverage.multiple_coverage([bamfile, bamfile])
+        self.intervals = [('ref', 5, 9), ('ref', 19, 27), ('ref', 43, 49),
+            ('ref', 48, 56), ('ref', 64, 70)]
+        self.dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def test_matrix(self):
+        matrix = self.cov.coverage_matrix(self.intervals, remove_dup=True,
+            processes=2)
+        exptcov = np.array([1.25, 2.25, 2, 0.5, 0])
+        self.assertTrue(np.allclose(matrix.values, exptcov[:, None]))
+        self.assertEqual(len(self.cov.shard_metrics), 8)
+        # Matrices are saved with labels
+        path = os.path.join(self.dir, 'matrix.npz')
+        matrix.save(path)
+        loaded = pysam_coverage.load_matrix(path)
+        self.assertEqual(loaded.intervals, self.intervals)
+        self.assertEqual(loaded.samples, self.cov.bamList)
+        self.assertTrue(np.array_equal(loaded.values, matrix.values))
+    
+    def test_empty(self):
+        self.assertRaises(ValueError, pysam_coverage.multiple_coverage, [])
+    
+    def test_summaries(self):
+        matrix = pysam_coverage.coverageMatrix([[1, 2], [2, 4], [0, 3],
+            [4, 8]], self.intervals[:4], ['a', 'b'])
+        normalised = matrix.normalise('median').values
+        self.assertTrue(np.allclose(normalised / 2 ** 0.5, [[1, 1], [2, 2],
+            [0, 1.5], [4, 4]]))
+        self.assertEqual(matrix.filter(1).intervals, [self.intervals[0],
+            self.intervals[1], self.intervals[3]])
+        self.assertAlmostEqual(matrix.filter(1).correlation().loc['a', 'b'],
+            1)
+        self.assertTrue(np.allclose(matrix.summary()['zero'], [0.25, 0]))
+        cor, meanCov = self.cov.mean_coverage_cor(self.intervals,
+            min_coverage=1)
+        self.assertEqual(list(meanCov.index), ['ref:5-9', 'ref:19-27',
+            'ref:43-49', 'ref:48-56', 'ref:64-70'])
+        self.assertAlmostEqual(cor.values[0, 1], 1)
+
+class test_coverage_cache(unittest.TestCase):
+    
+    def setUp(self):
+        dirpath = os.path.dirname(os.path.realpath(__file__))
+        self.dir = tempfile.mkdtemp()
+        self.bam = os.path.join(self.dir, 'test_coverage.bam')
+        for suffix in ('', '.bai'):
+            shutil.copy(os.path.join(dirpath, 'test_coverage.bam' + suffix),
+                self.bam + suffix)
+        self.cov = pysam_coverage.single_coverage(self.bam)
+        self.cached = pysam_coverage.single_coverage(self.bam, cache=True)
+        self.intervals = [('ref', 0, 2), ('ref', 5, 9), ('ref', 19, 27),
+            ('ref', 43, 49), ('ref', 48, 56), ('ref', 0, 70)]
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def test_cached_coverage(self):
+        for filters in ({}, {'remove_dup': True}, {'remove_secondary': True},
+                {'map_quality': 20}):
+            self.assertTrue(np.array_equal(
+                self.cached.mean_coverage_each(self.intervals, **filters),
+                self.cov.mean_coverage_each(self.intervals, **filters)))
+            self.assertEqual(
+                self.cached.coverage_count_all(self.intervals, **filters),
+                self.cov.coverage_count_all(self.intervals, **filters))
+        self.assertEqual(len(self.cached.caches), 4)
+        # Caches built in small windows are identical
+        cache = pysam_coverage.coverageCache(self.bam, remove_dup=True,
+            directory=os.path.join(self.dir, 'windows'), window=7)
+        self.assertTrue(np.array_equal(cache.depth('ref'),
+            self.cached.coverage_cache(remove_dup=True).depth('ref')))
+        bins = self.cached.mean_coverage_bins(10, True)
+        self.assertTrue(np.allclose(bins['ref']['mean'],
+            self.cov.mean_coverage_each([('ref', start, start + 10) for
+            start in range(0, 70, 10)])))
+        bins = self.cached.mean_coverage_bins(8, True)
+        self.assertTrue(np.allclose(bins['ref']['mean'],
+            self.cov.mean_coverage_each([('ref', start, start + 8) for
+            start in range(3, 67, 8)])))
+        # Bedgraphs are identical
+        for number, cov in enumerate((self.cov, self.cached)):
+            cov.bedgraph_file(os.path.join(self.dir, '{}.bg'.format(number)),
+                self.intervals[-1:])
+        with open(os.path.join(self.dir, '0.bg')) as first, open(
+                os.path.join(self.dir, '1.bg')) as second:
+            self.assertEqual(first.read(), second.read())
+    
+    def test_invalidation(self):
+        cache = self.cached.coverage_cache()
+        self.assertTrue(os.path.isdir(cache.path))
+        self.assertTrue(pysam_coverage.coverageCache(self.bam).manifest)
+        # Modified BAM files invalidate caches
+        os.utime(self.bam, (0, 0))
+        self.assertFalse(cache.valid())
+        self.assertRaises(IOError, cache.depth, 'ref', 0, 10)
+        rebuilt = self.cached.coverage_cache()
+        self.assertIsNot(rebuilt, cache)
+        self.assertTrue(rebuilt.valid())
+        self.assertEqual(os.listdir(self.bam + '.cache'),
+            [os.path.basename(rebuilt.path)])
+        matrix = pysam_coverage.multiple_coverage([self.bam], cache=True
+            ).coverage_matrix(self.intervals)
+        self.assertTrue(np.array_equal(matrix.values[:, 0],
+            self.cov.mean_coverage_each(self.intervals)))
+    
+    def test_coverage_track(self):
+        paths = [os.path.join(self.dir, name) for name in ('coverage.bg',
+            'coverage.track', 'track.bg')]
+        self.cov.bedgraph_file(paths[0], [('ref', 0, self.cov.length['ref'])],
+            remove_dup=True)
+        self.cached.coverage_track(paths[1], remove_dup=True, zooms=(10,))
+        track = covtrack.coverageTrack(paths[1])
+        track.write_bedgraph(paths[2])
+        with open(paths[0]) as first, open(paths[2]) as second:
+            self.assertEqual(first.read(), second.read())
+        starts, bins = track.zoom('ref', 10, 0, 70)
+        self.assertTrue(np.allclose(bins['sum'] / 10,
+            self.cov.mean_coverage_each([('ref', start, start + 10) for
+            start in starts], remove_dup=True)))
+
 class test_create_bins(unittest.TestCase):
     
     def setUp(self):
@@ -288,6 +478,16 @@ if __name__ == '__main__':
     suite = unittest.TestLoader().loadTestsFromTestCase(test_coverage_histogram)
     unittest.TextTestRunner(verbosity=2).run(suite)
     
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_coverage_runs)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    
+    suite = unittest.TestLoader().loadTestsFromTestCase(
+        test_multiple_coverage)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_coverage_cache)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    
     suite = unittest.TestLoader().loadTestsFromTestCase(test_create_bins)
     unittest.TextTestRunner(verbosity=2).run(suite)
     
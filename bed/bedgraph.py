@@ -2,7 +2,11 @@ import collections
 import multiprocessing
 import pysam
 import os
+import sys
+import numpy as np
 import pandas as pd
+from ngs_python.bam import pysam_coverage
+from ngs_python.bed import covtrack
 
 def bedgraph_coverage(intervals, zero=False, lengths=None):
     ''' Function creates coverage from a supplied interval list.
@@ -140,31 +144,30 @@ def bedgraph_bam(
     parentConn.close()
     return(bedgraph)
 
-bg = bedgraph_bam(
-    bam = '/farm/scratch/rs-bio-lif/rabino01/Elza/bamFiles/310123-NORM_dedup_realign_recal.bam'
-)
-print bg
-
 def intlist2bg(pipe, bedgraph):
     ''' Function to parse list of overlapping genomic intervals and
-    create a bedgraph file. Function takes two arguments.
+    create a bedgraph file. Coverage of each list is calculated by
+    pysam_coverage.coverage_runs and written by a covtrack.bedgraphWriter.
+    Function takes two arguments.
     
     1)  pipe - Python pipe down which the chromsome name and interval list
         will be sent.
     2)  bedgraph - Name of bedgraph file.
     
     '''
-    # Print pid
-    print 'intList2bg', os.getpid()
     # Open out file
-    with open(bedgraph, 'w') as bg:
+    with covtrack.bedgraphWriter(bedgraph) as bg:
         # Loop to process lists
         while True:
             # Extract data from pipe
             inData = pipe.recv()
-            # Create change dictionary from input list
+            # Calculate coverage of input list
             if isinstance(inData, list):
-                coverageList = intlist2covlist(inData)
+                starts, ends = np.array(inData, np.int64).reshape(-1, 2).T
+                if not len(starts):
+                    continue
+                positions, coverage = pysam_coverage.coverage_runs(starts,
+                    ends, starts.min(), ends.max())
             # Set chromosome name from input string
             elif isinstance(inData, str):
                 chromosome = inData
@@ -175,85 +178,58 @@ def intlist2bg(pipe, bedgraph):
                 break
             # Raise error for unexpected type
             else:
-                print inData
-                raise TypeError('Unexpected entry %s')
-            # Print calculate coverage to file
-            for start, end, coverage in coverageList:
-                bg.write('%s\t%s\t%s\t%s\n' %(chromosome, start, end, coverage))
+                raise TypeError('Unexpected entry {}'.format(inData))
+            # Print covered runs to file
+            keep = coverage > 0
+            bg.add(chromosome, positions[:-1][keep], positions[1:][keep],
+                coverage[keep])
 
-def bam2bg(bam, bedgraph):
+def bam2bg(bam, bedgraph, window = 10000000):
     ''' Function extracts all mapped reads a BAM file and creates a bedgrpah
-    file containing absolute coverage. Function takes two arguments:
+    file containing absolute coverage. Each chromosome is processed in
+    windows: the aligned blocks of the reads of a window are extracted into
+    numpy arrays by pysam_coverage.read_blocks, a difference array of the
+    window is built with numpy.bincount and its cumulative sum run-length
+    encoded by covtrack.run_length. The last run of each window is joined
+    to the runs of the next. The number of aligned blocks of each
+    chromosome is written to stderr. Function takes three arguments:
     
     1)  bam - Full path to input bam file.
     2)  bedgraph - Full path to output bedgraph file.
+    3)  window - Number of bases processed at once.
     
     '''
-    # Print pid
-    print 'bam2bg', os.getpid()
-    # Open bam file and extract chromosome names
+    # Open bam file and bedgraph
     bamFile = pysam.AlignmentFile(bam)
-    chromosomes = bamFile.references
-    # Create pipe
-    pipeRecv, pipeSend = multiprocessing.Pipe(False)
-    # Create and start int2cov process
-    intlist2bgProcess = multiprocessing.Process(
-        target = intlist2bg,
-        args = (pipeRecv, bedgraph)
-    )
-    intlist2bgProcess.start()
-    # Close unwanted pipes
-    pipeRecv.close()
-    # Loop through chromsome names and extract intervals
-    for chrom in chromosomes:
-        # Send chromosome name
-        pipeSend.send(chrom)
-        # Create counter and iterator
-        count = 0
-        chromIterator = bamFile.fetch(chrom)
-        # Create initial values from first mapped read
-        while True:
-            # Extract read
-            try:
-                read = chromIterator.next()
-            except StopIteration:
-                break
-            # Skip unmapped reads
-            if read.is_unmapped:
-                continue
-            # Extract start and end, create interval list and maximum
-            start, end = read.reference_start, read.reference_end
-            intervalList = [(start, end)]
-            maxList = end
-            # Count read and break
-            count += 1
-            break
-        # Loop through remaining reads in chromsome
-        for read in chromIterator:
-            # Skip unmapped reads
-            if read.is_unmapped:
-                continue
-            # Count read and extract start and end
-            count += 1
-            start, end = read.reference_start, read.reference_end
-            # Process non-overlapping interval
-            if start > maxList:
-                # Send current chromosome interval list
-                pipeSend.send(intervalList)
-                # Create new interval list and list maximum
-                intervalList = [(start, end)]
-                maxList = end
-            # Process overlapping intervals
-            else:
-                # Add interval to list and recalculate list maximum
-                intervalList.append((start, end))
-                maxList = max(maxList, end)
-        # Send last list and print chromosome metrics
-        if len(intervalList) > 0:
-            pipeSend.send(intervalList)
-        print '%s: %s' %(chrom, count)
-    # Add poisin pill, close pipes and join process
-    pipeSend.send(None)
-    pipeSend.close()
-    intlist2bgProcess.join()
-
+    with covtrack.bedgraphWriter(bedgraph) as bg:
+        # Loop through chromsome names and windows
+        for chrom, length in zip(bamFile.references, bamFile.lengths):
+            runStart, runCoverage = 0, 0
+            blockCount = 0
+            for start in range(0, length, window):
+                end = min(start + window, length)
+                starts, ends = pysam_coverage.read_blocks(bamFile, chrom,
+                    start, end, flag = 4)
+                blockCount += len(starts)
+                # Build difference array and encode runs of coverage
+                starts = np.clip(starts, start, end) - start
+                ends = np.clip(ends, start, end) - start
+                change = np.bincount(starts, minlength = end - start + 1) - (
+                    np.bincount(ends, minlength = end - start + 1))
+                positions, coverage = covtrack.run_length(np.cumsum(
+                    change[:-1]), start)
+                # Join the last run of the previous window
+                if coverage[0] == runCoverage:
+                    positions[0] = runStart
+                else:
+                    positions = np.concatenate(([runStart], positions))
+                    coverage = np.concatenate(([runCoverage], coverage))
+                # Write covered runs, keeping the last run
+                runStart, runCoverage = positions[-2], coverage[-1]
+                keep = coverage[:-1] > 0
+                bg.add(chrom, positions[:-2][keep], positions[1:-1][keep],
+                    coverage[:-1][keep])
+            if runCoverage > 0:
+                bg.add(chrom, [runStart], [length], [runCoverage])
+            sys.stderr.write('%s: %s aligned blocks\n' %(chrom, blockCount))
+    bamFile.close()
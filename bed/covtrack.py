@@ -0,0 +1,495 @@
+''' Functions and classes to write run-length encoded coverage. Arrays of
+coverage are encoded as runs of constant value by run_length. Runs are
+written to bedGraph files by bedgraphWriter, which formats each block of
+runs with a single string operation, or to an indexed binary track by
+trackWriter. Similar to a bigWig file, a track stores the runs of each
+chromosome in blocks, indexed by the first start and last end of each
+block, and summaries of fixed size bins at several zoom levels. Tracks are
+memory-mapped by the coverageTrack class to answer range queries.
+'''
+import collections
+import json
+import os
+import struct
+import tempfile
+import time
+import numpy as np
+
+# Magic string and version at the start of track files
+TRACK_MAGIC = 'NGSTRACK'
+TRACK_VERSION = 1
+# Footer holding the offset and length of the JSON header
+TRACK_FOOTER = struct.Struct('<QQ8s')
+# Records of the block index and zoom levels
+BLOCK_DTYPE = np.dtype([('start', '<u4'), ('end', '<u4'), ('offset', '<u8'),
+    ('count', '<u4')])
+ZOOM_DTYPE = np.dtype([('covered', '<u4'), ('min', '<f4'), ('max', '<f4'),
+    ('sum', '<f8'), ('squares', '<f8')])
+# Data types of run values
+VALUE_DTYPES = ('uint32', 'int32', 'float32')
+
+def run_length(values, start = 0):
+    ''' Function to run-length encode an array, finding the boundaries of
+    runs with numpy.flatnonzero(numpy.diff(values)).
+
+    Args:
+        values (numpy.array)- Value of each position.
+        start (int)- Position of the first value.
+
+    Returns:
+        positions (numpy.array)- Boundaries of runs of constant value.
+        values (numpy.array)- Value of each run.
+
+    '''
+    if not len(values):
+        return(np.array([start], np.int64), values[:0])
+    changes = np.flatnonzero(np.diff(values)) + 1
+    positions = np.concatenate(([0], changes, [len(values)]))
+    return(positions + start, values[positions[:-1]])
+
+class bedgraphWriter(object):
+    ''' Class writes runs to a bedGraph file. Each block of runs is
+    converted to a flat list and formatted by repeating a line template,
+    avoiding a write call for every line. Integer values are written as
+    integers and other values with six significant figures.
+    '''
+
+    def __init__(self, path, block_size = 65536, buffer_size = 4194304):
+        ''' Function to initialise bedgraphWriter object.
+
+        Args:
+            path (str)- Full path to bedGraph file.
+            block_size (int)- Number of runs formatted at once.
+            buffer_size (int)- Size of file buffer.
+
+        '''
+        self.handle = open(path, 'w', buffer_size)
+        self.block_size = block_size
+        self.runs = 0
+
+    def add(self, chrom, starts, ends, values):
+        ''' Function to write runs of a chromosome.
+
+        Args:
+            chrom (str)- Chromosome name.
+            starts (numpy.array)- Start of each run.
+            ends (numpy.array)- End of each run.
+            values (numpy.array)- Value of each run.
+
+        '''
+        values = np.asarray(values)
+        if np.issubdtype(values.dtype, np.integer):
+            dtype, template = np.int64, '%d'
+        else:
+            dtype, template = np.float64, '%.6g'
+        line = chrom.replace('%', '%%') + '\t%d\t%d\t' + template + '\n'
+        # Interleave columns and format blocks
+        data = np.empty((len(values), 3), dtype)
+        data[:, 0], data[:, 1], data[:, 2] = starts, ends, values
+        for start in range(0, len(values), self.block_size):
+            block = data[start:start + self.block_size]
+            self.handle.write((line * len(block)) % tuple(
+                block.ravel().tolist()))
+        self.runs += len(values)
+
+    def close(self):
+        self.handle.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+class trackWriter(object):
+    ''' Class writes runs to an indexed binary track. Runs of each
+    chromosome must be added in order, and chromosomes may not be split,
+    but need not be added in the order of the supplied lengths. Runs are
+    written in blocks of 'block_size' runs, each storing contiguous arrays
+    of starts, ends and values, and the summaries of the bins of each zoom
+    level are accumulated in memory and written when a chromosome is
+    complete. The block index, the zoom levels and the chromosome lengths
+    are recorded in a JSON header at the end of the file.
+    '''
+
+    def __init__(
+            self, path, lengths, zooms = (1000, 10000, 100000),
+            block_size = 4096, dtype = 'float32'
+        ):
+        ''' Function to initialise trackWriter object.
+
+        Args:
+            path (str)- Full path to track file.
+            lengths (dict)- Ordered dictionary of chromosome lengths.
+            zooms (tuple)- Bin size of each zoom level.
+            block_size (int)- Maximum number of runs in each block.
+            dtype (str)- Data type of stored values, one of 'uint32',
+                'int32' or 'float32'.
+
+        Raises:
+            ValueError - If arguments have an unexpected value.
+
+        '''
+        if dtype not in VALUE_DTYPES:
+            raise ValueError('dtype must be one of: {}'.format(
+                ', '.join(VALUE_DTYPES)))
+        if block_size < 1 or any(size < 1 for size in zooms):
+            raise ValueError('block_size and zooms must be positive')
+        self.lengths = collections.OrderedDict(lengths)
+        self.zooms = sorted(set(int(size) for size in zooms))
+        self.block_size = block_size
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.handle = open(path, 'wb')
+        self.handle.write(TRACK_MAGIC + struct.pack('<Q', TRACK_VERSION))
+        self.sections = collections.OrderedDict()
+        self.blocks = []
+        self.chrom = None
+
+    def __start_chrom(self, chrom):
+        ''' Function to finish the current chromosome and start another '''
+        if chrom in self.sections:
+            raise ValueError('Runs of {} are not contiguous'.format(chrom))
+        if chrom not in self.lengths:
+            raise ValueError('Invalid chromosome: {}'.format(chrom))
+        self.__finish_chrom()
+        self.chrom = chrom
+        self.end = 0
+        self.pending = (np.zeros(0, '<u4'), np.zeros(0, '<u4'),
+            np.zeros(0, self.dtype))
+        self.sections[chrom] = {'blocks': [len(self.blocks), 0],
+            'zooms': {}}
+        # Create empty bins of each zoom level
+        self.bins = []
+        for size in self.zooms:
+            bins = np.zeros(-(-self.lengths[chrom] // size), ZOOM_DTYPE)
+            bins['min'], bins['max'] = np.inf, -np.inf
+            self.bins.append(bins)
+
+    def __add_zooms(self, starts, ends, values):
+        ''' Function to add runs to the bins of each zoom level. Runs are
+        split at bin boundaries and the pieces of each bin are summarised
+        by numpy reduceat functions.
+        '''
+        values = values.astype(np.float64)
+        for size, bins in zip(self.zooms, self.bins):
+            first = starts // size
+            counts = (ends - 1) // size - first + 1
+            run = np.repeat(np.arange(len(starts)), counts)
+            number = first[run] + np.arange(len(run)) - np.repeat(
+                np.cumsum(counts) - counts, counts)
+            lengths = (np.minimum(ends[run], (number + 1) * size) -
+                np.maximum(starts[run], number * size))
+            pieces = values[run]
+            # Summarise pieces of each bin
+            index = np.concatenate(([0], np.flatnonzero(np.diff(number)) + 1))
+            unique = number[index]
+            records = bins[unique]
+            records['covered'] += np.add.reduceat(lengths, index).astype(
+                np.uint32)
+            records['sum'] += np.add.reduceat(lengths * pieces, index)
+            records['squares'] += np.add.reduceat(lengths * pieces ** 2,
+                index)
+            records['min'] = np.minimum(records['min'],
+                np.minimum.reduceat(pieces, index))
+            records['max'] = np.maximum(records['max'],
+                np.maximum.reduceat(pieces, index))
+            bins[unique] = records
+
+    def __write_blocks(self, final = False):
+        ''' Function to write full blocks of pending runs, and a final
+        partial block if required.
+        '''
+        starts, ends, values = self.pending
+        count = len(starts) if final else len(starts) - (len(starts) %
+            self.block_size)
+        for start in range(0, count, self.block_size):
+            end = min(start + self.block_size, count)
+            self.blocks.append((starts[start], ends[end - 1],
+                self.handle.tell(), end - start))
+            for array in (starts, ends, values):
+                self.handle.write(array[start:end].tobytes())
+        self.pending = (starts[count:], ends[count:], values[count:])
+        self.sections[self.chrom]['blocks'][1] = len(self.blocks) - (
+            self.sections[self.chrom]['blocks'][0])
+
+    def __finish_chrom(self):
+        ''' Function to write remaining runs and zoom levels of the current
+        chromosome.
+        '''
+        if self.chrom is None:
+            return
+        self.__write_blocks(final = True)
+        for size, bins in zip(self.zooms, self.bins):
+            empty = bins['covered'] == 0
+            bins['min'][empty], bins['max'][empty] = 0, 0
+            self.sections[self.chrom]['zooms'][str(size)] = (
+                self.handle.tell())
+            self.handle.write(bins.tobytes())
+        self.chrom, self.bins = None, []
+
+    def add(self, chrom, starts, ends, values):
+        ''' Function to add runs of a chromosome.
+
+        Args:
+            chrom (str)- Chromosome name.
+            starts (numpy.array)- Start of each run.
+            ends (numpy.array)- End of each run.
+            values (numpy.array)- Value of each run.
+
+        Raises:
+            ValueError - If runs are unsorted, overlap previous runs or
+                extend beyond the chromosome.
+
+        '''
+        if chrom != self.chrom:
+            self.__start_chrom(chrom)
+        starts = np.asarray(starts, np.int64)
+        ends = np.asarray(ends, np.int64)
+        if not len(starts):
+            return
+        # Check runs are sorted and within chromosome
+        if (starts[0] < self.end or ends[-1] > self.lengths[chrom] or
+                (ends <= starts).any() or (starts[1:] < ends[:-1]).any()):
+            raise ValueError('Runs must be sorted, non-overlapping and '\
+                'within the chromosome')
+        self.end = ends[-1]
+        values = np.asarray(values).astype(self.dtype)
+        self.__add_zooms(starts, ends, values)
+        # Add runs to pending blocks
+        self.pending = tuple(np.concatenate((pending, array)) for pending,
+            array in zip(self.pending, (starts.astype('<u4'),
+            ends.astype('<u4'), values)))
+        self.__write_blocks()
+
+    def close(self):
+        ''' Function to write the block index and header and close file '''
+        if self.handle.closed:
+            return
+        self.__finish_chrom()
+        index = np.array(self.blocks, BLOCK_DTYPE)
+        header = {
+            'version': TRACK_VERSION,
+            'dtype': self.dtype.str,
+            'chromosomes': [(chrom, int(length)) for chrom, length in
+                self.lengths.items()],
+            'zooms': self.zooms,
+            'block_size': self.block_size,
+            'index': [self.handle.tell(), len(index)],
+            'sections': self.sections
+        }
+        self.handle.write(index.tobytes())
+        offset = self.handle.tell()
+        data = json.dumps(header)
+        self.handle.write(data)
+        self.handle.write(TRACK_FOOTER.pack(offset, len(data), TRACK_MAGIC))
+        self.handle.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+class coverageTrack(object):
+    ''' Class reads tracks written by trackWriter. The file is
+    memory-mapped and range queries read only the blocks whose span,
+    recorded in the block index, overlaps the range.
+    '''
+
+    def __init__(self, path):
+        ''' Function to initialise coverageTrack object.
+
+        Args:
+            path (str)- Full path to track file.
+
+        Raises:
+            IOError - If the file is not a track.
+
+        '''
+        self.path = path
+        self.data = np.memmap(path, np.uint8, 'r')
+        if (len(self.data) < len(TRACK_MAGIC) + TRACK_FOOTER.size or
+                self.data[:len(TRACK_MAGIC)].tobytes() != TRACK_MAGIC):
+            raise IOError('{} is not a coverage track'.format(path))
+        offset, length, magic = TRACK_FOOTER.unpack(
+            self.data[-TRACK_FOOTER.size:].tobytes())
+        if magic != TRACK_MAGIC:
+            raise IOError('{} is truncated'.format(path))
+        header = json.loads(self.data[offset:offset + length].tobytes())
+        self.dtype = np.dtype(str(header['dtype']))
+        self.lengths = collections.OrderedDict((str(chrom), length) for
+            chrom, length in header['chromosomes'])
+        self.zooms = header['zooms']
+        self.sections = dict((str(chrom), section) for chrom, section in
+            header['sections'].items())
+        # Extract block index as contiguous arrays
+        index = np.frombuffer(self.data, BLOCK_DTYPE, header['index'][1],
+            header['index'][0])
+        self.block_starts = index['start'].astype(np.int64)
+        self.block_ends = index['end'].astype(np.int64)
+        self.block_offsets = index['offset'].astype(np.int64)
+        self.block_counts = index['count'].astype(np.int64)
+
+    def __check_range(self, chrom, start, end):
+        ''' Function returns the end of a checked range '''
+        if chrom not in self.lengths:
+            raise ValueError('Invalid chromosome: {}'.format(chrom))
+        if end is None:
+            end = self.lengths[chrom]
+        if not 0 <= start < end <= self.lengths[chrom]:
+            raise ValueError('Invalid range: {}:{}-{}'.format(chrom, start,
+                end))
+        return(end)
+
+    def runs(self, chrom, start = 0, end = None):
+        ''' Function returns the runs overlapping a range, clipped to the
+        range.
+
+        Args:
+            chrom (str)- Chromosome name.
+            start (int)- Start of range.
+            end (int)- End of range. Defaults to the chromosome end.
+
+        Returns:
+            starts (numpy.array)- Start of each run.
+            ends (numpy.array)- End of each run.
+            values (numpy.array)- Value of each run.
+
+        '''
+        end = self.__check_range(chrom, start, end)
+        output = [[np.zeros(0, np.int64)] * 2 + [np.zeros(0, self.dtype)]]
+        if chrom in self.sections:
+            # Find blocks overlapping range
+            first, count = self.sections[chrom]['blocks']
+            last = first + count
+            low = first + np.searchsorted(self.block_ends[first:last], start,
+                'right')
+            high = first + np.searchsorted(self.block_starts[first:last], end,
+                'left')
+            for block in range(low, high):
+                offset, count = (self.block_offsets[block],
+                    self.block_counts[block])
+                output.append([np.frombuffer(self.data, dtype, count,
+                    offset + 4 * count * number) for number, dtype in
+                    enumerate(('<u4', '<u4', self.dtype))])
+        starts, ends, values = [np.concatenate(arrays) for arrays in zip(
+            *output)]
+        # Select and clip runs
+        keep = (ends > start) & (starts < end)
+        return(np.maximum(starts[keep].astype(np.int64), start),
+            np.minimum(ends[keep].astype(np.int64), end), values[keep])
+
+    def mean(self, chrom, start = 0, end = None):
+        ''' Function returns the mean value of the bases of a range,
+        where bases outside runs have a value of zero.
+        '''
+        end = self.__check_range(chrom, start, end)
+        starts, ends, values = self.runs(chrom, start, end)
+        return(np.dot(ends - starts, values.astype(np.float64)) / (
+            end - start))
+
+    def zoom(self, chrom, size, start = 0, end = None):
+        ''' Function returns the summaries of the bins of a zoom level
+        overlapping a range.
+
+        Args:
+            chrom (str)- Chromosome name.
+            size (int)- Bin size of zoom level.
+            start (int)- Start of range.
+            end (int)- End of range. Defaults to the chromosome end.
+
+        Returns:
+            starts (numpy.array)- Start of each bin.
+            bins (numpy.array)- Record of each bin with the number of bases
+                covered by runs, 'covered', and their 'min', 'max', 'sum' and
+                sum of squares, 'squares'.
+
+        '''
+        end = self.__check_range(chrom, start, end)
+        if size not in self.zooms:
+            raise ValueError('Zoom levels are: {}'.format(self.zooms))
+        first, last = start // size, -(-end // size)
+        if chrom in self.sections:
+            bins = np.frombuffer(self.data, ZOOM_DTYPE, last - first,
+                self.sections[chrom]['zooms'][str(size)] +
+                first * ZOOM_DTYPE.itemsize)
+        else:
+            bins = np.zeros(last - first, ZOOM_DTYPE)
+        return(np.arange(first, last) * size, bins)
+
+    def write_bedgraph(self, path, chroms = None):
+        ''' Function to write the runs of a track to a bedGraph file.
+
+        Args:
+            path (str)- Full path to bedGraph file.
+            chroms (list)- Chromosomes to write. Defaults to all.
+
+        '''
+        with bedgraphWriter(path) as outFile:
+            for chrom in chroms or self.lengths.keys():
+                outFile.add(chrom, *self.runs(chrom))
+
+def benchmark(runs = 1000000, queries = 1000, width = 10000, seed = 1):
+    ''' Function to compare writing random runs to a bedGraph file, line by
+    line and with a bedgraphWriter, and to a track, and to measure the
+    speed of range queries of the track. The track is converted back to a
+    bedGraph file to check the round trip.
+
+    Args:
+        runs (int)- Number of runs.
+        queries (int)- Number of range queries.
+        width (int)- Width of range queries.
+        seed (int)- Seed for random number generator.
+
+    Returns:
+        metrics (dict)- Dictionary of seconds taken by each method and
+            range queries per second.
+
+    Raises:
+        ValueError - If the bedGraph files differ.
+
+    '''
+    random = np.random.RandomState(seed)
+    positions = np.cumsum(random.randint(1, 100, runs + 1))
+    values = random.randint(0, 200, runs).astype(np.uint32)
+    lengths = {'chr1': int(positions[-1])}
+    directory = tempfile.mkdtemp()
+    paths = [os.path.join(directory, name) for name in ('line.bedgraph',
+        'block.bedgraph', 'track.bin', 'track.bedgraph')]
+    metrics = {}
+    try:
+        # Time bedGraph and track writing
+        start = time.time()
+        with open(paths[0], 'w') as outFile:
+            for run in zip(positions[:-1], positions[1:], values):
+                outFile.write('chr1\t{}\t{}\t{}\n'.format(*run))
+        metrics['line'] = time.time() - start
+        start = time.time()
+        with bedgraphWriter(paths[1]) as outFile:
+            outFile.add('chr1', positions[:-1], positions[1:], values)
+        metrics['block'] = time.time() - start
+        start = time.time()
+        with trackWriter(paths[2], lengths, dtype = 'uint32') as outFile:
+            outFile.add('chr1', positions[:-1], positions[1:], values)
+        metrics['track'] = time.time() - start
+        # Time range queries
+        track = coverageTrack(paths[2])
+        starts = random.randint(0, lengths['chr1'] - width, queries)
+        start = time.time()
+        for position in starts:
+            track.runs('chr1', position, position + width)
+        metrics['queries/s'] = queries / max(time.time() - start, 1e-9)
+        # Check bedGraph files
+        track.write_bedgraph(paths[3])
+        contents = set()
+        for path in (paths[0], paths[1], paths[3]):
+            with open(path) as inFile:
+                contents.add(inFile.read())
+        if len(contents) != 1:
+            raise ValueError('bedGraph files differ')
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(directory)
+    return(metrics)
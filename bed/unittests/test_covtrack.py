@@ -0,0 +1,115 @@
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from ngs_python.bed import covtrack
+
+class test_coverage_track(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        random = np.random.RandomState(1)
+        self.lengths = collections.OrderedDict([('chr1', 5000),
+            ('chr2', 300), ('chr3', 1000)])
+        # Create dense values with runs and gaps
+        self.depth = {}
+        for chrom in ('chr2', 'chr1'):
+            depth = np.repeat(random.randint(0, 4, 500),
+                random.randint(1, 20, 500))[:self.lengths[chrom]]
+            self.depth[chrom] = np.concatenate((depth, np.zeros(
+                self.lengths[chrom] - len(depth), depth.dtype)))
+        self.depth['chr3'] = np.zeros(1000, np.int64)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def runs(self, chrom):
+        positions, values = covtrack.run_length(self.depth[chrom])
+        keep = values > 0
+        return(positions[:-1][keep], positions[1:][keep], values[keep])
+
+    def test_run_length(self):
+        positions, values = covtrack.run_length(self.depth['chr1'], 10)
+        self.assertEqual((positions[0], positions[-1]), (10, 5010))
+        self.assertTrue((np.diff(values) != 0).all())
+        self.assertTrue(np.array_equal(np.repeat(values, np.diff(positions)),
+            self.depth['chr1']))
+        # Values are written to bedGraph files in blocks
+        path = os.path.join(self.dir, 'test.bedgraph')
+        with covtrack.bedgraphWriter(path, block_size = 2) as outFile:
+            outFile.add('chr1', [0, 5, 9], [5, 6, 12], np.array([1, 2, 3]))
+            outFile.add('chr%', [0], [5], [0.25])
+        with open(path) as inFile:
+            self.assertEqual(inFile.read(), 'chr1\t0\t5\t1\nchr1\t5\t6\t2\n'\
+                'chr1\t9\t12\t3\nchr%\t0\t5\t0.25\n')
+
+    def test_track(self):
+        path = os.path.join(self.dir, 'test.track')
+        with covtrack.trackWriter(path, self.lengths, zooms = (10, 100),
+                block_size = 7, dtype = 'uint32') as outFile:
+            for chrom in ('chr2', 'chr1'):
+                starts, ends, values = self.runs(chrom)
+                for start in range(0, len(starts), 50):
+                    outFile.add(chrom, starts[start:start + 50],
+                        ends[start:start + 50], values[start:start + 50])
+        track = covtrack.coverageTrack(path)
+        self.assertEqual(track.lengths, self.lengths)
+        # Range queries return clipped runs
+        random = np.random.RandomState(2)
+        for chrom in self.lengths:
+            for _ in range(20):
+                start, end = sorted(random.choice(self.lengths[chrom] + 1, 2,
+                    replace = False))
+                starts, ends, values = track.runs(chrom, start, end)
+                depth = np.zeros(end - start, np.int64)
+                for run in zip(starts, ends, values):
+                    depth[run[0] - start:run[1] - start] = run[2]
+                self.assertTrue(np.array_equal(depth,
+                    self.depth[chrom][start:end]))
+                self.assertAlmostEqual(track.mean(chrom, start, end),
+                    self.depth[chrom][start:end].mean())
+        # Zoom levels summarise bins
+        starts, bins = track.zoom('chr1', 100, 250, 5000)
+        self.assertEqual(list(starts[:2]), [200, 300])
+        for binStart, record in zip(starts, bins):
+            depth = self.depth['chr1'][binStart:binStart + 100]
+            covered = depth[depth > 0]
+            self.assertEqual(record['covered'], len(covered))
+            self.assertEqual(record['sum'], depth.sum())
+            self.assertEqual(record['squares'], (depth ** 2).sum())
+            if len(covered):
+                self.assertEqual((record['min'], record['max']),
+                    (covered.min(), covered.max()))
+        self.assertEqual(track.zoom('chr3', 10)[1]['covered'].sum(), 0)
+        # Tracks are converted to bedGraph files
+        paths = [os.path.join(self.dir, name) for name in ('track.bedgraph',
+            'runs.bedgraph')]
+        track.write_bedgraph(paths[0], ['chr1', 'chr2'])
+        with covtrack.bedgraphWriter(paths[1]) as outFile:
+            for chrom in ('chr1', 'chr2'):
+                outFile.add(chrom, *self.runs(chrom))
+        with open(paths[0]) as first, open(paths[1]) as second:
+            self.assertEqual(first.read(), second.read())
+
+    def test_invalid(self):
+        path = os.path.join(self.dir, 'test.track')
+        outFile = covtrack.trackWriter(path, self.lengths)
+        outFile.add('chr1', [0, 10], [5, 20], [1, 2])
+        self.assertRaises(ValueError, outFile.add, 'chr1', [15], [30], [1])
+        self.assertRaises(ValueError, outFile.add, 'chr4', [0], [5], [1])
+        outFile.add('chr2', [0], [300], [1.5])
+        self.assertRaises(ValueError, outFile.add, 'chr1', [30], [40], [1])
+        outFile.close()
+        track = covtrack.coverageTrack(path)
+        self.assertEqual(track.runs('chr2', 5, 10)[2].tolist(), [1.5])
+        self.assertRaises(ValueError, track.zoom, 'chr1', 20)
+        self.assertRaises(ValueError, track.runs, 'chr1', 10, 6000)
+        with open(path, 'r+b') as inFile:
+            inFile.truncate(100)
+        self.assertRaises(IOError, covtrack.coverageTrack, path)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_coverage_track)
+    unittest.TextTestRunner(verbosity=3).run(suite)
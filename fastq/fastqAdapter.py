@@ -0,0 +1,636 @@
+''' Functions and classes to trim adapters, low quality bases and N bases
+from single or paired FASTQ reads in a single pass, following the trimming
+order and summary statistics of cutadapt. Reads are trimmed in batches using
+numpy: 3' adapters are located by comparing each adapter against every
+position of a matrix of read sequences, 5' adapters by comparing the
+reversed adapter against the reversed reads.
+
+Adapters are matched allowing mismatches, but not insertions or deletions,
+at the supplied error rate. A 3' adapter may be partially present at the end
+of a read and a 5' adapter at the start of a read, provided the overlap is
+at least min_overlap. Where several adapters match, the match with the most
+matching bases is removed. 'N' within adapters matches any base.
+'''
+import itertools
+import os
+import random
+import subprocess
+import tempfile
+import time
+import numpy
+from ngs_python.fastq import fastqJunction, fastqParse, fastqShard
+from ngs_python.system import pgzip
+
+def sequence_matrix(strings, width = None, fill = 0):
+    ''' Function to create a matrix of the characters of a list of strings.
+
+    Args:
+        strings (list)- List of strings.
+        width (int)- Number of columns. Defaults to the longest string.
+        fill (int)- Value of positions beyond the end of each string.
+
+    Returns:
+        matrix (numpy.array)- Two dimensional uint8 array of characters.
+        lengths (numpy.array)- Length of each string.
+
+    '''
+    lengths = numpy.fromiter(itertools.imap(len, strings), numpy.int64,
+        len(strings))
+    if width is None:
+        width = int(lengths.max()) if len(strings) else 0
+    data = numpy.frombuffer(''.join(strings), numpy.uint8)
+    # Reshape strings of identical length
+    if len(strings) and lengths.min() == width:
+        return(data.reshape(len(strings), width).copy(), lengths)
+    matrix = numpy.full((len(strings), width), fill, numpy.uint8)
+    rows = numpy.repeat(numpy.arange(len(strings)), lengths)
+    columns = numpy.arange(len(data)) - numpy.repeat(
+        numpy.cumsum(lengths) - lengths, lengths)
+    matrix[rows, columns] = data
+    return(matrix, lengths)
+
+def adapter_matches(sequences, adapter, error_rate = 0.1, min_overlap = 3):
+    ''' Function to find the best match of a 3' adapter in each sequence.
+    The adapter may overlap the end of the sequence.
+
+    Args:
+        sequences (list)- Read sequences.
+        adapter (str)- Adapter sequence.
+        error_rate (float)- Maximum number of mismatches divided by the
+            length of the matching region.
+        min_overlap (int)- Minimum length of the matching region.
+
+    Returns:
+        matches (numpy.array)- Number of matching bases of the best match or
+            -1 if the adapter was not found.
+        starts (numpy.array)- Start of the best match within each sequence.
+
+    '''
+    size = len(adapter)
+    # Create sequence matrix with space for adapter beyond sequence end
+    matrix, lengths = sequence_matrix(sequences)
+    width = matrix.shape[1]
+    if width == 0:
+        return(numpy.full(len(sequences), -1, numpy.int64),
+            numpy.zeros(len(sequences), numpy.int64))
+    matrix = numpy.hstack((matrix, numpy.zeros((len(sequences), size),
+        numpy.uint8)))
+    # Count mismatches of adapter starting at each position
+    mismatches = numpy.zeros((len(sequences), width), numpy.int16)
+    wildcard = numpy.array([base == 'N' for base in adapter])
+    for offset, base in enumerate(adapter):
+        if not wildcard[offset]:
+            mismatches += matrix[:, offset:offset + width] != ord(base)
+    # Remove mismatches of adapter positions beyond sequence end
+    overlap = numpy.clip(lengths[:, None] - numpy.arange(width), 0, size)
+    beyond = numpy.concatenate((numpy.cumsum((~wildcard)[::-1])[::-1], [0]))
+    mismatches -= beyond[overlap].astype(numpy.int16)
+    # Identify matches with most matching bases
+    allowed = numpy.floor(error_rate * numpy.arange(size + 1) + 1e-9).astype(
+        numpy.int64)
+    valid = (overlap >= max(min_overlap, 1)) & (
+        mismatches <= allowed[overlap])
+    score = numpy.where(valid, overlap - mismatches, -1)
+    starts = score.argmax(axis = 1)
+    matches = score[numpy.arange(len(sequences)), starts]
+    return(matches, starts)
+
+def quality_trim_index(matrix, lengths, cutoff, base = 33):
+    ''' Function to calculate the number of bases to trim from the start of
+    each quality string using the algorithm of BWA and cutadapt. To trim
+    the end of quality strings, supply a matrix of reversed qualities.
+
+    Args:
+        matrix (numpy.array)- Matrix of quality strings.
+        lengths (numpy.array)- Length of each quality string.
+        cutoff (int)- Quality cutoff.
+        base (int)- Quality encoding offset.
+
+    Returns:
+        trim (numpy.array)- Number of bases to trim.
+
+    '''
+    width = matrix.shape[1]
+    if width == 0:
+        return(numpy.zeros(len(lengths), numpy.int64))
+    # Calculate cumulative sum of cutoff minus quality
+    positions = numpy.arange(width)
+    within = positions < lengths[:, None]
+    difference = numpy.where(within, cutoff - (matrix.astype(numpy.int64)
+        - base), -1000000)
+    cumulative = numpy.cumsum(difference, axis = 1)
+    # Find maximum prior to the cumulative sum becoming negative
+    negative = cumulative < 0
+    stop = numpy.where(negative.any(axis = 1), negative.argmax(axis = 1),
+        width)
+    cumulative[positions >= stop[:, None]] = -1
+    index = cumulative.argmax(axis = 1)
+    maximum = cumulative[numpy.arange(len(lengths)), index]
+    return(numpy.where(maximum > 0, index + 1, 0))
+
+class adapterTrimmer(object):
+    ''' Class trims batches of FASTQ reads. Low quality bases are trimmed
+    first, followed by the best matching adapter and then N bases at the
+    ends of the reads.
+    '''
+
+    def __init__(
+            self, adapters = (), front = (), error_rate = 0.1,
+            min_overlap = 3, quality = None, quality_base = 33,
+            trim_n = False
+        ):
+        ''' Function to initialise adapterTrimmer object.
+
+        Args:
+            adapters (list)- 3' adapter sequences, removed along with all
+                following bases.
+            front (list)- 5' adapter sequences, removed along with all
+                preceding bases.
+            error_rate (float)- Maximum number of mismatches divided by the
+                length of the matching region.
+            min_overlap (int)- Minimum overlap of a partial adapter match
+                at the end of a read.
+            quality - Quality cutoff for trimming the 3' end of reads, or a
+                tuple of cutoffs for the 5' and 3' ends.
+            quality_base (int)- Quality encoding offset.
+            trim_n (bool)- Trim N bases from the ends of reads.
+
+        Raises:
+            ValueError - If arguments are invalid.
+
+        '''
+        # Check arguments
+        if isinstance(adapters, str):
+            adapters = [adapters]
+        if isinstance(front, str):
+            front = [front]
+        for adapter in list(adapters) + list(front):
+            if not adapter or set(adapter.upper()) - set('ACGTN'):
+                raise ValueError('Invalid adapter: {}'.format(adapter))
+        if not 0 <= error_rate < 1:
+            raise ValueError('error_rate must be >= 0 and < 1')
+        if quality is None:
+            quality = (None, None)
+        elif isinstance(quality, int):
+            quality = (None, quality)
+        # Store arguments
+        self.adapters = [adapter.upper() for adapter in adapters]
+        self.front = [adapter.upper() for adapter in front]
+        self.error_rate = error_rate
+        self.min_overlap = min_overlap
+        self.quality = tuple(quality)
+        self.quality_base = quality_base
+        self.trim_n = trim_n
+
+    def __quality_trim(self, qualities):
+        ''' Function returns the start and end of quality trimmed reads '''
+        lengths = numpy.fromiter(itertools.imap(len, qualities),
+            numpy.int64, len(qualities))
+        starts = numpy.zeros(len(qualities), numpy.int64)
+        ends = lengths.copy()
+        front, back = self.quality
+        if front is not None:
+            matrix, lengths = sequence_matrix(qualities)
+            starts = quality_trim_index(matrix, lengths, front,
+                self.quality_base)
+        if back is not None:
+            reverse = [quality[start:][::-1] for quality, start in
+                itertools.izip(qualities, starts.tolist())]
+            matrix, remaining = sequence_matrix(reverse)
+            ends = lengths - quality_trim_index(matrix, remaining, back,
+                self.quality_base)
+        return(starts, ends)
+
+    def __adapter_trim(self, sequences):
+        ''' Function returns the start and end of adapter trimmed reads and
+        whether an adapter was found.
+        '''
+        lengths = numpy.fromiter(itertools.imap(len, sequences), numpy.int64,
+            len(sequences))
+        starts = numpy.zeros(len(sequences), numpy.int64)
+        ends = lengths.copy()
+        best = numpy.full(len(sequences), -1, numpy.int64)
+        # Find best 3' adapter match
+        for adapter in self.adapters:
+            matches, positions = adapter_matches(sequences, adapter,
+                self.error_rate, self.min_overlap)
+            better = matches > best
+            best[better] = matches[better]
+            ends[better] = positions[better]
+            starts[better] = 0
+        # Find best 5' adapter match using reversed sequences
+        if self.front:
+            reverse = [sequence[::-1] for sequence in sequences]
+            for adapter in self.front:
+                matches, positions = adapter_matches(reverse, adapter[::-1],
+                    self.error_rate, self.min_overlap)
+                better = matches > best
+                best[better] = matches[better]
+                starts[better] = lengths[better] - positions[better]
+                ends[better] = lengths[better]
+        return(starts, ends, best > -1)
+
+    def __trim_offsets(self, sequences, qualities):
+        ''' Function returns the start and end of the trimmed region of
+        each read, whether an adapter was found in each read and the number
+        of bases removed by quality trimming.
+        '''
+        lengths = numpy.fromiter(itertools.imap(len, sequences), numpy.int64,
+            len(sequences))
+        starts = numpy.zeros(len(sequences), numpy.int64)
+        ends = lengths
+        quality_trimmed = 0
+        # Trim low quality bases
+        if self.quality != (None, None):
+            starts, ends = self.__quality_trim(qualities)
+            ends = numpy.maximum(ends, starts)
+            sequences = [sequence[start:end] for sequence, start, end in
+                itertools.izip(sequences, starts.tolist(), ends.tolist())]
+            quality_trimmed = int(lengths.sum() - (ends - starts).sum())
+        # Trim adapters
+        if self.adapters or self.front:
+            adapter_starts, adapter_ends, adapter = self.__adapter_trim(
+                sequences)
+            ends = starts + adapter_ends
+            starts = starts + adapter_starts
+            trimmed = numpy.flatnonzero(adapter).tolist()
+            if self.trim_n and trimmed:
+                sequences = list(sequences)
+                adapter_starts = adapter_starts.tolist()
+                adapter_ends = adapter_ends.tolist()
+                for index in trimmed:
+                    sequences[index] = sequences[index][
+                        adapter_starts[index]:adapter_ends[index]]
+        else:
+            adapter = numpy.zeros(len(sequences), bool)
+        # Trim N bases
+        if self.trim_n:
+            n_starts = []
+            n_ends = []
+            for sequence in sequences:
+                end = len(sequence.rstrip('Nn'))
+                n_starts.append(end - len(sequence[:end].lstrip('Nn')))
+                n_ends.append(end)
+            ends = starts + numpy.array(n_ends, numpy.int64)
+            starts = starts + numpy.array(n_starts, numpy.int64)
+        return(starts, ends, adapter, quality_trimmed)
+
+    def trim(self, sequences, qualities):
+        ''' Function to trim a batch of reads.
+
+        Args:
+            sequences (list)- Read sequences.
+            qualities (list)- Read qualities.
+
+        Returns:
+            sequences (list)- Trimmed sequences.
+            qualities (list)- Trimmed qualities.
+            adapter (numpy.array)- Whether an adapter was found in each
+                read.
+            quality_trimmed (int)- Number of bases removed by quality
+                trimming.
+
+        '''
+        starts, ends, adapter, quality_trimmed = self.__trim_offsets(
+            sequences, qualities)
+        starts, ends = starts.tolist(), ends.tolist()
+        sequences = [sequence[start:end] for sequence, start, end in
+            itertools.izip(sequences, starts, ends)]
+        qualities = [quality[start:end] for quality, start, end in
+            itertools.izip(qualities, starts, ends)]
+        return(sequences, qualities, adapter, quality_trimmed)
+
+    def trim_batch(self, batch):
+        ''' Function to trim a fastqBatch.readBatch. The trimmed batch
+        shares the sequence and quality buffers of the original.
+
+        Args:
+            batch - fastqBatch.readBatch object.
+
+        Returns:
+            batch - Trimmed readBatch.
+            adapter (numpy.array)- Whether an adapter was found in each
+                read.
+            quality_trimmed (int)- Number of bases removed by quality
+                trimming.
+
+        '''
+        names, sequences, qualities = batch.records()
+        starts, ends, adapter, quality_trimmed = self.__trim_offsets(
+            sequences, qualities)
+        return(batch.trim(starts, ends), adapter, quality_trimmed)
+
+def new_metrics(paired):
+    ''' Function returns a dictionary of zero trimming metrics '''
+    metrics = {'reads': 0, 'short': 0, 'written': 0, 'paired': paired}
+    for number in (1, 2) if paired else (1,):
+        for key in ('adapter', 'bp', 'quality', 'written_bp'):
+            metrics['{}{}'.format(key, number)] = 0
+    return(metrics)
+
+def trim_batches(batches, trimmers, min_length = 0):
+    ''' Function to trim a batch of single reads or a batch of paired reads,
+    removing reads, or read pairs, in which a trimmed read is shorter than
+    min_length.
+
+    Args:
+        batches (list)- One or two batches of read names, sequences and
+            qualities.
+        trimmers (list)- An adapterTrimmer for each batch.
+        min_length (int)- Minimum length of trimmed reads.
+
+    Returns:
+        records (list)- String of FASTQ records for each batch.
+        metrics (dict)- Trimming metrics.
+
+    '''
+    metrics = new_metrics(len(batches) == 2)
+    metrics['reads'] = len(batches[0][0])
+    # Trim reads and identify short reads
+    trimmed = []
+    short = numpy.zeros(len(batches[0][0]), bool)
+    for number, (batch, trimmer) in enumerate(zip(batches, trimmers), 1):
+        sequences, qualities, adapter, quality_trimmed = trimmer.trim(
+            batch[1], batch[2])
+        lengths = numpy.fromiter(itertools.imap(len, sequences), numpy.int64,
+            len(sequences))
+        short |= lengths < min_length
+        trimmed.append((sequences, qualities, lengths))
+        metrics['adapter{}'.format(number)] = int(adapter.sum())
+        metrics['bp{}'.format(number)] = sum(itertools.imap(len, batch[1]))
+        metrics['quality{}'.format(number)] = quality_trimmed
+    # Generate records of retained reads
+    keep = numpy.flatnonzero(~short).tolist()
+    metrics['short'] = int(short.sum())
+    metrics['written'] = len(keep)
+    records = []
+    for number, (batch, (sequences, qualities, lengths)) in enumerate(
+            zip(batches, trimmed), 1):
+        metrics['written_bp{}'.format(number)] = int(lengths[~short].sum())
+        names = batch[0]
+        records.append(''.join(['@%s\n%s\n+\n%s\n' %(names[index],
+            sequences[index], qualities[index]) for index in keep]))
+    return(records, metrics)
+
+def sum_metrics(first, second):
+    ''' Function returns the sum of two dictionaries of trimming metrics '''
+    paired = first['paired']
+    combined = fastqShard.sum_dict(first, second)
+    combined['paired'] = paired
+    return(combined)
+
+def _trim_shard(shard, trimmers, outputs, min_length, level):
+    ''' Function to trim a shard, or paired shards, generated by fastqShard
+    and write the trimmed reads to shard output files.
+
+    Args:
+        shard (tuple)- Shard number and tuple of one or two Shard objects.
+        trimmers (list)- An adapterTrimmer for each shard.
+        outputs (list)- Full paths to output fastq files.
+        min_length (int)- Minimum length of trimmed reads.
+        level (int)- Compression level for gzipped output.
+
+    Returns:
+        metrics (dict)- Trimming metrics.
+
+    '''
+    number, shards = shard
+    outFiles = []
+    for output in outputs:
+        path = fastqShard.shard_output(output, number)
+        if output.endswith('.gz'):
+            outFiles.append(pgzip.parallelGzipWriter(path, 1, level))
+        else:
+            outFiles.append(open(path, 'w'))
+    # Create batches of single or paired reads
+    batches = [fastqShard.shard_batches(shard) for shard in shards]
+    if len(batches) == 2:
+        batches = fastqJunction.paired_batches(*batches)
+    else:
+        batches = ((batch,) for batch in batches[0])
+    # Trim batches and write output
+    metrics = new_metrics(len(shards) == 2)
+    try:
+        for batch in batches:
+            records, batchMetrics = trim_batches(batch, trimmers, min_length)
+            metrics = sum_metrics(metrics, batchMetrics)
+            for outFile, data in zip(outFiles, records):
+                outFile.write(data)
+    finally:
+        for outFile in outFiles:
+            outFile.close()
+    return(metrics)
+
+def trimFastq(
+        fastq1, output1, fastq2 = None, output2 = None, adapters1 = (),
+        adapters2 = (), front1 = (), front2 = (), error_rate = 0.1,
+        min_overlap = 3, quality = None, trim_n = False, min_length = 0,
+        processes = 1, level = 6
+    ):
+    ''' Function to trim single or paired FASTQ files in a single pass. Paired
+    reads are trimmed together and read pairs are removed if either trimmed
+    read is shorter than min_length. Files are processed in shards by
+    multiple processes where they may be split by fastqShard.
+
+    Args:
+        fastq1 (str)- Full path to read1 FASTQ file.
+        output1 (str)- Full path to trimmed read1 FASTQ file.
+        fastq2 (str)- Full path to read2 FASTQ file.
+        output2 (str)- Full path to trimmed read2 FASTQ file.
+        adapters1 (list)- 3' adapters of read1.
+        adapters2 (list)- 3' adapters of read2.
+        front1 (list)- 5' adapters of read1.
+        front2 (list)- 5' adapters of read2.
+        error_rate (float)- Maximum number of mismatches divided by the
+            length of the matching region.
+        min_overlap (int)- Minimum overlap of partial adapter matches.
+        quality - Quality cutoff for the 3' end of reads, or a tuple of
+            cutoffs for the 5' and 3' ends.
+        trim_n (bool)- Trim N bases from the ends of reads.
+        min_length (int)- Minimum length of trimmed reads.
+        processes (int)- Number of processes.
+        level (int)- Compression level for gzipped output.
+
+    Returns:
+        metrics (dict)- Trimming metrics, which may be formatted by
+            cutadapt_report.
+
+    Raises:
+        ValueError - If output2 is not supplied for paired reads.
+
+    '''
+    # Create trimmers and shards
+    trimmers = [adapterTrimmer(adapters1, front1, error_rate, min_overlap,
+        quality, trim_n = trim_n)]
+    outputs = [output1]
+    if fastq2 is None:
+        shards = [(shard,) for shard in fastqShard.plan_shards(fastq1,
+            processes * 2 if processes > 1 else 1)]
+    else:
+        if output2 is None:
+            raise ValueError('output2 required for paired reads')
+        trimmers.append(adapterTrimmer(adapters2, front2, error_rate,
+            min_overlap, quality, trim_n = trim_n))
+        outputs.append(output2)
+        shards = fastqShard.plan_paired_shards(fastq1, fastq2,
+            processes * 2 if processes > 1 else 1, build = True)
+    # Trim shards and concatenate output
+    metrics = fastqShard.map_reduce(_trim_shard, sum_metrics,
+        list(enumerate(shards)), processes,
+        (trimmers, outputs, min_length, level))
+    for output in outputs:
+        fastqShard.concatenate_files([fastqShard.shard_output(output, number)
+            for number in range(len(shards))], output)
+    return(metrics)
+
+def _line(label, value, indent = 0):
+    ''' Function returns a line of a cutadapt summary '''
+    return('{}{:<{}}{:>20}'.format(' ' * indent, label, 36 - indent, value))
+
+def _percent(count, total, suffix = ''):
+    ''' Function returns a count formatted with a percentage of a total '''
+    return('{:,}{} ({:.1%})'.format(count, suffix, float(count) / total if
+        total else 0))
+
+def cutadapt_report(metrics):
+    ''' Function to format trimming metrics as a cutadapt summary.
+
+    Args:
+        metrics (dict)- Trimming metrics returned by trimFastq.
+
+    Returns:
+        report (str)- Summary of trimming.
+
+    '''
+    paired = metrics['paired']
+    numbers = (1, 2) if paired else (1,)
+    reads = metrics['reads']
+    lines = ['=== Summary ===', '']
+    # Summarise reads
+    unit, label = ('read pairs', 'Pairs') if paired else ('reads', 'Reads')
+    lines.append(_line('Total {} processed:'.format(unit), '{:,}'.format(
+        reads)))
+    for number in numbers:
+        lines.append(_line('Read {} with adapter:'.format(number) if paired
+            else 'Reads with adapters:', _percent(metrics['adapter{}'.format(
+            number)], reads), 2))
+    lines.append(_line('{} that were too short:'.format(label),
+        _percent(metrics['short'], reads)))
+    lines.append(_line('{} written (passing filters):'.format(label),
+        _percent(metrics['written'], reads)))
+    lines.append('')
+    # Summarise base pairs
+    total = sum(metrics['bp{}'.format(number)] for number in numbers)
+    for title, key in (('Total basepairs processed:', 'bp'),
+            ('Quality-trimmed:', 'quality'),
+            ('Total written (filtered):', 'written_bp')):
+        count = sum(metrics['{}{}'.format(key, number)] for number in
+            numbers)
+        if key == 'bp':
+            lines.append(_line(title, '{:,} bp'.format(count)))
+        else:
+            lines.append(_line(title, _percent(count, total, ' bp')))
+        if paired:
+            for number in numbers:
+                lines.append(_line('Read {}:'.format(number), '{:,} bp'.format(
+                    metrics['{}{}'.format(key, number)]), 2))
+    return('\n'.join(lines) + '\n')
+
+def synthetic_reads(number, adapter, length = 100, mismatches = 1, seed = 1):
+    ''' Function to generate reads containing a 3' adapter after an insert
+    of random length, with mismatches at random positions of the adapter.
+
+    Args:
+        number (int)- Number of reads.
+        adapter (str)- Adapter sequence.
+        length (int)- Read length.
+        mismatches (int)- Maximum number of mismatches within the adapter.
+        seed (int)- Random seed.
+
+    Returns:
+        reads (list)- Tuples of read name, sequence and quality.
+        inserts (list)- Insert length of each read.
+
+    '''
+    generator = random.Random(seed)
+    reads, inserts = [], []
+    for count in xrange(number):
+        insert = generator.randint(0, length)
+        sequence = [generator.choice('ACGT') for _ in xrange(insert)]
+        bases = list(adapter)
+        for position in generator.sample(range(len(adapter)),
+                generator.randint(0, mismatches)):
+            bases[position] = generator.choice('ACGT'.replace(
+                bases[position], ''))
+        sequence.extend(bases)
+        while len(sequence) < length:
+            sequence.append(generator.choice('ACGT'))
+        sequence = ''.join(sequence[:length])
+        reads.append(('read{}'.format(count), sequence, 'I' * length))
+        inserts.append(insert)
+    return(reads, inserts)
+
+def benchmark(
+        number = 100000, adapter = 'AGATCGGAAGAGC', error_rate = 0.1,
+        min_overlap = 3, processes = 1, path = None
+    ):
+    ''' Function to benchmark the speed of adapter trimming and the
+    concordance of trimmed read lengths with the known insert lengths of
+    synthetic reads and, if the path to cutadapt is supplied, with the
+    output of cutadapt.
+
+    Args:
+        number (int)- Number of synthetic reads.
+        adapter (str)- Adapter sequence.
+        error_rate (float)- Maximum error rate of adapter matches.
+        min_overlap (int)- Minimum overlap of partial adapter matches.
+        processes (int)- Number of processes.
+        path (str)- Path to cutadapt.
+
+    Returns:
+        results (dict)- Reads per second and concordance of native trimming
+            and of cutadapt, if supplied.
+
+    '''
+    directory = tempfile.mkdtemp()
+    inFastq = os.path.join(directory, 'input.fastq')
+    reads, inserts = synthetic_reads(number, adapter, mismatches =
+        int(error_rate * len(adapter)))
+    with open(inFastq, 'w') as outFile:
+        for read in reads:
+            outFile.write('@%s\n%s\n+\n%s\n' %(read))
+    # Trim reads and compare lengths
+    def lengths(fastq):
+        with open(fastq) as inFile:
+            return([len(sequence) for batch in fastqParse.FastqBlockIterator(
+                inFile) for sequence in batch[1]])
+    def concordance(first, second):
+        return(sum(a == b for a, b in zip(first, second)) /
+            float(len(first)))
+    results = {}
+    try:
+        output = os.path.join(directory, 'native.fastq')
+        start = time.time()
+        trimFastq(inFastq, output, adapters1 = [adapter], error_rate =
+            error_rate, min_overlap = min_overlap, processes = processes)
+        results['native_reads_per_second'] = number / (time.time() - start)
+        native = lengths(output)
+        results['native_concordance'] = concordance(native, inserts)
+        if path:
+            output = os.path.join(directory, 'cutadapt.fastq')
+            start = time.time()
+            with open(os.devnull, 'w') as null:
+                subprocess.check_call([path, '-a', adapter, '-e',
+                    str(error_rate), '-O', str(min_overlap), '-o', output,
+                    inFastq], stdout = null)
+            results['cutadapt_reads_per_second'] = number / (
+                time.time() - start)
+            cutadapt = lengths(output)
+            results['cutadapt_concordance'] = concordance(cutadapt, inserts)
+            results['native_cutadapt_concordance'] = concordance(native,
+                cutadapt)
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+    return(results)
@@ -1,13 +1,33 @@
+import glob
 import os
+import pipes
 import sys
+import tempfile
 from ngs_python.bam import samtools
+from ngs_python.system import pipeline
+
+def _sortPipe(
+        alignCommand, outBam, nameSort, threads, memory, samtoolsPath
+    ):
+    ''' Function returns a shell command piping the SAM output of an
+    aligner directly into samtools sort. The pipe is run by bash with the
+    pipefail option, so that the command fails if either the aligner or
+    the sort fails, and coordinate sorted output is indexed.
+    '''
+    sortCommand = ' '.join(pipes.quote(argument) for argument in
+        samtools.sortStream(outBam, nameSort, threads, memory, samtoolsPath))
+    command = 'bash -o pipefail -c {}'.format(pipes.quote('{} | {}'.format(
+        alignCommand, sortCommand)))
+    if not nameSort:
+        command += ' && ' + samtools.index(outBam, samtoolsPath)
+    return(command)
 
 def bowtie2Align(
         index, outFile, read1, read2 = None, bowtie2Path = 'bowtie2',
         threads = 1, readGroup = 1, sampleName = None, libraryID = None,
         platform = None, discordant = False, mixed = False, upto = None,
         maxInsert = None, check = True, samtoolsPath = 'samtools',
-        memory = 2, nameSort = False
+        memory = 2, nameSort = False, sortThreads = None
     ):
     ''' Function to generate command to peform Bowtie2 Alignment of
     paired FASTQ files. Function takes 9 arguments:
@@ -22,6 +42,13 @@ def bowtie2Align(
     8)  mixed - Boolean; whether to output mixed pairs.
     9)  upto - Number of reads to align
     10) check - Boolean; whether to check for index entensions.
+    11) memory - Memory of each sort thread, in gigabytes or as a string
+        such as '768M'.
+    12) nameSort - Boolean; whether to sort BAM output by read name.
+    13) sortThreads - Number of sort threads; defaults to threads.
+    
+    An outFile of '-' writes SAM to stdout, such as for alignSort, while
+    for BAM output the SAM is piped directly into samtools sort.
     
     '''
     # Check for index extensions
@@ -59,13 +86,15 @@ def bowtie2Align(
             raise TypeError('maxInsert argument must be integer')
         if maxInsert < 1:
             raise ValueError('maxInsert argument must be >= 1')
-    # Check outut file name and generate intermediate file names
-    if outFile.endswith('.sam'):
+    # Check outut file name
+    if outFile == '-':
+        outSam = outBam = ''
+    elif outFile.endswith('.sam'):
         outSam = outFile
         outBam = ''
     elif outFile.endswith('.bam'):
         outBam = outFile
-        outSam = outFile[:-4] + '.sam'
+        outSam = ''
     else:
         raise ValueError("'outFile' argument must end '.sam' or '.bam'")
     # Join multiple fastq files
@@ -75,7 +104,9 @@ def bowtie2Align(
         read2 = ','.join(read2)
     # Create initial command
     bowtie2Command = [bowtie2Path, '--phred33', '--very-sensitive', mixed,
-        discordant, '-p', str(threads), '-x', index, '-S', outSam]
+        discordant, '-p', str(threads), '-x', index]
+    if outSam:
+        bowtie2Command.extend(['-S', outSam])
     # Extend command depending on if read2 is applied
     if read2:
         bowtie2Command.extend(['-1', read1, '-2', read2])
@@ -101,12 +132,10 @@ def bowtie2Align(
     # Concatenate bowtie2Command command
     bowtie2Command = filter(None, bowtie2Command)
     bowtie2Command = ' '.join(bowtie2Command)
-    # Supplement BWA command with sort command
+    # Pipe Bowtie2 output into sort command
     if outBam:
-        sortCommand = samtools.sort(inFile = outSam, outFile = outBam,
-            name = nameSort, memory = memory, delete = True,
-            path = samtoolsPath, threads = threads)
-        completeCommand = bowtie2Command + ' && ' + sortCommand
+        completeCommand = _sortPipe(bowtie2Command, outBam, nameSort,
+            sortThreads or threads, memory, samtoolsPath)
     else:
         completeCommand = bowtie2Command
     # Return complete command
@@ -116,13 +145,17 @@ def bwaMemAlign(
         index, outFile, read1, read2 = None, bwaPath = 'bwa', threads = 1,
         readGroup = '1', sampleName = None, libraryID = None, platform = None,
         markSecondary = True, check = True, samtoolsPath = 'samtools',
-        memory = '2', nameSort = False
+        memory = '2', nameSort = False, interleaved = False,
+        sortThreads = None
     ):
     ''' Function to generate command to perform BWA mem alignment of single
     end or paired end FASTQ files. If the supplied output file name ends with
-    '.bam' then a sorted BAM file will be generated else if the file names
-    ends with '.sam' a sam file is returned. Function takes the following 14
-    arguments:
+    '.bam' then the SAM output is piped directly into samtools sort to
+    generate a sorted BAM file, else if the file names ends with '.sam' a
+    sam file is returned and if it is '-' SAM is written to stdout, such as
+    for alignSort. A read1 of '-' reads FASTQ
+    from stdin, or '{input}' the input of a streamio.processWriter. Function
+    takes the following 16 arguments:
     
     Args:
         index (str)- Full path BWA index prefix.
@@ -138,8 +171,10 @@ def bwaMemAlign(
         markSecondary (bool)- Mark secondary alignments.
         check (bool)- Check for index extensions and output directory.
         samtoolsPath (str)- Samtools executable.
-        memory (int)- Gigabytes of memory to use in generating BAM file.
+        memory (int)- Gigabytes of memory of each sort thread.
         nameSort (bool)- Generate a name sorted BAM file.
+        interleaved (bool)- read1 contains interleaved paired reads.
+        sortThreads (int)- Number of sort threads; defaults to threads.
     
     Returns:
         bwaCommand (str)- Command to perform BWA alignment.
@@ -158,16 +193,18 @@ def bwaMemAlign(
         for s in suffixes:
             if not os.path.isfile(index + s):
                 raise IOError('Genome index file %s no found' %(index + s))
-        if not os.path.isdir(os.path.dirname(outFile)):
+        if outFile != '-' and not os.path.isdir(os.path.dirname(outFile)):
             raise IOError('Could not find output directory {}'.format(
                 os.path.dirname(outFile)))
-    # Check outut file name and generate intermediate file names
-    if outFile.endswith('.sam'):
+    # Check outut file name
+    if outFile == '-':
+        outSam = outBam = ''
+    elif outFile.endswith('.sam'):
         outSam = outFile
         outBam = ''
     elif outFile.endswith('.bam'):
         outBam = outFile
-        outSam = outFile[:-4] + '.sam'
+        outSam = ''
     else:
         raise ValueError('outFile argument must end .sam or .bam')
     # Process secondary command
@@ -177,14 +214,19 @@ def bwaMemAlign(
         markSecondary = '-M'
     else:
         markSecondary = ''
+    # Process interleaved argument
+    if not isinstance(interleaved, bool):
+        raise TypeError('interleaved argument must be bool')
+    if interleaved and read2:
+        raise ValueError('read2 argument not supported for interleaved reads')
     # Process multiple input fastq files
     if isinstance(read1, list):
         read1 = "'< zcat " + ' '.join(read1) + "'"
     if isinstance(read2, list):
         read2 = "'< zcat " + ' '.join(read2) + "'"
     # Create command
-    bwaCommand = [bwaPath, 'mem', markSecondary ,'-t', str(threads),
-        index, read1, read2]
+    bwaCommand = [bwaPath, 'mem', markSecondary, '-p' if interleaved else '',
+        '-t', str(threads), index, read1, read2]
     # Remove missing elements from command
     bwaCommand = filter(None, bwaCommand)
     # Add read group data
@@ -201,16 +243,72 @@ def bwaMemAlign(
         # Add string to command
         bwaCommand.insert(2,rgString)
         bwaCommand.insert(2,'-R')
-    # Complete BWA command
-    bwaCommand = '%s > %s' %(' '.join(bwaCommand), outSam)
-    # Supplement BWA command with sort command, if required, and return
-    if outBam:
-        sortCommand = samtools.sort(inFile = outSam, outFile = outBam,
-            name = nameSort, memory = memory, delete = True,
-            path = samtoolsPath, threads = threads)
-        bwaCommand = bwaCommand + ' && ' + sortCommand
+    # Complete BWA command, piping output into sort command if required
+    bwaCommand = ' '.join(bwaCommand)
+    if outSam:
+        bwaCommand = '%s > %s' %(bwaCommand, outSam)
+    elif outBam:
+        bwaCommand = _sortPipe(bwaCommand, outBam, nameSort,
+            sortThreads or threads, memory, samtoolsPath)
     return(bwaCommand)
 
+def alignSort(
+        alignCommand, outBam, nameSort = False, threads = 1, memory = 2,
+        samtoolsPath = 'samtools', log = None, stdin = None
+    ):
+    ''' Function to run an aligner, writing SAM to stdout, with its output
+    piped directly into samtools sort, so that no intermediate SAM file is
+    written. The exit status of both commands is checked and, if either
+    fails, both are killed and no output generated. The sorted BAM is
+    written to a temporary file in the output directory, which replaces
+    outBam on success, and coordinate sorted output is indexed.
+
+    Args:
+        alignCommand - Aligner command as a string, run by the shell, or
+            list of arguments, such as from bwaMemAlign or bowtie2Align with
+            outFile '-'.
+        outBam (str)- Full path to output BAM file.
+        nameSort (bool)- Sort by read name rather than coordinate.
+        threads (int)- Number of sort threads.
+        memory - Memory of each sort thread, in gigabytes or as a string
+            such as '768M'.
+        samtoolsPath (str)- Samtools executable.
+        log (str)- Full path to file in which to write the stderr of the
+            aligner and sort.
+        stdin - Open file from which the aligner reads, or None.
+
+    Returns:
+        returncodes (list)- Exit status of the aligner and sort.
+
+    Raises:
+        IOError - If the output directory is absent or a command fails.
+
+    '''
+    # Check output directory and create temporary output file
+    directory = os.path.dirname(os.path.abspath(outBam))
+    if not os.path.isdir(directory):
+        raise IOError('Could not find output directory {}'.format(directory))
+    handle, tempBam = tempfile.mkstemp(prefix = '.', suffix = '.bam',
+        dir = directory)
+    os.close(handle)
+    sortCommand = samtools.sortStream(tempBam, nameSort, threads, memory,
+        samtoolsPath)
+    # Run alignment and sort, removing temporary files on failure
+    try:
+        returncodes = pipeline.run_pipeline([alignCommand, sortCommand],
+            stdin, log = log)
+    except:
+        for path in [tempBam] + glob.glob(tempBam[:-4] + '.tmp.*'):
+            os.remove(path)
+        raise
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tempBam, 0o666 & ~umask)
+    os.rename(tempBam, outBam)
+    if not nameSort:
+        pipeline.run_pipeline([[samtoolsPath, 'index', outBam]])
+    return(returncodes)
+
 def rsemBowtie2Align(
         index, outPrefix, read1, read2 = None,
         rsemPath = 'rsem-calculate-expression', bowtie2Path = '', threads = 1,
@@ -0,0 +1,317 @@
+''' Functions and classes to store batches of FASTQ reads in numpy arrays.
+A readBatch stores the names, sequences and qualities of its reads as
+concatenated numpy uint8 buffers with arrays holding the start and end of
+each read within the buffers. Selecting or trimming reads creates a new
+readBatch sharing the buffers of the original, with only the start and end
+arrays copied, and the whole batch may be processed by vectorised numpy
+operations. Batches are serialised for transfer between processes, with
+sequences optionally packed into two bits per base.
+'''
+import itertools
+import struct
+import numpy
+from ngs_python.fastq import fastqParse
+
+# Two bit codes of bases, where other characters are stored separately
+BASE_CODES = numpy.full(256, 255, numpy.uint8)
+for code, base in enumerate('ACGT'):
+    BASE_CODES[ord(base)] = code
+CODE_BASES = numpy.frombuffer('ACGT', numpy.uint8)
+# Header of serialised batches: magic, packed flag and array sizes
+HEADER = struct.Struct('<4s?QQQQ')
+MAGIC = 'FQB1'
+
+def pack_sequence(sequence):
+    ''' Function to pack a sequence into two bits per base. Characters
+    other than A, C, G and T are stored separately.
+
+    Args:
+        sequence (numpy.array)- Sequence as a uint8 array.
+
+    Returns:
+        packed (numpy.array)- uint8 array holding four bases per element.
+        positions (numpy.array)- Positions of other characters.
+        characters (numpy.array)- Other characters as a uint8 array.
+
+    '''
+    codes = BASE_CODES[sequence]
+    positions = numpy.flatnonzero(codes == 255)
+    characters = sequence[positions]
+    codes[positions] = 0
+    padded = numpy.zeros(-(-len(codes) // 4) * 4, numpy.uint8)
+    padded[:len(codes)] = codes
+    packed = ((padded[0::4] << 6) | (padded[1::4] << 4) | (padded[2::4] << 2)
+        | padded[3::4])
+    return(packed, positions, characters)
+
+def unpack_sequence(packed, length, positions, characters):
+    ''' Function to unpack a sequence packed by pack_sequence.
+
+    Args:
+        packed (numpy.array)- uint8 array holding four bases per element.
+        length (int)- Length of sequence.
+        positions (numpy.array)- Positions of other characters.
+        characters (numpy.array)- Other characters as a uint8 array.
+
+    Returns:
+        sequence (numpy.array)- Sequence as a uint8 array.
+
+    '''
+    codes = numpy.empty(len(packed) * 4, numpy.uint8)
+    for index, shift in enumerate((6, 4, 2, 0)):
+        codes[index::4] = (packed >> shift) & 3
+    sequence = CODE_BASES[codes[:length]]
+    sequence[positions] = characters
+    return(sequence)
+
+def _buffer(strings):
+    ''' Function returns a list of strings as a uint8 buffer and the start
+    and end of each string within the buffer.
+    '''
+    lengths = numpy.fromiter(itertools.imap(len, strings), numpy.int64,
+        len(strings))
+    ends = numpy.cumsum(lengths)
+    return(numpy.frombuffer(''.join(strings), numpy.uint8), ends - lengths,
+        ends)
+
+def _gather(buffer, starts, ends):
+    ''' Function returns the regions of a buffer as a contiguous buffer and
+    the start and end of each region within it.
+    '''
+    lengths = ends - starts
+    new_ends = numpy.cumsum(lengths)
+    new_starts = new_ends - lengths
+    # Return contiguous regions unchanged
+    if not len(starts):
+        return(buffer[:0], new_starts, new_ends)
+    if (starts[0] == 0 and ends[-1] == len(buffer) and
+            numpy.array_equal(starts[1:], ends[:-1])):
+        return(buffer, starts, ends)
+    positions = numpy.arange(int(new_ends[-1]))
+    positions += numpy.repeat(starts - new_starts, lengths)
+    return(buffer[positions], new_starts, new_ends)
+
+class readBatch(object):
+    ''' Class stores a batch of FASTQ reads in numpy arrays. Names are
+    stored without the leading '@'. Reads are selected by indexing with an
+    integer, returning a tuple of name, sequence and quality, or with a
+    slice, integer array or boolean array, returning a readBatch sharing the
+    buffers of the original.
+    '''
+
+    def __init__(self, names, name_starts, name_ends, sequences, qualities,
+            starts, ends
+        ):
+        ''' Function to initialise readBatch object.
+
+        Args:
+            names (numpy.array)- uint8 buffer of read names.
+            name_starts (numpy.array)- Start of each name within names.
+            name_ends (numpy.array)- End of each name within names.
+            sequences (numpy.array)- uint8 buffer of read sequences.
+            qualities (numpy.array)- uint8 buffer of read qualities, of the
+                same length as sequences.
+            starts (numpy.array)- Start of each read within sequences and
+                qualities.
+            ends (numpy.array)- End of each read within sequences and
+                qualities.
+
+        '''
+        self.names = names
+        self.name_starts = name_starts
+        self.name_ends = name_ends
+        self.sequences = sequences
+        self.qualities = qualities
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return(len(self.starts))
+
+    def __getitem__(self, key):
+        ''' Function to select reads by integer, slice or array '''
+        if isinstance(key, (int, long, numpy.integer)):
+            return((self.names[self.name_starts[key]:self.name_ends[key]]
+                .tostring(),
+                self.sequences[self.starts[key]:self.ends[key]].tostring(),
+                self.qualities[self.starts[key]:self.ends[key]].tostring()))
+        return(readBatch(self.names, self.name_starts[key],
+            self.name_ends[key], self.sequences, self.qualities,
+            self.starts[key], self.ends[key]))
+
+    def lengths(self):
+        ''' Function returns the length of each read '''
+        return(self.ends - self.starts)
+
+    def trim(self, starts, ends):
+        ''' Function to trim reads without copying sequences or qualities.
+
+        Args:
+            starts (numpy.array)- Start of the retained region of each
+                read, relative to the start of the read.
+            ends (numpy.array)- End of the retained region of each read.
+
+        Returns:
+            batch - Trimmed readBatch.
+
+        '''
+        starts = self.starts + starts
+        ends = numpy.maximum(self.starts + ends, starts)
+        return(readBatch(self.names, self.name_starts, self.name_ends,
+            self.sequences, self.qualities, starts, ends))
+
+    def compact(self):
+        ''' Function returns a readBatch holding only the data of its
+        reads, in contiguous buffers, or the readBatch itself if its buffers
+        are already contiguous.
+        '''
+        names, name_starts, name_ends = _gather(self.names,
+            self.name_starts, self.name_ends)
+        sequences, starts, ends = _gather(self.sequences, self.starts,
+            self.ends)
+        if sequences is self.sequences and names is self.names:
+            return(self)
+        qualities = _gather(self.qualities, self.starts, self.ends)[0]
+        return(readBatch(names, name_starts, name_ends, sequences, qualities,
+            starts, ends))
+
+    def headers(self):
+        ''' Function returns the list of read names '''
+        names, starts, ends = _gather(self.names, self.name_starts,
+            self.name_ends)
+        data = names.tostring()
+        return([data[start:end] for start, end in itertools.izip(
+            starts.tolist(), ends.tolist())])
+
+    def records(self):
+        ''' Function returns lists of read names, sequences and qualities,
+        as generated by fastqParse.FastqBlockIterator.
+        '''
+        lists = [self.headers()]
+        sequences, starts, ends = _gather(self.sequences, self.starts,
+            self.ends)
+        qualities = _gather(self.qualities, self.starts, self.ends)[0]
+        starts, ends = starts.tolist(), ends.tolist()
+        for buffer in (sequences, qualities):
+            data = buffer.tostring()
+            lists.append([data[start:end] for start, end in itertools.izip(
+                starts, ends)])
+        return(tuple(lists))
+
+    def fastq(self):
+        ''' Function returns the reads as FASTQ records '''
+        names, sequences, qualities = self.records()
+        return(''.join(['@%s\n%s\n+\n%s\n' %(read) for read in
+            itertools.izip(names, sequences, qualities)]))
+
+    def write(self, handle):
+        ''' Function to write the reads as FASTQ records to an open file '''
+        handle.write(self.fastq())
+
+    def serialise(self, packed = False):
+        ''' Function to serialise the batch.
+
+        Args:
+            packed (bool)- Whether to pack sequences into two bits per base.
+
+        Returns:
+            data (str)- Serialised batch.
+
+        '''
+        batch = self.compact()
+        name_lengths = batch.name_ends - batch.name_starts
+        lengths = batch.lengths()
+        if packed:
+            sequence, positions, characters = pack_sequence(batch.sequences)
+            parts = [sequence, positions.astype(numpy.int64), characters]
+            extra = len(positions)
+        else:
+            parts = [batch.sequences]
+            extra = 0
+        header = HEADER.pack(MAGIC, packed, len(batch), len(batch.names),
+            len(batch.sequences), extra)
+        return(header + ''.join(array.astype(array.dtype.newbyteorder('<'))
+            .tostring() for array in [name_lengths.astype(numpy.int64),
+            lengths.astype(numpy.int64), batch.names] + parts +
+            [batch.qualities]))
+
+    def __reduce__(self):
+        ''' Function to pickle batches in serialised form '''
+        return(deserialise, (self.serialise(),))
+
+def deserialise(data):
+    ''' Function to create a readBatch from data generated by
+    readBatch.serialise.
+
+    Args:
+        data (str)- Serialised batch.
+
+    Returns:
+        batch - readBatch object.
+
+    Raises:
+        ValueError - If the data is not a serialised batch.
+
+    '''
+    magic, packed, count, name_size, size, extra = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Data is not a serialised readBatch')
+    offset = [HEADER.size]
+    def take(number, dtype):
+        array = numpy.frombuffer(data, numpy.dtype(dtype).newbyteorder('<'),
+            number, offset[0])
+        offset[0] += array.nbytes
+        return(array.astype(dtype))
+    name_lengths = take(count, numpy.int64)
+    lengths = take(count, numpy.int64)
+    names = take(name_size, numpy.uint8)
+    if packed:
+        sequences = unpack_sequence(take(-(-size // 4), numpy.uint8), size,
+            take(extra, numpy.int64), take(extra, numpy.uint8))
+    else:
+        sequences = take(size, numpy.uint8)
+    qualities = take(size, numpy.uint8)
+    if offset[0] != len(data):
+        raise ValueError('Serialised readBatch has unexpected length')
+    name_ends = numpy.cumsum(name_lengths)
+    ends = numpy.cumsum(lengths)
+    return(readBatch(names, name_ends - name_lengths, name_ends, sequences,
+        qualities, ends - lengths, ends))
+
+def from_records(names, sequences, qualities):
+    ''' Function to create a readBatch from lists of read names, sequences
+    and qualities.
+
+    Args:
+        names (list)- Read names.
+        sequences (list)- Read sequences.
+        qualities (list)- Read qualities.
+
+    Returns:
+        batch - readBatch object.
+
+    Raises:
+        ValueError - If sequence and quality lengths differ.
+
+    '''
+    names, name_starts, name_ends = _buffer(names)
+    sequences, starts, ends = _buffer(sequences)
+    qualities, quality_starts, quality_ends = _buffer(qualities)
+    if not numpy.array_equal(ends, quality_ends):
+        raise ValueError('Sequence and quality lengths differ')
+    return(readBatch(names, name_starts, name_ends, sequences, qualities,
+        starts, ends))
+
+def batch_iterator(handle, block_size = 4194304, batch_size = 10000):
+    ''' Generator returning readBatch objects of reads parsed from a file
+    handle by fastqParse.FastqBlockIterator.
+
+    Args:
+        handle - Open file handle, or object with a 'read' method.
+        block_size (int)- Number of bytes to read from handle at once.
+        batch_size (int)- Maximum number of reads in each batch.
+
+    '''
+    for names, sequences, qualities in fastqParse.FastqBlockIterator(
+            handle, block_size, batch_size):
+        yield(from_records(names, sequences, qualities))
@@ -0,0 +1,397 @@
+''' Functions and classes to demultiplex FASTQ files by sample barcode.
+Barcodes are read from the Illumina read headers, from index read FASTQ
+files or from the start of the reads themselves, and may be single or dual
+indexes. Each barcode is matched, allowing up to N mismatches, through a
+table of every sequence within N substitutions of each sample barcode, so
+that matching a read requires a single dictionary lookup per index. Reads
+are processed in batches parsed by fastqParse.FastqBlockIterator and the
+reads of each sample written to BGZF files by parallelGzipWriter objects
+sharing a single pool of compression threads.
+'''
+import collections
+import itertools
+import json
+import multiprocessing.pool
+import time
+from ngs_python.fastq import fastqJunction
+from ngs_python.system import pgzip
+
+# Barcode bases, name of unassigned reads and locations of barcodes
+BASES = 'ACGTN'
+UNDETERMINED = 'Undetermined'
+LOCATIONS = ('header', 'index', 'inline')
+
+def read_samples(path):
+    ''' Function to read a tab or comma delimited sample sheet listing the
+    sample name, index1 barcode and, for dual indexes, index2 barcode of
+    each sample. Blank lines and lines starting with '#' are ignored.
+
+    Args:
+        path (str)- Full path to sample sheet.
+
+    Returns:
+        samples (list)- Tuples of sample name and tuple of barcodes.
+
+    '''
+    samples = []
+    with open(path) as inFile:
+        for line in inFile:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = [field.strip() for field in line.replace(',', '\t')
+                .split('\t')]
+            samples.append((fields[0], tuple(fields[1:])))
+    return(samples)
+
+def neighbours(barcode, mismatches):
+    ''' Generator returning the sequences within a number of substitutions
+    of a barcode, including the barcode itself.
+
+    Args:
+        barcode (str)- Barcode sequence.
+        mismatches (int)- Maximum number of substitutions.
+
+    '''
+    for number in xrange(min(mismatches, len(barcode)) + 1):
+        for positions in itertools.combinations(xrange(len(barcode)),
+                number):
+            choices = [[base for base in BASES if base != barcode[position]]
+                for position in positions]
+            for bases in itertools.product(*choices):
+                sequence = list(barcode)
+                for position, base in zip(positions, bases):
+                    sequence[position] = base
+                yield(''.join(sequence))
+
+def neighbour_table(barcodes, mismatches):
+    ''' Function to create a table mapping every sequence within a number of
+    substitutions of each barcode to the barcode.
+
+    Args:
+        barcodes (list)- Unique barcode sequences.
+        mismatches (int)- Maximum number of substitutions.
+
+    Returns:
+        table (dict)- Dictionary where the key is a sequence and the value
+            is the index of the matching barcode.
+
+    Raises:
+        ValueError - If a sequence is within the allowed mismatches of two
+            barcodes.
+
+    '''
+    table = {}
+    for index, barcode in enumerate(barcodes):
+        for sequence in neighbours(barcode, mismatches):
+            if table.setdefault(sequence, index) != index:
+                raise ValueError('Barcodes {} and {} collide with {} '\
+                    'mismatches'.format(barcodes[table[sequence]], barcode,
+                    mismatches))
+    return(table)
+
+class barcodeMatcher(object):
+    ''' Class assigns reads to samples from one or two barcodes using tables
+    of barcode neighbours generated by neighbour_table.
+    '''
+
+    def __init__(self, samples, mismatches = 1):
+        ''' Function to initialise barcodeMatcher object.
+
+        Args:
+            samples (list)- Tuples of sample name and barcode, or tuple of
+                index1 and index2 barcodes.
+            mismatches - Maximum number of mismatches within each barcode,
+                as an integer or a tuple of integers for each index.
+
+        Raises:
+            ValueError - If samples or barcodes are duplicated, differ in
+                length or number, or collide with the allowed mismatches.
+
+        '''
+        # Extract and check sample names and barcodes
+        self.names = []
+        self.barcodes = []
+        for name, barcodes in samples:
+            if isinstance(barcodes, str):
+                barcodes = (barcodes,)
+            self.names.append(name)
+            self.barcodes.append(tuple(barcode.upper() for barcode in
+                barcodes))
+        if not self.names:
+            raise ValueError('No samples supplied')
+        if len(set(self.names)) != len(self.names) or UNDETERMINED in \
+                self.names:
+            raise ValueError('Sample names must be unique')
+        if len(set(self.barcodes)) != len(self.barcodes):
+            raise ValueError('Sample barcodes must be unique')
+        self.count = len(self.barcodes[0])
+        if not 1 <= self.count <= 2:
+            raise ValueError('Samples must have one or two barcodes')
+        if isinstance(mismatches, int):
+            mismatches = (mismatches,) * self.count
+        self.mismatches = tuple(mismatches)
+        self.lengths = []
+        for index in range(self.count):
+            lengths = set(len(barcodes[index]) if len(barcodes) ==
+                self.count else None for barcodes in self.barcodes)
+            if len(lengths) != 1 or None in lengths:
+                raise ValueError('Barcodes of index{} differ in number or '\
+                    'length'.format(index + 1))
+            self.lengths.append(lengths.pop())
+        # Create neighbour tables and map barcode combinations to samples
+        self.tables = []
+        indices = [[] for index in range(self.count)]
+        for index in range(self.count):
+            unique = sorted(set(barcodes[index] for barcodes in
+                self.barcodes))
+            self.tables.append(neighbour_table(unique,
+                self.mismatches[index]))
+            for barcodes in self.barcodes:
+                indices[index].append(unique.index(barcodes[index]))
+        self.combinations = dict((combination, number) for number,
+            combination in enumerate(zip(*indices)))
+        self.undetermined = len(self.names)
+
+    def assign(self, codes):
+        ''' Function to assign reads to samples.
+
+        Args:
+            codes (list)- Lists of the read barcodes of each index.
+
+        Returns:
+            assignments (list)- Sample number of each read, where reads
+                matching no sample are assigned to self.undetermined.
+
+        '''
+        combinations = self.combinations
+        undetermined = self.undetermined
+        if self.count == 1:
+            table = self.tables[0]
+            return([combinations.get((table.get(code),), undetermined)
+                for code in codes[0]])
+        table1, table2 = self.tables
+        return([combinations.get((table1.get(code1), table2.get(code2)),
+            undetermined) for code1, code2 in zip(codes[0], codes[1])])
+
+def header_barcodes(headers, count):
+    ''' Function to extract barcodes from Illumina FASTQ headers, such as
+    'name 1:N:0:ATCACG+GATCAG'.
+
+    Args:
+        headers (list)- FASTQ headers.
+        count (int)- Number of indexes.
+
+    Returns:
+        codes (list)- Lists of the read barcodes of each index.
+
+    '''
+    fields = [header[header.rfind(':') + 1:] for header in headers]
+    if count == 1:
+        return([[field.split('+', 1)[0] for field in fields]])
+    split = [field.split('+', 1) + [''] for field in fields]
+    return([[codes[0] for codes in split], [codes[1] for codes in split]])
+
+def zip_batches(iterables):
+    ''' Generator returning tuples of batches containing equal numbers of
+    reads from a list of iterables of batches, such as the batches of
+    read1, read2 and index reads.
+
+    Args:
+        iterables (list)- Iterables of batches of read names, sequences and
+            qualities.
+
+    Returns:
+        batches (tuple)- Batches of each iterable.
+
+    Raises:
+        IOError - If the iterables contain differing numbers of reads.
+
+    '''
+    # Join batches of successive iterables, as paired_batches slices each
+    # list of a batch
+    joined = iter(iterables[0])
+    for iterable in iterables[1:]:
+        joined = (first + second for first, second in
+            fastqJunction.paired_batches(joined, iterable))
+    for batch in joined:
+        yield(tuple(batch[start:start + 3] for start in
+            xrange(0, len(batch), 3)))
+
+def open_writers(outPrefix, names, reads, level = 6, pool = None):
+    ''' Function to create BGZF writers for the reads of each sample.
+    Output files are named '<outPrefix><sample>_R1.fastq.gz' and
+    '<outPrefix><sample>_R2.fastq.gz' for paired reads, or
+    '<outPrefix><sample>.fastq.gz' for single reads.
+
+    Args:
+        outPrefix (str)- Prefix of output files.
+        names (list)- Sample names.
+        reads (int)- Number of reads, 1 or 2, of each sample.
+        level (int)- zlib compression level between 1 and 9.
+        pool - multiprocessing.pool.ThreadPool shared by the writers.
+
+    Returns:
+        paths (list)- Lists of the output files of each sample.
+        writers (list)- Lists of the pgzip.parallelGzipWriter objects of
+            each sample.
+
+    '''
+    paths = []
+    for name in names:
+        if reads == 1:
+            paths.append(['{}{}.fastq.gz'.format(outPrefix, name)])
+        else:
+            paths.append(['{}{}_R{}.fastq.gz'.format(outPrefix, name, number)
+                for number in (1, 2)])
+    writers = [[pgzip.parallelGzipWriter(path, 2, level, 262144, pool)
+        for path in sample] for sample in paths]
+    return(paths, writers)
+
+def demultiplex_batches(batches, matcher, writers, location, reads,
+        metrics
+    ):
+    ''' Function to assign batches of reads to samples and write the reads
+    of each sample to its writers. Barcodes read from the start of reads are
+    removed from the output reads.
+
+    Args:
+        batches - Iterable of tuples of the batches of each read followed
+            by the batches of each index read.
+        matcher - barcodeMatcher object.
+        writers (list)- Lists of the writers of each sample and of
+            undetermined reads.
+        location (str)- Location of barcodes: 'header', 'index' or
+            'inline'.
+        reads (int)- Number of reads, 1 or 2.
+        metrics (dict)- Metrics to which the number of reads ('total'),
+            reads ('reads') and reads with perfectly matched barcodes
+            ('perfect') of each sample, and counts of undetermined barcodes
+            ('undetermined') are added.
+
+    '''
+    lengths = matcher.lengths
+    undetermined = matcher.undetermined
+    for batch in batches:
+        # Extract barcodes
+        if location == 'header':
+            codes = header_barcodes(batch[0][0], matcher.count)
+        elif location == 'index':
+            if len(batch) - reads != matcher.count:
+                raise ValueError('Index reads required for each barcode')
+            codes = [index[1] for index in batch[reads:]]
+        else:
+            codes = [batch[index][1] for index in range(matcher.count)]
+        codes = [[code[:length] for code in index] for index, length in
+            zip(codes, lengths)]
+        assignments = matcher.assign(codes)
+        # Group reads by sample and count barcodes
+        groups = collections.defaultdict(list)
+        for index, sample in enumerate(assignments):
+            groups[sample].append(index)
+        metrics['total'] += len(assignments)
+        combined = zip(*codes)
+        for sample, selected in groups.items():
+            metrics['reads'][sample] += len(selected)
+            if sample == undetermined:
+                metrics['undetermined'].update('+'.join(combined[index])
+                    for index in selected)
+            else:
+                barcodes = matcher.barcodes[sample]
+                metrics['perfect'][sample] += sum(1 for index in selected
+                    if combined[index] == barcodes)
+            # Write reads, removing inline barcodes
+            for number in range(reads):
+                names, sequences, qualities = batch[number]
+                trim = lengths[number] if (location == 'inline' and
+                    number < matcher.count) else 0
+                writers[sample][number].write(''.join(['@%s\n%s\n+\n%s\n' %(
+                    names[index], sequences[index][trim:],
+                    qualities[index][trim:]) for index in selected]))
+
+def demultiplex(batches, samples, outPrefix, location = 'header',
+        mismatches = 1, reads = 2, threads = 4, level = 6
+    ):
+    ''' Function to demultiplex batches of reads into gzipped FASTQ files
+    for each sample. The reads of each sample are written in input order,
+    so that paired outputs may be interleaved or aligned directly.
+
+    Args:
+        batches - Iterable of tuples of the batches of each read followed
+            by the batches of each index read, such as from zip_batches.
+        samples (list)- Tuples of sample name and barcode, or tuple of
+            index1 and index2 barcodes.
+        outPrefix (str)- Prefix of output files.
+        location (str)- Location of barcodes: 'header' for the end of the
+            read1 header, 'index' for index reads or 'inline' for the start
+            of read1 and, for dual indexes, read2.
+        mismatches - Maximum number of mismatches within each barcode.
+        reads (int)- Number of reads, 1 or 2.
+        threads (int)- Number of threads used to compress output.
+        level (int)- zlib compression level between 1 and 9.
+
+    Returns:
+        metrics (dict)- Total number of reads, time taken, reads per second
+            and, for each sample and undetermined reads, the output files,
+            barcodes and numbers of reads and reads with perfectly matched
+            barcodes. The 100 most frequent undetermined barcodes are listed
+            with their counts.
+
+    Raises:
+        ValueError - If arguments have an unexpected value.
+
+    '''
+    # Check arguments and create matcher
+    if location not in LOCATIONS:
+        raise ValueError('location must be one of: {}'.format(
+            ', '.join(LOCATIONS)))
+    if reads not in (1, 2):
+        raise ValueError('reads must be 1 or 2')
+    matcher = barcodeMatcher(samples, mismatches)
+    if location == 'inline' and matcher.count > reads:
+        raise ValueError('Dual inline barcodes require paired reads')
+    names = matcher.names + [UNDETERMINED]
+    metrics = {
+        'total': 0,
+        'reads': [0] * len(names),
+        'perfect': [0] * len(names),
+        'undetermined': collections.Counter()
+    }
+    # Demultiplex reads
+    start = time.time()
+    pool = multiprocessing.pool.ThreadPool(threads)
+    try:
+        paths, writers = open_writers(outPrefix, names, reads, level, pool)
+        try:
+            demultiplex_batches(batches, matcher, writers, location, reads,
+                metrics)
+        finally:
+            for sample in writers:
+                for writer in sample:
+                    writer.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    seconds = time.time() - start
+    # Generate report
+    report = {
+        'reads': metrics['total'],
+        'seconds': seconds,
+        'reads_per_second': metrics['total'] / seconds if seconds else 0.0,
+        'samples': collections.OrderedDict(),
+        'undetermined_barcodes': metrics['undetermined'].most_common(100)
+    }
+    for number, name in enumerate(names):
+        report['samples'][name] = {
+            'barcodes': '+'.join(matcher.barcodes[number]) if
+                number < matcher.undetermined else None,
+            'reads': metrics['reads'][number],
+            'perfect': metrics['perfect'][number],
+            'outputs': paths[number]
+        }
+    return(report)
+
+def write_report(report, path):
+    ''' Function to write a demultiplexing report to a JSON file '''
+    with open(path, 'w') as outFile:
+        json.dump(report, outFile, indent = 2)
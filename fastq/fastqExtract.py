@@ -1,73 +1,36 @@
-import gzip
-import random
 import multiprocessing
-import subprocess
-import cStringIO
 import itertools
-from Bio.SeqIO.QualityIO import FastqGeneralIterator
-
-def readFastqProcess(fastq, pipes, shell = True):
-    ''' Function to open FASTQ files, parse entries and add individual
-    read to a pipe. Function takes three arguments:
-    
-    1)  fastq - Full path to FASTQ file.
-    2)  pipes - Send enabled pipe.
-    3)  shell - Boolean indicating whether to use shell 'zcat' command
-        to read FASTQ file.
-    
-    '''
-    # Loop through fastq files and add contents to pipe
-    for f in fastqFile:
-        # Create fastq handle
-        if shell and fastq.endswith('.gz'):
-            sp = subprocess.Popen(["zcat", f], stdout = subprocess.PIPE)
-            fh = cStringIO.StringIO(sp.communicate()[0])
-        elif f.endswith('.gz'):
-            fh = gzip.open(f)
-        else:
-            fh = open(f)
-        # Create output and add to pipe
-        for read in FastqGeneralIterator(fh):
-            pipe.send(read)
-        # Add poisin pill to pipe and close
-        pipe.close()
-        # Try to close the fastq handle
-        try:
-            fh.close()
-        except AttributeError:
-            continue
+from ngs_python.fastq.fastqIO import FastqGeneralIterator, writeFastq
+from ngs_python.fastq.fastqParse import FastqBlockIterator
+from ngs_python.fastq import fastqIndex, fastqSample, fastqShard
+from ngs_python.system import streamio
 
 def fastqPairIterator(fastq1, fastq2, shell = True):
-    # Create read1 pipes and process
-    pipe1Recv, pipe1Send = multiprocessing.Pipe(False)
-    process1 = multiprocessing.Process(
-        target = readFastqProcess,
-        args = (fastq1, pipe1Send, shell) 
-    )
-    process1.start()
-    pipe1Send.close()
-    # Create read2 pipes and process
-    pipe2Recv, pipe2Send = multiprocessing.Pipe(False)
-    process2 = multiprocessing.Process(
-        target = readFastqProcess,
-        args = (fastq2, pipe2Send, shell) 
-    )
-    process2.start()
-    pipe2Send.close()
-    # Create iterator from pipes
-    while True:
-        try:
-            read1 = pipe1Recv.recv()
-            read2 = pipe2Recv.recv()
-        except EOFError:
-            break
-        yield((read1, read2))
+    ''' Creates a generator returning pairs of reads from two FASTQ files,
+    each read in a seperate process by a readFastqProcess object.
+    '''
+    read1In = readFastqProcess(fastq1, shell)
+    read2In = readFastqProcess(fastq2, shell)
+    try:
+        for read1, read2 in itertools.izip(read1In, read2In):
+            yield((read1, read2))
+    finally:
+        read1In.close()
+        read2In.close()
 
-def fastqCount(fastqFile, shell = True):
+def fastqCount(fastqFile, shell = True, threads = 1, processes = 1):
     ''' Creates a generator that parses FASTQ files using the 
-    FastqGeneralIterator in Bio.SeqIO. Function takes one argument:
+    FastqGeneralIterator in Bio.SeqIO. Function takes four arguments:
     
     1)  fastqFile - Path to FASTQ file or a list of paths.
+    2)  shell - Boolean indicating whether to use shell gzip command
+        to read gzipped input.
+    3)  threads - Number of threads used to decompress BGZF or
+        multi-member gzip input.
+    4)  processes - Number of processes used to count shards of
+        uncompressed, BGZF or multi-member gzip input.
+    
+    Read counts are taken from the fastqIndex of a FASTQ file, if present.
     
     '''
     # Process input file(s)
@@ -76,17 +39,20 @@ def fastqCount(fastqFile, shell = True):
     count = 0
     # Loop through fastq files and add contents to pipe
     for f in fastqFile:
-        # Create open file command
-        if shell and f.endswith('.gz'):
-            sp = subprocess.Popen(["zcat", f], stdout = subprocess.PIPE)
-            fh = cStringIO.StringIO(sp.communicate()[0])
-        elif f.endswith('.gz'):
-            fh = gzip.open(f)
-        else:
-            fh = open(f)
-        # Create output and add to pipe
-        for read in FastqGeneralIterator(fh):
-            count += 1
+        # Use read count from index, if present
+        index = fastqIndex.load_index(f)
+        if index:
+            count += index.count
+            continue
+        # Count shards in parallel
+        if processes > 1 and fastqShard.splittable(f):
+            count += fastqShard.count_records(f, processes)
+            continue
+        # Create file handle
+        fh = streamio.streamReader(f, shell = shell, threads = threads)
+        # Count reads in each batch
+        for names, sequences, qualities in FastqBlockIterator(fh):
+            count += len(names)
         try:
             fh.close()
         except AttributeError:
@@ -94,11 +60,15 @@ def fastqCount(fastqFile, shell = True):
     # Return count
     return(count)
 
-def fastqGenerator(fastqFile, shell = True):
+def fastqGenerator(fastqFile, shell = True, threads = 1):
     ''' Creates a generator that parses FASTQ files using the 
-    FastqGeneralIterator in Bio.SeqIO. Function takes one argument:
+    FastqGeneralIterator in Bio.SeqIO. Function takes three arguments:
     
     1)  fastqFile - Path to FASTQ file or a list of paths.
+    2)  shell - Boolean indicating whether to use shell gzip command
+        to read gzipped input.
+    3)  threads - Number of threads used to decompress BGZF or
+        multi-member gzip input.
     
     '''
     # Process input file(s)
@@ -106,14 +76,8 @@ def fastqGenerator(fastqFile, shell = True):
         fastqFile = [fastqFile]
     # Loop through fastq files and add contents to pipe
     for f in fastqFile:
-        # Create open file command
-        if shell and f.endswith('.gz'):
-            sp = subprocess.Popen(["zcat", f], stdout = subprocess.PIPE)
-            fh = cStringIO.StringIO(sp.communicate()[0])
-        elif f.endswith('.gz'):
-            fh = gzip.open(f)
-        else:
-            fh = open(f)
+        # Create file handle
+        fh = streamio.streamReader(f, shell = shell, threads = threads)
         # Create output and add to pipe
         for title, seq, qual in FastqGeneralIterator(fh):
             yield('@' + title + '\n' + seq + '\n' '+' '\n' + qual)
@@ -124,6 +88,30 @@ def fastqGenerator(fastqFile, shell = True):
     # Raise stop iteration
     raise StopIteration
 
+def fastqBatchGenerator(
+        fastqFile, shell = True, threads = 1, batch_size = 10000
+    ):
+    ''' Creates a generator returning batches of FASTQ records parsed by
+    fastqParse.FastqBlockIterator. Each batch is a tuple of lists of read
+    names, sequences and qualities. Function takes four arguments:
+    
+    1)  fastqFile - Path to FASTQ file or a list of paths.
+    2)  shell - Boolean indicating whether to use shell gzip command
+        to read gzipped input.
+    3)  threads - Number of threads used to decompress BGZF or
+        multi-member gzip input.
+    4)  batch_size - Maximum number of reads in each batch.
+    
+    '''
+    # Process input file(s)
+    if isinstance(fastqFile, str):
+        fastqFile = [fastqFile]
+    # Loop through fastq files and return batches
+    for f in fastqFile:
+        with streamio.streamReader(f, shell = shell, threads = threads) as fh:
+            for batch in FastqBlockIterator(fh, batch_size = batch_size):
+                yield(batch)
+
 def readToPipe(fastqFile, pipes, shell = True):
     ''' Function extract reads from a FASTQ file using fastqGenerator
     and adds reads to a pipe. The function closes the pipe when all
@@ -221,50 +209,40 @@ class readFastqProcess(object):
     def __exit__(self, type, value, traceback):
         self.close()
 
-def randomPair(fastqIn1, fastqIn2, fastqOut1, fastqOut2, number, shell = True):
-    ''' Extract random paired end read '''
-    # Count reads in file
-    readCount = fastqCount(fastqIn1)
-    # Select which reads to extract
-    random.seed(1)
-    selected = random.sample(
-        range(0,readCount),
-        min(readCount,number)
-    )
-    selected.sort(reverse = True)
-    # Select random reads
-    nextRead = selected.pop()
-    readCount = 0
-    # Create pbjects
+def randomPair(
+        fastqIn1, fastqIn2, fastqOut1, fastqOut2, number, shell = True,
+        seed = 1
+    ):
+    ''' Extract random paired end reads in a single pass of the input
+    files. Read pairs are selected using a reservoir sampler so that at most
+    'number' pairs are held in memory. If the input contains fewer than
+    'number' pairs then all pairs are extracted.
+    '''
+    # Create objects
+    sampler = fastqSample.reservoirSampler(number, seed)
     read1In = readFastqProcess(fastqIn1, shell)
     read2In = readFastqProcess(fastqIn2, shell)
-    read1Out = writeFile.writeFileProcess(fastqOut1, shell)
-    read2Out = writeFile.writeFileProcess(fastqOut2, shell)
-    # Loop through fastq files
+    # Loop through fastq files and add read pairs to sampler
     for read1, read2 in itertools.izip(read1In, read2In):
-        # Find the next random read
-        if readCount == nextRead:
-            # Check for matching read names and write reads
-            read1Name = read1.split('\n',1)[0].split(' ',1)[0]
-            read2Name = read2.split('\n',1)[0].split(' ',1)[0]
-            if read1Name == read2Name:
-                read1Out.add(read1 + '\n')
-                read2Out.add(read2 + '\n')
-            else:
-                raise IOError('Input FASTQ files are not paired')
-            # Extract next read number
-            try:
-                nextRead = selected.pop()
-            except IndexError:
-                nextRead = 0
-        readCount += 1
-    # Check that all reads have been extracted
+        # Check for matching read names
+        read1Name = fastqSample.read_name(read1.split('\n',1)[0][1:])
+        read2Name = fastqSample.read_name(read2.split('\n',1)[0][1:])
+        if read1Name != read2Name:
+            read1In.close()
+            read2In.close()
+            raise IOError('Input FASTQ files are not paired')
+        sampler.add((read1, read2))
     read1In.close()
     read2In.close()
-    read1Out.close()
-    read2Out.close()
-    if selected:
-        raise ValueError('Not all read numbers extracted')
+    # Write selected reads
+    with writeFastq(fastqOut1, fastqOut2, shell) as fastqOut:
+        for read1, read2 in sampler.sample():
+            read1 = read1.split('\n')
+            read2 = read2.split('\n')
+            fastqOut.write((
+                (read1[0][1:], read1[1], read1[3]),
+                (read2[0][1:], read2[1], read2[3])
+            ))
 
 def extractRandom(read1In, read2In, read1Out, read2Out, number = 100000):
     ''' This function generates and reutrns a command to extracts random
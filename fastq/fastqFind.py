@@ -1,8 +1,38 @@
 ''' Functions to identify and return names of fastq files '''
 import re
 import os
+from ngs_python.fastq import fastqManifest
 
-def findFastq(prefix, dirList, pair = True):
+def _walk(directory, prefixes, manifestDir = None):
+    ''' Generator returning the path and file names of each directory
+    beneath a directory, along with the file names starting with each of a
+    list of literal prefixes. Directories are listed directly if manifestDir
+    is None or using a manifest cached in manifestDir, in which case file
+    names are found by bisection.
+    '''
+    if manifestDir is None:
+        for (dirpath, dirnames, filenames) in os.walk(directory):
+            yield(dirpath, filenames, [filenames for prefix in prefixes])
+        return
+    manifest = fastqManifest.load_manifest(directory, manifestDir)
+    for dirpath, filenames in manifest.walk():
+        yield(dirpath, filenames, [fastqManifest.prefix_names(filenames,
+            prefix) for prefix in prefixes])
+    manifest.save()
+
+def _listdir(directory, manifestDir = None):
+    ''' Function returns the names of the files and directories in a
+    directory, or the sorted names of the files only if manifestDir is not
+    None.
+    '''
+    if manifestDir is None:
+        return(os.listdir(directory))
+    manifest = fastqManifest.load_manifest(directory, manifestDir)
+    filenames = manifest.filenames()
+    manifest.save()
+    return(list(filenames))
+
+def findFastq(prefix, dirList, pair = True, manifestDir = None):
     ''' A function to identify R1 and R2 FASTQ files from directories
     using a supplied filename prefix. Function returns two list
     containing the read1 and read2 files respectively. Function has
@@ -12,6 +42,9 @@ def findFastq(prefix, dirList, pair = True):
     2)  dirList - A list of directories to search.
     3)  pair - A boolean indicating whether to return only paired reads. Paired
         reads must be in the same directory to be identified. Default = True.
+    4)  manifestDir - Directory in which to cache directory manifests, such
+        as fastqManifest.MANIFEST_DIR. If None directories are listed
+        directly. Default = None.
     
     The output is a list of list where the first list is the identified
     read1 files and the second list is a list of the identified read2
@@ -25,16 +58,16 @@ def findFastq(prefix, dirList, pair = True):
     read1 = []
     read2 = []
     # Create regular expression to find files
-    prefix = re.escape(prefix)
     read1Pattern = re.compile(
-            prefix+'.*?R1(_\\d{3}){0,1}\\.fastq(\\.gz){0,1}$'
+            re.escape(prefix)+'.*?R1(_\\d{3}){0,1}\\.fastq(\\.gz){0,1}$'
         )
     # Loop through directories to find fastq files
     for directory in dirList:
         # Extract file names
-        for (dirpath, dirnames, filenames) in os.walk(directory):
+        for (dirpath, filenames, candidates) in _walk(
+                directory, [prefix], manifestDir):
             # Loop through filenames
-            for f in filenames:
+            for f in candidates[0]:
                 # Find files matching read1 regular expression
                 if re.match(read1Pattern, f):
                     # Process pairs
@@ -70,7 +103,9 @@ def findFastq(prefix, dirList, pair = True):
     else:
         return(read1)
 
-def findFastqMultiPrefix(prefixList, dirList, pair = True):
+def findFastqMultiPrefix(prefixList, dirList, pair = True,
+        manifestDir = None
+    ):
     ''' A function to identify R1 and R2 FASTQ files from directories
     using a supplied list of FASTQ prefixes.
     
@@ -79,6 +114,8 @@ def findFastqMultiPrefix(prefixList, dirList, pair = True):
         dirList - A tuple or list of directories to search.
         pair (bool)- Whether to return only paired reads. Paired
             reads must be in the same directory. Default = True.
+        manifestDir (str)- Directory in which to cache directory manifests.
+            If None directories are listed directly. Default = None.
     
     Returns:
         fastqDict - A dictionary where the key is the prefix and the
@@ -112,13 +149,14 @@ def findFastqMultiPrefix(prefixList, dirList, pair = True):
     # Create regular expression for read2
     regxRead2 = re.compile('R1(?=(_\\d{3}){0,1}\\.fastq(\\.gz){0,1}$)')
     # Loop through directories to find fastq files
+    prefixes = list(regxDict)
     for directory in dirList:
         # Extract file names
-        for (dirpath, dirnames, filenames) in os.walk(directory):
-                # Loop through filenames
-                for f in filenames:
-                    # Loop through prefixes
-                    for prefix in regxDict:
+        for (dirpath, filenames, candidates) in _walk(
+                directory, prefixes, manifestDir):
+                # Loop through prefixes and candidate filenames
+                for prefix, prefixFiles in zip(prefixes, candidates):
+                    for f in prefixFiles:
                         # Find files matching read1 regular expression
                         if regxDict[prefix].match(f):
                             # Store read name
@@ -154,7 +192,7 @@ def findFastqMultiPrefix(prefixList, dirList, pair = True):
             fastqFiles.sort()
     return(fastqDict)
 
-def findIlluminaFastq(prefix, dirList, pair = True):
+def findIlluminaFastq(prefix, dirList, pair = True, manifestDir = None):
     ''' A function to identify R1 and R2 FASTQ files from directories
     using a supplied filename prefix. Function returns two list
     containing the read1 and read2 files respectively. Function has
@@ -164,6 +202,9 @@ def findIlluminaFastq(prefix, dirList, pair = True):
     2)  dirList - A list of directories to search.
     3)  pair - A boolean indicating whether to return only paired reads. Paired
         reads must be in the same directory to be identified. Default = True.
+    4)  manifestDir - Directory in which to cache directory manifests, such
+        as fastqManifest.MANIFEST_DIR. If None directories are listed
+        directly. Default = None.
 
     The output is a list of list where the first list is the identified
     read1 files and the second list is a list of the identified read2
@@ -186,12 +227,17 @@ def findIlluminaFastq(prefix, dirList, pair = True):
     # Loop through dirList to find files
     for directory in dirList:
         # Extract file names
-        fileList = os.listdir(directory)
+        fileList = _listdir(directory, manifestDir)
         fileList.sort()
+        # Select candidate files by literal prefix of the regular expression
+        candidates = fileList
+        if manifestDir is not None:
+            candidates = fastqManifest.prefix_names(fileList,
+                fastqManifest.literal_prefix(prefix))
         # Find paired reads
         if pair:
             # Loop through files
-            for f in fileList:
+            for f in candidates:
                 # Find files matching read1 regular expression
                 if re.match(read1Pattern, f):
                     # Generate name of paired read file
@@ -207,7 +253,7 @@ def findIlluminaFastq(prefix, dirList, pair = True):
         # Or find potentially unpaired reads
         else:
             # Loop through files
-            for f in fileList:
+            for f in candidates:
                 if re.match(read1Pattern, f):
                     read1.append(directory + f)
                 elif re.match(read2Pattern, f):
@@ -215,10 +261,18 @@ def findIlluminaFastq(prefix, dirList, pair = True):
     # Return data
     return(read1,read2)
 
-def findIlluminaPrefix(directory):
+def findIlluminaPrefix(directory, manifestDir = None):
     ''' Function to find all Illumina FASTQ prefixes within a specified
-    directory.
+    directory. If manifestDir is not None prefixes are extracted from a
+    directory manifest cached in manifestDir.
     '''
+    # Extract prefixes from manifest
+    if manifestDir is not None:
+        manifest = fastqManifest.load_manifest(directory, manifestDir)
+        prefix = set(fields[0] for name, size, mtime, fields in
+            manifest.files() if fields and fields[2] == 1)
+        manifest.save()
+        return(prefix)
     # Create output variable and regular expression
     prefix = set()
     readPattern = re.compile(
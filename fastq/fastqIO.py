@@ -1,74 +1,102 @@
-import gzip
+import itertools
 import multiprocessing
-import subprocess
 import os
 import random
+import shutil
+import subprocess
+import tempfile
+import time
+from ngs_python.fastq import fastqIndex, fastqParse, fastqPipe, fastqSample
+from ngs_python.fastq import fastqBatch, fastqDemultiplex, fastqJunction
+from ngs_python.fastq import fastqQC, fastqScreen, fastqShard
+from ngs_python.system import pgzip, streamio
 
-def FastqGeneralIterator(handle): 
-    ''' Function taken from Bio.SeqIO.Quality.IO '''
-    # We need to call handle.readline() at least four times per record, 
-    # so we'll save a property look up each time: 
-    handle_readline = handle.readline 
-    
-    # Skip any text before the first record (e.g. blank lines, comments?) 
-    while True: 
-        line = handle_readline() 
-        if not line: 
-            return
-        if line[0] == "@": 
-           break 
-        if isinstance(line[0], int): 
-             raise ValueError("Is this handle in binary mode not text mode?") 
-   
-    while line: 
-        if line[0] != "@": 
-            raise ValueError( 
-                "Records in Fastq files should start with '@' character") 
-        title_line = line[1:].rstrip()
-        # Will now be at least one line of quality data - in most FASTQ files 
-        # just one line! We therefore use string concatenation (if needed) 
-        # rather using than the "".join(...) trick just in case it is multiline: 
-        seq_string = handle_readline().rstrip() 
-        # There may now be more sequence lines, or the "+" quality marker line: 
-        while True: 
-            line = handle_readline() 
-            if not line: 
-                raise ValueError("End of file without quality information.") 
-            if line[0] == "+": 
-                # The title here is optional, but if present must match! 
-                second_title = line[1:].rstrip() 
-                if second_title and second_title != title_line: 
-                    raise ValueError("Sequence and quality captions differ.") 
-                break 
-            seq_string += line.rstrip()  # removes trailing newlines 
-        seq_len = len(seq_string) 
+def FastqGeneralIterator(handle):
+    ''' Generator returning FASTQ records as three element tuples of read
+    name, sequence and quality. Retained for compatibility with the
+    FastqGeneralIterator from Bio.SeqIO.QualityIO, records are extracted
+    from large blocks of the file using fastqParse.blockParser.
 
-        # Will now be at least one line of quality data... 
-        quality_string = handle_readline().rstrip() 
-        # There may now be more quality data, or another sequence, or EOF 
-        while True: 
-            line = handle_readline() 
-            if not line: 
-                break
-            if line[0] == "@": 
-                # This COULD be the start of a new sequence. However, it MAY just 
-                # be a line of quality data which starts with a "@" character.  We 
-                # should be able to check this by looking at the sequence length 
-                # and the amount of quality data found so far. 
-                if len(quality_string) >= seq_len: 
-                    # We expect it to be equal if this is the start of a new record. 
-                    # If the quality data is longer, we'll raise an error below. 
-                    break 
-                    # Continue - its just some (more) quality data. 
-                quality_string += line.rstrip() 
-        if seq_len != len(quality_string): 
-            raise ValueError("Lengths of sequence and quality values differs " 
-                " for %s (%i and %i)." 
-                % (title_line, seq_len, len(quality_string))) 
+    Args:
+        handle - Open file handle.
+
+    '''
+    return(iter(fastqParse.blockParser(handle)))
+
+def _name_number(header):
+    ''' Function returns the read name and read number from a FASTQ header '''
+    name, description = header.split(None, 1)
+    return(name, description.split(':', 1)[0])
+
+def _check_names_shard(shards):
+    ''' Function to check the read names and read numbers of a shard, or of
+    paired shards, generated by fastqShard.
+    
+    Args:
+        shards (tuple)- One or two fastqShard.Shard objects.
+    
+    Returns:
+        count (int)- Number of reads, or read pairs, in the shard.
+    
+    Raises:
+        ValueError - If read names or numbers are incorrect.
+        IOError - If paired shards contain differing numbers of reads.
+    
+    '''
+    count = 0
+    expected = ['1', '2']
+    records = [fastqShard.shard_records(shard) for shard in shards]
+    for reads in itertools.izip_longest(*records):
+        if None in reads:
+            raise IOError('Differing number of data points')
+        count += 1
+        data = [_name_number(read[0]) for read in reads]
+        if (len(set(name for name, number in data)) != 1
+            or [number for name, number in data] != expected[:len(data)]):
+            if shards[0].record is None:
+                raise ValueError('Read {} name error'.format(data[0][0]))
+            raise ValueError('Read {} name error'.format(
+                shards[0].record + count))
+    return(count)
 
-        # Return the record and then continue... 
-        yield (title_line, seq_string, quality_string) 
-    raise StopIteration 
+def _trim_shard(shard, trim, minLength, outFastq, level, qc):
+    ''' Function to trim and interleave the reads of paired shards generated
+    by fastqShard, writing the output to a shard output file.
+    
+    Args:
+        shard (tuple)- Shard number and tuple of paired Shard objects.
+        trim (str)- Sequence after which sequence is trimmed.
+        minLength (int)- Minimum length of trimmed reads.
+        outFastq (str)- Full path to output fastq file.
+        level (int)- Compression level for gzipped output.
+        qc (bool)- Generate quality control statistics of output reads.
+    
+    Returns:
+        metrics (dict)- Trim metrics.
+        stats (list)- fastqQC.qcStats objects of output read1 and read2, or
+            None if qc is False.
+    
+    '''
+    number, shards = shard
+    output = fastqShard.shard_output(outFastq, number)
+    if outFastq.endswith('.gz'):
+        outFile = pgzip.parallelGzipWriter(output, 1, level)
+    else:
+        outFile = open(output, 'w')
+    stats = [fastqQC.qcStats(), fastqQC.qcStats()] if qc else None
+    with outFile:
+        metrics = fastqJunction.trim_pairs(
+            fastqShard.shard_batches(shards[0]),
+            fastqShard.shard_batches(shards[1]),
+            trim, outFile, minLength, stats)
+    return(metrics, stats)
+
+def _trim_reduce(first, second):
+    ''' Function to combine the metrics and statistics of trimmed shards '''
+    if first[1] is not None:
+        for stats, other in zip(first[1], second[1]):
+            stats.merge(other)
+    return(fastqShard.sum_dict(first[0], second[0]), first[1])
 
 class parseFastq(object):
     
@@ -79,7 +107,8 @@ class parseFastq(object):
     '''
     
     def __init__(
-        self, fastq1, fastq2 = None, shell = True
+        self, fastq1, fastq2 = None, shell = True, batch_size = 10000,
+        threads = 1, processes = 1
     ):
         ''' Function to initialise readFastq object. Checks FASTQ files
         exist and creates lists to store read and write processes.
@@ -88,6 +117,14 @@ class parseFastq(object):
             fastq1 (str)- Full path to fastq file.
             fastq2 (str)- Full path to paired fastq file.
             shell (bool)- Whether to use shell to read gzip files.
+            batch_size (int)- Number of reads sent between processes in
+                each message.
+            threads (int)- Number of threads used to decompress each BGZF
+                or multi-member gzip file and to compress gzipped output.
+            processes (int)- Number of processes used to process shards of
+                the fastq files in check_names and interleave_trim_reads.
+                Shards are generated by fastqShard from uncompressed, BGZF
+                or multi-member gzip files, or files with a fastqIndex.
         
         '''
         # Store fastq files
@@ -103,60 +140,42 @@ class parseFastq(object):
                 raise IOError('File {} could not be found'.format(fastq))
         # Store and create additional variables
         self.shell = shell
+        self.batch_size = batch_size
+        self.threads = threads
+        self.processes = processes
         self.read_processes = []
     
+    def __shards(self):
+        ''' Function to split the fastq files into shards for processing by
+        self.processes processes.
+        
+        Returns:
+            shards (list)- List of tuples of one or two fastqShard.Shard
+                objects.
+        
+        '''
+        number = self.processes * 2
+        if self.pair:
+            return(fastqShard.plan_paired_shards(
+                self.fastq_list[0], self.fastq_list[1], number,
+                build = self.processes > 1))
+        return([(shard,) for shard in fastqShard.plan_shards(
+            self.fastq_list[0], number)])
+    
     def __read_handle_create(self, fastq):
-        ''' Function to create filehandle and subprocess for reading of
-        FASTQ files.
+        ''' Function to create a file handle for reading of FASTQ files.
+        Data is decompressed, if required, and read in a background thread
+        by a streamReader object from ngs_python.system.streamio.
         
         Args:
             fastq (str)- Full path to fastq file.
         
         Returns:
             fh - File handle for fastq file.
-            sp - zcat subprocess reading the FASTQ file if self.shell=True
-                and files ends with '.gz', else None.
         
         '''
-        # Create fastq handle and subprocess
-        if self.shell and fastq.endswith('.gz'):
-            sp = subprocess.Popen(['zcat', fastq], stdout = subprocess.PIPE,
-                bufsize = 1)
-            fh = sp.stdout
-        elif fastq.endswith('.gz'):
-            sp = None
-            fh = gzip.open(fastq)
-        else:
-            sp = None
-            fh = open(fastq)
-        # Return handle and subprocess
-        return(fh, sp)
-    
-    def __send(self, data, conn):
-        ''' Function to send data down the end of multiprocessing pipe.
-        First checks that termination signal, None, has not been received
-        first.
-        
-        Args:
-            data - Data to send down pipe.
-            conn - End of pipe.
-            
-        Raises:
-            StopIteration: If termination signal of None is received.
-            ValueError: If anythind other than None is received.
-       
-        '''
-        # Check pipe for incoming signal
-        if conn.poll():
-            # Extract signal and process
-            recv = pend.recv()
-            if recv is None:
-                raise StopIteration('Termination signal received')
-            else:
-                raise ValueError('Unknown signal received')
-        # Add read to connection
-        else:
-            conn.send(data)
+        return(streamio.streamReader(fastq, shell = self.shell,
+            threads = self.threads))
     
     def __read_processes_recv(self):
         ''' Function to receive data from running processes.
@@ -185,7 +204,7 @@ class parseFastq(object):
             except EOFError:
                 raise IOError('Differing number of data points')
         else:
-            data = data.append(self.read_processes[0][1].recv())
+            data.append(self.read_processes[0][1].recv())
         return(data)
     
     def __read_process_stop(self):
@@ -194,15 +213,12 @@ class parseFastq(object):
         self.process_list is then emptied.
         '''
         # Loop through processes and terminate
-        for process, conn in self.read_processes:
-            # Add termination signal to pipes
-            try:
-                conn.send(None)
-            except IOError:
-                pass
+        for process, receiver in self.read_processes:
+            # Add termination signal to pipes and discard unread data
+            receiver.stop()
             # Join process and close pipes
             process.join()
-            conn.close()
+            receiver.close()
         # Empty process list
         self.read_processes = []
     
@@ -211,18 +227,44 @@ class parseFastq(object):
         will be sent doen the supplied multiprocessing pipe. If self.shell is
         True then gzipped input files will be read using the zcat command in the
         shell. If self.entries is set then only the FASTQ entries at the desired
-        indices will be sent down the pipe. FASTQ entries are generated as three
-        element tuples consisting of: read name, base calls, base qualities.
-        Function takes two arguments:
+        indices will be sent down the pipe, else all entries are sent. FASTQ
+        entries are generated as three element tuples consisting of: read name,
+        base calls, base qualities. Function takes three arguments:
         
         1)  fastq - Full path to the FASTQ file to read
-        2)  pend - End of multiprocessing pipe down which reads will be sent.
+        2)  entries - Reverse sorted list of indices of entries to send.
+        3)  pend - End of multiprocessing pipe down which reads will be sent.
+        
+        If a seekable fastqIndex exists for the FASTQ file, desired entries
+        are read from the index checkpoints preceding them.
         '''
         # Process pipes
         conn1, conn2 = conn
         conn1.close()
-        # Create file handle and subprocess
-        fh, sp = self.__read_handle_create(fastq)
+        sender = fastqPipe.batchSender(conn2, self.batch_size)
+        # Send desired reads using index
+        index = fastqIndex.load_index(fastq)
+        if entries and index and index.seekable:
+            for read in index.read_entries(entries[::-1]):
+                try:
+                    sender.send(read)
+                except StopIteration:
+                    break
+            sender.close()
+            return(None)
+        # Create file handle
+        fh = self.__read_handle_create(fastq)
+        # Send all reads
+        if entries is None:
+            for names, sequences, qualities in fastqParse.FastqBlockIterator(
+                    fh, batch_size = self.batch_size):
+                try:
+                    sender.send_batch(zip(names, sequences, qualities))
+                except StopIteration:
+                    break
+            fh.close()
+            sender.close()
+            return(None)
         # Create count and sort numbers
         count = 0
         nextRead = entries.pop()
@@ -231,7 +273,7 @@ class parseFastq(object):
             if count == nextRead:
                 # Send data or break iteration
                 try:
-                    self.__send(read, conn2)
+                    sender.send(read)
                 except StopIteration:
                     break
                 # Extract next read or break iteration
@@ -241,13 +283,12 @@ class parseFastq(object):
                     break
             count += 1
         # Clean up
-        if sp:
-            sp.terminate()
         fh.close()
-        conn2.close()
+        sender.close()
     
     def sample_reads(
-            self, number, outFastq1, outFastq2=None, sample=None, seed=1234
+            self, number, outFastq1, outFastq2=None, sample=None, seed=1234,
+            level=6
         ):
         ''' Function to sample reads from fastq files and write to output
         fastq file.
@@ -256,8 +297,12 @@ class parseFastq(object):
             outFastq1 (str)- Full path to output fastq file.
             outFastq2 (str)- Full path to paired output fastq file.
             number (int)- Number of reads to extract.
-            sample (int)- Number of reads from which to sample reads.
+            sample (int)- Number of reads from which to sample reads. If
+                not supplied the first 'number' reads are extracted. To
+                sample from all reads, without a prior read count, use
+                reservoir_reads or fraction_reads.
             seed (int)- Seed for random number generator
+            level (int)- Compression level for gzipped output.
         
         '''
         # Check output fastq files
@@ -286,22 +331,185 @@ class parseFastq(object):
             )
             process.start()
             conn[1].close()
-            self.read_processes.append((process, conn[0]))
+            self.read_processes.append(
+                (process, fastqPipe.batchReceiver(conn[0])))
         # Create processes to write output reads
         count = 0
-        with writeFastq(outFastq1, outFastq2, self.shell) as fastqOut:
+        with writeFastq(outFastq1, outFastq2, self.shell,
+            self.batch_size, self.threads, level) as fastqOut:
             while True:
                 try:
                     data = self.__read_processes_recv()
                 except EOFError:
                     break
                 count += 1
-                fastqOut.write(data)
+                fastqOut.write(data if self.pair else data[0])
         # Clean up
         self.__read_process_stop()
         # Raise error if desired number of reads not extracted
         if count != number:
             raise IOError('Not all desired reads extracted')
+    
+    def reservoir_reads(
+            self, number, outFastq1, outFastq2=None, seed=1234, level=6
+        ):
+        ''' Function to randomly sample reads from fastq files in a single
+        pass, without prior knowledge of the number of reads, and write them
+        to output fastq files. Paired reads are sampled together and at most
+        'number' reads, or read pairs, are held in memory.
+        
+        Args:
+            number (int)- Number of reads to extract.
+            outFastq1 (str)- Full path to output fastq file.
+            outFastq2 (str)- Full path to paired output fastq file.
+            seed (int)- Seed for random number generator.
+            level (int)- Compression level for gzipped output.
+        
+        Returns:
+            total (int)- Number of reads, or read pairs, sampled from.
+        
+        Raises:
+            ValueError - If paired read names differ.
+            IOError - If input contains fewer than 'number' reads.
+        
+        '''
+        # Check output fastq files
+        if self.pair:
+            if outFastq2 is None:
+                raise ValueError('No output file for 2nd fastq input')
+        else:
+            if not outFastq2 is None:
+                raise ValueError('No 2nd output file required')
+        # Create pipes and processes to extract all reads
+        for fastq in self.fastq_list:
+            conn = multiprocessing.Pipe(True)
+            process = multiprocessing.Process(
+                target = self.__sample_read_process,
+                args = (fastq, None, conn)
+            )
+            process.start()
+            conn[1].close()
+            self.read_processes.append(
+                (process, fastqPipe.batchReceiver(conn[0])))
+        # Add reads to reservoir, checking read names of pairs
+        sampler = fastqSample.reservoirSampler(number, seed)
+        while True:
+            try:
+                data = self.__read_processes_recv()
+            except EOFError:
+                break
+            if self.pair and (fastqSample.read_name(data[0][0]) !=
+                fastqSample.read_name(data[1][0])):
+                self.__read_process_stop()
+                raise ValueError('Read {} name error'.format(
+                    sampler.count + 1))
+            sampler.add(data)
+        self.__read_process_stop()
+        if sampler.count < number:
+            raise IOError('Not all desired reads extracted')
+        # Write sampled reads
+        with writeFastq(outFastq1, outFastq2, self.shell,
+            self.batch_size, self.threads, level) as fastqOut:
+            for data in sampler.sample():
+                fastqOut.write(data if self.pair else data[0])
+        return(sampler.count)
+    
+    def __fraction_read_process(
+            self, fastq, outFastq, fraction, seed, level, conn
+        ):
+        ''' Function to generate a process to write reads from a FASTQ file
+        selected using the hash of the read name.
+        
+        Args:
+            fastq (str)- Full path to the FASTQ file to read.
+            outFastq (str)- Full path to output fastq file.
+            fraction (float)- Fraction of reads to select.
+            seed (int)- Seed for read name hash.
+            level (int)- Compression level for gzipped output.
+            conn - Multiprocessing pipe down which counts will be sent.
+        
+        Sends:
+            selected (int)- Number of selected reads.
+            total (int)- Number of reads.
+        
+        '''
+        # Process pipes
+        conn[0].close()
+        # Loop through reads and write selected reads
+        selected = total = 0
+        fh = self.__read_handle_create(fastq)
+        with writeFastq(outFastq, None, self.shell, self.batch_size,
+            self.threads, level) as fastqOut:
+            for read in FastqGeneralIterator(fh):
+                total += 1
+                if fastqSample.hash_select(read[0], fraction, seed):
+                    selected += 1
+                    fastqOut.write(read)
+        fh.close()
+        # Send counts
+        conn[1].send((selected, total))
+        conn[1].close()
+    
+    def fraction_reads(
+            self, fraction, outFastq1, outFastq2=None, seed=1234, level=6
+        ):
+        ''' Function to sample a fraction of reads from fastq files and write
+        to output fastq files. Reads are selected using a seeded hash of the
+        read name, with any '/1' or '/2' suffix removed, so each fastq file
+        is sampled independently in a separate process while selecting the
+        same read pairs.
+        
+        Args:
+            fraction (float)- Fraction of reads to extract.
+            outFastq1 (str)- Full path to output fastq file.
+            outFastq2 (str)- Full path to paired output fastq file.
+            seed (int)- Seed for read name hash.
+            level (int)- Compression level for gzipped output.
+        
+        Returns:
+            selected (int)- Number of reads, or read pairs, extracted.
+        
+        Raises:
+            IOError - If differing numbers of reads are extracted from paired
+                fastq files.
+        
+        '''
+        # Check arguments
+        if not 0 <= fraction <= 1:
+            raise ValueError('fraction must be between 0 and 1')
+        if self.pair:
+            if outFastq2 is None:
+                raise ValueError('No output file for 2nd fastq input')
+            outFastqList = [outFastq1, outFastq2]
+        else:
+            if not outFastq2 is None:
+                raise ValueError('No 2nd output file required')
+            outFastqList = [outFastq1]
+        # Create processes to sample each fastq file
+        processList = []
+        for fastq, outFastq in zip(self.fastq_list, outFastqList):
+            conn = multiprocessing.Pipe(False)
+            process = multiprocessing.Process(
+                target = self.__fraction_read_process,
+                args = (fastq, outFastq, fraction, seed, level, conn)
+            )
+            process.start()
+            conn[1].close()
+            processList.append((process, conn[0]))
+        # Receive counts and check pairing
+        counts = []
+        for process, conn in processList:
+            try:
+                counts.append(conn.recv())
+            except EOFError:
+                counts.append(None)
+            process.join()
+            conn.close()
+        if None in counts:
+            raise IOError('Fraction sampling failed')
+        if len(set(counts)) != 1:
+            raise IOError('Paired fastq files produced differing samples')
+        return(counts[0][0])
 
     def __check_name_process(self, fastq, conn):
         ''' Function to generate a process to read FASTQ files and extract read
@@ -319,22 +527,21 @@ class parseFastq(object):
         # Process pipes
         conn1, conn2 = conn
         conn1.close()
+        sender = fastqPipe.batchSender(conn2, self.batch_size)
         # Loop through fastq files
-        fh, sp = self.__read_handle_create(fastq)
+        fh = self.__read_handle_create(fastq)
         for read in FastqGeneralIterator(fh):
             # Extract read
             name, other = read[0].split(None, 1)
             number = other.split(':', 1)[0]
             # Send data or break iteration
             try:
-                self.__send((name, number), conn2)
+                sender.send((name, number))
             except StopIteration:
                 break
         # Clean up
-        if sp:
-            sp.terminate()
         fh.close()
-        conn2.close()
+        sender.close()
     
     def check_names(self):
         ''' Arguments check fastq files and returns count of reads.
@@ -347,6 +554,12 @@ class parseFastq(object):
             count (int) - Number of reads in each FASTQ file.
         
         '''
+        # Check shards in parallel
+        if self.processes > 1:
+            shards = self.__shards()
+            if len(shards) > 1:
+                return(sum(fastqShard.map_shards(_check_names_shard, shards,
+                    self.processes)))
         # Loop through fastq files:
         for fastq in self.fastq_list:
             # Create pipe and process
@@ -358,7 +571,8 @@ class parseFastq(object):
             process.start()
             conn[1].close()
             # Store process data
-            self.read_processes.append((process, conn[0]))
+            self.read_processes.append(
+                (process, fastqPipe.batchReceiver(conn[0])))
         # Extract data and count reads
         count = 0
         while True:
@@ -376,62 +590,74 @@ class parseFastq(object):
                     raise ValueError('Read {} name error'.format(count))
             # Check read number for single fastq
             else:
-                if data[0][1] != 1:
-                    self.close()
+                if data[0][1] != '1':
+                    self.__read_process_stop()
                     raise ValueError('Read {} name error'.format(count))
         # Stop read processes and return count
         self.__read_process_stop()
         return(count)
     
-    def __interleave_read_process(self, fastq, conn):
-        ''' Function to generate a process to read FASTQ files and extract read
-        name and number.
+    def screen_reads(
+            self, references, k = 25, threshold = 0.1, fraction = 1.0,
+            seed = 1234, outJson = None
+        ):
+        ''' Function screens reads for contamination by the sequences of
+        reference FASTA files, such as adapter dimers, PhiX or other
+        species, and counts overrepresented sequences. Reads are sampled
+        using a seeded hash of the read name and screened in batches by
+        fastqScreen.kmerScreen. Each fastq file is split into shards by
+        fastqShard and screened by self.processes processes, with read1 and
+        read2 of paired files screened as separate reads.
         
         Args:
-            fastq (str)- Full path to the FASTQ file to read
-            pend - End of multiprocessing pipe down which data will be sent.
+            references - List of full paths to reference FASTA files, or a
+                dictionary of names and full paths, or a
+                fastqScreen.kmerScreen object.
+            k (int)- Length of k-mers.
+            threshold (float)- Minimum fraction of the k-mers of a read
+                found in a reference for the read to hit the reference.
+            fraction (float)- Fraction of reads to screen.
+            seed (int)- Seed for read name hash.
+            outJson (str)- Full path to JSON file in which to write a
+                summary of the screen.
         
-        Sends:
-            name (str)- Read name
-            number (int)- Read number
+        Returns:
+            stats - fastqScreen.screenStats object.
         
         '''
-        # Process pipes
-        conn1, conn2 = conn
-        conn1.close()
-        # Loop through fastq files
-        fh, sp = self.__read_handle_create(fastq)
-        for read in FastqGeneralIterator(fh):
-            # Extract read name and number
-            name, other = read[0].split(None, 1)
-            number = other.split(':', 1)[0]
-            # Add label to read name
-            read = (
-                '{}:{} {}'.format(name, number, other),
-                read[1],
-                read[2]
-            )
-            # Send data or break iteration
-            try:
-                self.__send((name, number, read), conn2)
-            except StopIteration:
-                break
-        # Clean up
-        if sp:
-            sp.terminate()
-        fh.close()
-        conn2.close()
+        if isinstance(references, fastqScreen.kmerScreen):
+            screen = references
+        else:
+            screen = fastqScreen.kmerScreen(references, k, threshold)
+        # Shard fastq files independently as pairing is not required
+        shards = []
+        for fastq in self.fastq_list:
+            shards.extend([(shard,) for shard in fastqShard.plan_shards(
+                fastq, self.processes * 2 if self.processes > 1 else 1)])
+        stats = fastqScreen.screen_shards(shards, screen, fraction, seed,
+            self.processes)
+        if outJson:
+            stats.write(outJson)
+        return(stats)
     
     def interleave_reads(
-            self, outFastq
+            self, outFastq, level = 6, normaliser = 'illumina'
         ):
         ''' Function interleaves paired fastq files into a single fastq
-        file.
+        file, appending ':1' and ':2' to the names of read1 and read2.
+        Read names are checked while the output is written to a temporary
+        file, which replaces outFastq only if all read names match and read
+        numbers are 1 and 2. Otherwise the temporary file is deleted and
+        a ValueError reporting the first incorrect pair is raised.
         
         Args:
-            label (bool)- Add ':1' label to read1 name and ':2' label to
-                read2 name.
-            check_pairs (bool)- Check read pairing prior to interleaving.
+            outFastq (str)- Full path to output fastq file.
+            level (int)- Compression level for gzipped output. Low levels
+                are faster and suited to intermediate files.
+            normaliser - Name of a fastqNames normaliser, 'illumina' for
+                'name 1:N:0:1' headers, 'slash' for 'name/1' headers or
+                'auto' for either, or a function returning the read name and
+                read number of a header.
         
         Returns:
             count (int)- Number of paired reads processed
@@ -440,154 +666,193 @@ class parseFastq(object):
         # Check paired fastq files are present
         if not self.pair:
             raise ValueError('Paired fastq files required')
-        # Check pairing if required
-        self.check_names()
-        # Loop through fastq files:
-        for fastq in self.fastq_list:
-            # Create pipe and process
-            conn = multiprocessing.Pipe(True)
-            process = multiprocessing.Process(
-                target = self.__interleave_read_process,
-                args = (fastq, conn)
-            )
-            process.start()
-            conn[1].close()
-            # Store process data
-            self.read_processes.append((process, conn[0]))
-        # Extract data and count reads
-        count = 0
-        with writeFastq(outFastq, None, self.shell) as fastqOut:
-            while True:
-                try:
-                    data = self.__read_processes_recv()
-                except EOFError:
-                    break
-                count += 1
-                # Check names and read number
-                if (data[0][0] != data [1][0]
-                    or data[0][1] != '1'
-                    or data[1][1] != '2'):
-                    self.__read_process_stop()
-                    raise ValueError('Read {} name error'.format(count))
-                # Write output fastq:
-                fastqOut.write(data[0][2])
-                fastqOut.write(data[1][2])
-        # Stop read processes and return count
-        self.__read_process_stop()
+        # Check names and interleave batches of reads
+        handles = [self.__read_handle_create(fastq) for fastq in
+            self.fastq_list]
+        try:
+            with streamio.open_output(outFastq, self.shell, self.threads,
+                level, atomic = True) as outFile:
+                count = fastqJunction.interleave_pairs(
+                    fastqParse.FastqBlockIterator(handles[0],
+                        batch_size = self.batch_size),
+                    fastqParse.FastqBlockIterator(handles[1],
+                        batch_size = self.batch_size),
+                    outFile, normaliser)
+        finally:
+            for handle in handles:
+                handle.close()
         return(count)
     
-    def __interleave_trim_read_process(
-            self, trim, fastq, conn
+    def demultiplex(
+            self, samples, outPrefix, location = 'header', mismatches = 1,
+            index1 = None, index2 = None, level = 6, report = None
         ):
-        ''' Function to trim fastq reads until after supplied sequence.
+        ''' Function to demultiplex single or paired fastq files into
+        gzipped fastq files for each sample using fastqDemultiplex. Paired
+        reads are written to '<outPrefix><sample>_R1.fastq.gz' and
+        '<outPrefix><sample>_R2.fastq.gz', in input order, and unassigned
+        reads to the sample 'Undetermined'.
         
         Args:
-            fastq (str)- Full path to the FASTQ file to read.
-            trim (str)- Sequence after which sequence is trimmed.
-            pend - End of multiprocessing pipe down which data will be sent.
+            samples (list)- Tuples of sample name and barcode, or tuple of
+                index1 and index2 barcodes, as from
+                fastqDemultiplex.read_samples.
+            outPrefix (str)- Prefix of output files.
+            location (str)- Location of barcodes: 'header' for the end of
+                the read1 header, 'index' for the index1 and index2 fastq
+                files or 'inline' for the start of read1 and, for dual
+                indexes, read2. Inline barcodes are removed from the reads.
+            mismatches - Maximum number of mismatches within each barcode,
+                as an integer or a tuple of integers for each index.
+            index1 (str)- Full path to index1 fastq file.
+            index2 (str)- Full path to index2 fastq file.
+            level (int)- Compression level for gzipped output.
+            report (str)- Full path to JSON file in which to write the
+                demultiplexing report.
         
-        Sends:
-            name (str)- Read name
-            number (int)- Read number
+        Returns:
+            report (dict)- Demultiplexing report, with reads per second and
+                the number of reads of each sample and undetermined barcode.
         
         '''
-        # Process pipes
-        conn1, conn2 = conn
-        conn1.close()
-        # Extract numbe for string find adjustment
-        adj = len(trim)
-        # Loop through fastq files
-        fh, sp = self.__read_handle_create(fastq)
-        for read in FastqGeneralIterator(fh):
-            # Extract read data
-            header, sequence, quality = read
-            name, description = header.split(None, 1)
-            number = description.split(':', 1)[0]
-            # Find trim sequence
-            trimLoc = sequence.find(trim)
-            if trimLoc != -1:
-                trimLoc += adj
-                sequence = sequence[:trimLoc]
-                quality = quality[:trimLoc]
-            # Send data or break iteration
-            read = (
-                '{}:{} {}'.format(name, number, description),
-                sequence,
-                quality
-            )
-            try:
-                self.__send((name, number, trimLoc, read), conn2)
-            except StopIteration:
-                break
-        # Clean up
-        if sp:
-            sp.terminate()
-        fh.close()
-        conn2.close()
-
+        # Check index files are present
+        indexes = [index for index in (index1, index2) if index]
+        if (location == 'index') != bool(indexes):
+            raise ValueError('Index fastq files required for, and only '\
+                'for, index barcodes')
+        for fastq in indexes:
+            if not os.path.isfile(fastq):
+                raise IOError('File {} could not be found'.format(fastq))
+        # Demultiplex batches of reads
+        handles = [self.__read_handle_create(fastq) for fastq in
+            self.fastq_list + indexes]
+        try:
+            metrics = fastqDemultiplex.demultiplex(
+                fastqDemultiplex.zip_batches([fastqParse.FastqBlockIterator(
+                    handle, batch_size = self.batch_size) for handle in
+                    handles]),
+                samples, outPrefix, location, mismatches,
+                len(self.fastq_list), max(self.threads, 2), level)
+        finally:
+            for handle in handles:
+                handle.close()
+        if report:
+            fastqDemultiplex.write_report(metrics, report)
+        return(metrics)
+    
     def interleave_trim_reads(
-        self, trim, outFastq, minLength = 20
+        self, trim, outFastq, minLength = 20, level = 6, qc = None
     ):
-        ''' Function interleaves paired fastq files into a single fastq
-        file.
+        ''' Function trims paired reads after the supplied sequence and
+        interleaves them into a single fastq file, discarding pairs in which
+        a trimmed read is shorter than minLength. Reads are trimmed in
+        batches by fastqJunction.trim_pairs.
         
         Args:
-            label (bool)- Add ':1' label to read1 name and ':2' label to
-                read2 name.
-            check_pairs (bool)- Check read pairing prior to interleaving.
+            trim (str)- Sequence after which reads are trimmed.
+            outFastq (str)- Full path to output fastq file.
+            minLength (int)- Minimum length of trimmed reads.
+            level (int)- Compression level for gzipped output. Low levels
+                are faster and suited to intermediate files.
+            qc (str)- Full path to JSON file in which to write quality
+                control statistics of the output reads, generated by
+                fastqQC.qcStats during trimming.
         
         Returns:
-            count (int)- Number of paired reads processed
+            metrics (dict)- Number of read pairs, pairs with a short read
+                and retained pairs in which read1 or read2 were trimmed.
         
         '''
         # Check paired fastq files are present
         if not self.pair:
             raise ValueError('Paired fastq files required')
-        # Loop through fastq files:
-        for fastq in self.fastq_list:
-            # Create pipe and process
-            conn = multiprocessing.Pipe(True)
-            process = multiprocessing.Process(
-                target = self.__interleave_trim_read_process,
-                args = (trim, fastq, conn)
-            )
-            process.start()
-            conn[1].close()
-            # Store process data
-            self.read_processes.append((process, conn[0]))
-        # Extract data and count reads
-        metrics = {'total':0, 'short':0, 'trim1':0, 'trim2':0}
-        with writeFastq(outFastq, None, self.shell) as fastqOut:
-            while True:
-                try:
-                    data = self.__read_processes_recv()
-                except EOFError:
-                    break
-                metrics['total'] += 1
-                # Check names and read number
-                if data[0][0] != data [1][0]:
-                    self.__read_process_stop()
-                    raise ValueError('Read name mismatch')
-                if (data[0][1] != '1'
-                    or data[1][1] != '2'):
-                    self.__read_process_stop()
-                    raise ValueError('Read number error')
-                # Count and skip short reads
-                if (-1 <data[0][2] < minLength
-                    or -1 < data[1][2] < minLength):
-                    metrics['short'] += 1
-                    continue
-                # Write output fastq
-                if data[0][2] != -1:
-                    metrics['trim1'] += 1
-                if data[1][2] != -1:
-                    metrics['trim2'] += 1
-                fastqOut.write(data[0][3])
-                fastqOut.write(data[1][3])
-        # Stop read processes and return count
-        self.__read_process_stop()
+        # Trim shards in parallel and concatenate output
+        if self.processes > 1:
+            shards = self.__shards()
+            if len(shards) > 1:
+                metrics, stats = fastqShard.map_reduce(_trim_shard,
+                    _trim_reduce, list(enumerate(shards)), self.processes,
+                    (trim, minLength, outFastq, level, bool(qc)))
+                fastqShard.concatenate_files([fastqShard.shard_output(
+                    outFastq, number) for number in range(len(shards))],
+                    outFastq)
+                if qc:
+                    fastqQC.write_stats(stats, qc)
+                return(metrics)
+        # Trim and interleave batches of reads
+        with streamio.open_output(outFastq, self.shell, self.threads,
+            level) as outFile:
+            return(self.__trim_pairs(outFile, trim, minLength, qc))
+    
+    def __trim_pairs(self, outFile, trim, minLength, qc):
+        ''' Function to trim and interleave batches of paired reads,
+        writing the output to an open file and writing any quality control
+        statistics to the JSON file qc.
+        '''
+        stats = [fastqQC.qcStats(), fastqQC.qcStats()] if qc else None
+        handles = [self.__read_handle_create(fastq) for fastq in
+            self.fastq_list]
+        try:
+            metrics = fastqJunction.trim_pairs(
+                fastqParse.FastqBlockIterator(handles[0],
+                    batch_size = self.batch_size),
+                fastqParse.FastqBlockIterator(handles[1],
+                    batch_size = self.batch_size),
+                trim, outFile, minLength, stats)
+        finally:
+            for handle in handles:
+                handle.close()
+        if stats:
+            fastqQC.write_stats(stats, qc)
         return(metrics)
     
+    def stream_trim_reads(
+        self, trim, command, minLength = 20, fifo = False, tee = None,
+        level = 1, qc = None, log = None, timeout = 60
+    ):
+        ''' Function trims and interleaves paired reads, as
+        interleave_trim_reads, streaming the uncompressed output directly
+        into a command, such as an aligner, rather than to an intermediate
+        file. The command reads its input from stdin, or from a named pipe
+        if fifo is True, with '{input}' in the command replaced by '-' or
+        the path of the named pipe. Reads are trimmed in a single process,
+        as reads must reach the command in order.
+        
+        Args:
+            trim (str)- Sequence after which reads are trimmed.
+            command - Command as a string, run by the shell, or list, such
+                as from fastqAlign.bwaMemAlign with read1 '{input}' and
+                interleaved True.
+            minLength (int)- Minimum length of trimmed reads.
+            fifo (bool)- Whether to stream reads through a named pipe.
+            tee (str)- Full path to fastq file in which to keep a copy of
+                the trimmed reads.
+            level (int)- Compression level of a gzipped tee file.
+            qc (str)- Full path to JSON file in which to write quality
+                control statistics of the output reads.
+            log (str)- Full path to file in which to write the stderr of
+                the command.
+            timeout (int)- Seconds to wait for the command to open the
+                named pipe, such as while an aligner loads its index. If
+                None, wait while the command is running.
+        
+        Returns:
+            metrics (dict)- Number of read pairs, pairs with a short read
+                and retained pairs in which read1 or read2 were trimmed.
+        
+        Raises:
+            IOError - If the command fails or stops reading its input, in
+                which case the command is killed and no tee file written.
+        
+        '''
+        # Check paired fastq files are present
+        if not self.pair:
+            raise ValueError('Paired fastq files required')
+        # Trim and interleave batches of reads into command
+        with streamio.open_process(command, fifo, tee, self.shell,
+            self.threads, level, log, timeout) as outFile:
+            return(self.__trim_pairs(outFile, trim, minLength, qc))
+    
 class writeFastq(object):
     ''' An object that uses multiprocessing processes to parralelize the
     writing of FASTQ files. It assumes that the fastq files to write will
@@ -596,15 +861,28 @@ class writeFastq(object):
     therefore added by the write function.
     '''
     
-    def __init__(self, fastq1, fastq2 = None, shell = True):
-        ''' Function to initialise object. Function takes three arguments:
+    def __init__(
+        self, fastq1, fastq2 = None, shell = True, batch_size = 10000,
+        threads = 1, level = 6
+    ):
+        ''' Function to initialise object. Function takes six arguments:
         
         1)  fastq1 - Full path to FASTQ file.
         2)  fastq2 - Full path to paired FASTQ file (optional).
         3)  shell - Boolean indicating whether to use shell gzip command
             to write gzipped output.
+        4)  batch_size - Number of reads sent to the writing processes in
+            each message.
+        5)  threads - Number of threads used to compress each gzipped
+            output file. If greater than 1 output is written as BGZF.
+        6)  level - Compression level between 1 and 9 for gzipped output.
         
         '''
+        # Check compression arguments
+        if not isinstance(threads, int) or threads < 1:
+            raise ValueError('threads must be an integer >= 1')
+        if not isinstance(level, int) or not 1 <= level <= 9:
+            raise ValueError('level must be an integer between 1 and 9')
         # Store fastq files
         if not fastq2 is None:
             self.fastq_list = [fastq1, fastq2]
@@ -619,12 +897,17 @@ class writeFastq(object):
                 raise IOError('Could not find output directory')
         # Store shell argument and process list
         self.shell = shell
+        self.batch_size = batch_size
+        self.threads = threads
+        self.level = level
         self.process_list = []
     
     def __write_process(self, fastq, conn):
         ''' Function to generate a process to write FASTQ files. FASTQ reads
         received from the multiprocessing pipe will be written to file. Receipt
-        of None will cause the termination of the process. If self.shell is True
+        of None will cause the termination of the process. If self.threads is
+        greater than 1 then gzipped output files will be written as BGZF
+        using a pgzip.parallelGzipWriter. Otherwise, if self.shell is True
         then gzipped output files will be written using the gzip command in the
         shell. Funcion takes two arguments:
         
@@ -633,36 +916,24 @@ class writeFastq(object):
             extracted.
         '''
         # Process connections
-        conn[1].close
-        # Write gzip file using shell
-        if self.shell and fastq.endswith('.gz'):
-            # Create process
-            command = 'gzip -c > %s' %(fastq)
-            sp = subprocess.Popen(command, shell=True,
-                stdin = subprocess.PIPE)
-            fh = sp.stdin
-        # Write file using python
-        elif fastq.endswith('.gz'):
-            sp = None
-            fh = gzip.open(fastq, 'w')
-        else:
-            sp = None
-            fh = open(fastq, 'w')
-        # Extract reads from pipe and write to file
+        conn[1].close()
+        receiver = fastqPipe.batchReceiver(conn[0])
+        # Open output file
+        fh = streamio.open_output(fastq, self.shell, self.threads, self.level)
+        # Extract batches of reads from pipe and write to file
         while True:
-            # Extract read
-            read = conn[0].recv()
-            # Break loop if read is none
-            if read is None:
+            # Extract batch of reads or break loop
+            try:
+                reads = receiver.recv_batch()
+            except EOFError:
                 break
-            # Write read to file
-            readString = '@{}\n{}\n+\n{}\n'.format(read[0], read[1], read[2])
-            fh.write(readString)
-        # Close files, pipes and subprocesses
+            # Write reads and batches of reads to file
+            fh.write(''.join([read.fastq() if isinstance(read,
+                fastqBatch.readBatch) else '@%s\n%s\n+\n%s\n' %(read)
+                for read in reads]))
+        # Close files and pipes
         fh.close()
-        if sp:
-            sp.communicate()
-        conn[0].close()
+        receiver.close()
     
     def start(self):
         ''' Function creates processes to write the FASTQ files listed in
@@ -684,7 +955,8 @@ class writeFastq(object):
             process.start()
             conn[0].close()
             # Store pipe end and processes
-            self.process_list.append((process, conn[1]))
+            self.process_list.append(
+                (process, fastqPipe.batchSender(conn[1], self.batch_size)))
     
     def close(self):
         ''' Function terminates the processes and closes the pipe-ends
@@ -692,18 +964,17 @@ class writeFastq(object):
         self.process_list is then emptied.
         '''
         # Extract process and pipes
-        for process, conn in self.process_list:
-            # Add poisin pill, join process and close pipe
+        for process, sender in self.process_list:
+            # Send remaining reads, close pipe and join process
             try:
-                conn.send(None)
+                sender.close()
             except IOError:
                 pass
             process.join()
-            conn.close()
         # Clear pipe and process list
         self.process_list = []
     
-    def __pipe_send(self, read, conn):
+    def __pipe_send(self, read, sender):
         ''' Function to send a FASTQ read down a multiprocessing pipe. If
         the read does not correspond to the expected format all active
         processes are terminated and an IOError is raised. Function takes
@@ -711,12 +982,12 @@ class writeFastq(object):
         
         1)  read - FASTQ read. This should consist of a tuple/list of
             three elements: read name, sequence, quality string.
-        2)  pend - End of multiprocessing pipe down which read should be
-            sent.
+        2)  sender - fastqPipe.batchSender for the pipe down which read
+            should be sent.
         '''
         # Add read1 to pipe
         if isinstance(read, (tuple,list)) and len(read) == 3:
-            conn.send(read)
+            sender.send(tuple(read))
         else:
             self.close()
             raise IOError('Read must be a list/tuple of three elements')
@@ -744,6 +1015,27 @@ class writeFastq(object):
             # Send read to pipe
             self.__pipe_send(reads, self.process_list[0][1])
     
+    def write_batch(self, batches):
+        ''' Function to write batches of reads to the FASTQ files. Batches
+        are serialised by fastqBatch and sent to the writing processes
+        immediately.
+        
+        Args:
+            batches - A fastqBatch.readBatch for single FASTQ files or a
+                tuple/list of two readBatch objects, of equal length, for
+                paired FASTQ files.
+        
+        '''
+        if not self.pair:
+            batches = [batches]
+        if (len(batches) != len(self.process_list) or
+            len(set(len(batch) for batch in batches)) != 1):
+            self.close()
+            raise IOError('Write requires a batch for each FASTQ file')
+        for batch, (process, sender) in zip(batches, self.process_list):
+            sender.send(batch)
+            sender.flush()
+    
     def __enter__(self):
         ''' Start processes upon entry into with scope '''
         self.start()
@@ -752,3 +1044,55 @@ class writeFastq(object):
     def __exit__(self, type, value, traceback):
         ''' Terminate processes upon exit of with scope '''
         self.close()
+
+def benchmark_stream(
+        fastq1, fastq2, trim, command, minLength = 20, threads = 1,
+        level = 1
+    ):
+    ''' Function to compare the time taken to trim paired reads into a
+    gzipped intermediate file, which is then decompressed into a command,
+    with that taken to stream trimmed reads directly into the command.
+
+    Args:
+        fastq1 (str)- Full path to read1 fastq file.
+        fastq2 (str)- Full path to read2 fastq file.
+        trim (str)- Sequence after which reads are trimmed.
+        command (str)- Shell command reading interleaved reads from
+            '{input}', such as an aligner or 'cat {input} > /dev/null'.
+        minLength (int)- Minimum length of trimmed reads.
+        threads (int)- Number of threads used for compression.
+        level (int)- Compression level of the intermediate file.
+
+    Returns:
+        metrics (dict)- Dictionary where the key is 'file' or 'stream' and
+            the value is a dictionary of the time taken in seconds and the
+            bytes written to, and read from, an intermediate file.
+
+    Raises:
+        IOError - If the command fails.
+
+    '''
+    directory = tempfile.mkdtemp()
+    metrics = {}
+    try:
+        parser = parseFastq(fastq1, fastq2, threads = threads)
+        # Time trimming to an intermediate file
+        intermediate = os.path.join(directory, 'trimmed.fastq.gz')
+        start = time.time()
+        parser.interleave_trim_reads(trim, intermediate, minLength, level)
+        decompress = subprocess.Popen(['gzip', '-dc', intermediate],
+            stdout = subprocess.PIPE)
+        consumer = subprocess.Popen(command.replace('{input}', '-'),
+            shell = True, stdin = decompress.stdout)
+        decompress.stdout.close()
+        if consumer.wait() or decompress.wait():
+            raise IOError('Command {} failed'.format(command))
+        metrics['file'] = {'seconds': time.time() - start,
+            'bytes': 2 * os.path.getsize(intermediate)}
+        # Time streaming
+        start = time.time()
+        parser.stream_trim_reads(trim, command, minLength)
+        metrics['stream'] = {'seconds': time.time() - start, 'bytes': 0}
+    finally:
+        shutil.rmtree(directory)
+    return(metrics)
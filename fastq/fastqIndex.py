@@ -0,0 +1,395 @@
+''' Functions and classes to build and use random access indices of FASTQ
+files. An index stores the number of records in a FASTQ file and a
+checkpoint for every Nth record, consisting of the record's offset in the
+decompressed file and, for gzip files, the offset of the gzip member in
+which the record starts. Indices are stored as JSON in a sidecar file with
+the suffix '.fqi'.
+
+For BGZF and multi-member gzip files, decompression may begin at the member
+containing a checkpoint. Storing the zlib window to resume decompression
+within a member requires inflateSetDictionary and inflatePrime, which are
+not exposed by the python zlib module, so single-member gzip files must be
+decompressed from their start and index checkpoints only avoid parsing of
+the skipped records.
+'''
+import bisect
+import json
+import os
+import zlib
+from ngs_python.fastq import fastqParse
+from ngs_python.system import pgzip, streamio
+
+INDEX_SUFFIX = '.fqi'
+INDEX_VERSION = 1
+
+def decompressed_pieces(path, compression, start = 0, chunk_size = 1048576):
+    ''' Generator returning the decompressed contents of a file in pieces.
+    Each piece of a gzip file lies within a single gzip member.
+
+    Args:
+        path (str)- Full path to file.
+        compression (str)- Compression of file: 'gzip', 'bzip2' or None.
+        start (int)- Offset of the first gzip member to decompress.
+        chunk_size (int)- Number of bytes read at once.
+
+    Returns:
+        piece (str)- Decompressed data.
+        member (int)- Offset of the gzip member containing the data or
+            None for other files.
+
+    Raises:
+        IOError - If the gzip file is truncated or cannot be decompressed.
+
+    '''
+    # Return plain and bzip2 files
+    if compression != 'gzip':
+        with streamio.streamReader(path, chunk_size = chunk_size) as inFile:
+            for piece in iter(lambda: inFile.read(chunk_size), ''):
+                yield(piece, None)
+        return
+    # Return individual gzip members
+    with open(path, 'rb') as inFile:
+        inFile.seek(start)
+        consumed = start
+        decompressor = None
+        for block in iter(lambda: inFile.read(chunk_size), ''):
+            while block:
+                if decompressor is None:
+                    decompressor = zlib.decompressobj(31)
+                    member = consumed
+                try:
+                    piece = decompressor.decompress(block)
+                except zlib.error as error:
+                    raise IOError('Decompression of {} failed: {}'.format(
+                        path, error))
+                if piece:
+                    yield(piece, member)
+                unused = decompressor.unused_data
+                consumed += len(block) - len(unused)
+                if unused:
+                    decompressor = None
+                block = unused
+        if decompressor is not None and not pgzip.stream_ended(decompressor):
+            raise IOError('Unexpected end of file {}'.format(path))
+
+def index_path(fastq):
+    ''' Function returns the path of the index of a FASTQ file '''
+    return(fastq + INDEX_SUFFIX)
+
+def build_index(fastq, interval = 100000, path = None, save = True):
+    ''' Function to build and save an index of a FASTQ file. The FASTQ file
+    must consist of four line records.
+
+    Args:
+        fastq (str)- Full path to FASTQ file.
+        interval (int)- Number of records between checkpoints.
+        path (str)- Full path to index file. Defaults to the FASTQ path with
+            the suffix '.fqi'.
+        save (bool)- Whether to save the index to file.
+
+    Returns:
+        index - fastqIndex object.
+
+    Raises:
+        ValueError - If the FASTQ file does not consist of four line records.
+
+    '''
+    # Check arguments
+    if not isinstance(interval, int):
+        raise TypeError('interval must be integer')
+    if interval < 1:
+        raise ValueError('interval must be >= 1')
+    stat = os.stat(fastq)
+    compression = streamio.detect_compression(fastq)
+    # Create variables to store positions
+    checkpoints = []
+    lines = 0
+    offset = 0
+    target = 0
+    last = '\n'
+    pending = True
+    current = None
+    # Loop through decompressed data
+    for piece, member in decompressed_pieces(fastq, compression):
+        # Store offset of the start of each member
+        if member is None:
+            member = 0
+        if member != current:
+            current = member
+            member_start = offset
+        # Store checkpoint at start of piece
+        if pending:
+            if piece[0] != '@':
+                raise ValueError('Record {} does not start with @'.format(
+                    target // 4))
+            checkpoints.append([target // 4, offset, member,
+                offset - member_start])
+            target += interval * 4
+            pending = False
+        # Store checkpoints within piece
+        newlines = piece.count('\n')
+        found = 0
+        position = -1
+        while lines + newlines >= target:
+            while found < target - lines:
+                position = piece.find('\n', position + 1)
+                found += 1
+            start = position + 1
+            if start == len(piece):
+                pending = True
+                break
+            if piece[start] != '@':
+                raise ValueError('Record {} does not start with @'.format(
+                    target // 4))
+            checkpoints.append([target // 4, offset + start, member,
+                offset + start - member_start])
+            target += interval * 4
+        # Update counts and offsets
+        lines += newlines
+        offset += len(piece)
+        last = piece[-1]
+    # Check and count records
+    if last != '\n':
+        lines += 1
+    if lines % 4:
+        raise ValueError('FASTQ file does not consist of four line records')
+    # Create, save and return index
+    index = fastqIndex(fastq, {
+        'version': INDEX_VERSION,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'compression': compression,
+        'interval': interval,
+        'count': lines // 4,
+        'checkpoints': checkpoints
+    })
+    if save:
+        index.save(path)
+    return(index)
+
+def load_index(fastq, path = None):
+    ''' Function to load the index of a FASTQ file.
+
+    Args:
+        fastq (str)- Full path to FASTQ file.
+        path (str)- Full path to index file. Defaults to the FASTQ path with
+            the suffix '.fqi'.
+
+    Returns:
+        index - fastqIndex object or None if the index does not exist or
+            does not match the size and modification time of the FASTQ file.
+
+    '''
+    if path is None:
+        path = index_path(fastq)
+    if not os.path.isfile(path):
+        return(None)
+    with open(path) as inFile:
+        try:
+            data = json.load(inFile)
+        except ValueError:
+            return(None)
+    # Check index matches FASTQ file
+    stat = os.stat(fastq)
+    if (data.get('version') != INDEX_VERSION
+        or data.get('size') != stat.st_size
+        or data.get('mtime') != stat.st_mtime):
+        return(None)
+    return(fastqIndex(fastq, data))
+
+class indexReader(object):
+    ''' Class generates a file-like object to read a FASTQ file from a
+    checkpoint of a fastqIndex.
+    '''
+
+    def __init__(self, fastq, compression, checkpoint):
+        ''' Function to initialise indexReader object.
+
+        Args:
+            fastq (str)- Full path to FASTQ file.
+            compression (str)- Compression of file: 'gzip', 'bzip2' or None.
+            checkpoint (list)- Record number, decompressed offset, member
+                offset and offset within member of the checkpoint.
+
+        '''
+        record, offset, member, skip = checkpoint
+        # Seek within plain files
+        if compression is None:
+            self.pieces = None
+            self.handle = open(fastq, 'rb')
+            self.handle.seek(offset)
+            return
+        # Decompress from start of member and skip data
+        self.handle = None
+        self.pieces = decompressed_pieces(fastq, compression, member,
+            65536)
+        self.buffer = ''
+        while skip:
+            piece = next(self.pieces, ('', None))[0]
+            if not piece:
+                raise IOError('Checkpoint beyond end of {}'.format(fastq))
+            if len(piece) > skip:
+                self.buffer = piece[skip:]
+                break
+            skip -= len(piece)
+
+    def read(self, size = -1):
+        ''' Function to read data from the file.
+
+        Args:
+            size (int)- Number of bytes to read. If negative all remaining
+                data is returned.
+
+        Returns:
+            data (str)- Data read from file.
+
+        '''
+        if self.handle:
+            return(self.handle.read(size))
+        parts = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            piece = next(self.pieces, ('', None))[0]
+            if not piece:
+                break
+            parts.append(piece)
+            length += len(piece)
+        data = ''.join(parts)
+        if 0 <= size < length:
+            self.buffer = data[size:]
+            return(data[:size])
+        self.buffer = ''
+        return(data)
+
+    def close(self):
+        ''' Function to close the file '''
+        if self.handle:
+            self.handle.close()
+        else:
+            self.pieces.close()
+            self.buffer = ''
+
+class fastqIndex(object):
+    ''' Class provides random access to the records of a FASTQ file using
+    an index generated by build_index.
+    '''
+
+    def __init__(self, fastq, data):
+        ''' Function to initialise fastqIndex object.
+
+        Args:
+            fastq (str)- Full path to FASTQ file.
+            data (dict)- Index data.
+
+        '''
+        self.fastq = fastq
+        self.data = data
+        self.count = data['count']
+        self.interval = data['interval']
+        self.compression = data['compression']
+        self.checkpoints = data['checkpoints']
+        self.records = [checkpoint[0] for checkpoint in self.checkpoints]
+        # Checkpoints are seekable for plain and multi-member gzip files
+        self.seekable = self.compression is None or (
+            self.compression == 'gzip' and
+            len(set(checkpoint[2] for checkpoint in self.checkpoints)) > 1)
+
+    def save(self, path = None):
+        ''' Function to save index to file.
+
+        Args:
+            path (str)- Full path to index file. Defaults to the FASTQ path
+                with the suffix '.fqi'.
+
+        '''
+        if path is None:
+            path = index_path(self.fastq)
+        with open(path, 'w') as outFile:
+            json.dump(self.data, outFile)
+
+    def checkpoint(self, record):
+        ''' Function to return the last checkpoint at or before a record.
+
+        Args:
+            record (int)- Record number.
+
+        Returns:
+            checkpoint (list)- Record number, decompressed offset, member
+                offset and offset within member of the checkpoint.
+
+        Raises:
+            IndexError - If record is not within the FASTQ file.
+
+        '''
+        if not 0 <= record < self.count:
+            raise IndexError('Record {} not in {}'.format(record, self.fastq))
+        return(self.checkpoints[bisect.bisect_right(self.records, record) - 1])
+
+    def read_records(
+            self, start = 0, stop = None, block_size = 262144,
+            batch_size = 1000
+        ):
+        ''' Generator returning FASTQ records from record 'start' up to, but
+        not including, record 'stop'. Records are returned as three element
+        tuples of read name, sequence and quality.
+
+        Args:
+            start (int)- Number of first record.
+            stop (int)- Number of record after last record. Defaults to the
+                end of the file.
+            block_size (int)- Number of bytes parsed at once.
+            batch_size (int)- Maximum number of records parsed at once.
+
+        '''
+        if stop is None or stop > self.count:
+            stop = self.count
+        if start >= stop:
+            return
+        checkpoint = self.checkpoint(start)
+        reader = indexReader(self.fastq, self.compression, checkpoint)
+        record = checkpoint[0]
+        try:
+            for names, sequences, qualities in fastqParse.FastqBlockIterator(
+                    reader, block_size, batch_size):
+                # Skip records before start
+                if record + len(names) <= start:
+                    record += len(names)
+                    continue
+                first = max(start - record, 0)
+                last = min(stop - record, len(names))
+                for index in xrange(first, last):
+                    yield((names[index], sequences[index], qualities[index]))
+                record += len(names)
+                if record >= stop:
+                    break
+        finally:
+            reader.close()
+
+    def read_entries(self, entries):
+        ''' Generator returning FASTQ records at sorted record numbers. Data
+        is read from the checkpoint preceding each entry unless the entry is
+        within the current checkpoint interval.
+
+        Args:
+            entries (list)- Sorted list of record numbers.
+
+        '''
+        index = 0
+        while index < len(entries):
+            # Find entries sharing the next checkpoint interval
+            start = entries[index]
+            checkpoint = bisect.bisect_right(self.records, start)
+            if checkpoint < len(self.records):
+                limit = self.records[checkpoint]
+            else:
+                limit = self.count
+            end = bisect.bisect_left(entries, limit, index)
+            selected = entries[index:end]
+            # Return selected records
+            position = 0
+            for record, read in enumerate(self.read_records(
+                    start, selected[-1] + 1), start):
+                if record == selected[position]:
+                    yield(read)
+                    position += 1
+            index = end
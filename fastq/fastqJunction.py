@@ -0,0 +1,270 @@
+''' Functions to interleave paired FASTQ reads and to trim paired reads at
+ligation junctions, such as those generated in HiC experiments. Reads are
+processed in batches generated by fastqParse.FastqBlockIterator: read names
+are checked, junctions identified, reads filtered by length and interleaved
+FASTQ records generated for each batch, which is then written to file in a
+single write.
+'''
+import numpy
+from ngs_python.fastq import fastqNames
+
+def paired_batches(batches1, batches2):
+    ''' Generator returning batches of paired reads containing equal numbers
+    of reads, from two iterables of batches of differing sizes.
+
+    Args:
+        batches1 - Iterable of batches of read1 names, sequences and
+            qualities.
+        batches2 - Iterable of batches of read2 names, sequences and
+            qualities.
+
+    Returns:
+        batch1 (tuple)- Lists of read1 names, sequences and qualities.
+        batch2 (tuple)- Lists of read2 names, sequences and qualities.
+
+    Raises:
+        IOError - If the iterables contain differing numbers of reads.
+
+    '''
+    batches1, batches2 = iter(batches1), iter(batches2)
+    batch1 = batch2 = ([], [], [])
+    while True:
+        # Extract next batches when current batches are exhausted
+        if not batch1[0]:
+            batch1 = next(batches1, None)
+        if not batch2[0]:
+            batch2 = next(batches2, None)
+        if batch1 is None and batch2 is None:
+            return
+        if batch1 is None or batch2 is None:
+            raise IOError('Differing number of data points')
+        # Return reads present in both batches
+        count = min(len(batch1[0]), len(batch2[0]))
+        if count == len(batch1[0]) == len(batch2[0]):
+            yield(batch1, batch2)
+            batch1 = batch2 = ([], [], [])
+            continue
+        yield(tuple(data[:count] for data in batch1),
+            tuple(data[:count] for data in batch2))
+        batch1 = tuple(data[count:] for data in batch1)
+        batch2 = tuple(data[count:] for data in batch2)
+
+def find_junctions(sequences, junction):
+    ''' Function to find the end of the first junction within each sequence.
+
+    Args:
+        sequences (list)- Read sequences.
+        junction (str)- Junction sequence.
+
+    Returns:
+        ends (numpy.array)- Position after the first junction in each
+            sequence or -1 if the junction is absent.
+
+    '''
+    ends = numpy.fromiter((sequence.find(junction) for sequence in
+        sequences), numpy.int64, len(sequences))
+    ends[ends != -1] += len(junction)
+    return(ends)
+
+def split_headers(headers):
+    ''' Function to split FASTQ headers into names and descriptions and
+    extract the read number from the start of the description.
+
+    Args:
+        headers (list)- FASTQ headers.
+
+    Returns:
+        names (list)- Read names.
+        descriptions (list)- Read descriptions.
+        numbers (list)- Read numbers.
+
+    '''
+    split = [header.split(None, 1) for header in headers]
+    names = [name for name, description in split]
+    descriptions = [description for name, description in split]
+    numbers = [description.split(':', 1)[0] for description in descriptions]
+    return(names, descriptions, numbers)
+
+def trim_batch(batch1, batch2, junction, minLength):
+    ''' Function to trim a batch of paired reads after the first junction,
+    discard pairs with a trimmed read shorter than minLength and generate
+    interleaved FASTQ records. Read names must be identical and read numbers
+    1 and 2, and the read number is appended to the name of output reads.
+
+    Args:
+        batch1 (tuple)- Lists of read1 names, sequences and qualities.
+        batch2 (tuple)- Lists of read2 names, sequences and qualities.
+        junction (str)- Junction sequence.
+        minLength (int)- Minimum length of trimmed reads.
+
+    Returns:
+        records (str)- Interleaved FASTQ records.
+        metrics (dict)- Number of read pairs in the batch, pairs with a
+            short read and retained pairs in which read1 or read2 contain
+            the junction.
+
+    Raises:
+        ValueError - If read names or numbers are incorrect.
+
+    '''
+    if not batch1[0]:
+        return('', {'total':0, 'short':0, 'trim1':0, 'trim2':0})
+    # Check read names and numbers
+    names1, descriptions1, numbers1 = split_headers(batch1[0])
+    names2, descriptions2, numbers2 = split_headers(batch2[0])
+    count = len(names1)
+    if (names1 != names2 or numbers1.count('1') != count
+        or numbers2.count('2') != count):
+        for data in zip(names1, names2, numbers1, numbers2):
+            if data[0] != data[1]:
+                raise ValueError('Read name mismatch')
+            if data[2] != '1' or data[3] != '2':
+                raise ValueError('Read number error')
+    # Find junctions and short reads
+    ends1 = find_junctions(batch1[1], junction)
+    ends2 = find_junctions(batch2[1], junction)
+    short = (((-1 < ends1) & (ends1 < minLength))
+        | ((-1 < ends2) & (ends2 < minLength)))
+    keep = numpy.flatnonzero(~short).tolist()
+    metrics = {
+        'total': count,
+        'short': int(short.sum()),
+        'trim1': int(((ends1 != -1) & ~short).sum()),
+        'trim2': int(((ends2 != -1) & ~short).sum())
+    }
+    # Generate trimmed and interleaved records
+    ends1 = [None if end == -1 else end for end in ends1.tolist()]
+    ends2 = [None if end == -1 else end for end in ends2.tolist()]
+    sequences1, qualities1 = batch1[1], batch1[2]
+    sequences2, qualities2 = batch2[1], batch2[2]
+    records = ''.join(['@%s:1 %s\n%s\n+\n%s\n@%s:2 %s\n%s\n+\n%s\n' %(
+        names1[index], descriptions1[index],
+        sequences1[index][:ends1[index]], qualities1[index][:ends1[index]],
+        names1[index], descriptions2[index],
+        sequences2[index][:ends2[index]], qualities2[index][:ends2[index]]
+    ) for index in keep])
+    return(records, metrics)
+
+def add_stats(stats, records):
+    ''' Function to add interleaved FASTQ records to quality control
+    statistics.
+
+    Args:
+        stats (list)- fastqQC.qcStats objects of read1 and read2.
+        records (str)- Interleaved FASTQ records.
+
+    '''
+    if not records:
+        return
+    lines = records.split('\n')
+    for number in (0, 1):
+        stats[number].add(lines[4 * number + 1::8], lines[4 * number + 3::8])
+
+def trim_pairs(batches1, batches2, junction, outFile, minLength = 20,
+        stats = None
+    ):
+    ''' Function to trim and interleave paired reads, writing the output to
+    an open file.
+
+    Args:
+        batches1 - Iterable of batches of read1 names, sequences and
+            qualities.
+        batches2 - Iterable of batches of read2 names, sequences and
+            qualities.
+        junction (str)- Junction sequence.
+        outFile - File-like object to which output is written.
+        minLength (int)- Minimum length of trimmed reads.
+        stats (list)- fastqQC.qcStats objects of read1 and read2, to which
+            output reads are added.
+
+    Returns:
+        metrics (dict)- Trim metrics.
+
+    '''
+    metrics = {'total':0, 'short':0, 'trim1':0, 'trim2':0}
+    for batch1, batch2 in paired_batches(batches1, batches2):
+        records, batchMetrics = trim_batch(batch1, batch2, junction,
+            minLength)
+        for key, value in batchMetrics.items():
+            metrics[key] += value
+        if stats:
+            add_stats(stats, records)
+        outFile.write(records)
+    return(metrics)
+
+def header_descriptions(headers):
+    ''' Function returns the descriptions of FASTQ headers, including the
+    leading space, or an empty string for headers without a description.
+    '''
+    split = [header.split(None, 1) for header in headers]
+    return([' ' + parts[1] if len(parts) == 2 else '' for parts in split])
+
+def interleave_batch(batch1, batch2, normaliser, record = 0):
+    ''' Function to check the read names and numbers of a batch of paired
+    reads and generate interleaved FASTQ records. The read number is
+    appended to the normalised read name of output reads.
+
+    Args:
+        batch1 (tuple)- Lists of read1 names, sequences and qualities.
+        batch2 (tuple)- Lists of read2 names, sequences and qualities.
+        normaliser - Function returning the read name and read number of a
+            header, from fastqNames.
+        record (int)- Number of read pairs preceding the batch.
+
+    Returns:
+        records (str)- Interleaved FASTQ records.
+
+    Raises:
+        ValueError - If read names differ or read numbers are not 1 and 2,
+            reporting the number and headers of the first such pair.
+
+    '''
+    # Check read names and numbers
+    names1, numbers1 = fastqNames.normalise_headers(batch1[0], normaliser)
+    names2, numbers2 = fastqNames.normalise_headers(batch2[0], normaliser)
+    count = len(names1)
+    if (names1 != names2 or numbers1.count('1') != count
+        or numbers2.count('2') != count):
+        for index, data in enumerate(zip(names1, names2, numbers1, numbers2)):
+            if data[0] != data[1] or data[2] != '1' or data[3] != '2':
+                raise ValueError('Read {} name error: {} {}'.format(
+                    record + index + 1, batch1[0][index], batch2[0][index]))
+    # Generate interleaved records
+    descriptions1 = header_descriptions(batch1[0])
+    descriptions2 = header_descriptions(batch2[0])
+    sequences1, qualities1 = batch1[1], batch1[2]
+    sequences2, qualities2 = batch2[1], batch2[2]
+    records = ''.join(['@%s:1%s\n%s\n+\n%s\n@%s:2%s\n%s\n+\n%s\n' %(
+        names1[index], descriptions1[index], sequences1[index],
+        qualities1[index], names1[index], descriptions2[index],
+        sequences2[index], qualities2[index]
+    ) for index in xrange(count)])
+    return(records)
+
+def interleave_pairs(batches1, batches2, outFile, normaliser = 'illumina'):
+    ''' Function to check read names and interleave paired reads in a
+    single pass, writing the output to an open file.
+
+    Args:
+        batches1 - Iterable of batches of read1 names, sequences and
+            qualities.
+        batches2 - Iterable of batches of read2 names, sequences and
+            qualities.
+        outFile - File-like object to which output is written.
+        normaliser - Name of a fastqNames normaliser or a function
+            returning the read name and read number of a header.
+
+    Returns:
+        count (int)- Number of read pairs.
+
+    Raises:
+        ValueError - If read names differ or read numbers are not 1 and 2.
+        IOError - If the files contain differing numbers of reads.
+
+    '''
+    normaliser = fastqNames.get_normaliser(normaliser)
+    count = 0
+    for batch1, batch2 in paired_batches(batches1, batches2):
+        outFile.write(interleave_batch(batch1, batch2, normaliser, count))
+        count += len(batch1[0])
+    return(count)
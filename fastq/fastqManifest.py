@@ -0,0 +1,287 @@
+''' Functions and classes to cache directory listings of FASTQ archives. A
+manifest records, for each directory beneath a root directory, the
+directory's modification time, its subdirectories and the name, size,
+modification time and parsed Illumina fields (sample, lane, read and chunk)
+of each file. Directories are listed again only when their modification
+time differs from that recorded, so repeated searches of a large archive
+require a single stat of each directory. Sizes and modification times of
+files are those recorded when their directory was last listed.
+
+Manifests are stored as JSON in MANIFEST_DIR, named by the SHA1 digest of
+the absolute path of the root directory, and file names within each
+directory are stored sorted so that prefix lookups are performed by
+bisection.
+'''
+import bisect
+import errno
+import hashlib
+import json
+import os
+import re
+import stat
+import time
+from ngs_python.system import streamio
+
+MANIFEST_DIR = os.path.join(os.path.expanduser('~'), '.ngs_python',
+    'manifests')
+MANIFEST_VERSION = 1
+# Directories modified within this many seconds of being listed are listed
+# again, as further changes may not alter their modification time
+MTIME_RESOLUTION = 1
+ILLUMINA_PATTERN = re.compile(
+    '(.*?)_L(\\d{3})_R([12])(_(\\d{3})){0,1}\\.fastq(\\.gz){0,1}$')
+
+def illumina_fields(filename):
+    ''' Function to parse the name of an Illumina FASTQ file.
+
+    Args:
+        filename (str)- File name.
+
+    Returns:
+        fields (list)- Sample, lane, read and chunk, which is None for files
+            without a chunk, or None if the file name is not in the Illumina
+            format.
+
+    '''
+    match = ILLUMINA_PATTERN.match(filename)
+    if not match:
+        return(None)
+    chunk = match.group(5)
+    return([match.group(1), int(match.group(2)), int(match.group(3)),
+        None if chunk is None else int(chunk)])
+
+def prefix_names(names, prefix):
+    ''' Function to return names starting with a prefix.
+
+    Args:
+        names (list)- Sorted list of names.
+        prefix (str)- Prefix.
+
+    Returns:
+        selected (list)- Names starting with the prefix.
+
+    '''
+    start = bisect.bisect_left(names, prefix)
+    end = start
+    while end < len(names) and names[end].startswith(prefix):
+        end += 1
+    return(names[start:end])
+
+def literal_prefix(pattern):
+    ''' Function to return the literal text which must start any string
+    matched by a regular expression.
+
+    Args:
+        pattern (str)- Regular expression.
+
+    Returns:
+        prefix (str)- Literal prefix of the regular expression.
+
+    '''
+    if '|' in pattern:
+        return('')
+    for position, character in enumerate(pattern):
+        if character in '.^$*+?{}[]\\()':
+            # Quantifiers may remove the preceding character
+            if character in '*?{':
+                position = max(position - 1, 0)
+            return(pattern[:position])
+    return(pattern)
+
+def _encode(data):
+    ''' Function to convert unicode strings in loaded JSON to UTF-8 '''
+    if isinstance(data, unicode):
+        return(data.encode('utf-8'))
+    if isinstance(data, list):
+        return([_encode(value) for value in data])
+    if isinstance(data, dict):
+        return(dict((_encode(key), _encode(value)) for key, value in
+            data.iteritems()))
+    return(data)
+
+def manifest_path(root, manifestDir = MANIFEST_DIR):
+    ''' Function returns the path of the manifest of a root directory '''
+    digest = hashlib.sha1(os.path.abspath(root)).hexdigest()
+    return(os.path.join(manifestDir, digest + '.json'))
+
+def load_manifest(root, manifestDir = MANIFEST_DIR):
+    ''' Function to load the manifest of a root directory.
+
+    Args:
+        root (str)- Root directory.
+        manifestDir (str)- Directory in which manifests are stored.
+
+    Returns:
+        manifest - fastqManifest object.
+
+    '''
+    return(fastqManifest(root, manifest_path(root, manifestDir)))
+
+class fastqManifest(object):
+    ''' Class provides cached listings of the directories beneath a root
+    directory.
+    '''
+
+    def __init__(self, root, path = None):
+        ''' Function to initialise fastqManifest object.
+
+        Args:
+            root (str)- Root directory.
+            path (str)- Full path to manifest file. If None the manifest is
+                not loaded or saved.
+
+        '''
+        self.root = root
+        self.path = path
+        self.changed = False
+        self.directories = {}
+        self.names = {}
+        self.checked = set()
+        # Load existing manifest
+        if path is None or not os.path.isfile(path):
+            return
+        with open(path) as inFile:
+            try:
+                data = json.load(inFile)
+            except ValueError:
+                return
+        if (data.get('version') == MANIFEST_VERSION
+            and data.get('root') == os.path.abspath(root)):
+            for relative, entry in data['directories'].iteritems():
+                entry['dirs'] = _encode(entry['dirs'])
+                self.directories[_encode(relative)] = entry
+
+    def __scan(self, directory, mtime):
+        ''' Function to list a directory.
+
+        Args:
+            directory (str)- Full path to directory.
+            mtime (float)- Modification time of directory.
+
+        Returns:
+            entry (dict)- Directory listing.
+
+        '''
+        scanned = time.time()
+        entry = {'mtime': mtime, 'scanned': scanned, 'dirs': [], 'names': [],
+            'sizes': [], 'mtimes': [], 'fields': []}
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            try:
+                status = os.stat(path)
+            except OSError:
+                status = None
+            if status and stat.S_ISDIR(status.st_mode):
+                entry['dirs'].append([name, os.path.islink(path)])
+                continue
+            entry['names'].append(name)
+            entry['sizes'].append(status.st_size if status else None)
+            entry['mtimes'].append(status.st_mtime if status else None)
+            entry['fields'].append(illumina_fields(name))
+        entry['names'] = '\0'.join(entry['names'])
+        return(entry)
+
+    def listing(self, relative = ''):
+        ''' Function to return the listing of a directory, listing the
+        directory again if it has been modified. Each directory is checked
+        once by a fastqManifest object.
+
+        Args:
+            relative (str)- Path of directory relative to the root.
+
+        Returns:
+            entry (dict)- Directory listing, containing the modification
+                time of the directory ('mtime'), the time it was listed
+                ('scanned'), the names of subdirectories and whether each
+                is a link ('dirs'), and the sorted names of files joined by
+                null characters ('names') with their sizes ('sizes'),
+                modification times ('mtimes') and Illumina fields
+                ('fields').
+
+        Raises:
+            OSError - If the directory cannot be listed.
+
+        '''
+        if relative in self.checked:
+            return(self.directories[relative])
+        directory = os.path.join(self.root, relative)
+        mtime = os.stat(directory).st_mtime
+        entry = self.directories.get(relative)
+        if (entry is None or entry['mtime'] != mtime
+            or entry['scanned'] - mtime <= MTIME_RESOLUTION):
+            self.names.pop(relative, None)
+            entry = self.__scan(directory, mtime)
+            self.directories[relative] = entry
+            self.changed = True
+        self.checked.add(relative)
+        return(entry)
+
+    def filenames(self, relative = ''):
+        ''' Function returns the sorted file names within a directory '''
+        entry = self.listing(relative)
+        if relative not in self.names:
+            names = _encode(entry['names'])
+            self.names[relative] = names.split('\0') if names else []
+        return(self.names[relative])
+
+    def files(self, relative = ''):
+        ''' Function to return the files within a directory.
+
+        Args:
+            relative (str)- Path of directory relative to the root.
+
+        Returns:
+            files (list)- Name, size, modification time and Illumina fields
+                of each file.
+
+        '''
+        entry = self.listing(relative)
+        return(zip(self.filenames(relative), entry['sizes'], entry['mtimes'],
+            _encode(entry['fields'])))
+
+    def walk(self):
+        ''' Generator returning the path and sorted file names of each
+        directory beneath the root, top down and without following links.
+        Directories that cannot be listed are skipped, as by os.walk, and
+        directories no longer present are removed from the manifest once
+        all directories have been returned.
+        '''
+        visited = set()
+        stack = ['']
+        while stack:
+            relative = stack.pop()
+            try:
+                filenames = self.filenames(relative)
+            except OSError:
+                continue
+            visited.add(relative)
+            yield(os.path.join(self.root, relative), filenames)
+            stack.extend(os.path.join(relative, name) for name, link in
+                reversed(self.directories[relative]['dirs']) if not link)
+        # Remove deleted directories
+        for relative in set(self.directories) - visited:
+            del self.directories[relative]
+            self.names.pop(relative, None)
+            self.changed = True
+
+    def save(self):
+        ''' Function to save the manifest if it has changed. The manifest
+        is a cache, so failure to save it is not an error.
+        '''
+        if not self.changed or self.path is None:
+            return
+        try:
+            try:
+                os.makedirs(os.path.dirname(self.path))
+            except OSError as error:
+                if error.errno != errno.EEXIST:
+                    raise
+            with streamio.streamWriter(self.path, atomic = True) as outFile:
+                json.dump({
+                    'version': MANIFEST_VERSION,
+                    'root': os.path.abspath(self.root),
+                    'directories': self.directories
+                }, outFile)
+        except (IOError, OSError, ValueError):
+            return
+        self.changed = False
@@ -3,7 +3,9 @@ import multiprocessing
 import gzip
 import re
 import itertools
-from ngs_python.fastq import fastqExtract
+import numpy
+from ngs_python.fastq import fastqExtract, fastqFind, fastqJunction
+from ngs_python.system import gzconcat, streamio
 from general_python import writeFile
 
 def mergeLabelPair(fastqIn1, fastqIn2, fastqOut, label1=':1', label2=':2'):
@@ -72,78 +74,88 @@ def mergeLabelTrimPair(fastqIn1, fastqIn2, trimSeq, fastqOut, minLength = 20,
     3)  trim1 - Number of acceptable pairs with read1 trimmed.
     4)  trim2 - Number of acceptable pairs with read2 trimmed.
     '''
-    # Create output dictionary and key variables
+    # Create output dictionary
     metrics = {'total' : 0, 'short': 0, 'trim1': 0, 'trim2' : 0}
-    seqLength = len(trimSeq)
-    # Open input and output process
-    input1 = fastqExtract.readFastqProcess(fastqIn1)
-    input2 = fastqExtract.readFastqProcess(fastqIn2)
-    output = writeFile.writeFileProcess(fastqOut)
-    # Extract labelled reads and save to output
-    for read1, read2 in itertools.izip(input1, input2):
-        # Count total reads
-        metrics['total'] += 1
-        # Extract elements of read and identify trim sequence
-        read1 = read1.split('\n')
-        read2 = read2.split('\n')
-        read1Loc = read1[1].find(trimSeq)
-        read2Loc = read2[1].find(trimSeq)
-        # Set trim length for read1 and count and skip if too short
-        if read1Loc == -1:
-            read1Trim = None
-        else:
-            read1Trim = read1Loc + seqLength
-        if read1Trim and read1Trim < minLength:
-            metrics['short'] += 1
-            continue
-        # Set trim length for read2 and count and skip if too short
-        if read2Loc == -1:
-            read2Trim = None
-        else:
-            read2Trim = read2Loc + seqLength
-        if read2Trim and read2Trim < minLength:
-            metrics['short'] +=1
-            continue
-        # Trim reads if required
-        if read1Trim and read1Trim < len(read1[1]):
-            read1[1] = read1[1][:read1Trim]
-            read1[3] = read1[3][:read1Trim]
-            metrics['trim1'] += 1
-        if read2Trim and read2Trim < len(read2[1]):
-            read2[1] = read2[1][:read2Trim]
-            read2[3] = read2[3][:read2Trim]
-            metrics['trim2'] += 1
-        # Label reads
-        if label1:
-            read1Head = read1[0].split(' ',1)
-            read1Head[0] += label1
-            read1[0] = ' '.join(read1Head)
-        if label2:
-            read2Head = read2[0].split(' ',1)
-            read2Head[0] += label2
-            read2[0] = ' '.join(read2Head)
-        # Save to file
-        output.add('%s\n%s\n' %(
-            '\n'.join(read1),
-            '\n'.join(read2)
-        ))
-    # Close input and output objects
-    input1.close()
-    input2.close()
-    output.close()
+    # Open input generators and output file
+    input1 = fastqExtract.fastqBatchGenerator(fastqIn1)
+    input2 = fastqExtract.fastqBatchGenerator(fastqIn2)
+    with streamio.open_output(fastqOut) as output:
+        # Trim and label batches of reads and save to output
+        for batch1, batch2 in fastqJunction.paired_batches(input1, input2):
+            records, batchMetrics = _trim_label_batch(batch1, batch2,
+                trimSeq, minLength, label1, label2)
+            for key, value in batchMetrics.items():
+                metrics[key] += value
+            output.write(records)
     # Return metrics
     return(metrics)
 
-def concatFastq(inPrefix, inDirList, outPrefix, pair=True):
-    ''' Function to generate command to concatenate fastq files '''
+def _trim_label_batch(batch1, batch2, trimSeq, minLength, label1, label2):
+    ''' Function to trim and label a batch of paired reads for
+    mergeLabelTrimPair. Reads are trimmed after the first occurence of the
+    trim sequence and pairs containing a trimmed read shorter than minLength
+    are discarded. Read1 and read2 are counted as trimmed only if the trim
+    sequence ends before the end of the read. Function returns a string of
+    interleaved FASTQ records and a dictionary of metrics.
+    '''
+    # Find trim locations and short reads
+    ends1 = fastqJunction.find_junctions(batch1[1], trimSeq)
+    ends2 = fastqJunction.find_junctions(batch2[1], trimSeq)
+    short = (((-1 < ends1) & (ends1 < minLength))
+        | ((-1 < ends2) & (ends2 < minLength)))
+    length1 = numpy.fromiter(itertools.imap(len, batch1[1]), numpy.int64,
+        len(batch1[1]))
+    length2 = numpy.fromiter(itertools.imap(len, batch2[1]), numpy.int64,
+        len(batch2[1]))
+    metrics = {
+        'total': len(short),
+        'short': int(short.sum()),
+        'trim1': int(((ends1 != -1) & (ends1 < length1) & ~short).sum()),
+        'trim2': int(((ends2 != -1) & (ends2 < length2) & ~short).sum())
+    }
+    # Label read headers
+    headers = []
+    for batch, label in ((batch1, label1), (batch2, label2)):
+        if label:
+            split = [header.split(' ', 1) for header in batch[0]]
+            headers.append([' '.join([parts[0] + label] + parts[1:])
+                for parts in split])
+        else:
+            headers.append(batch[0])
+    # Generate trimmed and interleaved records
+    ends1 = [None if end == -1 else end for end in ends1.tolist()]
+    ends2 = [None if end == -1 else end for end in ends2.tolist()]
+    records = ''.join(['@%s\n%s\n+\n%s\n@%s\n%s\n+\n%s\n' %(
+        headers[0][index], batch1[1][index][:ends1[index]],
+        batch1[2][index][:ends1[index]], headers[1][index],
+        batch2[1][index][:ends2[index]], batch2[2][index][:ends2[index]]
+    ) for index in numpy.flatnonzero(~short).tolist()])
+    return(records, metrics)
+
+def concatFastq(inPrefix, inDirList, outPrefix, pair=True, threads=4):
+    ''' Function to concatenate Illumina FASTQ files sharing a prefix.
+    Gzip files are joined without decompression and other files are
+    compressed before being joined.
+
+    Args:
+        inPrefix (str)- Prefix of the FASTQ files.
+        inDirList (list)- Directories to search.
+        outPrefix (str)- Prefix of output files, to which '_R1.fastq.gz'
+            and '_R2.fastq.gz' are appended.
+        pair (bool)- Whether to find only paired reads.
+        threads (int)- Number of files copied at once.
+
+    Returns:
+        outputs (list)- Output file for read1 and read2, or None where
+            fewer than two files were found.
+
+    '''
     # Extract reads
-    reads = findIlluminaFastq(prefix = inPrefix, dirList = inDirList,
-        pair = pair)
-    commands = []
+    reads = fastqFind.findIlluminaFastq(prefix = inPrefix,
+        dirList = inDirList, pair = pair)
+    outputs = []
     # Sequentially process read lists
     for readNo, readList in enumerate(reads):
-        # Count gzip files
-        gzipCount = sum([x.endswith('.gz') for x in readList])
         # Check that there are multiple files to be concatendated
         if len(readList) < 2:
             print "Prefix %s, %s, has %s files and won't be processed" %(
@@ -151,21 +163,11 @@ def concatFastq(inPrefix, inDirList, outPrefix, pair=True):
                 'R' + str(readNo + 1),
                 len(readList)
             )
-            command = ''
-        # Generate commands to perform concatenation
-        elif gzipCount == 0:
-            command = 'cat %s | gzip > %s' %(
-                ' '.join(readList),
-                outPrefix + '_R' + str(readNo + 1) + '.fastq.gz'
-            )
-        elif gzipCount == len(readList):
-            command = 'zcat %s | gzip > %s' %(
-                ' '.join(readList),
-                outPrefix + '_R' + str(readNo + 1) + '.fastq.gz'
-            )
-        else:
-            raise TypeError('Mix of unzipped and gzipped files')
-        commands.append(command)
-     # Return commands
-    return(commands)
-
+            outputs.append(None)
+            continue
+        # Concatenate files
+        output = outPrefix + '_R' + str(readNo + 1) + '.fastq.gz'
+        gzconcat.concatenate_gzip(readList, output, threads)
+        outputs.append(output)
+    # Return outputs
+    return(outputs)
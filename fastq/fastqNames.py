@@ -0,0 +1,103 @@
+''' Functions to normalise the headers of paired FASTQ reads into a read
+name, shared by both reads of a pair, and a read number. Headers in the
+Illumina 1.8+ format, 'name 1:N:0:ATCACG', store the read number at the
+start of the description, while older headers, 'name/1', append the read
+number to the name. Normalisers take a header and return the read name and
+read number as strings.
+'''
+
+def illumina_name(header):
+    ''' Function to normalise Illumina 1.8+ FASTQ headers.
+
+    Args:
+        header (str)- FASTQ header without the leading '@'.
+
+    Returns:
+        name (str)- Read name.
+        number (str)- Read number.
+
+    Raises:
+        ValueError - If the header has no description.
+
+    '''
+    name, description = header.split(None, 1)
+    return(name, description.split(':', 1)[0])
+
+def slash_name(header):
+    ''' Function to normalise FASTQ headers in which the read number is
+    appended to the read name, as in 'name/1'.
+
+    Args:
+        header (str)- FASTQ header without the leading '@'.
+
+    Returns:
+        name (str)- Read name.
+        number (str)- Read number or '' if absent.
+
+    '''
+    name = header.split(None, 1)[0] if header else ''
+    if name[-2:-1] == '/':
+        return(name[:-2], name[-1])
+    return(name, '')
+
+def auto_name(header):
+    ''' Function to normalise FASTQ headers in either the Illumina 1.8+ or
+    the 'name/1' format.
+
+    Args:
+        header (str)- FASTQ header without the leading '@'.
+
+    Returns:
+        name (str)- Read name.
+        number (str)- Read number.
+
+    '''
+    split = header.split(None, 1)
+    if split and split[0][-2:] in ('/1', '/2'):
+        return(split[0][:-2], split[0][-1])
+    return(illumina_name(header))
+
+# Available normalisers
+NORMALISERS = {
+    'illumina': illumina_name,
+    'slash': slash_name,
+    'auto': auto_name
+}
+
+def get_normaliser(normaliser):
+    ''' Function to return a name normaliser.
+
+    Args:
+        normaliser - Name of a normaliser in NORMALISERS or a function
+            taking a header and returning a read name and read number.
+
+    Returns:
+        normaliser - Normaliser function.
+
+    Raises:
+        ValueError - If the normaliser name is not recognised.
+
+    '''
+    if callable(normaliser):
+        return(normaliser)
+    try:
+        return(NORMALISERS[normaliser])
+    except KeyError:
+        raise ValueError('Unrecognised name normaliser: {}'.format(
+            normaliser))
+
+def normalise_headers(headers, normaliser):
+    ''' Function to normalise a list of FASTQ headers.
+
+    Args:
+        headers (list)- FASTQ headers.
+        normaliser - Normaliser function.
+
+    Returns:
+        names (list)- Read names.
+        numbers (list)- Read numbers.
+
+    '''
+    split = [normaliser(header) for header in headers]
+    return([name for name, number in split],
+        [number for name, number in split])
@@ -0,0 +1,347 @@
+''' Functions to parse FASTQ files in large blocks '''
+import gzip
+import itertools
+import operator
+import time
+
+# Maximum number of lines checked by each attempt at bulk parsing
+BULK_LINES = 16384
+
+class blockParser(object):
+    ''' Class parses FASTQ entries from a file handle by reading large blocks
+    of data and identifying record boundaries within each block. Records are
+    returned in batches of up to batch_size records, where each batch holds
+    lists of the read names, sequences and qualities. Records must follow the format
+    accepted by FastqGeneralIterator from Bio.SeqIO.QualityIO; sequence and
+    quality may be split over multiple lines and quality lines may start
+    with '@'. Runs of records are parsed in bulk, in windows of at most
+    BULK_LINES lines. When a window contains other records, a run of
+    records is parsed individually before bulk parsing is retried, the run
+    doubling with each consecutive failure, so that files of other records
+    are not repeatedly rescanned.
+    '''
+
+    def __init__(self, handle, block_size = 4194304, batch_size = 10000):
+        ''' Function to initialise blockParser object.
+
+        Args:
+            handle - Open file handle, or object with a 'read' method,
+                from which FASTQ data will be read.
+            block_size (int)- Number of bytes to read from handle at once.
+            batch_size (int)- Maximum number of reads in each batch.
+
+        Raises:
+            TypeError - If arguments are of the wrong type.
+            ValueError - If arguments have an unexpected value.
+
+        '''
+        # Check arguments
+        if not isinstance(block_size, int):
+            raise TypeError('block_size must be integer')
+        if block_size < 1:
+            raise ValueError('block_size must be >= 1')
+        if not isinstance(batch_size, int):
+            raise TypeError('batch_size must be integer')
+        if batch_size < 1:
+            raise ValueError('batch_size must be >= 1')
+        # Store arguments
+        self.handle = handle
+        self.block_size = block_size
+        self.batch_size = batch_size
+        self.last = None
+        self.run = 1
+
+    def __bulk_records(self, lines, start, end):
+        ''' Function to extract single line, four line records from a list
+        of lines using list operations. Returns None if any record in the
+        list is not a single line, four line record or contains trailing
+        whitespace.
+
+        Args:
+            lines (list)- List of lines.
+            start (int)- Index of first line of first record.
+            end (int)- Index of line after last line of last record.
+
+        Returns:
+            names (list)- List of read names.
+            sequences (list)- List of read sequences.
+            qualities (list)- List of read qualities.
+
+        '''
+        # Extract titles, sequences, separators and qualities
+        count = (end - start) // 4
+        titles = lines[start:end:4]
+        sequences = lines[start + 1:end:4]
+        separators = lines[start + 2:end:4]
+        qualities = lines[start + 3:end:4]
+        # Check record starts and lengths
+        first = operator.itemgetter(0)
+        try:
+            if map(first, titles).count('@') != count:
+                return(None)
+            if map(first, separators).count('+') != count:
+                return(None)
+        except IndexError:
+            return(None)
+        if map(len, sequences) != map(len, qualities):
+            return(None)
+        # Check for whitespace
+        joined = '\n'.join(titles) + '\n'
+        if ' \n' in joined or '\t\n' in joined:
+            return(None)
+        for joined in (''.join(sequences), ''.join(qualities)):
+            if ' ' in joined or '\t' in joined:
+                return(None)
+        # Extract names and check names on separator lines
+        names = map(operator.itemgetter(slice(1, None)), titles)
+        if separators.count('+') != count:
+            for name, separator in itertools.izip(names, separators):
+                separator = separator[1:].rstrip()
+                if separator and separator != name:
+                    raise ValueError('Sequence and quality captions differ.')
+        # Return records
+        return(names, sequences, qualities)
+
+    def __single_record(self, lines, start, end, eof):
+        ''' Function to extract a single, possibly multi-line, record from a
+        list of lines. Trailing whitespace is removed from all lines.
+
+        Args:
+            lines (list)- List of lines.
+            start (int)- Index of first line of record.
+            end (int)- Number of complete lines in the list.
+            eof (bool)- Whether the lines end at the end of the file.
+
+        Returns:
+            record (tuple)- Read name, sequence and quality or None if the
+                record is incomplete.
+            index (int)- Index of the line following the record.
+
+        Raises:
+            ValueError - If the record is malformed.
+
+        '''
+        # Extract title line
+        name = lines[start][1:].rstrip()
+        index = start + 1
+        if index >= end:
+            if eof:
+                raise ValueError('End of file without quality information.')
+            return(None, start)
+        # Extract sequence until '+' line
+        sequence = [lines[index].rstrip()]
+        index += 1
+        while True:
+            if index >= end:
+                if eof:
+                    raise ValueError(
+                        'End of file without quality information.')
+                return(None, start)
+            line = lines[index].rstrip()
+            index += 1
+            if line[:1] == '+':
+                if len(line) > 1 and line[1:] != name:
+                    raise ValueError('Sequence and quality captions differ.')
+                break
+            sequence.append(line)
+        sequence = ''.join(sequence)
+        if ' ' in sequence or '\t' in sequence:
+            raise ValueError('Whitespace is not allowed in the sequence.')
+        # Extract quality until its length matches the sequence
+        if index < end:
+            quality = [lines[index].rstrip()]
+            index += 1
+        elif eof:
+            quality = ['']
+        else:
+            return(None, start)
+        length = len(quality[0])
+        while length < len(sequence):
+            if index >= end:
+                if eof:
+                    break
+                return(None, start)
+            quality.append(lines[index].rstrip())
+            length += len(quality[-1])
+            index += 1
+        quality = ''.join(quality)
+        if len(sequence) != len(quality):
+            raise ValueError('Lengths of sequence and quality values differs '
+                ' for %s (%i and %i).' %(name, len(sequence), len(quality)))
+        return((name, sequence, quality), index)
+
+    def __block_records(self, lines, eof):
+        ''' Function to extract all complete records from a list of lines.
+
+        Args:
+            lines (list)- List of complete lines.
+            eof (bool)- Whether the lines end at the end of the file.
+
+        Returns:
+            names (list)- List of read names.
+            sequences (list)- List of read sequences.
+            qualities (list)- List of read qualities.
+            index (int)- Index of first line not yet parsed.
+
+        '''
+        names, sequences, qualities = [], [], []
+        index = 0
+        end = len(lines)
+        single = 0
+        while index < end:
+            line = lines[index]
+            # Skip blank lines and check records start with '@'
+            if line[:1] != '@':
+                line = line.rstrip()
+                if not line:
+                    index += 1
+                    continue
+                if self.last is None:
+                    raise ValueError(
+                        "Records in Fastq files should start with '@' "\
+                        "character")
+                raise ValueError('Lengths of sequence and quality values '\
+                    'differs  for %s (%i and %i).' %(self.last[0],
+                    len(self.last[1]), len(self.last[2]) + len(line)))
+            # Extract runs of single line, four line records
+            bulk_end = index + ((min(end - index, BULK_LINES) // 4) * 4)
+            if not single and bulk_end > index:
+                bulk = self.__bulk_records(lines, index, bulk_end)
+                if bulk is not None:
+                    names.extend(bulk[0])
+                    sequences.extend(bulk[1])
+                    qualities.extend(bulk[2])
+                    self.last = (names[-1], sequences[-1], qualities[-1])
+                    index = bulk_end
+                    self.run = 1
+                    continue
+                # Extract a run of single records before retrying
+                single = self.run
+                self.run = min(self.run * 2, BULK_LINES // 4)
+            # Extract single record
+            record, index = self.__single_record(lines, index, end, eof)
+            if record is None:
+                break
+            names.append(record[0])
+            sequences.append(record[1])
+            qualities.append(record[2])
+            self.last = record
+            single = max(single - 1, 0)
+        return(names, sequences, qualities, index)
+
+    def batches(self):
+        ''' Generator returning batches of FASTQ records. Each batch is a
+        three element tuple of equal length lists containing the read names,
+        sequences and qualities respectively.
+        '''
+        read = self.handle.read
+        leftover = ''
+        started = False
+        eof = False
+        while not eof:
+            # Read block and split into lines
+            block = read(self.block_size)
+            if block:
+                data = leftover + block
+            else:
+                eof = True
+                data = leftover
+                if data and not data.endswith('\n'):
+                    data += '\n'
+            lines = data.split('\n')
+            leftover = lines.pop()
+            # Remove carriage returns from lines, if present
+            if '\r' in data:
+                lines = map(str.rstrip, lines)
+            # Skip any text before the first record
+            if not started:
+                for index, line in enumerate(lines):
+                    if line[:1] == '@':
+                        lines = lines[index:]
+                        started = True
+                        break
+                else:
+                    continue
+            # Extract records and store incomplete record
+            names, sequences, qualities, index = self.__block_records(
+                lines, eof)
+            if index < len(lines):
+                lines.append(leftover)
+                leftover = '\n'.join(lines[index:])
+            # Return records in batches
+            for start in xrange(0, len(names), self.batch_size):
+                end = start + self.batch_size
+                yield((names[start:end], sequences[start:end],
+                    qualities[start:end]))
+
+    def __iter__(self):
+        ''' Returns individual FASTQ records as three element tuples of
+        read name, sequence and quality.
+        '''
+        for batch in self.batches():
+            for record in itertools.izip(*batch):
+                yield(record)
+
+def FastqBlockIterator(
+        handle, block_size = 4194304, batch_size = 10000
+    ):
+    ''' Generator returning batches of FASTQ records from a file handle.
+
+    Args:
+        handle - Open file handle.
+        block_size (int)- Number of bytes to read from handle at once.
+        batch_size (int)- Maximum number of reads in each batch.
+
+    Returns:
+        batch (tuple)- Lists of read names, sequences and qualities.
+
+    '''
+    return(blockParser(handle, block_size, batch_size).batches())
+
+def benchmark(fastq, block_size = 4194304, batch_size = 10000):
+    ''' Function to compare the speed of the blockParser with the line
+    based FastqGeneralIterator from Bio.SeqIO.QualityIO.
+
+    Args:
+        fastq (str)- Full path to FASTQ file.
+        block_size (int)- Number of bytes to read from handle at once.
+        batch_size (int)- Maximum number of reads in each batch.
+
+    Returns:
+        metrics (dict)- Dictionary with keys 'line' and 'block' where each
+            value is a dictionary of reads, seconds and reads per second.
+
+    Raises:
+        ValueError - If the two parsers return different numbers of reads.
+
+    '''
+    from Bio.SeqIO.QualityIO import FastqGeneralIterator
+    # Create function to open file
+    def open_fastq():
+        if fastq.endswith('.gz'):
+            return(gzip.open(fastq))
+        return(open(fastq))
+    # Time line based parser
+    metrics = {}
+    fh = open_fastq()
+    start = time.time()
+    count = 0
+    for read in FastqGeneralIterator(fh):
+        count += 1
+    metrics['line'] = {'reads': count, 'seconds': time.time() - start}
+    fh.close()
+    # Time block based parser
+    fh = open_fastq()
+    start = time.time()
+    count = 0
+    for names, sequences, qualities in FastqBlockIterator(
+            fh, block_size, batch_size):
+        count += len(names)
+    metrics['block'] = {'reads': count, 'seconds': time.time() - start}
+    fh.close()
+    # Check counts and calculate speed
+    if metrics['line']['reads'] != metrics['block']['reads']:
+        raise ValueError('Parsers returned differing read counts')
+    for parser in metrics.values():
+        parser['reads/s'] = parser['reads'] / max(parser['seconds'], 1e-9)
+    return(metrics)
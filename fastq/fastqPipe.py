@@ -0,0 +1,239 @@
+''' Classes to transport batches of FASTQ reads through multiprocessing
+pipes '''
+import multiprocessing
+import time
+
+class batchSender(object):
+    ''' Object buffers data and sends it down a multiprocessing pipe as
+    lists of up to batch_size elements. Before each batch is sent the pipe
+    is checked for a termination signal of None from the receiving end.
+    '''
+
+    def __init__(self, conn, batch_size = 10000):
+        ''' Function to initialise batchSender object.
+
+        Args:
+            conn - Multiprocessing connection down which batches are sent.
+            batch_size (int)- Maximum number of elements in each batch.
+
+        Raises:
+            TypeError - If batch_size is not an integer.
+            ValueError - If batch_size is less than 1.
+
+        '''
+        # Check arguments
+        if not isinstance(batch_size, int):
+            raise TypeError('batch_size must be integer')
+        if batch_size < 1:
+            raise ValueError('batch_size must be >= 1')
+        # Store arguments and create buffer
+        self.conn = conn
+        self.batch_size = batch_size
+        self.batch = []
+        self.stopped = False
+
+    def send(self, data):
+        ''' Function to add data to the buffer and send the buffer down the
+        pipe once full.
+
+        Args:
+            data - Data to send down pipe.
+
+        Raises:
+            StopIteration: If termination signal of None is received.
+            ValueError: If anything other than None is received.
+
+        '''
+        self.batch.append(data)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def send_batch(self, batch):
+        ''' Function to send a list of data down the pipe.
+
+        Args:
+            batch (list)- List of data to send down pipe.
+
+        Raises:
+            StopIteration: If termination signal of None is received.
+            ValueError: If anything other than None is received.
+
+        '''
+        start = 0
+        while len(self.batch) + len(batch) - start >= self.batch_size:
+            end = start + self.batch_size - len(self.batch)
+            self.batch.extend(batch[start:end])
+            start = end
+            self.flush()
+        self.batch.extend(batch[start:])
+
+    def flush(self):
+        ''' Function to send all buffered data down the pipe.
+
+        Raises:
+            StopIteration: If termination signal of None is received.
+            ValueError: If anything other than None is received.
+
+        '''
+        # Check pipe for incoming signal
+        if self.conn.readable and self.conn.poll():
+            recv = self.conn.recv()
+            if recv is None:
+                self.stopped = True
+                raise StopIteration('Termination signal received')
+            else:
+                raise ValueError('Unknown signal received')
+        # Send buffered data
+        if self.batch:
+            self.conn.send(self.batch)
+            self.batch = []
+
+    def close(self):
+        ''' Function to send remaining data, unless a termination signal
+        has been received, followed by None to indicate the end of the data
+        and then close the pipe. None is sent as copies of the pipe inherited
+        by other processes may prevent the receiver detecting its closure.
+        '''
+        if not self.stopped:
+            try:
+                self.flush()
+            except StopIteration:
+                pass
+        try:
+            self.conn.send(None)
+        except IOError:
+            pass
+        self.conn.close()
+
+class batchReceiver(object):
+    ''' Object receives batches sent by a batchSender and returns the
+    individual elements. Receipt of None, or the closure of the sending end
+    of the pipe, indicates the end of the data.
+    '''
+
+    def __init__(self, conn):
+        ''' Function to initialise batchReceiver object.
+
+        Args:
+            conn - Multiprocessing connection from which batches are
+                received.
+
+        '''
+        self.conn = conn
+        self.batch = []
+        self.index = 0
+        self.finished = False
+
+    def recv_batch(self):
+        ''' Function to return the remaining data from the current batch or,
+        if exhausted, the next batch received from the pipe.
+
+        Returns:
+            batch (list)- List of data.
+
+        Raises:
+            EOFError - If there is no more data.
+
+        '''
+        # Return remainder of current batch
+        if self.index < len(self.batch):
+            batch = self.batch[self.index:]
+        # Or receive next batch
+        else:
+            batch = self.conn.recv()
+            if batch is None:
+                self.finished = True
+                raise EOFError('No more data in pipe')
+        self.batch = []
+        self.index = 0
+        return(batch)
+
+    def recv(self):
+        ''' Function to return the next element of data.
+
+        Returns:
+            data - Next element of data.
+
+        Raises:
+            EOFError - If there is no more data.
+
+        '''
+        if self.index >= len(self.batch):
+            self.batch = self.recv_batch()
+        data = self.batch[self.index]
+        self.index += 1
+        return(data)
+
+    def stop(self):
+        ''' Function to send the termination signal of None back up the
+        pipe and discard any data sent before the signal was received, so
+        that the sending process is not left blocked on a full pipe. Data
+        is discarded until the None sent at the end of the data, which is
+        not awaited if it has already been received.
+        '''
+        try:
+            self.conn.send(None)
+        except IOError:
+            pass
+        while not self.finished:
+            try:
+                if self.conn.recv() is None:
+                    self.finished = True
+            except (EOFError, IOError):
+                break
+        self.batch = []
+        self.index = 0
+
+    def close(self):
+        ''' Function to close the pipe '''
+        self.conn.close()
+
+def _benchmark_process(conn, number, batch_size):
+    ''' Function to send synthetic FASTQ reads down a pipe '''
+    conn[0].close()
+    read = ('read 1:N:0:1', 'A' * 100, 'I' * 100)
+    sender = batchSender(conn[1], batch_size)
+    for _ in xrange(number):
+        sender.send(read)
+    sender.close()
+
+def benchmark(number = 1000000, batch_sizes = (1, 10000)):
+    ''' Function to measure the number of FASTQ reads per second that can be
+    transferred between processes at different batch sizes.
+
+    Args:
+        number (int)- Number of reads to send.
+        batch_sizes (tuple)- Batch sizes to test.
+
+    Returns:
+        metrics (dict)- Dictionary where the key is the batch size and the
+            value is the reads per second.
+
+    '''
+    metrics = {}
+    for batch_size in batch_sizes:
+        # Create pipe and process
+        conn = multiprocessing.Pipe(False)
+        start = time.time()
+        process = multiprocessing.Process(
+            target = _benchmark_process,
+            args = (conn, number, batch_size)
+        )
+        process.start()
+        conn[1].close()
+        # Receive reads
+        receiver = batchReceiver(conn[0])
+        count = 0
+        while True:
+            try:
+                receiver.recv()
+            except EOFError:
+                break
+            count += 1
+        process.join()
+        receiver.close()
+        # Check count and store speed
+        if count != number:
+            raise IOError('Not all reads received')
+        metrics[batch_size] = count / max(time.time() - start, 1e-9)
+    return(metrics)
@@ -1,5 +1,23 @@
-import re
+''' Functions to perform quality control of FASTQ files. Statistics may be
+generated by FastQC, using the command returned by fastQC, or within python
+by the qcStats class, which accumulates statistics from batches of reads
+using numpy.
+'''
+import json
 import os
+import re
+import numpy
+from ngs_python.fastq import fastqShard
+
+# Index of each base in base composition arrays; other characters are N
+BASES = 'ACGTN'
+BASE_CODES = numpy.full(256, 4, dtype = numpy.int64)
+for code, base in enumerate(BASES[:4]):
+    BASE_CODES[ord(base)] = code
+    BASE_CODES[ord(base.lower())] = code
+# Quality scores are phred+33 encoded
+QUALITY_OFFSET = 33
+QUALITY_VALUES = 128
 
 def fastQC(inFile, outDir, path = 'fastqc'):
     ''' This function performs a FastQC analysis on a fastq file and
@@ -23,3 +41,262 @@ def fastQC(inFile, outDir, path = 'fastqc'):
     )
     # Execute or return command
     return(fastqcCommand)
+
+class qcStats(object):
+    ''' Class accumulates quality control statistics from batches of FASTQ
+    reads: per position quality distributions, per read mean qualities, per
+    position base composition, per read GC content, read lengths and N
+    counts. Statistics are stored as arrays of counts, so that statistics
+    from shards of a FASTQ file may be merged.
+    '''
+
+    def __init__(self):
+        ''' Function to initialise qcStats object '''
+        self.reads = 0
+        self.n_reads = 0
+        self.quality_counts = numpy.zeros((0, QUALITY_VALUES), numpy.int64)
+        self.base_counts = numpy.zeros((0, len(BASES)), numpy.int64)
+        self.length_counts = numpy.zeros(1, numpy.int64)
+        self.mean_quality_counts = numpy.zeros(QUALITY_VALUES, numpy.int64)
+        self.gc_counts = numpy.zeros(101, numpy.int64)
+
+    def __resize(self, length):
+        ''' Function to extend position arrays to the supplied length '''
+        extra = length - len(self.base_counts)
+        if extra > 0:
+            self.quality_counts = numpy.vstack((self.quality_counts,
+                numpy.zeros((extra, QUALITY_VALUES), numpy.int64)))
+            self.base_counts = numpy.vstack((self.base_counts,
+                numpy.zeros((extra, len(BASES)), numpy.int64)))
+            self.length_counts = numpy.concatenate((self.length_counts,
+                numpy.zeros(extra, numpy.int64)))
+
+    def add(self, sequences, qualities):
+        ''' Function to add a batch of reads to the statistics.
+
+        Args:
+            sequences (list)- Read sequences.
+            qualities (list)- Read qualities.
+
+        Raises:
+            ValueError - If sequence and quality lengths differ or a quality
+                character is outside the phred+33 range.
+
+        '''
+        if not sequences:
+            return
+        # Create arrays of bases, qualities and read lengths
+        bases = numpy.frombuffer(''.join(sequences), numpy.uint8)
+        quality = numpy.frombuffer(''.join(qualities), numpy.uint8)
+        lengths = numpy.fromiter((len(sequence) for sequence in sequences),
+            numpy.int64, len(sequences))
+        if len(bases) != len(quality):
+            raise ValueError('Sequence and quality lengths differ')
+        self.__add_arrays(bases, quality, lengths)
+
+    def add_batch(self, batch):
+        ''' Function to add a fastqBatch.readBatch to the statistics. Raises
+        ValueError if a quality character is outside the phred+33 range.
+        '''
+        if not len(batch):
+            return
+        batch = batch.compact()
+        self.__add_arrays(batch.sequences, batch.qualities, batch.lengths())
+
+    def __add_arrays(self, bases, quality, lengths):
+        ''' Function to add reads to the statistics.
+
+        Args:
+            bases (numpy.array)- uint8 array of concatenated sequences.
+            quality (numpy.array)- uint8 array of concatenated qualities.
+            lengths (numpy.array)- Length of each read.
+
+        Raises:
+            ValueError - If a quality character is outside the phred+33
+                range.
+
+        '''
+        if len(quality) and (quality.min() < QUALITY_OFFSET or
+                quality.max() >= QUALITY_VALUES):
+            raise ValueError('Quality characters must be between {!r} and '\
+                '{!r}'.format(chr(QUALITY_OFFSET), chr(QUALITY_VALUES - 1)))
+        bases = BASE_CODES[bases]
+        quality = quality.astype(numpy.int64)
+        ends = numpy.cumsum(lengths)
+        starts = ends - lengths
+        # Count bases and qualities at each position
+        length = int(lengths.max())
+        self.__resize(length)
+        positions = numpy.arange(len(bases)) - numpy.repeat(starts, lengths)
+        self.base_counts[:length] += numpy.bincount(
+            positions * len(BASES) + bases, minlength = length * len(BASES)
+        ).reshape(length, len(BASES))
+        self.quality_counts[:length] += numpy.bincount(
+            positions * QUALITY_VALUES + quality,
+            minlength = length * QUALITY_VALUES
+        ).reshape(length, QUALITY_VALUES)
+        self.length_counts += numpy.bincount(lengths,
+            minlength = len(self.length_counts))
+        # Count per read GC content, N bases and mean quality of reads
+        nonzero = lengths > 0
+        starts, lengths = starts[nonzero], lengths[nonzero]
+        if len(starts):
+            gc, n, quality_sum = [numpy.add.reduceat(values, starts,
+                dtype = numpy.int64) for values in (
+                (bases == 1) | (bases == 2), bases == 4, quality)]
+        else:
+            gc = n = quality_sum = lengths
+        self.gc_counts += numpy.bincount(numpy.rint(
+            100.0 * gc / lengths).astype(numpy.int64), minlength = 101)
+        self.mean_quality_counts += numpy.bincount(numpy.rint(
+            1.0 * quality_sum / lengths).astype(numpy.int64),
+            minlength = QUALITY_VALUES)
+        self.n_reads += int(numpy.count_nonzero(n))
+        self.reads += len(ends)
+
+    def merge(self, other):
+        ''' Function to add the statistics of another qcStats object.
+
+        Args:
+            other - qcStats object.
+
+        Returns:
+            self - Merged qcStats object.
+
+        '''
+        self.__resize(len(other.base_counts))
+        length = len(other.base_counts)
+        self.quality_counts[:length] += other.quality_counts
+        self.base_counts[:length] += other.base_counts
+        self.length_counts[:length + 1] += other.length_counts
+        self.mean_quality_counts += other.mean_quality_counts
+        self.gc_counts += other.gc_counts
+        self.reads += other.reads
+        self.n_reads += other.n_reads
+        return(self)
+
+    def summary(self):
+        ''' Function to summarise statistics.
+
+        Returns:
+            summary (dict)- Dictionary of statistics containing lists and
+                numbers that may be serialised as JSON.
+
+        '''
+        scores = numpy.arange(QUALITY_VALUES) - QUALITY_OFFSET
+        coverage = self.base_counts.sum(axis = 1)
+        divisor = numpy.maximum(coverage, 1).astype(float)
+        # Calculate per position quality quantiles
+        cumulative = numpy.cumsum(self.quality_counts, axis = 1)
+        quantiles = {}
+        for name, fraction in (('lower_quartile', 0.25), ('median', 0.5),
+                ('upper_quartile', 0.75)):
+            indices = [int(numpy.searchsorted(row, fraction * total))
+                for row, total in zip(cumulative, coverage)]
+            quantiles[name] = [int(scores[index]) for index in indices]
+        quality = {'mean': list((self.quality_counts * scores).sum(axis = 1)
+            / divisor)}
+        quality.update(quantiles)
+        # Summarise length distribution
+        lengths = numpy.nonzero(self.length_counts)[0]
+        bases = int(numpy.dot(self.length_counts,
+            numpy.arange(len(self.length_counts))))
+        summary = {
+            'reads': self.reads,
+            'bases': bases,
+            'length': {
+                'min': int(lengths[0]) if self.reads else 0,
+                'max': int(lengths[-1]) if self.reads else 0,
+                'mean': float(bases) / self.reads if self.reads else 0.0,
+                'histogram': [[int(length), int(self.length_counts[length])]
+                    for length in lengths]
+            },
+            'quality': quality,
+            'mean_quality': [[int(scores[index]),
+                int(self.mean_quality_counts[index])] for index in
+                numpy.nonzero(self.mean_quality_counts)[0]],
+            'base_composition': dict((base, list(self.base_counts[:, code]
+                / divisor)) for code, base in enumerate(BASES)),
+            'gc': {
+                'mean': float(numpy.dot(self.gc_counts, numpy.arange(101)))
+                    / max(self.gc_counts.sum(), 1),
+                'histogram': [int(count) for count in self.gc_counts]
+            },
+            'n': {
+                'reads': self.n_reads,
+                'bases': int(self.base_counts[:, 4].sum()),
+                'per_position': [int(count) for count in
+                    self.base_counts[:, 4]]
+            }
+        }
+        return(summary)
+
+    def write(self, path):
+        ''' Function to write a summary of the statistics as JSON.
+
+        Args:
+            path (str)- Full path to output file.
+
+        '''
+        with open(path, 'w') as outFile:
+            json.dump(self.summary(), outFile, indent = 1, sort_keys = True)
+
+def write_stats(stats, path):
+    ''' Function to write summaries of the statistics of paired reads as
+    JSON, with keys 'read1' and 'read2'.
+
+    Args:
+        stats (list)- qcStats objects of read1 and read2.
+        path (str)- Full path to output file.
+
+    '''
+    summary = dict(('read{}'.format(number), read.summary()) for number,
+        read in enumerate(stats, 1))
+    with open(path, 'w') as outFile:
+        json.dump(summary, outFile, indent = 1, sort_keys = True)
+
+def merge_stats(first, second):
+    ''' Function returns the merge of two qcStats objects '''
+    return(first.merge(second))
+
+def _qc_shard(shard):
+    ''' Function returns the qcStats object of a shard '''
+    stats = qcStats()
+    for names, sequences, qualities in fastqShard.shard_batches(shard):
+        stats.add(sequences, qualities)
+    return(stats)
+
+def fastqStats(fastq, processes = 1):
+    ''' Function to generate quality control statistics for a FASTQ file.
+    Uncompressed, BGZF and multi-member gzip files, and files with a
+    seekable fastqIndex, are processed in shards by multiple processes.
+
+    Args:
+        fastq (str)- Full path to FASTQ file.
+        processes (int)- Number of processes.
+
+    Returns:
+        stats - qcStats object.
+
+    '''
+    shards = fastqShard.plan_shards(fastq, processes * 2 if processes > 1
+        else 1)
+    return(fastqShard.map_reduce(_qc_shard, merge_stats, shards, processes))
+
+def nativeQC(inFile, outDir, processes = 1):
+    ''' Function to generate quality control statistics for a FASTQ file
+    and write them as JSON, without running FastQC.
+
+    Args:
+        inFile (str)- Input FASTQ file.
+        outDir (str)- Output directory.
+        processes (int)- Number of processes.
+
+    Returns:
+        path (str)- Full path to JSON file '<sample>_qc.json'.
+
+    '''
+    name = re.search('([^/]+)\\.fastq(?:\\.gz){0,1}$',inFile).group(1)
+    path = os.path.join(outDir, name + '_qc.json')
+    fastqStats(inFile, processes).write(path)
+    return(path)
@@ -0,0 +1,143 @@
+''' Functions and classes to randomly sample FASTQ reads in a single pass '''
+import math
+import random
+import zlib
+import numpy
+
+def read_name(title):
+    ''' Function to extract the read name from a FASTQ title line, removing
+    any comment and trailing '/1' or '/2' read number.
+
+    Args:
+        title (str)- FASTQ title line without the leading '@'.
+
+    Returns:
+        name (str)- Read name.
+
+    '''
+    name = title.split(None, 1)[0] if title else ''
+    if name[-2:] in ('/1', '/2'):
+        name = name[:-2]
+    return(name)
+
+def name_hash(name, seed = 1234):
+    ''' Function to generate a reproducible pseudo-random number from a read
+    name. Identical names and seeds always generate identical numbers, so
+    reads may be sampled from paired FASTQ files independently.
+
+    Args:
+        name (str)- Read name.
+        seed (int)- Seed for the hash.
+
+    Returns:
+        value (float)- Value between 0 and 1.
+
+    '''
+    return((zlib.crc32(name, seed) & 0xffffffff) / 4294967296.0)
+
+def hash_select(title, fraction, seed = 1234):
+    ''' Function to determine whether a read is selected in a fractional
+    sample using the hash of its name.
+
+    Args:
+        title (str)- FASTQ title line without the leading '@'.
+        fraction (float)- Fraction of reads to select.
+        seed (int)- Seed for the hash.
+
+    Returns:
+        selected (bool)- Whether the read is selected.
+
+    '''
+    return(name_hash(read_name(title), seed) < fraction)
+
+def hash_select_batch(batch, fraction, seed = 1234):
+    ''' Function to select reads from a fastqBatch.readBatch in a fractional
+    sample using the hash of their names.
+
+    Args:
+        batch - fastqBatch.readBatch object.
+        fraction (float)- Fraction of reads to select.
+        seed (int)- Seed for the hash.
+
+    Returns:
+        batch - readBatch of selected reads, sharing the buffers of the
+            original.
+
+    '''
+    selected = numpy.fromiter((hash_select(title, fraction, seed) for title
+        in batch.headers()), bool, len(batch))
+    return(batch[selected])
+
+class reservoirSampler(object):
+    ''' Class selects a uniform random sample of a fixed number of items
+    from a stream of unknown length, holding at most 'number' items in
+    memory. Items are selected using Algorithm L (Li 1994) so that random
+    numbers are only generated for items entering the reservoir. Items, such
+    as pairs of reads, are returned in the order in which they were added.
+    '''
+
+    def __init__(self, number, seed = 1234):
+        ''' Function to initialise reservoirSampler object.
+
+        Args:
+            number (int)- Number of items to sample.
+            seed (int)- Seed for random number generator.
+
+        Raises:
+            TypeError - If number is not an integer.
+            ValueError - If number is less than 1.
+
+        '''
+        # Check arguments
+        if not isinstance(number, int):
+            raise TypeError('number must be integer')
+        if number < 1:
+            raise ValueError('number must be >= 1')
+        # Store arguments and create reservoir
+        self.number = number
+        self.random = random.Random(seed)
+        self.reservoir = []
+        self.count = 0
+        self.weight = None
+        self.next = None
+
+    def __skip(self):
+        ''' Function to calculate the index of the next item to enter the
+        reservoir.
+        '''
+        uniform = 1.0
+        while uniform >= 1.0:
+            uniform = 1.0 - self.random.random()
+        self.weight *= math.exp(math.log(uniform) / self.number)
+        skip = math.floor(math.log(1.0 - self.random.random()) /
+            math.log(1.0 - self.weight))
+        self.next = self.count + int(skip) + 1
+
+    def add(self, item):
+        ''' Function to add an item to the stream.
+
+        Args:
+            item - Item to add.
+
+        '''
+        self.count += 1
+        # Fill reservoir
+        if self.count <= self.number:
+            self.reservoir.append((self.count, item))
+            if self.count == self.number:
+                self.weight = 1.0
+                self.__skip()
+        # Replace random item in reservoir
+        elif self.count == self.next:
+            index = self.random.randrange(self.number)
+            self.reservoir[index] = (self.count, item)
+            self.__skip()
+
+    def sample(self):
+        ''' Function to return the sampled items.
+
+        Returns:
+            items (list)- Sampled items in the order they were added.
+
+        '''
+        return([item for count, item in sorted(self.reservoir)])
@@ -0,0 +1,337 @@
+''' Functions to align FASTQ files by scatter-gather. Each input FASTQ file,
+pair of files or interleaved file is split by fastqShard into record aligned
+chunks, written as gzipped FASTQ files in a scratch directory. The chunks
+are aligned and sorted concurrently, by local processes or by jobs submitted
+with moab.submitjob, through the aligner to sort pipes of fastqAlign, and
+the sorted chunks are combined by samtools merge, a k-way merge preserving
+coordinate or read name order. All chunks of an input share the read group
+of the input, and identical read group headers are combined by the merge.
+Interleaved files are split at the checkpoints of a fastqIndex with an even
+interval, so that read pairs are never split between chunks.
+'''
+import os
+import shutil
+import time
+from ngs_python.bam import samtools
+from ngs_python.fastq import fastqAlign, fastqIndex, fastqShard
+from ngs_python.system import moab, pipeline, streamio
+
+# Supported aligners
+ALIGNERS = ('bwa', 'bowtie2')
+
+def plan_chunks(read1, read2 = None, chunks = 4, interleaved = False,
+        interval = 100000
+    ):
+    ''' Function to split a FASTQ file, or pair of files, into record
+    aligned chunks. Files that cannot be split are returned as a single
+    chunk.
+
+    Args:
+        read1 (str)- Full path to read1, or interleaved, FASTQ file.
+        read2 (str)- Full path to read2 FASTQ file.
+        chunks (int)- Desired number of chunks.
+        interleaved (bool)- read1 contains interleaved paired reads.
+        interval (int)- Number of records between checkpoints of built
+            indices. Must be even for interleaved files.
+
+    Returns:
+        chunks (list)- List of tuples of one or two fastqShard.Shard
+            objects.
+
+    Raises:
+        ValueError - If interval is odd for interleaved files.
+
+    '''
+    if read2:
+        return(fastqShard.plan_paired_shards(read1, read2, chunks, interval,
+            build = True))
+    if not interleaved:
+        return([(shard,) for shard in fastqShard.plan_shards(read1, chunks)])
+    # Split interleaved files at checkpoints of an even interval
+    if interval % 2:
+        raise ValueError('interval must be even for interleaved reads')
+    single = [(fastqShard.Shard(read1, streamio.detect_compression(read1),
+        (0, 0), None, 0),)]
+    index = fastqIndex.load_index(read1)
+    if index is not None and index.interval % 2:
+        index = None
+    if chunks == 1 or (index is None and not fastqShard.splittable(read1)):
+        return(single)
+    if index is None:
+        index = fastqIndex.build_index(read1, interval, save = os.access(
+            os.path.dirname(os.path.abspath(read1)), os.W_OK))
+    if not index.seekable:
+        return(single)
+    return([(shard,) for shard in fastqShard.plan_shards(read1, chunks,
+        index)])
+
+def write_chunk(chunk, level = 1):
+    ''' Function to write the reads of a chunk to gzipped FASTQ files.
+
+    Args:
+        chunk (tuple)- Tuple of one or two Shard objects and a list of the
+            full paths of their output files.
+        level (int)- Compression level of output files.
+
+    Returns:
+        paths (list)- Full paths to output files.
+
+    '''
+    shards, paths = chunk
+    for shard, path in zip(shards, paths):
+        reader = fastqShard.shardReader(shard)
+        try:
+            with streamio.open_output(path, True, 1, level, True) as outFile:
+                for data in iter(lambda: reader.read(4194304), ''):
+                    outFile.write(data)
+        finally:
+            reader.close()
+    return(paths)
+
+def chunk_command(
+        aligner, index, reads, outBam, readGroup = '1', sampleName = None,
+        libraryID = None, platform = None, nameSort = False, threads = 1,
+        memory = 2, interleaved = False, alignerPath = None,
+        samtoolsPath = 'samtools'
+    ):
+    ''' Function to generate the command to align a chunk, piping the
+    output of the aligner into samtools sort.
+
+    Args:
+        aligner (str)- Aligner: 'bwa' or 'bowtie2'.
+        index (str)- Full path to aligner index prefix.
+        reads (list)- Full paths to the one or two FASTQ files of the chunk.
+        outBam (str)- Full path to sorted output BAM file.
+        readGroup (str)- Read group of the reads.
+        sampleName (str)- Name of sample.
+        libraryID (str)- Library ID.
+        platform (str)- Sequencing platform.
+        nameSort (bool)- Sort output by read name.
+        threads (int)- Number of aligner and sort threads.
+        memory (int)- Gigabytes of memory of each sort thread.
+        interleaved (bool)- The FASTQ file contains interleaved pairs.
+        alignerPath (str)- Aligner executable.
+        samtoolsPath (str)- Samtools executable.
+
+    Returns:
+        command (str)- Command to align and sort the chunk.
+
+    Raises:
+        ValueError - If the aligner is not supported.
+
+    '''
+    read2 = reads[1] if len(reads) > 1 else None
+    if aligner == 'bwa':
+        return(fastqAlign.bwaMemAlign(index = index, outFile = outBam,
+            read1 = reads[0], read2 = read2, bwaPath = alignerPath or 'bwa',
+            threads = threads, readGroup = readGroup,
+            sampleName = sampleName, libraryID = libraryID,
+            platform = platform, markSecondary = True, check = False,
+            samtoolsPath = samtoolsPath, memory = memory,
+            nameSort = nameSort, interleaved = interleaved))
+    if aligner == 'bowtie2' and not interleaved:
+        return(fastqAlign.bowtie2Align(index = index, outFile = outBam,
+            read1 = reads[0], read2 = read2,
+            bowtie2Path = alignerPath or 'bowtie2', threads = threads,
+            readGroup = readGroup, sampleName = sampleName,
+            libraryID = libraryID, platform = platform, check = False,
+            samtoolsPath = samtoolsPath, memory = memory,
+            nameSort = nameSort))
+    raise ValueError('Aligner must be bwa, or bowtie2 for reads that are '\
+        'not interleaved')
+
+def run_local(commands, logs, processes = 2, interval = 0.1):
+    ''' Function to run shell commands concurrently in local processes. If
+    a command fails all running commands are killed.
+
+    Args:
+        commands (list)- Shell commands.
+        logs (list)- Full paths to the log file of each command.
+        processes (int)- Maximum number of concurrent commands.
+        interval (float)- Seconds between checks of the commands.
+
+    Raises:
+        IOError - If a command fails.
+
+    '''
+    pending = list(zip(commands, logs))
+    running = []
+    try:
+        while pending or running:
+            while pending and len(running) < processes:
+                command, log = pending.pop(0)
+                running.append(pipeline.commandPipeline([command], log = log))
+            for job in list(running):
+                if job.poll() is not None:
+                    running.remove(job)
+                    job.wait()
+            time.sleep(interval)
+    except:
+        for job in running:
+            job.abort()
+        raise
+
+def remove_chunks(planned):
+    ''' Function to remove the FASTQ and BAM files of planned chunks.
+
+    Args:
+        planned (list)- List of tuples of the chunk prefix, read group and
+            a tuple of the chunk shards and FASTQ files.
+
+    '''
+    for prefix, readGroup, (shards, paths) in planned:
+        for path in paths + [prefix + '.bam']:
+            if os.path.exists(path):
+                os.remove(path)
+
+def collect_logs(logs, outLog):
+    ''' Function to concatenate existing log files into a single file.
+
+    Args:
+        logs (list)- Full paths to log files.
+        outLog (str)- Full path to output log file.
+
+    '''
+    with open(outLog, 'w') as outFile:
+        for log in logs:
+            if os.path.exists(log):
+                with open(log) as inFile:
+                    shutil.copyfileobj(inFile, outFile)
+
+def scatter_align(
+        inputs, index, outBam, aligner = 'bwa', chunks = 4, processes = 2,
+        threads = 1, nameSort = False, readGroups = None, sampleName = None,
+        libraryID = None, platform = None, interleaved = False, memory = 2,
+        alignerPath = None, samtoolsPath = 'samtools', level = 1,
+        submit = False, scratch = None, log = None
+    ):
+    ''' Function to align FASTQ files by scatter-gather. Inputs are split
+    into chunks, which are aligned and sorted concurrently and merged into
+    a single sorted BAM file, indexed if coordinate sorted. Chunks are
+    aligned by local processes or, if submit is True, by jobs submitted
+    with moab.submitjob followed by a merge job dependent on the alignment
+    jobs.
+
+    Args:
+        inputs (list)- Inputs, each the full path to a FASTQ file or a tuple
+            of the full paths to read1 and read2 FASTQ files.
+        index (str)- Full path to aligner index prefix.
+        outBam (str)- Full path to output BAM file.
+        aligner (str)- Aligner: 'bwa' or 'bowtie2'.
+        chunks (int)- Number of chunks into which each input is split.
+        processes (int)- Number of processes used to split inputs and of
+            concurrent local alignments.
+        threads (int)- Number of threads of each alignment.
+        nameSort (bool)- Sort output by read name.
+        readGroups (list)- Read group of each input. Defaults to the input
+            number, starting at 1.
+        sampleName (str)- Name of sample.
+        libraryID (str)- Library ID.
+        platform (str)- Sequencing platform.
+        interleaved (bool)- Inputs are single files of interleaved pairs.
+        memory (int)- Gigabytes of memory of each sort thread.
+        alignerPath (str)- Aligner executable.
+        samtoolsPath (str)- Samtools executable.
+        level (int)- Compression level of chunk FASTQ files.
+        submit (bool)- Whether to submit jobs with moab.submitjob.
+        scratch (str)- Directory in which to write chunks and logs.
+            Defaults to outBam without the '.bam' suffix followed by
+            '.chunks'. The directory is removed on success only if it was
+            created by this call, otherwise only the chunk files written
+            by this call are removed. Logs are kept if the run fails.
+        log (str)- Full path to file in which to collect the logs of the
+            chunk alignments and of the merge of local runs.
+
+    Returns:
+        metrics (dict)- Number of chunks and either the time taken in
+            seconds or, if submit is True, the IDs of the alignment jobs
+            and the merge job.
+
+    Raises:
+        IOError - If an alignment or the merge fails, or a job could not be
+            submitted.
+        ValueError - If arguments have an unexpected value.
+
+    '''
+    # Check arguments and create scratch directory
+    if aligner not in ALIGNERS:
+        raise ValueError('aligner must be one of: {}'.format(
+            ', '.join(ALIGNERS)))
+    if not outBam.endswith('.bam'):
+        raise ValueError('outBam must end .bam')
+    inputs = [(reads,) if isinstance(reads, str) else tuple(reads) for
+        reads in inputs]
+    if readGroups is None:
+        readGroups = [str(number + 1) for number in range(len(inputs))]
+    if len(readGroups) != len(inputs):
+        raise ValueError('A read group is required for each input')
+    if scratch is None:
+        scratch = outBam[:-4] + '.chunks'
+    created = not os.path.isdir(scratch)
+    if created:
+        os.mkdir(scratch)
+    start = time.time()
+    jobs = []
+    planned = []
+    try:
+        # Split inputs into chunk files
+        for number, reads in enumerate(inputs):
+            for count, shards in enumerate(plan_chunks(reads[0],
+                    reads[1] if len(reads) > 1 else None, chunks,
+                    interleaved)):
+                prefix = os.path.join(scratch, 'input{}_chunk{}'.format(
+                    number + 1, count + 1))
+                paths = ['{}_R{}.fastq.gz'.format(prefix, read + 1) for read
+                    in range(len(shards))]
+                planned.append((prefix, readGroups[number], (shards, paths)))
+        fastqShard.map_shards(write_chunk, [chunk for prefix, readGroup,
+            chunk in planned], processes, (level,))
+        # Generate chunk alignment commands
+        commands = []
+        bams = []
+        for prefix, readGroup, (shards, paths) in planned:
+            bams.append(prefix + '.bam')
+            commands.append(chunk_command(aligner, index, paths, bams[-1],
+                readGroup, sampleName, libraryID, platform, nameSort,
+                threads, memory, interleaved, alignerPath, samtoolsPath))
+        logs = [bam[:-4] + '.log' for bam in bams]
+        # Generate merge command
+        if len(bams) == 1:
+            mergeCommand = 'mv {} {}'.format(bams[0], outBam)
+        else:
+            mergeCommand = samtools.merge(bams, outBam, True, samtoolsPath,
+                nameSort, threads)
+        if not nameSort:
+            mergeCommand += ' && ' + samtools.index(outBam, samtoolsPath)
+        # Submit jobs, removing chunk fastq files after alignment
+        if submit:
+            for command, log, (prefix, readGroup, (shards, paths)) in zip(
+                    commands, logs, planned):
+                jobs.append(moab.submitjob(command + ' && rm ' +
+                    ' '.join(paths), threads, log, log))
+            if created:
+                mergeCommand += ' && rm -r ' + scratch
+            merge = moab.submitjob(mergeCommand, threads,
+                scratch + '.merge.log', scratch + '.merge.log',
+                jobs)
+            if None in jobs or merge is None:
+                raise IOError('Job submission failed')
+            return({'chunks': len(bams), 'jobs': jobs, 'merge': merge})
+        # Align and merge chunks locally
+        logs.append(os.path.join(scratch, 'merge.log'))
+        try:
+            run_local(commands, logs[:-1], processes)
+            pipeline.run_pipeline([mergeCommand], log = logs[-1])
+        finally:
+            if log:
+                collect_logs(logs, log)
+    except:
+        # Remove chunk files, keeping logs to diagnose the failure
+        if not jobs:
+            remove_chunks(planned)
+        raise
+    if created:
+        shutil.rmtree(scratch)
+    else:
+        remove_chunks(planned)
+    return({'chunks': len(bams), 'seconds': time.time() - start})
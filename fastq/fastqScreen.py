@@ -0,0 +1,430 @@
+''' Functions and classes to screen FASTQ reads for contamination before
+alignment. A kmerScreen holds the canonical k-mers of a set of reference
+FASTA files, such as adapter dimers, PhiX or the genomes of other species,
+as sorted numpy arrays. Batches of reads are converted to k-mers by
+vectorised numpy operations and a read hits a reference if the fraction of
+its k-mers found in the reference reaches a threshold. The screenStats
+class accumulates hits together with overrepresented sequences, counted by
+a heavyHitters sketch of bounded size, and statistics from shards of a
+FASTQ file processed by separate processes may be merged.
+'''
+import collections
+import json
+import os
+import numpy
+from ngs_python.fastq import fastqBatch, fastqSample, fastqShard
+from ngs_python.system import streamio
+
+# Two bit codes of bases, where other characters are invalid
+BASE_CODES = numpy.full(256, 4, numpy.uint64)
+for code, base in enumerate('ACGT'):
+    BASE_CODES[ord(base)] = code
+    BASE_CODES[ord(base.lower())] = code
+# Maximum k-mer length stored in an unsigned 64 bit integer
+MAX_K = 31
+
+def fasta_windows(fasta, size, overlap):
+    ''' Generator returning windows of the sequences of a plain or gzipped
+    FASTA file, so that whole sequences are not held in memory. Windows
+    hold at most size bases, consecutive windows of a sequence overlap by
+    overlap bases and windows no longer than the overlap are skipped.
+
+    Args:
+        fasta (str)- Full path to FASTA file.
+        size (int)- Maximum number of bases in each window.
+        overlap (int)- Number of bases shared by consecutive windows.
+
+    Raises:
+        ValueError - If size is not greater than overlap.
+
+    '''
+    if size <= overlap:
+        raise ValueError('size must be greater than overlap')
+    lines, length = [], 0
+    with streamio.open_input(fasta) as inFile:
+        for line in inFile:
+            if line.startswith('>'):
+                if length > overlap:
+                    yield(''.join(lines))
+                lines, length = [], 0
+                continue
+            lines.append(line.strip())
+            length += len(lines[-1])
+            # Return full windows, keeping the overlap
+            while length >= size:
+                window = ''.join(lines)
+                yield(window[:size])
+                lines = [window[size - overlap:]]
+                length = len(lines[0])
+    if length > overlap:
+        yield(''.join(lines))
+
+def kmer_codes(sequences, starts, ends, k):
+    ''' Function to generate the canonical k-mers of sequences stored
+    contiguously in a buffer. Each k-mer is encoded in two bits per base
+    and the smaller of the k-mer and its reverse complement is returned.
+    K-mers containing bases other than A, C, G and T, or spanning
+    sequences, are skipped.
+
+    Args:
+        sequences (numpy.array)- uint8 buffer of concatenated sequences,
+            the first starting at the start of the buffer.
+        starts (numpy.array)- Start of each sequence within the buffer.
+        ends (numpy.array)- End of each sequence within the buffer.
+        k (int)- Length of k-mers.
+
+    Returns:
+        kmers (numpy.array)- uint64 array of canonical k-mers.
+        indices (numpy.array)- Index of the sequence of each k-mer.
+
+    '''
+    count = len(sequences) - k + 1
+    if count <= 0 or not len(starts):
+        return(numpy.zeros(0, numpy.uint64), numpy.zeros(0, numpy.int64))
+    codes = BASE_CODES[sequences]
+    # Encode k-mers and reverse complements by shifting in each base
+    forward = numpy.zeros(count, numpy.uint64)
+    reverse = numpy.zeros(count, numpy.uint64)
+    two = numpy.uint64(2)
+    for offset in range(k):
+        base = codes[offset:offset + count] & numpy.uint64(3)
+        forward = (forward << two) | base
+        reverse |= (numpy.uint64(3) - base) << numpy.uint64(2 * offset)
+    # Skip k-mers containing invalid bases or spanning sequences
+    invalid = numpy.concatenate(([0], numpy.cumsum(codes == 4)))
+    indices = numpy.repeat(numpy.arange(len(starts)), ends - starts)[:count]
+    positions = numpy.arange(count)
+    valid = ((positions + k <= ends[indices]) &
+        (invalid[positions + k] == invalid[positions]))
+    positions = positions[valid]
+    return(numpy.minimum(forward[positions], reverse[positions]),
+        indices[valid])
+
+def reference_kmers(fasta, k, window = 1048576):
+    ''' Function returns the sorted unique canonical k-mers of the
+    sequences of a FASTA file. Sequences are encoded in windows, which
+    overlap by k - 1 bases, and the unique k-mers of the windows are merged
+    once they outnumber the k-mers already merged.
+
+    Args:
+        fasta (str)- Full path to FASTA file.
+        k (int)- Length of k-mers.
+        window (int)- Number of bases encoded at once.
+
+    Returns:
+        kmers (numpy.array)- Sorted uint64 array of k-mers.
+
+    '''
+    kmers = numpy.zeros(0, numpy.uint64)
+    pending, count = [], 0
+    for sequence in fasta_windows(fasta, max(window, k), k - 1):
+        buffer = numpy.frombuffer(sequence, numpy.uint8)
+        pending.append(numpy.unique(kmer_codes(buffer, numpy.array([0]),
+            numpy.array([len(buffer)]), k)[0]))
+        count += len(pending[-1])
+        if count >= len(kmers):
+            kmers = numpy.unique(numpy.concatenate([kmers] + pending))
+            pending, count = [], 0
+    return(numpy.unique(numpy.concatenate([kmers] + pending)))
+
+class heavyHitters(object):
+    ''' Class counts the most frequent items of a stream in bounded memory
+    using the Misra-Gries algorithm. At most 'capacity' items are counted
+    and each count underestimates the true count by at most 'error', which
+    is no greater than the number of items divided by (capacity + 1). Any
+    item occurring more often than this is guaranteed to be counted.
+    Sketches of separate streams may be merged.
+    '''
+
+    def __init__(self, capacity = 1000):
+        ''' Function to initialise heavyHitters object.
+
+        Args:
+            capacity (int)- Maximum number of items counted.
+
+        '''
+        self.capacity = capacity
+        self.counts = collections.Counter()
+        self.total = 0
+        self.error = 0
+
+    def __prune(self):
+        ''' Function to reduce the number of counted items to capacity by
+        subtracting the count of the item ranked capacity + 1.
+        '''
+        if len(self.counts) <= self.capacity:
+            return
+        threshold = sorted(self.counts.itervalues(),
+            reverse = True)[self.capacity]
+        self.counts = collections.Counter(dict((item, count - threshold)
+            for item, count in self.counts.iteritems() if count > threshold))
+        self.error += threshold
+
+    def add(self, items):
+        ''' Function to add a batch of items to the sketch '''
+        self.counts.update(items)
+        self.total += len(items)
+        self.__prune()
+
+    def merge(self, other):
+        ''' Function to add the counts of another heavyHitters object.
+
+        Args:
+            other - heavyHitters object.
+
+        Returns:
+            self - Merged heavyHitters object.
+
+        '''
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.error += other.error
+        self.__prune()
+        return(self)
+
+    def top(self, number = 20, min_fraction = 0):
+        ''' Function returns the most frequent items.
+
+        Args:
+            number (int)- Maximum number of items.
+            min_fraction (float)- Minimum estimated fraction of all items.
+
+        Returns:
+            items (list)- Tuples of item and estimated count, in order of
+                decreasing count.
+
+        '''
+        return([(item, count) for item, count in self.counts.most_common(
+            number) if count > min_fraction * self.total])
+
+class screenStats(object):
+    ''' Class accumulates the results of screening reads: the number of
+    reads screened, the number hitting each reference and hitting only that
+    reference, the number hitting any reference and a heavyHitters sketch
+    of the start of each read.
+    '''
+
+    def __init__(self, names, capacity = 1000):
+        ''' Function to initialise screenStats object.
+
+        Args:
+            names (list)- Names of references.
+            capacity (int)- Number of sequences counted by heavyHitters.
+
+        '''
+        self.names = list(names)
+        self.reads = 0
+        self.screened = 0
+        self.hits = numpy.zeros(len(self.names), numpy.int64)
+        self.unique = numpy.zeros(len(self.names), numpy.int64)
+        self.any = 0
+        self.hitters = heavyHitters(capacity)
+
+    def merge(self, other):
+        ''' Function to add the statistics of another screenStats object.
+
+        Args:
+            other - screenStats object.
+
+        Returns:
+            self - Merged screenStats object.
+
+        '''
+        if other.names != self.names:
+            raise ValueError('Statistics of differing references')
+        self.reads += other.reads
+        self.screened += other.screened
+        self.hits += other.hits
+        self.unique += other.unique
+        self.any += other.any
+        self.hitters.merge(other.hitters)
+        return(self)
+
+    def summary(self, number = 20, min_fraction = 0.001):
+        ''' Function to summarise statistics.
+
+        Args:
+            number (int)- Maximum number of overrepresented sequences.
+            min_fraction (float)- Minimum fraction of reads of
+                overrepresented sequences.
+
+        Returns:
+            summary (dict)- Dictionary of statistics that may be serialised
+                as JSON.
+
+        '''
+        divisor = float(max(self.reads, 1))
+        summary = {
+            'reads': self.reads,
+            'screened': self.screened,
+            'references': dict((name, {
+                'hits': int(hits),
+                'unique': int(unique),
+                'fraction': hits / divisor,
+                'unique_fraction': unique / divisor
+            }) for name, hits, unique in zip(self.names, self.hits,
+                self.unique)),
+            'any': {'hits': self.any, 'fraction': self.any / divisor},
+            'overrepresented': [{
+                'sequence': sequence,
+                'count': count,
+                'fraction': count / divisor
+            } for sequence, count in self.hitters.top(number, min_fraction)],
+            'count_error': self.hitters.error
+        }
+        return(summary)
+
+    def write(self, path):
+        ''' Function to write a summary of the statistics as JSON.
+
+        Args:
+            path (str)- Full path to output file.
+
+        '''
+        with open(path, 'w') as outFile:
+            json.dump(self.summary(), outFile, indent = 1, sort_keys = True)
+
+def merge_stats(first, second):
+    ''' Function returns the merge of two screenStats objects '''
+    return(first.merge(second))
+
+class kmerScreen(object):
+    ''' Class screens batches of reads against the k-mers of a set of
+    reference FASTA files. A read hits a reference if at least 'threshold'
+    of its k-mers are found in the reference. Reads shorter than k are
+    counted but cannot hit a reference. The first 'length' bases of each
+    read are counted to find overrepresented sequences.
+    '''
+
+    def __init__(
+            self, references, k = 25, threshold = 0.1, capacity = 1000,
+            length = 50
+        ):
+        ''' Function to initialise kmerScreen object and extract the k-mers
+        of the references.
+
+        Args:
+            references (list)- Full paths to reference FASTA files, named
+                by the file name without extensions, or a dictionary of
+                names and full paths.
+            k (int)- Length of k-mers, at most 31.
+            threshold (float)- Minimum fraction of the k-mers of a read
+                found in a reference for the read to hit the reference.
+            capacity (int)- Number of sequences counted by heavyHitters.
+            length (int)- Length of sequences counted by heavyHitters.
+
+        Raises:
+            ValueError - If arguments have an unexpected value.
+
+        '''
+        if not 1 <= k <= MAX_K:
+            raise ValueError('k must be between 1 and {}'.format(MAX_K))
+        if not 0 < threshold <= 1:
+            raise ValueError('threshold must be greater than 0 and at most 1')
+        if not isinstance(references, dict):
+            references = collections.OrderedDict((os.path.basename(
+                fasta).split('.')[0], fasta) for fasta in references)
+        self.names = list(references.keys())
+        self.kmers = [reference_kmers(references[name], k) for name in
+            self.names]
+        self.k = k
+        self.threshold = threshold
+        self.capacity = capacity
+        self.length = length
+
+    def stats(self):
+        ''' Function returns an empty screenStats object '''
+        return(screenStats(self.names, self.capacity))
+
+    def hits(self, batch):
+        ''' Function to determine which references each read hits.
+
+        Args:
+            batch - fastqBatch.readBatch object.
+
+        Returns:
+            hits (numpy.array)- Boolean array with a row for each read and
+                a column for each reference.
+            screened (numpy.array)- Boolean array of reads with k-mers.
+
+        '''
+        batch = batch.compact()
+        kmers, indices = kmer_codes(batch.sequences, batch.starts,
+            batch.ends, self.k)
+        totals = numpy.bincount(indices, minlength = len(batch))
+        hits = numpy.zeros((len(batch), len(self.names)), bool)
+        for column, reference in enumerate(self.kmers):
+            if not len(reference) or not len(kmers):
+                continue
+            found = reference[numpy.minimum(numpy.searchsorted(reference,
+                kmers), len(reference) - 1)] == kmers
+            counts = numpy.bincount(indices[found], minlength = len(batch))
+            hits[:, column] = (counts > 0) & (counts >= self.threshold *
+                totals)
+        return(hits, totals > 0)
+
+    def add_batch(self, batch, stats):
+        ''' Function to screen a fastqBatch.readBatch, adding the results
+        to a screenStats object.
+        '''
+        if not len(batch):
+            return
+        hits, screened = self.hits(batch)
+        references = hits.sum(axis = 1)
+        stats.reads += len(batch)
+        stats.screened += int(screened.sum())
+        stats.hits += hits.sum(axis = 0)
+        stats.unique += hits[references == 1].sum(axis = 0)
+        stats.any += int(numpy.count_nonzero(references))
+        stats.hitters.add([sequence[:self.length] for sequence in
+            batch.records()[1]])
+
+# kmerScreen of the current process, set by _set_screen
+_screen = None
+
+def _set_screen(screen):
+    ''' Function to set the kmerScreen used by _screen_shard, sent once to
+    each pool process rather than with every shard.
+    '''
+    global _screen
+    _screen = screen
+
+def _screen_shard(shards, fraction, seed):
+    ''' Function returns the screenStats object of the reads of a shard, or
+    of paired shards, sampling reads by the hash of their names.
+    '''
+    stats = _screen.stats()
+    for shard in shards:
+        for names, sequences, qualities in fastqShard.shard_batches(shard):
+            batch = fastqBatch.from_records(names, sequences, qualities)
+            if fraction < 1:
+                batch = fastqSample.hash_select_batch(batch, fraction, seed)
+            _screen.add_batch(batch, stats)
+    return(stats)
+
+def screen_shards(shards, screen, fraction = 1.0, seed = 1234,
+        processes = 1
+    ):
+    ''' Function to screen shards of FASTQ files in a pool of processes.
+    The kmerScreen is sent to each process once, by the pool initializer.
+
+    Args:
+        shards (list)- List of tuples of one or two fastqShard.Shard
+            objects.
+        screen - kmerScreen object.
+        fraction (float)- Fraction of reads to screen, sampled by
+            fastqSample.hash_select.
+        seed (int)- Seed for read name hash.
+        processes (int)- Number of processes.
+
+    Returns:
+        stats - screenStats object.
+
+    '''
+    if not 0 < fraction <= 1:
+        raise ValueError('fraction must be greater than 0 and at most 1')
+    try:
+        return(fastqShard.map_reduce(_screen_shard, merge_stats, shards,
+            processes, (fraction, seed), _set_screen, (screen,)))
+    finally:
+        _set_screen(None)
@@ -0,0 +1,529 @@
+''' Functions and classes to split FASTQ files into record aligned shards and
+process the shards in parallel using a map/reduce pattern.
+
+Shard boundaries are stored as two element tuples of a member offset and an
+offset within the member. For uncompressed files the member offset is 0 and
+the second element is the byte offset of the record. For BGZF and
+multi-member gzip files the member offset is the compressed offset of the
+gzip member in which the record starts and the second element is the offset
+of the record within the decompressed member, equivalent to a BGZF virtual
+offset. Boundaries are identified from byte ranges of uncompressed files,
+BGZF blocks or the checkpoints of a fastqIndex. Single-member gzip files
+without a seekable index cannot be split and are processed as a single
+shard. Sharding requires FASTQ files to consist of four line records.
+'''
+import collections
+import itertools
+import multiprocessing
+import os
+import shutil
+import struct
+from ngs_python.fastq import fastqIndex, fastqParse
+from ngs_python.system import pgzip, streamio
+
+# Named tuple describing a shard
+Shard = collections.namedtuple('Shard',
+    ['fastq', 'compression', 'start', 'end', 'record'])
+
+def find_record_start(data, position = 0, eof = False):
+    ''' Function to find the start of the first four line FASTQ record at or
+    after the supplied position. A record start is a line starting with '@'
+    where the following lines are a sequence, a line starting with '+' and a
+    quality of the same length as the sequence, followed by the next record
+    or the end of the file.
+
+    Args:
+        data (str)- FASTQ data.
+        position (int)- Offset from which to search.
+        eof (bool)- Whether data ends at the end of the file.
+
+    Returns:
+        start (int)- Offset of the record start or -1 if not found.
+
+    '''
+    # Move to the start of the next line
+    if position > 0 and data[position - 1] != '\n':
+        position = data.find('\n', position) + 1
+        if not position:
+            return(-1)
+    while position < len(data):
+        # Extract up to five lines from position
+        lines = []
+        end = position
+        while len(lines) < 5:
+            newline = data.find('\n', end)
+            if newline == -1:
+                if not eof:
+                    return(-1)
+                if end < len(data):
+                    lines.append(data[end:])
+                break
+            lines.append(data[end:newline])
+            end = newline + 1
+        # Check lines match record
+        if (len(lines) >= 4 and lines[0][:1] == '@'
+            and lines[2][:1] == '+'
+            and len(lines[1]) == len(lines[3])
+            and (len(lines) == 4 or lines[4][:1] in ('@', ''))):
+            return(position)
+        position += len(lines[0]) + 1
+    return(-1)
+
+def bgzf_block_start(handle, offset, size):
+    ''' Function to find the first BGZF block at or after an offset. The
+    block is confirmed by the presence of a second BGZF block, or the end of
+    the file, at the position given by its block size.
+
+    Args:
+        handle - Open file handle.
+        offset (int)- Offset from which to search.
+        size (int)- Size of the file.
+
+    Returns:
+        start (int)- Offset of the block or None if not found.
+
+    '''
+    handle.seek(offset)
+    data = handle.read(262144)
+    position = data.find(pgzip.GZIP_MAGIC)
+    while position != -1:
+        if pgzip.is_member_start(data, position, True):
+            # Check block size points to next block
+            start = offset + position
+            handle.seek(start + 16)
+            block = struct.unpack('<H', handle.read(2))[0] + 1
+            handle.seek(start + block)
+            header = handle.read(18)
+            if start + block == size or pgzip.is_member_start(header, 0, True):
+                return(start)
+        position = data.find(pgzip.GZIP_MAGIC, position + 1)
+    return(None)
+
+class shardReader(object):
+    ''' Class generates a file-like object to read the decompressed data of
+    a shard.
+    '''
+
+    def __init__(self, shard, chunk_size = 1048576):
+        ''' Function to initialise shardReader object.
+
+        Args:
+            shard (Shard)- Shard to read.
+            chunk_size (int)- Number of bytes read at once.
+
+        '''
+        self.shard = shard
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        # Open plain file or gzip file pieces
+        if shard.compression is None:
+            self.handle = open(shard.fastq, 'rb')
+            self.handle.seek(sum(shard.start))
+            if shard.end is None:
+                self.remaining = -1
+            else:
+                self.remaining = sum(shard.end) - sum(shard.start)
+        elif shard.compression == 'gzip':
+            self.handle = None
+            self.generator = self.__pieces()
+        else:
+            self.handle = streamio.streamReader(shard.fastq)
+            self.remaining = -1
+
+    def __pieces(self):
+        ''' Generator returning the decompressed data of the shard from a
+        gzip file.
+        '''
+        member, skip = self.shard.start
+        position = 0
+        current = member
+        pieces = fastqIndex.decompressed_pieces(self.shard.fastq, 'gzip',
+            member, self.chunk_size)
+        for piece, member in pieces:
+            # Store offset within member
+            if member != current:
+                current = member
+                position = 0
+            start = position
+            position += len(piece)
+            # Skip data before shard start
+            if member == self.shard.start[0] and skip:
+                if position <= skip:
+                    continue
+                piece = piece[skip - start:]
+                start = skip
+                skip = 0
+            # Stop at shard end
+            if self.shard.end:
+                end_member, end_skip = self.shard.end
+                if member > end_member or (
+                    member == end_member and start >= end_skip):
+                    break
+                if member == end_member and position > end_skip:
+                    yield(piece[:end_skip - start])
+                    break
+            yield(piece)
+        pieces.close()
+
+    def read(self, size = -1):
+        ''' Function to read data from the shard.
+
+        Args:
+            size (int)- Number of bytes to read. If negative all remaining
+                data is returned.
+
+        Returns:
+            data (str)- Data read from shard.
+
+        '''
+        # Read plain and bzip2 files
+        if self.handle:
+            if self.remaining < 0:
+                return(self.handle.read(size))
+            if size < 0 or size > self.remaining:
+                size = self.remaining
+            data = self.handle.read(size)
+            self.remaining -= len(data)
+            return(data)
+        # Read gzip files
+        parts = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            piece = next(self.generator, '')
+            if not piece:
+                break
+            parts.append(piece)
+            length += len(piece)
+        data = ''.join(parts)
+        if 0 <= size < length:
+            self.buffer = data[size:]
+            return(data[:size])
+        self.buffer = ''
+        return(data)
+
+    def close(self):
+        ''' Function to close the shard '''
+        if self.handle:
+            self.handle.close()
+        else:
+            self.generator.close()
+
+def shard_batches(shard, block_size = 1048576, batch_size = 10000):
+    ''' Generator returning batches of FASTQ records from a shard. Each batch
+    is a three element tuple of lists of read names, sequences and
+    qualities.
+
+    Args:
+        shard (Shard)- Shard to read.
+        block_size (int)- Number of bytes parsed at once.
+        batch_size (int)- Maximum number of records in each batch.
+
+    '''
+    reader = shardReader(shard)
+    try:
+        for batch in fastqParse.FastqBlockIterator(
+                reader, block_size, batch_size):
+            yield(batch)
+    finally:
+        reader.close()
+
+def shard_records(shard):
+    ''' Generator returning FASTQ records from a shard as three element
+    tuples of read name, sequence and quality.
+    '''
+    for batch in shard_batches(shard):
+        for record in itertools.izip(*batch):
+            yield(record)
+
+def _plain_boundaries(fastq, number):
+    ''' Function to find record aligned boundaries in an uncompressed file
+    at approximately equal byte intervals.
+    '''
+    size = os.path.getsize(fastq)
+    boundaries = [(0, 0)]
+    with open(fastq, 'rb') as inFile:
+        for count in range(1, number):
+            # Read data from target and find record start
+            target = max(size * count // number, boundaries[-1][1] + 1)
+            window = 65536
+            while True:
+                inFile.seek(target - 1)
+                data = inFile.read(window)
+                eof = target - 1 + len(data) >= size
+                start = find_record_start(data, 1, eof)
+                if start != -1 or eof:
+                    break
+                window *= 2
+            if start == -1:
+                break
+            boundaries.append((0, target - 1 + start))
+    return(boundaries)
+
+def _bgzf_boundaries(fastq, number):
+    ''' Function to find record aligned boundaries in a BGZF file at
+    approximately equal compressed intervals.
+    '''
+    size = os.path.getsize(fastq)
+    boundaries = [(0, 0)]
+    with open(fastq, 'rb') as inFile:
+        for count in range(1, number):
+            block = bgzf_block_start(inFile, size * count // number, size)
+            if block is None or block <= boundaries[-1][0]:
+                continue
+            # Decompress blocks until a record start is identified
+            data = []
+            pieces = []
+            length = 0
+            start = -1
+            for piece, member in fastqIndex.decompressed_pieces(
+                    fastq, 'gzip', block, 65536):
+                data.append(piece)
+                pieces.append((length, member))
+                length += len(piece)
+                start = find_record_start(''.join(data), 1)
+                if start != -1:
+                    break
+            if start == -1:
+                break
+            # Convert record start to member and offset within member
+            member = [member for offset, member in pieces
+                if offset <= start][-1]
+            first = min(offset for offset, current in pieces
+                if current == member)
+            boundaries.append((member, start - first))
+    return(boundaries)
+
+def plan_shards(fastq, number, index = None):
+    ''' Function to split a FASTQ file into record aligned shards.
+
+    Args:
+        fastq (str)- Full path to FASTQ file.
+        number (int)- Desired number of shards.
+        index - fastqIndex object for the FASTQ file. If not supplied an
+            index is loaded from the sidecar file, if present.
+
+    Returns:
+        shards (list)- List of Shard objects in file order.
+
+    '''
+    compression = streamio.detect_compression(fastq)
+    if index is None:
+        index = fastqIndex.load_index(fastq)
+    # Find boundaries from index, file bytes or BGZF blocks
+    records = None
+    if index and index.seekable:
+        checkpoints = index.checkpoints
+        selected = sorted(set(len(checkpoints) * count // number
+            for count in range(number)))
+        boundaries = [tuple(checkpoints[count][2:4]) for count in selected]
+        records = [checkpoints[count][0] for count in selected]
+    elif compression is None:
+        boundaries = _plain_boundaries(fastq, number)
+    elif compression == 'gzip' and pgzip.is_bgzf(open(fastq, 'rb').read(18)):
+        boundaries = _bgzf_boundaries(fastq, number)
+    else:
+        boundaries = [(0, 0)]
+    # Create shards
+    shards = []
+    for count, start in enumerate(boundaries):
+        end = boundaries[count + 1] if count + 1 < len(boundaries) else None
+        record = records[count] if records else None
+        shards.append(Shard(fastq, compression, start, end, record))
+    return(shards)
+
+def plan_paired_shards(fastq1, fastq2, number, interval = 100000,
+        build = False, directory = None):
+    ''' Function to split paired FASTQ files into shards containing the same
+    records. Shards are identified from the checkpoints of the fastqIndex of
+    each file. Indices with matching checkpoints are built, which requires a
+    full pass through both files, only if build is True. Otherwise each file
+    is returned as a single shard.
+
+    Args:
+        fastq1 (str)- Full path to FASTQ file.
+        fastq2 (str)- Full path to paired FASTQ file.
+        number (int)- Desired number of shards.
+        interval (int)- Number of records between checkpoints of built
+            indices.
+        build (bool)- Build indices if either file lacks an index or the
+            checkpoints of the indices do not match.
+        directory (str)- Directory in which indices are loaded and built
+            indices are saved. If None, indices are loaded from beside the
+            FASTQ files and built indices are not saved.
+
+    Returns:
+        shards (list)- List of two element tuples of paired Shard objects.
+
+    '''
+    # Return single shards if files cannot be split
+    single = [(
+        Shard(fastq1, streamio.detect_compression(fastq1), (0, 0), None, 0),
+        Shard(fastq2, streamio.detect_compression(fastq2), (0, 0), None, 0)
+    )]
+    if number == 1:
+        return(single)
+    paths = [_index_path(fastq, directory) for fastq in (fastq1, fastq2)]
+    indices = [fastqIndex.load_index(fastq, path) for fastq, path in
+        zip((fastq1, fastq2), paths)]
+    for count, fastq in enumerate((fastq1, fastq2)):
+        if not (indices[count] and indices[count].seekable
+                or splittable(fastq)):
+            return(single)
+    # Build indices with matching checkpoints, if requested
+    if (None in indices or indices[0].records != indices[1].records):
+        if not build:
+            return(single)
+        indices = map_shards(_build_index, zip((fastq1, fastq2), paths), 2,
+            (interval,))
+    if (not all(index.seekable for index in indices)
+        or indices[0].records != indices[1].records):
+        return(single)
+    # Create paired shards
+    shards1 = plan_shards(fastq1, number, indices[0])
+    shards2 = plan_shards(fastq2, number, indices[1])
+    return(zip(shards1, shards2))
+
+def splittable(fastq):
+    ''' Function returns whether a FASTQ file can be split into shards
+    without an index: uncompressed, BGZF or multi-member gzip files.
+    '''
+    compression = streamio.detect_compression(fastq)
+    return(compression is None or (compression == 'gzip' and
+        pgzip.is_multimember(fastq)))
+
+def _index_path(fastq, directory):
+    ''' Function returns the path of the index of a FASTQ file within a
+    directory, or None if no directory is supplied.
+    '''
+    if directory is None:
+        return(None)
+    return(os.path.join(directory, os.path.basename(
+        fastqIndex.index_path(fastq))))
+
+def _build_index(paths, interval):
+    ''' Function to build the index of a FASTQ file, saving the index only
+    if an index path is supplied.
+    '''
+    fastq, path = paths
+    return(fastqIndex.build_index(fastq, interval, path,
+        save = path is not None))
+
+def _run_shard(arguments):
+    ''' Function to run a map function on a shard within a pool process '''
+    function, shard, args = arguments
+    return(function(shard, *args))
+
+def map_shards(function, shards, processes = 1, args = (),
+        initializer = None, initargs = ()
+    ):
+    ''' Function to apply a function to shards in a pool of processes.
+
+    Args:
+        function - Module level function taking a shard, or tuple of
+            shards, followed by args.
+        shards (list)- List of shards.
+        processes (int)- Number of processes.
+        args (tuple)- Additional arguments for function.
+        initializer - Function called with initargs in each process before
+            shards are processed, to send large shared data once per
+            process.
+        initargs (tuple)- Arguments for initializer.
+
+    Returns:
+        results (list)- Results of function in shard order.
+
+    '''
+    arguments = [(function, shard, args) for shard in shards]
+    if processes == 1 or len(shards) == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return(map(_run_shard, arguments))
+    pool = multiprocessing.Pool(min(processes, len(shards)), initializer,
+        initargs)
+    try:
+        results = pool.map(_run_shard, arguments, chunksize = 1)
+    finally:
+        pool.terminate()
+        pool.join()
+    return(results)
+
+def map_reduce(function, reducer, shards, processes = 1, args = (),
+        initializer = None, initargs = ()
+    ):
+    ''' Function to apply a function to shards in a pool of processes and
+    combine the results, in shard order, using a reduce function.
+
+    Args:
+        function - Module level function taking a shard, or tuple of
+            shards, followed by args.
+        reducer - Function combining two results.
+        shards (list)- List of shards.
+        processes (int)- Number of processes.
+        args (tuple)- Additional arguments for function.
+        initializer - Function called with initargs in each process.
+        initargs (tuple)- Arguments for initializer.
+
+    Returns:
+        result - Combined result.
+
+    '''
+    return(reduce(reducer, map_shards(function, shards, processes, args,
+        initializer, initargs)))
+
+def concatenate_files(inputs, output):
+    ''' Function to concatenate files, in order, into an output file and
+    then delete the input files. A single input file is renamed.
+    Concatenated gzip files are valid gzip files.
+
+    Args:
+        inputs (list)- Full paths to input files.
+        output (str)- Full path to output file.
+
+    '''
+    if len(inputs) == 1:
+        os.rename(inputs[0], output)
+        return
+    with open(output, 'wb') as outFile:
+        for path in inputs:
+            with open(path, 'rb') as inFile:
+                shutil.copyfileobj(inFile, outFile, 4194304)
+    for path in inputs:
+        os.remove(path)
+
+def shard_output(output, shard_number):
+    ''' Function returns the path of the output file of a shard '''
+    return('{}.shard{}'.format(output, shard_number))
+
+def sum_dict(first, second):
+    ''' Function to combine two dictionaries by adding the values of shared
+    keys.
+    '''
+    combined = dict(first)
+    for key, value in second.items():
+        combined[key] = combined.get(key, 0) + value
+    return(combined)
+
+def _count_shard(shard):
+    ''' Function returns the number of records in a shard '''
+    count = 0
+    for names, sequences, qualities in shard_batches(shard):
+        count += len(names)
+    return(count)
+
+def count_records(fastq, processes = 1):
+    ''' Function to count the records of a FASTQ file using multiple
+    processes.
+
+    Args:
+        fastq (str)- Full path to FASTQ file.
+        processes (int)- Number of processes.
+
+    Returns:
+        count (int)- Number of records.
+
+    '''
+    index = fastqIndex.load_index(fastq)
+    if index:
+        return(index.count)
+    shards = plan_shards(fastq, processes)
+    return(sum(map_shards(_count_shard, shards, processes)))
@@ -1,3 +1,5 @@
+from ngs_python.fastq import fastqAdapter
+
 ################################################################################
 ## cutadaptTrimPaired
 ################################################################################
@@ -173,3 +175,38 @@ def cutadaptTrim(
     jointCommand = filter(None, jointCommand)
     jointCommand = " && ".join(jointCommand)
     return(jointCommand)
+
+################################################################################
+## adapterTrim
+################################################################################
+# Define function
+def adapterTrim(
+        read1In, read1Out, read2In = None, read2Out = None, quality = 20,
+        adapter = 'AGATCGGAAGAGC', length = 25, processes = 1
+    ):
+    ''' This function performs quality and adapter trimming of single or
+    paired FASTQ files within python using fastqAdapter, with the settings
+    of the commands generated by the cutadapt function. Paired reads are
+    trimmed together in a single pass. Function takes 8 arguments:
+    
+    1)  read1In - Read1 input fastq file.
+    2)  read1Out - Read1 output fastq file.
+    3)  read2In - Read2 input fastq file (optional).
+    4)  read2Out - Read2 output fastq file (optional).
+    5)  quality - Minimum base quality.
+    6)  adapter - Adapter sequence to remove from 3' end of reads.
+    7)  length - Minimum read length post trimming.
+    8)  processes - Number of processes.
+    
+    Function returns a summary of trimming in the format of cutadapt.
+    
+    '''
+    # Check arguments
+    if not read2In is None and read2Out is None:
+        raise IOError('Output file must be supplied for 2nd read')
+    # Trim reads and return summary
+    metrics = fastqAdapter.trimFastq(read1In, read1Out, read2In, read2Out,
+        adapters1 = [adapter], adapters2 = [adapter], error_rate = 0.1,
+        min_overlap = 3 if read2In is None else 1, quality = quality,
+        min_length = length, processes = processes)
+    return(fastqAdapter.cutadapt_report(metrics))
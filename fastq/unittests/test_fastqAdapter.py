@@ -0,0 +1,110 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from ngs_python.fastq import fastqAdapter
+
+def reference_match(sequence, adapter, error_rate, min_overlap):
+    best = (-1, 0)
+    for start in range(len(sequence)):
+        overlap = min(len(adapter), len(sequence) - start)
+        if overlap < min_overlap:
+            continue
+        mismatches = sum(adapter[index] != 'N' and
+            sequence[start + index] != adapter[index] for index in
+            range(overlap))
+        if (mismatches <= int(error_rate * overlap)
+            and overlap - mismatches > best[0]):
+            best = (overlap - mismatches, start)
+    return(best)
+
+def reference_quality(quality, cutoff):
+    total, maximum, index = 0, 0, len(quality)
+    for position in reversed(range(len(quality))):
+        total += cutoff - (ord(quality[position]) - 33)
+        if total < 0:
+            break
+        if total > maximum:
+            maximum, index = total, position
+    return(index)
+
+class test_adapter_trimmer(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.sequences = [''.join(random.choice('ACGT') for _ in
+            range(random.randint(0, 40))) for _ in range(2000)]
+        self.qualities = [''.join(chr(random.randint(33, 73)) for _ in
+            sequence) for sequence in self.sequences]
+
+    def test_adapter_matches(self):
+        for adapter, error_rate, min_overlap in (('AGATCGGAAGAGC', 0.1, 1),
+                ('ACGNT', 0.25, 3), ('AC', 0, 1)):
+            matches, starts = fastqAdapter.adapter_matches(self.sequences,
+                adapter, error_rate, min_overlap)
+            for index, sequence in enumerate(self.sequences):
+                reference = reference_match(sequence, adapter, error_rate,
+                    min_overlap)
+                self.assertEqual(matches[index], reference[0])
+                if reference[0] > -1:
+                    self.assertEqual(starts[index], reference[1])
+
+    def test_quality_trim(self):
+        trimmer = fastqAdapter.adapterTrimmer(quality = 20)
+        sequences, qualities, adapter, trimmed = trimmer.trim(
+            self.sequences, self.qualities)
+        self.assertEqual([len(quality) for quality in qualities],
+            [reference_quality(quality, 20) for quality in self.qualities])
+        self.assertEqual(trimmed, sum(map(len, self.sequences)) -
+            sum(map(len, sequences)))
+
+    def test_trim(self):
+        trimmer = fastqAdapter.adapterTrimmer(adapters = ['AAGG'],
+            front = ['GGTT'], min_overlap = 2, trim_n = True)
+        sequences, qualities, adapter, trimmed = trimmer.trim(
+            ['GGTTACGN', 'TTACG', 'NNACAAGGCC', 'ACGA', 'ACGT'],
+            ['12345678', '12345', '1234567890', '1234', '1234'])
+        self.assertEqual(sequences, ['ACG', 'ACG', 'AC', 'ACGA', 'ACGT'])
+        self.assertEqual(qualities, ['567', '345', '34', '1234', '1234'])
+        self.assertEqual(list(adapter), [True, True, True, False, False])
+
+class test_trim_fastq(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fastq = []
+        reads, self.inserts = fastqAdapter.synthetic_reads(1000,
+            'AGATCGGAAGAGC', 50, 0)
+        for number in (1, 2):
+            path = os.path.join(self.dir, 'test_R{}.fastq'.format(number))
+            with open(path, 'w') as outFile:
+                for read in reads:
+                    outFile.write('@%s\n%s\n+\n%s\n' %(read))
+            self.fastq.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_paired(self):
+        output = [os.path.join(self.dir, 'out_R{}.fastq.gz'.format(number))
+            for number in (1, 2)]
+        for processes in (1, 2):
+            metrics = fastqAdapter.trimFastq(self.fastq[0], output[0],
+                self.fastq[1], output[1], ['AGATCGGAAGAGC'],
+                ['AGATCGGAAGAGC'], min_length = 10, processes = processes)
+            short = sum(insert < 10 for insert in self.inserts)
+            self.assertEqual(metrics['reads'], 1000)
+            self.assertEqual(metrics['written'], 1000 - metrics['short'])
+            self.assertTrue(short <= metrics['short'] <= short + 20)
+            self.assertEqual(metrics['adapter1'], metrics['adapter2'])
+            report = fastqAdapter.cutadapt_report(metrics)
+            self.assertIn('Total read pairs processed:', report)
+            self.assertIn('Pairs written (passing filters):', report)
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_adapter_trimmer)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_trim_fastq)
+    unittest.TextTestRunner(verbosity=2).run(suite)
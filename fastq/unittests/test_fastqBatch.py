@@ -0,0 +1,108 @@
+import cPickle
+import os
+import random
+import shutil
+import StringIO
+import tempfile
+import unittest
+import numpy
+from ngs_python.fastq import fastqAdapter, fastqBatch, fastqIO, fastqQC
+from ngs_python.fastq import fastqSample
+
+class test_read_batch(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        random.seed(1)
+        self.reads = []
+        for count in range(200):
+            length = random.randint(0, 60)
+            self.reads.append(('read{} 1:N:0:1'.format(count),
+                ''.join(random.choice('ACGTNacgt') for _ in range(length)),
+                ''.join(random.choice('#5@I') for _ in range(length))))
+        self.text = ''.join(['@%s\n%s\n+\n%s\n' %(read) for read in
+            self.reads])
+        self.batch = fastqBatch.from_records(*zip(*self.reads))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        batches = list(fastqBatch.batch_iterator(StringIO.StringIO(
+            self.text), batch_size = 64))
+        self.assertEqual([len(batch) for batch in batches], [64, 64, 64, 8])
+        self.assertEqual(''.join(batch.fastq() for batch in batches),
+            self.text)
+        self.assertEqual(self.batch[5], self.reads[5])
+        self.assertEqual(self.batch[-1], self.reads[-1])
+
+    def test_slicing(self):
+        # Selected reads share the buffers of the original batch
+        selected = self.batch[10:20][::2]
+        self.assertIs(selected.sequences, self.batch.sequences)
+        self.assertEqual(selected.fastq(), ''.join(['@%s\n%s\n+\n%s\n' %(
+            read) for read in self.reads[10:20:2]]))
+        mask = self.batch.lengths() > 30
+        self.assertEqual(list(zip(*self.batch[mask].records())),
+            [read for read in self.reads if len(read[1]) > 30])
+        self.assertEqual(len(self.batch[:0].compact().sequences), 0)
+        # Trimmed reads share buffers
+        trimmed = self.batch.trim(numpy.ones(200, numpy.int64),
+            numpy.full(200, 5, numpy.int64))
+        self.assertIs(trimmed.qualities, self.batch.qualities)
+        self.assertEqual(trimmed[10], (self.reads[10][0],
+            self.reads[10][1][1:5], self.reads[10][2][1:5]))
+
+    def test_packing(self):
+        sequence = numpy.frombuffer('ACGTNacgtTTG', numpy.uint8)
+        packed = fastqBatch.pack_sequence(sequence)
+        self.assertEqual(len(packed[0]), 3)
+        self.assertEqual(fastqBatch.unpack_sequence(packed[0], 12,
+            packed[1], packed[2]).tostring(), 'ACGTNacgtTTG')
+
+    def test_serialise(self):
+        selected = self.batch[50:150:3]
+        for packed in (False, True):
+            data = selected.serialise(packed)
+            self.assertEqual(fastqBatch.deserialise(data).fastq(),
+                selected.fastq())
+        # Sequences of A, C, G and T are packed into a quarter of the size
+        batch = fastqBatch.from_records(['read'], ['ACGT' * 100], ['I' * 400])
+        self.assertEqual(len(batch.serialise(False)) - len(batch.serialise(
+            True)), 300)
+        self.assertEqual(cPickle.loads(cPickle.dumps(selected, 2)).records(),
+            selected.records())
+        self.assertRaises(ValueError, fastqBatch.deserialise, 'X' * 40)
+
+    def test_consumers(self):
+        sequences, qualities = [read[1] for read in self.reads], [read[2]
+            for read in self.reads]
+        # Quality control statistics
+        stats = [fastqQC.qcStats(), fastqQC.qcStats()]
+        stats[0].add(sequences, qualities)
+        stats[1].add_batch(self.batch[::-1])
+        self.assertEqual(stats[0].summary(), stats[1].summary())
+        # Trimming
+        trimmer = fastqAdapter.adapterTrimmer('ACGTNA', quality = 20,
+            trim_n = True)
+        batch, adapter, quality = trimmer.trim_batch(self.batch)
+        expected = trimmer.trim(sequences, qualities)
+        self.assertEqual(batch.records()[1:], tuple(expected[:2]))
+        self.assertEqual(quality, expected[3])
+        # Sampling
+        self.assertEqual(list(zip(*fastqSample.hash_select_batch(self.batch,
+            0.3).records())), [read for read in self.reads if
+            fastqSample.hash_select(read[0], 0.3)])
+        # Writing
+        output = [os.path.join(self.dir, 'R{}.fastq'.format(number)) for
+            number in (1, 2)]
+        with fastqIO.writeFastq(*output) as writer:
+            writer.write((self.reads[0], self.reads[0]))
+            writer.write_batch((self.batch[1:], self.batch[1:]))
+        for path in output:
+            with open(path) as inFile:
+                self.assertEqual(inFile.read(), self.text)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_read_batch)
+    unittest.TextTestRunner(verbosity=3).run(suite)
@@ -0,0 +1,105 @@
+import gzip
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from ngs_python.fastq import fastqDemultiplex, fastqIO
+
+class test_fastq_demultiplex(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        random.seed(1)
+        self.samples = [('S1', ('ACGTACGT', 'TTGGCCAA')),
+            ('S2', ('ACGTACGT', 'GGCCAATT')), ('S3', ('CATGCATG', 'TTGGCCAA'))]
+        # Create reads with barcodes containing up to two mismatches
+        self.expected = {'S1': [], 'S2': [], 'S3': [], 'Undetermined': []}
+        self.reads = [[], []]
+        self.index = [[], []]
+        for count in range(300):
+            name, barcodes = random.choice(self.samples)
+            mismatches = random.choice((0, 0, 1, 2))
+            barcode = list(barcodes[0])
+            for position in random.sample(range(8), mismatches):
+                barcode[position] = 'N'
+            barcodes = (''.join(barcode), barcodes[1])
+            if mismatches == 2:
+                name = 'Undetermined'
+            self.expected[name].append(count)
+            for number in (0, 1):
+                sequence = ''.join(random.choice('ACGT') for _ in range(20))
+                self.reads[number].append(('read{} {}:N:0:{}+{}'.format(
+                    count, number + 1, *barcodes), sequence, 'I' * 20))
+                self.index[number].append(('read{} {}:N:0:1'.format(count,
+                    number + 1), barcodes[number], 'I' * 8))
+        self.fastq = self.write_fastq(self.reads, 'R')
+        self.outPrefix = os.path.join(self.dir, 'out_')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_fastq(self, reads, label):
+        paths = []
+        for number in (0, 1):
+            paths.append(os.path.join(self.dir, '{}{}.fastq'.format(label,
+                number + 1)))
+            with open(paths[-1], 'w') as outFile:
+                for read in reads[number]:
+                    outFile.write('@%s\n%s\n+\n%s\n' %(read))
+        return(paths)
+
+    def read_output(self, path):
+        with gzip.open(path) as inFile:
+            return(inFile.read())
+
+    def check_output(self, reads, trim = 0):
+        for name, counts in self.expected.items():
+            for number in (0, 1):
+                self.assertEqual(self.read_output('{}{}_R{}.fastq.gz'.format(
+                    self.outPrefix, name, number + 1)), ''.join([
+                    '@%s\n%s\n+\n%s\n' %(reads[number][count][0],
+                    reads[number][count][1][trim:],
+                    reads[number][count][2][trim:]) for count in counts]))
+
+    def test_neighbour_table(self):
+        table = fastqDemultiplex.neighbour_table(['AAAA', 'CCCC'], 1)
+        self.assertEqual(len(table), 2 * (1 + 4 * 4))
+        self.assertEqual(table['ANAA'], 0)
+        self.assertNotIn('AACC', table)
+        self.assertRaises(ValueError, fastqDemultiplex.neighbour_table,
+            ['AAAA', 'AACC'], 1)
+
+    def test_header(self):
+        parser = fastqIO.parseFastq(*self.fastq)
+        report = parser.demultiplex(self.samples, self.outPrefix)
+        self.check_output(self.reads)
+        self.assertEqual(report['reads'], 300)
+        for name, counts in self.expected.items():
+            self.assertEqual(report['samples'][name]['reads'], len(counts))
+        self.assertEqual(sum(count for barcode, count in
+            report['undetermined_barcodes']), len(self.expected[
+            'Undetermined']))
+
+    def test_index(self):
+        index = self.write_fastq(self.index, 'I')
+        parser = fastqIO.parseFastq(*self.fastq, batch_size = 7)
+        parser.demultiplex(self.samples, self.outPrefix, 'index',
+            index1 = index[0], index2 = index[1])
+        self.check_output(self.reads)
+        self.assertRaises(ValueError, parser.demultiplex, self.samples,
+            self.outPrefix, 'index', index1 = index[0])
+
+    def test_inline(self):
+        # Add barcodes to the start of reads
+        reads = [[(read[0], barcode[1] + read[1], barcode[2] + read[2]) for
+            read, barcode in zip(self.reads[number], self.index[number])]
+            for number in (0, 1)]
+        parser = fastqIO.parseFastq(*self.write_fastq(reads, 'inline'))
+        parser.demultiplex(self.samples, self.outPrefix, 'inline')
+        self.check_output(reads, 8)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(
+        test_fastq_demultiplex)
+    unittest.TextTestRunner(verbosity=3).run(suite)
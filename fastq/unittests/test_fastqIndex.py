@@ -0,0 +1,74 @@
+import gzip
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from ngs_python.fastq import fastqIndex
+from ngs_python.system import pgzip
+
+class test_fastq_index(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        random.seed(1)
+        self.reads = []
+        for count in range(1000):
+            length = random.randint(1, 60)
+            self.reads.append(('read{} 1:N:0:1'.format(count),
+                ''.join(random.choice('ACGT') for _ in range(length)),
+                ''.join(random.choice('@IJ') for _ in range(length))))
+        data = ''.join(['@%s\n%s\n+\n%s\n' %(read) for read in self.reads])
+        # Create plain, gzip and BGZF files
+        self.plain = os.path.join(self.dir, 'test.fastq')
+        with open(self.plain, 'w') as outFile:
+            outFile.write(data)
+        self.gzip = os.path.join(self.dir, 'test.fastq.gz')
+        with gzip.open(self.gzip, 'w') as outFile:
+            outFile.write(data)
+        self.bgzf = os.path.join(self.dir, 'test.bgzf.fastq.gz')
+        with pgzip.parallelGzipWriter(
+                self.bgzf, 2, chunk_size = 1000
+            ) as outFile:
+            outFile.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_read_records(self):
+        for fastq in (self.plain, self.gzip, self.bgzf):
+            fastqIndex.build_index(fastq, 100)
+            index = fastqIndex.load_index(fastq)
+            self.assertEqual(index.count, 1000)
+            self.assertEqual(len(index.checkpoints), 10)
+            self.assertEqual(list(index.read_records()), self.reads)
+            for start in (0, 99, 100, 101, 550, 999):
+                self.assertEqual(list(index.read_records(start, start + 5)),
+                    self.reads[start:start + 5])
+        self.assertTrue(fastqIndex.load_index(self.bgzf).seekable)
+        self.assertFalse(fastqIndex.load_index(self.gzip).seekable)
+
+    def test_read_entries(self):
+        entries = sorted(random.sample(range(1000), 50))
+        for fastq in (self.plain, self.gzip, self.bgzf):
+            index = fastqIndex.build_index(fastq, 64)
+            self.assertEqual(list(index.read_entries(entries)),
+                [self.reads[entry] for entry in entries])
+
+    def test_stale_index(self):
+        fastqIndex.build_index(self.plain, 100)
+        self.assertEqual(fastqIndex.load_index(self.gzip), None)
+        stat = os.stat(self.plain)
+        os.utime(self.plain, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(fastqIndex.load_index(self.plain), None)
+
+    def test_multiline(self):
+        multiline = os.path.join(self.dir, 'multi.fastq')
+        with open(multiline, 'w') as outFile:
+            outFile.write('@read1\nACGT\nACGT\n+\nIIIIIIII\n')
+        self.assertRaises(ValueError, fastqIndex.build_index, multiline)
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_fastq_index)
+    unittest.TextTestRunner(verbosity=2).run(suite)
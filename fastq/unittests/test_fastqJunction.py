@@ -0,0 +1,170 @@
+import gzip
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from ngs_python.fastq import fastqIO, fastqJunction, fastqNames
+
+def reference_trim(reads1, reads2, junction, minLength):
+    metrics = {'total':0, 'short':0, 'trim1':0, 'trim2':0}
+    output = []
+    for read1, read2 in zip(reads1, reads2):
+        metrics['total'] += 1
+        ends = []
+        for read in read1, read2:
+            end = read[1].find(junction)
+            ends.append(end + len(junction) if end != -1 else -1)
+        if any(-1 < end < minLength for end in ends):
+            metrics['short'] += 1
+            continue
+        for number, read, end in ((1, read1, ends[0]), (2, read2, ends[1])):
+            if end != -1:
+                metrics['trim{}'.format(number)] += 1
+            else:
+                end = None
+            name, description = read[0].split(None, 1)
+            output.append('@%s:%s %s\n%s\n+\n%s\n' %(name, number,
+                description, read[1][:end], read[2][:end]))
+    return(''.join(output), metrics)
+
+class test_junction_trim(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        self.reads = [[], []]
+        for count in range(2000):
+            for number in (1, 2):
+                length = random.randint(1, 80)
+                self.reads[number - 1].append((
+                    'read{} {}:N:0:1'.format(count, number),
+                    ''.join(random.choice('ACGT') for _ in range(length)),
+                    ''.join(random.choice('#@IJ') for _ in range(length))))
+
+    def batches(self, reads, size):
+        for start in range(0, len(reads), size):
+            batch = reads[start:start + size]
+            yield(tuple(list(data) for data in zip(*batch)))
+
+    def test_paired_batches(self):
+        pairs = list(fastqJunction.paired_batches(
+            self.batches(self.reads[0], 300), self.batches(self.reads[1], 70)))
+        for number in (0, 1):
+            reads = []
+            for pair in pairs:
+                self.assertEqual(len(pair[0][0]), len(pair[1][0]))
+                reads.extend(zip(*pair[number]))
+            self.assertEqual(reads, self.reads[number])
+        self.assertRaises(IOError, list, fastqJunction.paired_batches(
+            self.batches(self.reads[0], 300),
+            self.batches(self.reads[1][:-1], 70)))
+
+    def test_trim_pairs(self):
+        class output(list):
+            write = list.append
+        for junction, minLength in (('GATC', 20), ('AAGCTT', 0), ('A', 5)):
+            records = output()
+            metrics = fastqJunction.trim_pairs(
+                self.batches(self.reads[0], 300),
+                self.batches(self.reads[1], 70),
+                junction, records, minLength)
+            reference = reference_trim(self.reads[0], self.reads[1],
+                junction, minLength)
+            self.assertEqual(''.join(records), reference[0])
+            self.assertEqual(metrics, reference[1])
+
+    def test_name_errors(self):
+        reads2 = list(self.reads[1])
+        reads2[5] = ('other 2:N:0:1',) + reads2[5][1:]
+        self.assertRaises(ValueError, fastqJunction.trim_batch,
+            next(self.batches(self.reads[0], 10)),
+            next(self.batches(reads2, 10)), 'GATC', 20)
+        self.assertRaises(ValueError, fastqJunction.trim_batch,
+            next(self.batches(self.reads[0], 10)),
+            next(self.batches(self.reads[0], 10)), 'GATC', 20)
+
+    def test_stream_trim_reads(self):
+        directory = tempfile.mkdtemp()
+        try:
+            fastq = []
+            for number in (0, 1):
+                fastq.append(os.path.join(directory, 'R{}.fastq'.format(
+                    number + 1)))
+                with open(fastq[-1], 'w') as outFile:
+                    for read in self.reads[number]:
+                        outFile.write('@%s\n%s\n+\n%s\n' %(read))
+            reference = reference_trim(self.reads[0], self.reads[1], 'GATC',
+                20)
+            output = os.path.join(directory, 'output.fastq')
+            tee = os.path.join(directory, 'tee.fastq.gz')
+            parse = fastqIO.parseFastq(fastq[0], fastq[1])
+            # Stream reads through stdin and a named pipe
+            for fifo in (False, True):
+                metrics = parse.stream_trim_reads('GATC', 'cat {input} > ' +
+                    output, fifo = fifo, tee = tee)
+                self.assertEqual(metrics, reference[1])
+                with open(output) as inFile:
+                    self.assertEqual(inFile.read(), reference[0])
+                with gzip.open(tee) as inFile:
+                    self.assertEqual(inFile.read(), reference[0])
+            # Failure of the command is raised
+            os.remove(tee)
+            self.assertRaises(IOError, parse.stream_trim_reads, 'GATC',
+                'head -n 4 > /dev/null', tee = tee)
+            self.assertFalse(os.path.exists(tee))
+        finally:
+            shutil.rmtree(directory)
+
+class test_interleave(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fastq = []
+        for number in (1, 2):
+            path = os.path.join(self.dir, 'test_R{}.fastq'.format(number))
+            with open(path, 'w') as outFile:
+                for count in range(1000):
+                    outFile.write('@read{}/{}\nACGT\n+\nIIII\n'.format(
+                        count, number))
+            self.fastq.append(path)
+        self.output = os.path.join(self.dir, 'output.fastq')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_normalisers(self):
+        self.assertEqual(fastqNames.illumina_name('r1 2:N:0:1'), ('r1', '2'))
+        self.assertEqual(fastqNames.slash_name('r1/2 extra'), ('r1', '2'))
+        self.assertEqual(fastqNames.auto_name('r1/1'), ('r1', '1'))
+        self.assertEqual(fastqNames.auto_name('r1 1:N:0:1'), ('r1', '1'))
+        self.assertRaises(ValueError, fastqNames.get_normaliser, 'other')
+
+    def test_interleave(self):
+        parse = fastqIO.parseFastq(self.fastq[0], self.fastq[1])
+        self.assertEqual(parse.interleave_reads(self.output,
+            normaliser = 'auto'), 1000)
+        with open(self.output) as inFile:
+            lines = inFile.read().split('\n')
+        self.assertEqual(lines[:8], ['@read0:1', 'ACGT', '+', 'IIII',
+            '@read0:2', 'ACGT', '+', 'IIII'])
+        self.assertEqual(len(lines), 8001)
+
+    def test_mismatch(self):
+        with open(self.fastq[1], 'a') as outFile:
+            outFile.write('@other/2\nACGT\n+\nIIII\n')
+        with open(self.fastq[0], 'a') as outFile:
+            outFile.write('@extra/1\nACGT\n+\nIIII\n')
+        parse = fastqIO.parseFastq(self.fastq[0], self.fastq[1])
+        with self.assertRaises(ValueError) as context:
+            parse.interleave_reads(self.output, normaliser = 'slash')
+        self.assertTrue(str(context.exception).startswith(
+            'Read 1001 name error'))
+        self.assertEqual(sorted(os.listdir(self.dir)), ['test_R1.fastq',
+            'test_R2.fastq'])
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_junction_trim)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_interleave)
+    unittest.TextTestRunner(verbosity=2).run(suite)
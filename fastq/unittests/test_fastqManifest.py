@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+from ngs_python.fastq import fastqFind, fastqManifest
+
+class test_fastq_manifest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.data = os.path.join(self.dir, 'data')
+        self.manifestDir = os.path.join(self.dir, 'manifests')
+        # Create Illumina FASTQ files in a directory tree
+        for subdir in ('run1', 'run2', os.path.join('run2', 'lane2')):
+            os.makedirs(os.path.join(self.data, subdir))
+        for subdir, sample, lane in (('run1', 'A', 1), ('run1', 'B', 1),
+                ('run2', 'A', 2), (os.path.join('run2', 'lane2'), 'AB', 2)):
+            for read in (1, 2):
+                for chunk in (1, 2):
+                    self.touch(subdir, '{}_S1_L{:03d}_R{}_{:03d}.fastq.gz'\
+                        .format(sample, lane, read, chunk))
+        self.touch('', 'README')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def touch(self, subdir, name):
+        path = os.path.join(self.data, subdir, name)
+        open(path, 'w').close()
+        return(path)
+
+    def age(self, directory):
+        # Set modification time of a directory to an hour ago
+        mtime = os.stat(directory).st_mtime - 3600
+        os.utime(directory, (mtime, mtime))
+
+    def test_illumina_fields(self):
+        self.assertEqual(fastqManifest.illumina_fields(
+            'A_S1_L001_R2_003.fastq.gz'), ['A_S1', 1, 2, 3])
+        self.assertEqual(fastqManifest.illumina_fields(
+            'A_L002_R1.fastq'), ['A', 2, 1, None])
+        self.assertEqual(fastqManifest.illumina_fields('A_R1.fastq'), None)
+
+    def test_prefix(self):
+        names = ['A', 'AB', 'ABC', 'B', 'BA']
+        self.assertEqual(fastqManifest.prefix_names(names, 'A'),
+            ['A', 'AB', 'ABC'])
+        self.assertEqual(fastqManifest.prefix_names(names, 'C'), [])
+        self.assertEqual(fastqManifest.literal_prefix('AB.*'), 'AB')
+        self.assertEqual(fastqManifest.literal_prefix('ABC?'), 'AB')
+        self.assertEqual(fastqManifest.literal_prefix('A|B'), '')
+
+    def test_refresh(self):
+        manifest = fastqManifest.load_manifest(self.data, self.manifestDir)
+        self.assertEqual(len(list(manifest.walk())), 4)
+        manifest.save()
+        self.assertTrue(os.path.isfile(fastqManifest.manifest_path(
+            self.data, self.manifestDir)))
+        # Unmodified directories are not listed again
+        for dirpath, dirnames, filenames in os.walk(self.data):
+            self.age(dirpath)
+        manifest = fastqManifest.load_manifest(self.data, self.manifestDir)
+        list(manifest.walk())
+        manifest.save()
+        manifest = fastqManifest.load_manifest(self.data, self.manifestDir)
+        list(manifest.walk())
+        self.assertFalse(manifest.changed)
+        # Modified and deleted directories are updated
+        self.touch('run1', 'C_S2_L001_R1_001.fastq.gz')
+        shutil.rmtree(os.path.join(self.data, 'run2', 'lane2'))
+        manifest = fastqManifest.load_manifest(self.data, self.manifestDir)
+        walk = dict(manifest.walk())
+        self.assertTrue(manifest.changed)
+        self.assertIn('C_S2_L001_R1_001.fastq.gz',
+            walk[os.path.join(self.data, 'run1')])
+        self.assertNotIn(os.path.join('run2', 'lane2'),
+            manifest.directories)
+
+    def test_find(self):
+        # Results match those from directory listings when the manifest is
+        # created and when it is loaded
+        for manifestDir in (self.manifestDir, self.manifestDir):
+            self.assertEqual(fastqFind.findFastq('A', [self.data],
+                manifestDir = manifestDir), fastqFind.findFastq('A',
+                [self.data]))
+            self.assertEqual(fastqFind.findFastqMultiPrefix(['A', 'B'],
+                [self.data], manifestDir = manifestDir),
+                fastqFind.findFastqMultiPrefix(['A', 'B'], [self.data]))
+            run2 = os.path.join(self.data, 'run2') + '/'
+            self.assertEqual(fastqFind.findIlluminaFastq('A', [run2],
+                manifestDir = manifestDir), fastqFind.findIlluminaFastq('A',
+                [run2]))
+            self.assertEqual(fastqFind.findIlluminaPrefix(run2,
+                manifestDir = manifestDir), set(['A_S1']))
+        self.assertEqual(len(fastqFind.findFastq('A', [self.data])[0]), 6)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_fastq_manifest)
+    unittest.TextTestRunner(verbosity=3).run(suite)
@@ -0,0 +1,119 @@
+import cStringIO
+import random
+import time
+import unittest
+from Bio.SeqIO.QualityIO import FastqGeneralIterator
+from ngs_python.fastq import fastqParse
+
+tricky = '''@071113_EAS56_0053:1:1:998:236
+TTTCTTGCCCCCATAGACTGAGACCTTCCCTAAATA
++071113_EAS56_0053:1:1:998:236
+IIIIIIIIIIIIIIIIIIIIIIIIIIIIICII+III
+@071113_EAS56_0053:1:1:182:712
+ACCCAGCTAATTTTTGTATTTTTGTTAGAGACAGTG
++
+@IIIIIIIIIIIIIIICDIIIII<%<6&-*).(*%+
+@071113_EAS56_0053:1:1:153:10
+TGTTCTGAAGGAAGGTGTGCGTGCGTGTGTGTGTGT
++
+IIIIIIIIIIIICIIGIIIII>IAIIIE65I=II:6
+@071113_EAS56_0053:1:3:990:501
+TGGGAGGTTTTATGTGGA
+AAGCAGCAATGTACAAGA
++
+IIIIIII.IIIIII1@44
+@-7.%<&+/$/%4(++(%
+'''
+
+def parse(data, block_size):
+    handle = cStringIO.StringIO(data)
+    parser = fastqParse.blockParser(handle, block_size=block_size,
+        batch_size=3)
+    return(list(parser))
+
+class test_block_parser(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        reads = []
+        for count in range(200):
+            length = random.randint(0, 60)
+            sequence = ''.join(random.choice('ACGTN') for _ in range(length))
+            quality = ''.join(random.choice('!#@+IJ') for _ in range(length))
+            reads.append('@read{} 1:N:0:1\n{}\n+\n{}\n'.format(
+                count, sequence, quality))
+        self.simple = ''.join(reads)
+
+    def test_simple(self):
+        expected = list(FastqGeneralIterator(cStringIO.StringIO(self.simple)))
+        for block_size in (1, 7, 64, 1000, 100000):
+            self.assertEqual(parse(self.simple, block_size), expected)
+
+    def test_tricky(self):
+        expected = list(FastqGeneralIterator(cStringIO.StringIO(tricky)))
+        for block_size in (1, 5, 33, 100, 10000):
+            self.assertEqual(parse(tricky, block_size), expected)
+
+    def test_trailing_whitespace(self):
+        data = '@read1 \nACGT \n+ \nIIII\t\n' + self.simple
+        expected = list(FastqGeneralIterator(cStringIO.StringIO(data)))
+        self.assertEqual(parse(data, 50), expected)
+
+    def test_windows_newlines(self):
+        data = self.simple.replace('\n', '\r\n')
+        expected = list(FastqGeneralIterator(cStringIO.StringIO(data)))
+        self.assertEqual(parse(data, 50), expected)
+
+    def test_header_and_blank_lines(self):
+        data = 'comment\n\n' + self.simple + '\n\n'
+        expected = list(FastqGeneralIterator(cStringIO.StringIO(self.simple)))
+        self.assertEqual(parse(data, 50), expected)
+
+    def test_no_final_newline(self):
+        expected = list(FastqGeneralIterator(cStringIO.StringIO(tricky)))
+        self.assertEqual(parse(tricky.rstrip('\n'), 20), expected)
+
+    def test_batch_size(self):
+        handle = cStringIO.StringIO(self.simple)
+        parser = fastqParse.blockParser(handle, batch_size=7)
+        lengths = [len(batch[0]) for batch in parser.batches()]
+        self.assertEqual(sum(lengths), 200)
+        self.assertTrue(max(lengths) <= 7)
+
+    def test_fallback_time(self):
+        # Files of records that cannot be parsed in bulk parse in linear time
+        reads = [('read{}'.format(count), 'ACGT' * 10, 'I' * 40) for count
+            in range(40000)]
+        spaced = ''.join('@%s \n%s\n+\n%s\n' %(read) for read in reads)
+        wrapped = ''.join('@%s\n%s\n%s\n+\n%s\n' %(name, sequence[:20],
+            sequence[20:], quality) for name, sequence, quality in reads)
+        for data in (spaced, wrapped):
+            start = time.time()
+            records = parse(data, 4194304)
+            self.assertTrue(time.time() - start < 5)
+            self.assertEqual(records, reads)
+
+    def test_length_mismatch(self):
+        data = '@read1\nACGT\n+\nIII\n@read2\nACGT\n+\nIIII\n'
+        self.assertRaises(ValueError, parse, data, 100)
+
+    def test_caption_mismatch(self):
+        data = '@read1\nACGT\n+read2\nIIII\n'
+        self.assertRaises(ValueError, parse, data, 100)
+
+    def test_truncated(self):
+        data = '@read1\nACGT\n'
+        self.assertRaises(ValueError, parse, data, 100)
+
+    def test_whitespace(self):
+        data = '@read1\nAC T\n+\nIIII\n'
+        self.assertRaises(ValueError, parse, data, 100)
+
+    def test_extra_quality(self):
+        data = '@read1\nACGT\n+\nIIII\nII\n@read2\nACGT\n+\nIIII\n'
+        self.assertRaises(ValueError, parse, data, 100)
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_block_parser)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,90 @@
+import multiprocessing
+import unittest
+from ngs_python.fastq import fastqPipe
+
+def send_process(conn, number, batch_size):
+    conn[0].close()
+    sender = fastqPipe.batchSender(conn[1], batch_size)
+    for count in range(number):
+        try:
+            sender.send(('read{}'.format(count), 'ACGT', 'IIII'))
+        except StopIteration:
+            break
+    sender.close()
+
+class test_batch_transport(unittest.TestCase):
+
+    def start(self, number, batch_size):
+        conn = multiprocessing.Pipe(True)
+        process = multiprocessing.Process(
+            target = send_process,
+            args = (conn, number, batch_size)
+        )
+        process.start()
+        conn[1].close()
+        return(process, fastqPipe.batchReceiver(conn[0]))
+
+    def test_all_reads(self):
+        for batch_size in (1, 7, 1000):
+            process, receiver = self.start(100, batch_size)
+            reads = []
+            while True:
+                try:
+                    reads.append(receiver.recv())
+                except EOFError:
+                    break
+            process.join()
+            receiver.close()
+            self.assertEqual([read[0] for read in reads],
+                ['read{}'.format(count) for count in range(100)])
+
+    def test_recv_batch(self):
+        process, receiver = self.start(25, 10)
+        first = receiver.recv()
+        batches = [receiver.recv_batch(), receiver.recv_batch(),
+            receiver.recv_batch()]
+        self.assertRaises(EOFError, receiver.recv_batch)
+        process.join()
+        receiver.close()
+        self.assertEqual(first[0], 'read0')
+        self.assertEqual(map(len, batches), [9, 10, 5])
+
+    def test_stop(self):
+        process, receiver = self.start(1000000, 10)
+        self.assertEqual(receiver.recv()[0], 'read0')
+        receiver.stop()
+        process.join()
+        receiver.close()
+        self.assertEqual(process.exitcode, 0)
+
+    def test_stop_after_end(self):
+        # Stop returns after the end of the data while the pipe is open
+        conn = multiprocessing.Pipe(True)
+        sender = fastqPipe.batchSender(conn[1], 10)
+        sender.send_batch([('read', 'ACGT', 'IIII')] * 5)
+        sender.flush()
+        conn[1].send(None)
+        receiver = fastqPipe.batchReceiver(conn[0])
+        self.assertEqual(len(receiver.recv_batch()), 5)
+        self.assertRaises(EOFError, receiver.recv_batch)
+        receiver.stop()
+        receiver.close()
+        conn[1].close()
+
+    def test_send_batch(self):
+        conn = multiprocessing.Pipe(True)
+        sender = fastqPipe.batchSender(conn[1], 7)
+        sender.send(0)
+        sender.send_batch(range(1, 20))
+        sender.send_batch(range(20, 22))
+        self.assertEqual(sender.batch, [21])
+        batches = [conn[0].recv() for _ in range(3)]
+        self.assertFalse(conn[0].poll())
+        conn[0].close()
+        conn[1].close()
+        self.assertEqual(batches, [range(0, 7), range(7, 14), range(14, 21)])
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_batch_transport)
+    unittest.TextTestRunner(verbosity=2).run(suite)
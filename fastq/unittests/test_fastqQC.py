@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from ngs_python.fastq import fastqQC
+
+class test_qc_stats(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.reads = [('read1', 'ACGTN', 'IIII#'), ('read2', 'GGCC', '5555'),
+            ('read3', '', ''), ('read4', 'aaNNTT', '!!!!!!')]
+        self.fastq = os.path.join(self.dir, 'sample.fastq')
+        with open(self.fastq, 'w') as outFile:
+            for read in self.reads * 100:
+                outFile.write('@%s\n%s\n+\n%s\n' %(read))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_summary(self):
+        stats = fastqQC.qcStats()
+        stats.add([read[1] for read in self.reads],
+            [read[2] for read in self.reads])
+        summary = stats.summary()
+        self.assertEqual(summary['reads'], 4)
+        self.assertEqual(summary['bases'], 15)
+        self.assertEqual(summary['length']['histogram'],
+            [[0, 1], [4, 1], [5, 1], [6, 1]])
+        self.assertEqual(summary['quality']['median'][:5], [20, 20, 20, 20, 0])
+        self.assertEqual(summary['quality']['mean'][4], 1.0)
+        self.assertEqual(summary['mean_quality'], [[0, 1], [20, 1], [32, 1]])
+        self.assertEqual(summary['base_composition']['A'][:2], [2 / 3.0, 1 / 3.0])
+        self.assertEqual(summary['gc']['histogram'][40], 1)
+        self.assertEqual(summary['gc']['histogram'][100], 1)
+        self.assertEqual(summary['n']['reads'], 2)
+        self.assertEqual(summary['n']['per_position'], [0, 0, 1, 1, 1, 0])
+
+    def test_quality_range(self):
+        # Qualities outside the phred+33 range are rejected
+        stats = fastqQC.qcStats()
+        for quality in ('II\x80I', 'II I', 'II\x7f\xff'):
+            self.assertRaises(ValueError, stats.add, ['ACGT'], [quality])
+        self.assertEqual(stats.reads, 0)
+        stats.add(['ACGT'], ['!I~\x7f'])
+        self.assertEqual(stats.summary()['quality']['median'],
+            [0, 40, 93, 94])
+
+    def test_merge(self):
+        stats = [fastqQC.qcStats() for _ in range(3)]
+        for count, read in enumerate(self.reads):
+            stats[count % 2].add([read[1]], [read[2]])
+            stats[2].add([read[1]], [read[2]])
+        merged = stats[0].merge(stats[1])
+        self.assertEqual(merged.summary(), stats[2].summary())
+
+    def test_native_qc(self):
+        for processes in (1, 2):
+            path = fastqQC.nativeQC(self.fastq, self.dir, processes)
+            self.assertEqual(path, os.path.join(self.dir, 'sample_qc.json'))
+            with open(path) as inFile:
+                summary = json.load(inFile)
+            self.assertEqual(summary['reads'], 400)
+            self.assertEqual(summary['n']['bases'], 300)
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_qc_stats)
+    unittest.TextTestRunner(verbosity=2).run(suite)
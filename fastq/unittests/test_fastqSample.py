@@ -0,0 +1,64 @@
+import collections
+import unittest
+from ngs_python.fastq import fastqSample
+
+class test_reservoir_sampler(unittest.TestCase):
+
+    def sample(self, number, total, seed = 1234):
+        sampler = fastqSample.reservoirSampler(number, seed)
+        for count in range(total):
+            sampler.add(('read{}'.format(count), count))
+        return(sampler.sample())
+
+    def test_size_and_order(self):
+        for number, total in ((1, 1), (10, 10), (10, 1000), (100, 5000)):
+            sample = self.sample(number, total)
+            self.assertEqual(len(sample), number)
+            indices = [item[1] for item in sample]
+            self.assertEqual(indices, sorted(set(indices)))
+            self.assertTrue(all(0 <= index < total for index in indices))
+
+    def test_fewer_items(self):
+        sample = self.sample(10, 4)
+        self.assertEqual([item[1] for item in sample], [0, 1, 2, 3])
+
+    def test_seed(self):
+        self.assertEqual(self.sample(20, 1000, 1), self.sample(20, 1000, 1))
+        self.assertNotEqual(self.sample(20, 1000, 1),
+            self.sample(20, 1000, 2))
+
+    def test_uniform(self):
+        counts = collections.Counter()
+        for seed in range(2000):
+            for item in self.sample(5, 20, seed):
+                counts[item[1]] += 1
+        # Each item is expected to be selected 500 times
+        self.assertEqual(len(counts), 20)
+        self.assertTrue(all(400 < value < 600 for value in counts.values()))
+
+class test_hash_select(unittest.TestCase):
+
+    def test_read_name(self):
+        self.assertEqual(fastqSample.read_name('M:1:2 1:N:0:1'), 'M:1:2')
+        self.assertEqual(fastqSample.read_name('M:1:2/1'), 'M:1:2')
+        self.assertEqual(fastqSample.read_name('M:1:2/2 extra'), 'M:1:2')
+
+    def test_pairs(self):
+        for count in range(1000):
+            read1 = 'M:1:{} 1:N:0:1'.format(count)
+            read2 = 'M:1:{}/2'.format(count)
+            self.assertEqual(fastqSample.hash_select(read1, 0.3, 5),
+                fastqSample.hash_select(read2, 0.3, 5))
+
+    def test_fraction(self):
+        for fraction in (0, 0.1, 0.5, 1):
+            selected = sum(fastqSample.hash_select(
+                'M:1:{}'.format(count), fraction) for count in range(10000))
+            self.assertTrue(abs(selected - fraction * 10000) < 300)
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_reservoir_sampler)
+    unittest.TextTestRunner(verbosity=2).run(suite)
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_hash_select)
+    unittest.TextTestRunner(verbosity=2).run(suite)
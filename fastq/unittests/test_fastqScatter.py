@@ -0,0 +1,117 @@
+import gzip
+import os
+import random
+import shutil
+import stat
+import tempfile
+import unittest
+from ngs_python.fastq import fastqIndex, fastqScatter, fastqShard
+from ngs_python.system import pgzip
+
+class test_fastq_scatter(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        random.seed(1)
+        self.reads = []
+        for count in range(1000):
+            for number in (1, 2):
+                length = random.randint(1, 60)
+                self.reads.append(('read{} {}:N:0:1'.format(count, number),
+                    ''.join(random.choice('ACGT') for _ in range(length)),
+                    ''.join(random.choice('@IJ+') for _ in range(length))))
+        # Create interleaved BGZF file
+        self.interleaved = os.path.join(self.dir, 'test.fastq.gz')
+        with pgzip.parallelGzipWriter(
+                self.interleaved, 1, chunk_size = 1000) as outFile:
+            outFile.write(''.join(['@%s\n%s\n+\n%s\n' %(read) for read in
+                self.reads]))
+        # Create executables writing read names in place of alignments
+        self.bin = os.path.join(self.dir, 'bin')
+        os.mkdir(self.bin)
+        scripts = {
+            'bwa': 'for f in "$@"; do :; done\n'\
+                'gzip -dc "$f" | awk \'NR%4==1{print substr($1,2)}\'',
+            'samtools': 'cmd=$1; shift\n'\
+                'case $cmd in\n'\
+                'sort) while [ $# -gt 0 ]; do [ "$1" = -o ] && out=$2; '\
+                'shift; done; LC_ALL=C sort > "$out";;\n'\
+                'merge) while [ "${1:0:1}" = - ]; do [ "$1" = -@ ] && shift; '\
+                'shift; done; out=$1; shift; LC_ALL=C sort -m "$@" > "$out";;'\
+                '\nesac'}
+        for name, script in scripts.items():
+            path = os.path.join(self.bin, name)
+            with open(path, 'w') as outFile:
+                outFile.write('#!/bin/bash\n' + script + '\n')
+            os.chmod(path, stat.S_IRWXU)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_plan_chunks(self):
+        # Interleaved pairs are not split between chunks
+        chunks = fastqScatter.plan_chunks(self.interleaved, chunks = 5,
+            interleaved = True, interval = 100)
+        self.assertEqual(len(chunks), 5)
+        reads = []
+        for (shard,) in chunks:
+            chunkReads = list(fastqShard.shard_records(shard))
+            self.assertEqual(len(chunkReads) % 2, 0)
+            reads.extend(chunkReads)
+        self.assertEqual(reads, self.reads)
+        self.assertRaises(ValueError, fastqScatter.plan_chunks,
+            self.interleaved, chunks = 5, interleaved = True, interval = 99)
+        # Chunks are written to gzipped FASTQ files
+        path = os.path.join(self.dir, 'chunk.fastq.gz')
+        fastqScatter.write_chunk((chunks[1], [path]))
+        with gzip.open(path) as inFile:
+            self.assertEqual(inFile.read(), ''.join(['@%s\n%s\n+\n%s\n' %(
+                read) for read in fastqShard.shard_records(chunks[1][0])]))
+
+    def test_chunk_command(self):
+        self.assertEqual(fastqScatter.chunk_command('bwa', '/idx',
+            ['/in.fastq.gz'], '/out.bam', '2', nameSort = True,
+            interleaved = True), 'bash -o pipefail -c \'bwa mem -R '\
+            '\'"\'"\'@RG\\tID:2\'"\'"\' -M -p -t 1 /idx /in.fastq.gz | '\
+            'samtools sort -n -m 2G -@ 1 -T /out -O bam -o /out.bam -\'')
+        self.assertRaises(ValueError, fastqScatter.chunk_command, 'bowtie2',
+            '/idx', ['/in.fastq.gz'], '/out.bam', interleaved = True)
+
+    def test_scatter_align(self):
+        # Chunks are split at checkpoints of a saved index
+        fastqIndex.build_index(self.interleaved, 100, save = True)
+        outBam = os.path.join(self.dir, 'out.bam')
+        metrics = fastqScatter.scatter_align([self.interleaved], '/idx',
+            outBam, chunks = 4, processes = 2, nameSort = True,
+            interleaved = True, alignerPath = os.path.join(self.bin, 'bwa'),
+            samtoolsPath = os.path.join(self.bin, 'samtools'))
+        self.assertEqual(metrics['chunks'], 4)
+        with open(outBam) as inFile:
+            self.assertEqual(inFile.read().split(), sorted(read[0].split()[0]
+                for read in self.reads))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'out.chunks')))
+        # Failed alignments raise an error and remove chunks but keep logs
+        self.assertRaises(IOError, fastqScatter.scatter_align,
+            [self.interleaved], '/idx', outBam, chunks = 2,
+            interleaved = True, alignerPath = 'false',
+            samtoolsPath = os.path.join(self.bin, 'samtools'))
+        scratch = os.path.join(self.dir, 'out.chunks')
+        self.assertEqual(sorted(os.listdir(scratch)), ['input1_chunk1.log',
+            'input1_chunk2.log'])
+        # Existing scratch directories are kept with their other files
+        shutil.rmtree(scratch)
+        scratch = os.path.join(self.dir, 'scratch')
+        os.mkdir(scratch)
+        open(os.path.join(scratch, 'keep.txt'), 'w').close()
+        fastqScatter.scatter_align([self.interleaved], '/idx', outBam,
+            chunks = 2, nameSort = True, interleaved = True,
+            alignerPath = os.path.join(self.bin, 'bwa'),
+            samtoolsPath = os.path.join(self.bin, 'samtools'),
+            scratch = scratch, log = os.path.join(self.dir, 'align.log'))
+        self.assertEqual(sorted(os.listdir(scratch)), ['input1_chunk1.log',
+            'input1_chunk2.log', 'keep.txt', 'merge.log'])
+        self.assertTrue(os.path.isfile(os.path.join(self.dir, 'align.log')))
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_fastq_scatter)
+    unittest.TextTestRunner(verbosity=3).run(suite)
@@ -0,0 +1,126 @@
+import collections
+import gzip
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from ngs_python.fastq import fastqBatch, fastqIO, fastqScreen
+
+COMPLEMENT = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
+
+def reverse_complement(sequence):
+    return(''.join(COMPLEMENT[base] for base in reversed(sequence)))
+
+class test_fastq_screen(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        random.seed(1)
+        # Create reference and adapter FASTA files
+        self.reference = ''.join(random.choice('ACGT') for _ in range(2000))
+        self.adapter = 'AGATCGGAAGAGCACACGTCTGAACTCCAGTCAC'
+        self.fasta = [os.path.join(self.dir, name) for name in
+            ('phix.fa', 'adapter.fa.gz')]
+        with open(self.fasta[0], 'w') as outFile:
+            outFile.write('>phix\n' + '\n'.join(self.reference[start:start +
+                60] for start in range(0, 2000, 60)) + '\n')
+        with gzip.open(self.fasta[1], 'w') as outFile:
+            outFile.write('>adapter\n{}\n'.format(self.adapter))
+        # Create reads from the reference, adapter dimers and random reads
+        self.fastq = os.path.join(self.dir, 'test.fastq')
+        with open(self.fastq, 'w') as outFile:
+            for count in range(1000):
+                if count % 5 == 0:
+                    start = random.randint(0, 1900)
+                    sequence = self.reference[start:start + 100]
+                    if count % 10 == 0:
+                        sequence = reverse_complement(sequence)
+                elif count % 10 == 1:
+                    sequence = self.adapter + 'A' * 16
+                else:
+                    sequence = ''.join(random.choice('ACGT') for _ in
+                        range(100))
+                outFile.write('@read{} 1:N:0:1\n{}\n+\n{}\n'.format(count,
+                    sequence, 'I' * len(sequence)))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_kmer_codes(self):
+        sequences = [''.join(random.choice('ACGTNa') for _ in range(
+            random.randint(0, 30))) for _ in range(200)]
+        batch = fastqBatch.from_records(['read'] * 200, sequences,
+            ['I' * len(sequence) for sequence in sequences])
+        kmers, indices = fastqScreen.kmer_codes(batch.sequences,
+            batch.starts, batch.ends, 5)
+        # Compare with k-mers encoded as base four numbers
+        expected = []
+        for index, sequence in enumerate(sequences):
+            sequence = sequence.upper()
+            for start in range(len(sequence) - 4):
+                kmer = sequence[start:start + 5]
+                if 'N' not in kmer:
+                    expected.append((min(int(''.join(str('ACGT'.index(base))
+                        for base in strand), 4) for strand in (kmer,
+                        reverse_complement(kmer))), index))
+        self.assertEqual(zip(kmers.tolist(), indices.tolist()), expected)
+
+    def test_reference_kmers(self):
+        # K-mers of windows match k-mers of whole sequences
+        sequences = [''.join(random.choice('ACGTN') for _ in range(length))
+            for length in (200, 3, 57)]
+        fasta = os.path.join(self.dir, 'windows.fa')
+        with open(fasta, 'w') as outFile:
+            for count, sequence in enumerate(sequences):
+                outFile.write('>seq{}\n{}\n{}\n'.format(count,
+                    sequence[:30], sequence[30:]))
+        expected = set()
+        for sequence in sequences:
+            for start in range(len(sequence) - 4):
+                kmer = sequence[start:start + 5]
+                if 'N' not in kmer:
+                    expected.add(min(int(''.join(str('ACGT'.index(base))
+                        for base in strand), 4) for strand in (kmer,
+                        reverse_complement(kmer))))
+        for window in (5, 7, 64, 1048576):
+            self.assertEqual(fastqScreen.reference_kmers(fasta, 5,
+                window).tolist(), sorted(expected))
+
+    def test_heavy_hitters(self):
+        items = ['item{}'.format(random.randint(0, 1000)) for _ in
+            range(5000)] + ['frequent'] * 600 + ['common'] * 300
+        random.shuffle(items)
+        counts = collections.Counter(items)
+        # Sketches of separate batches are merged
+        sketches = [fastqScreen.heavyHitters(20), fastqScreen.heavyHitters(20)]
+        for start in range(0, len(items), 100):
+            sketches[start % 200 // 100].add(items[start:start + 100])
+        sketch = sketches[0].merge(sketches[1])
+        self.assertLessEqual(len(sketch.counts), 20)
+        self.assertLessEqual(sketch.error, len(items) / 21)
+        self.assertEqual([item for item, count in sketch.top(2)],
+            ['frequent', 'common'])
+        for item, count in sketch.counts.items():
+            self.assertTrue(counts[item] - sketch.error <= count <=
+                counts[item])
+
+    def test_screen_reads(self):
+        for processes in (1, 3):
+            stats = fastqIO.parseFastq(self.fastq,
+                processes = processes).screen_reads(self.fasta)
+            summary = stats.summary(2)
+            self.assertEqual(summary['reads'], 1000)
+            self.assertEqual(summary['references']['phix']['hits'], 200)
+            self.assertEqual(summary['references']['adapter']['unique'], 100)
+            self.assertEqual(summary['any']['hits'], 300)
+            self.assertEqual(summary['overrepresented'][0]['sequence'],
+                self.adapter + 'A' * 16)
+        # Reads are sampled by the hash of their names
+        stats = fastqIO.parseFastq(self.fastq).screen_reads(self.fasta,
+            fraction = 0.5)
+        self.assertTrue(400 < stats.reads < 600)
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_fastq_screen)
+    unittest.TextTestRunner(verbosity=3).run(suite)
@@ -0,0 +1,106 @@
+import gzip
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from ngs_python.fastq import fastqIO, fastqShard
+from ngs_python.system import pgzip
+
+class test_fastq_shard(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        random.seed(1)
+        self.reads = [[], []]
+        for count in range(1000):
+            for number in (1, 2):
+                length = random.randint(1, 60)
+                self.reads[number - 1].append((
+                    'read{} {}:N:0:1'.format(count, number),
+                    ''.join(random.choice('ACGT') for _ in range(length)),
+                    ''.join(random.choice('@IJ+') for _ in range(length))))
+        data = [''.join(['@%s\n%s\n+\n%s\n' %(read) for read in reads])
+            for reads in self.reads]
+        # Create plain, gzip and BGZF files
+        self.plain = os.path.join(self.dir, 'test.fastq')
+        with open(self.plain, 'w') as outFile:
+            outFile.write(data[0])
+        self.gzip = os.path.join(self.dir, 'test.fastq.gz')
+        with gzip.open(self.gzip, 'w') as outFile:
+            outFile.write(data[0])
+        self.bgzf = []
+        for number in (1, 2):
+            path = os.path.join(self.dir, 'test_R{}.fastq.gz'.format(number))
+            with pgzip.parallelGzipWriter(
+                    path, 1, chunk_size = 1000) as outFile:
+                outFile.write(data[number - 1])
+            self.bgzf.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_find_record_start(self):
+        data = '@r1\nAC\n+\n@I\n@r2\nGT\n+\nII\n'
+        self.assertEqual(fastqShard.find_record_start(data), 0)
+        self.assertEqual(fastqShard.find_record_start(data, 1), -1)
+        self.assertEqual(fastqShard.find_record_start(data, 1, True), 12)
+        # Quality lines starting with '@' are skipped
+        self.assertEqual(fastqShard.find_record_start(data, 9, True), 12)
+
+    def test_shards(self):
+        for path in (self.plain, self.gzip, self.bgzf[0]):
+            for number in (1, 3, 7, 50):
+                shards = fastqShard.plan_shards(path, number)
+                reads = []
+                for shard in shards:
+                    reads.extend(fastqShard.shard_records(shard))
+                self.assertEqual(reads, self.reads[0])
+                if path == self.gzip:
+                    self.assertEqual(len(shards), 1)
+
+    def test_paired_shards(self):
+        # Indices are only built on request and saved to a directory
+        shards = fastqShard.plan_paired_shards(self.bgzf[0], self.bgzf[1],
+            4, 100)
+        self.assertEqual(len(shards), 1)
+        directory = os.path.join(self.dir, 'indices')
+        os.mkdir(directory)
+        shards = fastqShard.plan_paired_shards(self.bgzf[0], self.bgzf[1],
+            4, 100, build = True, directory = directory)
+        self.assertEqual(sorted(os.listdir(directory)),
+            ['test_R1.fastq.gz.fqi', 'test_R2.fastq.gz.fqi'])
+        self.assertFalse(os.path.exists(self.bgzf[0] + '.fqi'))
+        self.assertEqual(len(shards), 4)
+        self.assertEqual(fastqShard.plan_paired_shards(self.bgzf[0],
+            self.bgzf[1], 4, directory = directory), shards)
+        self.assertEqual(len(shards), 4)
+        for number in (0, 1):
+            reads = []
+            for pair in shards:
+                self.assertEqual(pair[0].record, pair[1].record)
+                reads.extend(fastqShard.shard_records(pair[number]))
+            self.assertEqual(reads, self.reads[number])
+
+    def test_count_records(self):
+        for path in (self.plain, self.gzip, self.bgzf[0]):
+            self.assertEqual(fastqShard.count_records(path, 2), 1000)
+
+    def test_parallel_trim(self):
+        output = [os.path.join(self.dir, 'trim{}.fastq.gz'.format(processes))
+            for processes in (1, 2)]
+        metrics = []
+        for count, processes in enumerate((1, 2)):
+            fastq = fastqIO.parseFastq(self.bgzf[0], self.bgzf[1],
+                processes = processes)
+            self.assertEqual(fastq.check_names(), 1000)
+            metrics.append(fastq.interleave_trim_reads('GATC',
+                output[count], 10))
+        self.assertEqual(metrics[0], metrics[1])
+        with gzip.open(output[0]) as first, gzip.open(output[1]) as second:
+            self.assertEqual(first.read(), second.read())
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_fastq_shard)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -3,6 +3,7 @@
 Usage:
     coverageHistogram.py <intervals> <outfile> <bam>... 
         [--minmap=<mm>] [--maxcov=<mc>] [--rmdup] [--rmsec] [--onebased]
+        [--processes=<pr>] [--cache]
 
 Options:
     --minmap=<mm>  Minimum mapping quality for read [default: 0].
@@ -11,6 +12,8 @@ Options:
     --rmsec        Skip secondary reads in calculating coverage.
     --onebased     Intervals have a one-based start. Otherwise a
         zero-based start is presumed.
+    --processes=<pr>  Number of processes [default: 1].
+    --cache        Use, or build, per base coverage cache of BAM files.
 
 '''
 # Load required modules
@@ -22,6 +25,7 @@ import pandas as pd
 args = docopt.docopt(__doc__,version = 'v1')
 args['--minmap'] = int(args['--minmap'])
 args['--maxcov'] = int(args['--maxcov'])
+args['--processes'] = int(args['--processes'])
 args['<intervals>'] = os.path.abspath(args['<intervals>'])
 args['<outfile>'] = os.path.abspath(args['<outfile>'])
 args['<bam>'] = [os.path.abspath(x) for x in args['<bam>']]
@@ -40,11 +44,11 @@ outDF = pd.DataFrame(
     columns=args['<bam>'])
 # Extract mean coverage for intervals
 for bam in args['<bam>']:
-    covCalc = pysam_coverage.single_coverage(bam)
+    covCalc = pysam_coverage.single_coverage(bam, cache=args['--cache'])
     outDF[bam] = covCalc.coverage_histogram(
         intervals=intervalList, max_cov=args['--maxcov'],
         map_quality=args['--minmap'], remove_dup=args['--rmdup'],
-        remove_secondary=args['--rmsec'])
+        remove_secondary=args['--rmsec'], processes=args['--processes'])
 # Save intervals to file
 if args['<outfile>'].endswith('.gz'):
     compression = 'gzip'
@@ -3,6 +3,7 @@
 Usage:
     meanCoverageCorrelation.py <intervals> <outprefix> <bam>... 
         [--minmap=<mm>] [--mincov=<mc>] [--rmdup] [--onebased]
+        [--processes=<pr>] [--cache]
 
 Options:
     --minmap=<mm>  Minimum mapping quality for read [default: 0].
@@ -10,6 +11,8 @@ Options:
     --rmdup        Skip duplicate reads in calculating coverage.
     --onebased     Intervals have a one-based start. Otherwise a
         zero-based start is presumed.
+    --processes=<pr>  Number of processes [default: 1].
+    --cache        Use, or build, per base coverage cache of BAM files.
 
 '''
 # Load required modules
@@ -25,6 +28,7 @@ if args['--minmap'] < 0:
 args['--mincov'] = int(args['--mincov'])
 if args['--mincov'] < 1:
     raise ValueError('--mincov must be >= 1')
+args['--processes'] = int(args['--processes'])
 # Open interval list file and extract data
 intervalList = []
 with open(args['<intervals>']) as intervalFile:
@@ -35,24 +39,26 @@ with open(args['<intervals>']) as intervalFile:
 if args['--onebased']:
     intervalList = [(x[0], x[1] - 1, x[2]) for x in intervalList]
 # Extract mean coverage for intervals
-bamCov = pysam_coverage.multiple_coverage(args['<bam>'])
-coverage = bamCov.mean_coverage(intervals=intervalList,
-    map_quality=args['--minmap'], remove_dup=args['--rmdup'])
+bamCov = pysam_coverage.multiple_coverage(args['<bam>'],
+    cache=args['--cache'])
+matrix = bamCov.coverage_matrix(intervals=intervalList,
+    map_quality=args['--minmap'], remove_dup=args['--rmdup'],
+    processes=args['--processes'])
 # Shorten bam names
-for count, bam in enumerate(coverage):
+nameList = []
+for bam in matrix.samples:
     name = os.path.basename(bam)
     if name.endswith('.bam'):
         name = name[:-4]
-    if count:
-        nameList.append(name)
-    else:
-        nameList = [name]
-coverage.columns = nameList
+    nameList.append(name)
+matrix.samples = nameList
+coverage = matrix.dataframe()
 # Filter coverage and log convert
-filtCov = coverage[coverage.min(axis=1) >= args['--mincov']]
-log2Cov = np.log2(filtCov)
+filtMatrix = matrix.filter(args['--mincov'])
+log2Cov = np.log2(filtMatrix.dataframe())
 # Create output files
 covFile = args['<outprefix>'] + '.mean_coverage.txt'
+matrixFile = args['<outprefix>'] + '.mean_coverage.npz'
 corFile = args['<outprefix>'] + '.correlation_matrix.txt'
 corPlot = args['<outprefix>'] + '.correlation_matrix.png'
 denPlot = args['<outprefix>'] + '.correlation_dendrogram.png'
@@ -66,8 +72,10 @@ with open(corFile, 'w') as outfile:
     outfile.write('#   min map quality - {}\n'.format(args['--minmap']))
     outfile.write('#   remove duplicates - {}\n'.format(args['--rmdup']))
     outfile.write('#   supplied intervals - {}\n'.format(len(intervalList)))
-    outfile.write('#   correlated intervals - {}\n'.format(len(filtCov.index)))
-coverage.corr().to_csv(corFile, sep='\t', mode='append')
+    outfile.write('#   correlated intervals - {}\n'.format(
+        len(filtMatrix.intervals)))
+filtMatrix.correlation().to_csv(corFile, sep='\t', mode='append')
 coverage.to_csv(covFile, sep='\t', index_label='interval')
+matrix.save(matrixFile)
 custom_plots.correlationDendrogram(log2Cov, denPlot)
 custom_plots.correlationMatrix(log2Cov, corPlot)
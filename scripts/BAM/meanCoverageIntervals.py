@@ -2,13 +2,16 @@
     
 Usage:
     meanCoverageIntervals.py <intervals> <outfile> <bam>... 
-        [--minmap=<mm>] [--rmdup] [--onebased] [--header]
+        [--minmap=<mm>] [--rmdup] [--onebased] [--header] [--processes=<pr>]
+        [--cache]
 
 Options:
     --minmap=<mm>  Minimum mapping quality for read [default: 0].
     --rmdup        Skip duplicate reads in calculating coverage.
     --onebased     Intervals have a one-based start. Otherwise a
         zero-based start is presumed.
+    --processes=<pr>  Number of processes [default: 1].
+    --cache        Use, or build, per base coverage cache of BAM files.
 
 '''
 # Load required modules
@@ -17,6 +20,7 @@ from ngs_python.bam import pysam_coverage
 # Extract arguments
 args = docopt.docopt(__doc__,version = 'v1')
 args['--minmap'] = int(args['--minmap'])
+args['--processes'] = int(args['--processes'])
 # Open interval list file and extract data
 intervalList = []
 with open(args['<intervals>']) as intervalFile:
@@ -27,9 +31,11 @@ with open(args['<intervals>']) as intervalFile:
 if args['--onebased']:
     intervalList = [(x[0], x[1] - 1, x[2]) for x in intervalList]
 # Extract mean coverage for intervals
-bamCov = pysam_coverage.multiple_coverage(args['<bam>'])
+bamCov = pysam_coverage.multiple_coverage(args['<bam>'],
+    cache=args['--cache'])
 outDF = bamCov.mean_coverage(intervals=intervalList,
-    map_quality=args['--minmap'], remove_dup=args['--rmdup'])
+    map_quality=args['--minmap'], remove_dup=args['--rmdup'],
+    processes=args['--processes'])
 # Save intervals to file
 if args['<outfile>'].endswith('.gz'):
     compression = 'gzip'
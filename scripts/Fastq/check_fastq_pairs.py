@@ -1,10 +1,9 @@
 
-import gzip
 import multiprocessing
-import subprocess
 import os
 import random
 from Bio.SeqIO.QualityIO import FastqGeneralIterator
+from ngs_python.system import streamio
 
 class extractNames(object):
     ''' Class functions as an iterator to extract reads from single or paired
@@ -20,7 +19,7 @@ class extractNames(object):
         
         1)  fastq1 - Full path to FASTQ file.
         2)  fastq2 - Full path to paired FASTQ file (optional).
-        3)  shell - Boolean indicating whether to use shell zcat command
+        3)  shell - Boolean indicating whether to use a gzip subprocess
             to read gzipped input.
         4)  number - Number of reads to extract.
         5)  sample - Number of reads from which to sample the desired number
@@ -39,9 +38,9 @@ class extractNames(object):
     
     def __read_process(self, fastq, pend):
         ''' Function to generate a process to read FASTQ files. Extracted reads
-        will be sent doen the supplied multiprocessing pipe. If self.shell is
-        True then gzipped input files will be read using the zcat command in the
-        shell. If self.entries is set then only the FASTQ entries at the desired
+        will be sent doen the supplied multiprocessing pipe. Files are read by
+        streamio.open_input and, if self.shell is True, gzipped input files
+        are decompressed by a gzip subprocess. If self.entries is set then only the FASTQ entries at the desired
         indices will be sent down the pipe. FASTQ entries are generated as three
         element tuples consisting of: read name, base calls, base qualities.
         Function takes two arguments:
@@ -50,14 +49,7 @@ class extractNames(object):
         2)  pend - End of multiprocessing pipe down which reads will be sent.
         '''
         # Create fastq handle
-        if self.shell and fastq.endswith('.gz'):
-            sp = subprocess.Popen(['zcat', fastq], stdout = subprocess.PIPE,
-                bufsize = 1)
-            fh = sp.stdout
-        elif fastq.endswith('.gz'):
-            fh = gzip.open(fastq)
-        else:
-            fh = open(fastq)
+        fh = streamio.open_input(fastq, self.shell)
         # Extract all reads
         for read in FastqGeneralIterator(fh):
             name_list = read[0].split()
@@ -70,9 +62,7 @@ class extractNames(object):
                 self.__send(output, pend)
             except StopIteration:
                 break
-        # Close subprocess and file handle
-        if self.shell and fastq.endswith('.gz'):
-            sp.terminate()
+        # Close file handle
         fh.close()
     
     def __send(self, read, pend):
@@ -3,6 +3,7 @@
 Usage:
     
     concatIlluminaFrags.py <indir> <outdir> [--unpaired] [--traverse]
+        [--threads=<th>]
     
     concatIlluminaFrags.py (-h | --help)
     
@@ -10,6 +11,7 @@ Options:
     
     --unpaired  Do not check for paired reads.
     --traverse  Look for FASTQ files within subdirectories.
+    --threads=<th>  Number of fragments copied at once [default: 4].
     
 """
 
@@ -18,8 +20,10 @@ import os
 import re
 import collections
 from general_python import docopt, moab
+from ngs_python.system import gzconcat
 # Extract arguments
 args = docopt.docopt(__doc__,version = 'v1')
+args['--threads'] = int(args['--threads'])
 # Create regular expression to find fastq files
 rePattern = re.compile('(.*?_L\\d{3}_R[12])_\\d{3}\\.fastq\\.gz$')
 # Create dictionary
@@ -49,11 +53,11 @@ else:
                 continue
             # Add files to output dictionary
             name = match.group(1)
-            path = os.path.join(path, infile)
+            infile = os.path.join(path, infile)
             if name in fastqDict:
-                fastqDict[name].append(path)
+                fastqDict[name].append(infile)
             else:
-                fastqDict[name] = [path]
+                fastqDict[name] = [infile]
 keys = fastqDict.keys()
 keys.sort()
 print keys[:10]
@@ -66,13 +70,14 @@ for name in fastqDict.keys():
         reads.sort()
         # Create outfile and command
         outfile = os.path.join(args['<outdir>'], name + '.fastq.gz')
-        command = 'zcat %s | gzip > %s' %(' '.join(reads), outfile)
         # Check for missing files
         for count, rd in enumerate(reads):
             # Check for missing files
             number = int(rd[-12:][:3])
             if (number - count) != 1:
                 raise IOError('Missing fragments found for %s' %(name))
+        # Concatenate fragments without recompression
+        gzconcat.concatenate_gzip(reads, outfile, args['--threads'])
     # Process paired reads
     else:
         # Extract files
@@ -92,15 +97,13 @@ for name in fastqDict.keys():
             raise IOError('Unpaired reads found for %s' %(name))
         for count, (R1, R2) in enumerate(zip(read1, read2)):
             # Check pairing
-            if  R1[-12:] != R1[-12:]:
+            if  R1[-12:] != R2[-12:]:
                 raise IOError('Unpaired fragments found for %s' %(name))
             # Check for missing files
             number = int(R1[-12:][:3])
             if (number - count) != 1:
                 raise IOError('Missing fragments found for %s' %(name))
-        # Create commands
-        command1 = 'zcat %s | gzip > %s' %(' '.join(read1), outfile1)
-        command2 = 'zcat %s | gzip > %s' %(' '.join(read2), outfile2)
-        #moab.submitJob(command1)
-        #moab.submitJob(command2)
-        #print '%s paired files concatenated to prefix %s' %(len(read1), outfile1[:-10])
+        # Concatenate fragments without recompression
+        gzconcat.concatenate_gzip(read1, outfile1, args['--threads'])
+        gzconcat.concatenate_gzip(read2, outfile2, args['--threads'])
+        print '%s paired files concatenated to prefix %s' %(len(read1), outfile1[:-10])
@@ -0,0 +1,40 @@
+'''demultiplexFastq.py
+
+Usage:
+    
+    demultiplexFastq.py [--location=<loc>] [--mismatches=<mm>]
+        [--index1=<i1>] [--index2=<i2>] [--threads=<th>] [--report=<rp>]
+        <samples> <outPrefix> <inFastq1> [<inFastq2>]
+    
+Options:
+    
+    --location=<loc>    Barcode location: header, index or inline
+                        [default: header].
+    --mismatches=<mm>   Maximum mismatches in each barcode [default: 1].
+    --index1=<i1>       Index1 FASTQ file, for index barcodes.
+    --index2=<i2>       Index2 FASTQ file, for dual index barcodes.
+    --threads=<th>      Number of compression threads [default: 4].
+    --report=<rp>       JSON file in which to write report.
+    
+The samples file lists the sample name, index1 barcode and optional index2
+barcode of each sample, separated by tabs or commas.
+    
+'''
+# Import arguments
+from ngs_python.fastq import fastqDemultiplex, fastqIO
+from general_python import docopt
+# Extract arguments
+args = docopt.docopt(__doc__,version = 'v1')
+# Create input fastq object
+pf = fastqIO.parseFastq(fastq1=args['<inFastq1>'],
+    fastq2=args['<inFastq2>'], threads=int(args['--threads']))
+# Demultiplex fastq files
+report = pf.demultiplex(
+    samples=fastqDemultiplex.read_samples(args['<samples>']),
+    outPrefix=args['<outPrefix>'], location=args['--location'],
+    mismatches=int(args['--mismatches']), index1=args['--index1'],
+    index2=args['--index2'], report=args['--report'])
+# Print sample counts
+for name, sample in report['samples'].items():
+    print('{}\t{}\t{}'.format(name, sample['reads'], sample['perfect']))
+print('{:.0f} reads per second'.format(report['reads_per_second']))
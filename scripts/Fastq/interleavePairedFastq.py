@@ -2,7 +2,12 @@
 
 Usage:
     
-    interlevePairedFastq.py <inFastq1> <inFastq2> <outFastq>
+    interlevePairedFastq.py [--names=<names>] <inFastq1> <inFastq2> <outFastq>
+    
+Options:
+    
+    --names=<names>  Read name format: illumina, slash or auto
+                     [default: illumina].
     
 '''
 # Import arguments
@@ -15,5 +20,5 @@ args = docopt.docopt(__doc__,version = 'v1')
 pf = fastqIO.parseFastq(
     fastq1=args['<inFastq1>'], fastq2=args['<inFastq2>'])
 # Interleave fastq files
-count = pf.interleave_reads(args['<outFastq>'])
+count = pf.interleave_reads(args['<outFastq>'], normaliser=args['--names'])
 print(count)
@@ -9,7 +9,8 @@ import argparse
 import itertools
 import os
 # Import custom modules
-from ngs_python.fastq import fastqFind, fastqAlign, fastqIO
+from ngs_python.fastq import fastqFind, fastqAlign, fastqIO, fastqScatter
+from ngs_python.fastq import fastqIndex, fastqShard
 from ngs_python.bam import samtools
 from ngs_python.structure import alignedPair, fragendPair
 # Create parser
@@ -41,6 +42,13 @@ parser.add_argument('-b', '--bwa', help = 'Path to BWA', type = str,
     default = 'bwa')
 parser.add_argument('-t', '--threads', help = 'Number of threads to use',
     type = int, default = 4)
+parser.add_argument('-p', '--stream', help = 'Stream trimmed reads '+\
+    'directly into BWA', action = 'store_true')
+parser.add_argument('-k', '--keepFastq', help = 'Keep a copy of streamed '+\
+    'trimmed reads, or the trimmed reads of chunked alignments',
+    action = 'store_true')
+parser.add_argument('-n', '--chunks', help = 'Number of chunks of trimmed '+\
+    'reads to align concurrently', type = int, default = 1)
 # Check arguments
 args = parser.parse_args()
 if args.maxDistance < 0:
@@ -49,6 +57,8 @@ if args.minMapQ < 2:
     exit("Script terminated: -m option must be 2 or higher")
 if args.minLength < 18:
     exit("Script terminated: -l option must be 18 or higher")
+if args.chunks < 1:
+    exit("Script terminated: -n option must be 1 or higher")
 # Process areguments
 args.cutSite = args.cutSite.upper()
 args.fastqPrefix, args.sampleName = args.sampleData.split(',')
@@ -65,6 +75,7 @@ print 'Parameters:\n\t%s\n\t%s\n\t%s\n\t%s\n\t%s\n\t%s' %(
 args.logFile = args.outDir + args.sampleName + '.log'
 args.outFastq = args.outDir + args.sampleName + '_trimmed.fastq.gz'
 args.nameSortBam = args.outDir + args.sampleName + "_nSort.bam"
+args.bwaLog = args.outDir + args.sampleName + '_bwa.log'
 args.outPairs = args.outDir + args.sampleName + ".readPairs.gz"
 args.outFrags = args.outDir + args.sampleName + ".fragLigations.gz"
 
@@ -74,18 +85,89 @@ args.outFrags = args.outDir + args.sampleName + ".fragLigations.gz"
 # Extract fastq file names
 args.read1, args.read2 = fastqFind.findFastq(prefix = args.fastqPrefix,
     dirList = args.fastqDir.split(','), pair = True)
-if len(args.read1) > 1 or len(args.read2) > 1:
-    raise NotImplemented('Multiple FASTQ file input not implemented')
-# Trim and merge fastq files
-pf = fastqIO.parseFastq(
-    fastq1 = args.read1[0],
-    fastq2 = args.read2[0]
-)
-trimMetrics = pf.interleave_trim_reads(
-    outFastq = args.outFastq,
-    trim = args.cutSite,
-    minLength = args.minLength
-)
+if len(args.read1) != len(args.read2):
+    raise IOError('Unequal number of read1 and read2 FASTQ files')
+args.scatter = len(args.read1) > 1 or args.chunks > 1
+if args.scatter and args.stream:
+    parser.error('--stream requires a single FASTQ pair and one chunk')
+if args.scatter:
+    # Trim each pair of fastq files to a BGZF file that may be split
+    trimMetrics = {}
+    trimFastq = []
+    for number, (read1, read2) in enumerate(zip(args.read1, args.read2)):
+        trimFastq.append(args.outDir + args.sampleName +
+            '_trimmed.{}.fastq.gz'.format(number + 1))
+        pf = fastqIO.parseFastq(
+            fastq1 = read1,
+            fastq2 = read2,
+            threads = max(args.threads, 2)
+        )
+        metrics = pf.interleave_trim_reads(
+            outFastq = trimFastq[-1],
+            trim = args.cutSite,
+            minLength = args.minLength,
+            level = 1
+        )
+        trimMetrics = fastqShard.sum_dict(trimMetrics, metrics)
+    # Align chunks of trimmed reads concurrently and merge alignments
+    fastqScatter.scatter_align(
+        inputs = trimFastq,
+        index = args.bwaFasta,
+        outBam = args.nameSortBam,
+        aligner = 'bwa',
+        chunks = args.chunks,
+        processes = args.chunks,
+        threads = max(1, args.threads // args.chunks),
+        nameSort = True,
+        interleaved = True,
+        alignerPath = args.bwa,
+        log = args.bwaLog
+    )
+    # Remove trimmed reads and their indices
+    if not args.keepFastq:
+        for fastq in trimFastq:
+            os.remove(fastq)
+            if os.path.exists(fastqIndex.index_path(fastq)):
+                os.remove(fastqIndex.index_path(fastq))
+else:
+    # Generate align command
+    alignCommand = fastqAlign.bwaMemAlign(
+        index = args.bwaFasta,
+        outFile = args.nameSortBam,
+        read1 = '{input}' if args.stream else args.outFastq,
+        bwaPath = args.bwa,
+        threads = str(args.threads),
+        markSecondary = True,
+        check = True,
+        nameSort = True,
+        interleaved = True
+    )
+    # Trim and merge fastq files
+    pf = fastqIO.parseFastq(
+        fastq1 = args.read1[0],
+        fastq2 = args.read2[0],
+        threads = args.threads
+    )
+    if args.stream:
+        # Stream trimmed reads into alignment
+        trimMetrics = pf.stream_trim_reads(
+            trim = args.cutSite,
+            command = alignCommand,
+            minLength = args.minLength,
+            tee = args.outFastq if args.keepFastq else None,
+            level = 1,
+            log = args.bwaLog
+        )
+    else:
+        trimMetrics = pf.interleave_trim_reads(
+            outFastq = args.outFastq,
+            trim = args.cutSite,
+            minLength = args.minLength,
+            level = 1
+        )
+        # Run alignment
+        subprocess.check_output(alignCommand, shell = True,
+            stderr=subprocess.STDOUT)
 # Print trim metrics
 print '\nTrim Metrics:\n\t%s\n\t%s\n\t%s\n\t%s' %(
     'total: ' + str(trimMetrics['total']),
@@ -93,19 +175,6 @@ print '\nTrim Metrics:\n\t%s\n\t%s\n\t%s\n\t%s' %(
     'read1 trim: ' + str(trimMetrics['trim1']),
     'read2 trim: ' + str(trimMetrics['trim2'])
 )
-# Generate align command
-alignCommand = fastqAlign.bwaMemAlign(
-    index = args.bwaFasta,
-    outFile = args.nameSortBam,
-    read1 = args.outFastq,
-    bwaPath = args.bwa,
-    threads = str(args.threads),
-    markSecondary = True,
-    check = True,
-    nameSort = True
-)
-# Merge commands and run
-subprocess.check_output(alignCommand, shell = True, stderr=subprocess.STDOUT)
 
 ###############################################################################
 ## Extract aligned pairs
@@ -149,7 +218,8 @@ fragendMetrics = fragendPair.fragendPairs(
     fragendOut = args.outFrags,
     fasta = args.bwaFasta,
     maxDistance = args.maxDistance,
-    resite = args.cutSite
+    resite = args.cutSite,
+    threads = args.threads
 )
 # Print fragend metrics
 print '\nFragend Data:\n\t%s\n\t%s\n\t%s\n\t%s\n\t%s' %(
@@ -18,12 +18,12 @@ Options:
 """
 # Import required modules
 import argparse
-import gzip
 import collections
 import scipy.stats
 import pandas
 import statsmodels.stats.multitest as ssm
 from general_python import docopt
+from ngs_python.system import streamio
 # Extract arguments
 args = docopt.docopt(__doc__,version = 'v1')
 args['--mingo'] = int(args['--mingo'])
@@ -40,7 +40,7 @@ sigGeneSet = set()
 allGenesGO = collections.defaultdict(set)
 sigGenesGO = collections.defaultdict(set)
 # Loop through GO data and populate gene-GO dictionaries
-with gzip.open(args['<gofile>'], "r") as ifile:
+with streamio.open_input(args['<gofile>']) as ifile:
     # Skip header
     next(ifile)
     # Associate GO terms with gene names
@@ -1,5 +1,4 @@
 import collections
-import gzip
 import multiprocessing
 import numpy as np
 import os
@@ -9,6 +8,7 @@ import itertools
 from statsmodels.nonparametric.smoothers_lowess import lowess
 from statsmodels.sandbox.stats.multicomp import multipletests
 from scipy.stats import mannwhitneyu
+from ngs_python.system import streamio
 
 class analyse_interaction(object):
     
@@ -48,7 +48,7 @@ class analyse_interaction(object):
 
     def __distance_prob_generator(self, matrix):
         # Extract bin names
-        with gzip.open(matrix) as inFile:
+        with streamio.open_input(matrix) as inFile:
             binNames = inFile.next().strip().split()
         # Create distance matrix
         start, end = zip(
@@ -73,7 +73,7 @@ class analyse_interaction(object):
             fileName = os.path.basename(matrix)
             sample, binSize, region, minCount = fileName.split('.')[:4]
             # Create output dataframe
-            with gzip.open(matrix) as inFile:
+            with streamio.open_input(matrix) as inFile:
                 binNames = inFile.next().strip().split('\t')
             outDF = pd.DataFrame(index = binNames)
             outDF['sample'] = sample
@@ -151,7 +151,7 @@ class maskMatrix(object):
     def __init__(self, matrix, regions='', overlap = False):
         # Extract bin names
         if matrix.endswith('.gz'):
-            with gzip.open(matrix) as inFile:
+            with streamio.open_input(matrix) as inFile:
                 self.binNames = inFile.next().strip().split('\t')
         else:
             with open(matrix) as inFile:
@@ -376,7 +376,7 @@ class compare_paired_matrices(object):
     
     def __dist_matrix(self, path):
         # Extract bin names
-        with gzip.open(path) as inFile:
+        with streamio.open_input(path) as inFile:
             binNames = inFile.next().strip().split('\t')
         # Extract and check bin data
         binData = np.array([re.split('[:-]', x) for x in binNames])
@@ -4,8 +4,8 @@ from Bio.SeqUtils import nt_search
 from Bio.Seq import Seq
 import bisect
 import collections
-import gzip
 from general_python import writeFile
+from ngs_python.system import streamio
 
 def findFragendSites(fasta, resite):
     ''' Function creates FragendDict object. The object contains
@@ -127,15 +127,19 @@ def downstream(readIn, fragDict):
     # Close IO and return data
     return(output)
 
-def fragendPairs(pairIn, fasta, resite ,maxDistance, fragendOut):
+def fragendPairs(
+        pairIn, fasta, resite ,maxDistance, fragendOut, threads = 1
+    ):
     ''' Function identifies and reports upstream fragends for HiC read pairs. The
-    function takes 5 arguments:
+    function takes 6 arguments:
     
     1)  pairIn - Read apit input object
     2)  fasta - Genome fasta file
     3)  reSite - Restriction enzyme recognition sequence
     4)  maxDistance - Maximum acceptable distance between start of read and RE site.
     5)  pairOut - Name of output gzipped file containing fragend ligations.
+    6)  threads - Number of threads used to decompress BGZF or multi-member
+        gzip input.
     
     '''
     # Create fragend dictionary and metrics dictionary
@@ -144,10 +148,7 @@ def fragendPairs(pairIn, fasta, resite ,maxDistance, fragendOut):
     fragendCounts['fragDist'] = []
     fragendCounts['ligDist'] = []
     # Open input and output file
-    if pairIn.endswith('.gz'):
-        inFile = gzip.open(pairIn, 'r')
-    else:
-        inFile = open(pairIn, 'r')
+    inFile = streamio.streamReader(pairIn, threads = threads)
     outFile = writeFile.writeFileProcess(fragendOut)
     for pair in inFile:
         pair = pair.strip().split('\t')
@@ -1,11 +1,9 @@
 import collections
 import multiprocessing
 import os
-import subprocess
-import gzip
-import cStringIO
 import numpy as np
 import re
+from ngs_python.system import streamio
 
 class genomeBin(object):
 
@@ -177,13 +175,6 @@ class genomeBin(object):
         # Manage thread number
         if threads > 2:
             threads -= 1
-        # Open input file
-        if fragendFile.endswith('.gz'):
-            sp = subprocess.Popen(["zcat", fragendFile],
-                stdout = subprocess.PIPE)
-            fh = cStringIO.StringIO(sp.communicate()[0])
-        else:
-            fh = open(fragendFile)
         # Create queue
         fragQueue = multiprocessing.Queue()
         # Start processes to count interactions
@@ -199,9 +190,11 @@ class genomeBin(object):
             pipeSend.close()
             # Strore process and pipe data
             processData.append((process,pipeReceive))
-        # Add input data to queue
+        # Open input file and add input data to queue
+        fh = streamio.streamReader(fragendFile, threads = threads)
         for line in fh:
             fragQueue.put(line)
+        fh.close()
         # Add termination values to queue and close
         for _ in processData:
             fragQueue.put(None)
@@ -219,9 +212,6 @@ class genomeBin(object):
             else:
                 finalMatrix = processMatrix
                 finalLog = processLog
-        # Close input file
-        if not fragendFile.endswith('.gz'):
-            fh.close()
         # Return data
         return(finalMatrix, finalLog)
 
@@ -267,7 +257,7 @@ class normaliseCountMatrices(object):
         for count, infile in enumerate(self.matrixList):
             if not infile.endswith('countMatrix.gz'):
                 raise IOError("Input files must end '.countMatrix.gz'")
-            with gzip.open(infile, 'r') as openFile:
+            with streamio.open_input(infile) as openFile:
                 header = openFile.next().strip().split('\t')
             if count:
                 if not header == binNames:
@@ -427,12 +417,13 @@ class normaliseCountMatrices(object):
                 raise ValueError('Unrecognised matrix file name')
             sampleName = nameSearch.group(1)
             # Extract bin names
-            with gzip.open(matrix) as inFile:
+            with streamio.open_input(matrix) as inFile:
                 inHeader = np.array(inFile.next().strip().split('\t'))
-            # Create variable to store files and read in counts
+                # Read in counts
+                counts = np.loadtxt(inFile, dtype = np.uint32,
+                    delimiter = '\t')
+            # Create variable to store files
             fileList = []
-            counts = np.loadtxt(matrix, dtype = np.uint32, delimiter = '\t',
-                skiprows = 1)
             # Open log file and loop through regions
             for region, indices in self.regionIndices.items():
                 # Create output file names
@@ -564,11 +555,11 @@ class normaliseCountMatrices(object):
             biasFile = outPrefix + '.bias.gz'
             normMatrix = outPrefix + '.normMatrix.gz'
             # Extract header
-            with gzip.open(matrix) as inFile:
+            with streamio.open_input(matrix) as inFile:
                 header = inFile.next().strip()
-            # Open input matrix as integer array and check symetry
-            inMatrix = np.loadtxt(matrix, dtype=np.float64, skiprows=1,
-                delimiter='\t')
+                # Open input matrix as integer array and check symetry
+                inMatrix = np.loadtxt(inFile, dtype=np.float64,
+                    delimiter='\t')
             bias = self.__calculateBias(inMatrix, max_iter, max_dev)
             np.savetxt(biasFile, bias,  delimiter='\t')
             # Generate normalised matrix and save data
@@ -1,11 +1,11 @@
 import collections
-import gzip
 import multiprocessing
 import numpy as np
 import os
 import pandas as pd
 import re
 import itertools
+from ngs_python.system import streamio
 
 class tad_analysis(object):
     
@@ -45,10 +45,10 @@ class tad_analysis(object):
 
     def paired_prob_generator(self, matrix, max_length=100):
         # Extract bin names
-        with gzip.open(matrix) as inFile:
+        with streamio.open_input(matrix) as inFile:
             binNames = inFile.next().strip().split()
-        # Read in matrix and remove columns
-        prob = np.loadtxt(matrix, dtype=np.float32, delimiter='\t', skiprows=1)
+            # Read in matrix and remove columns
+            prob = np.loadtxt(inFile, dtype=np.float32, delimiter='\t')
         for index, column in enumerate(prob.T):
             # Extract upstream and downstream values
             upstream = column[:index]
@@ -65,7 +65,7 @@ class tad_analysis(object):
         # Loop through input queue
         for matrix, min_length, max_length in iter(inQueue.get, None):
             # Extract bin names
-            with gzip.open(matrix) as inFile:
+            with streamio.open_input(matrix) as inFile:
                 binNames = inFile.next().strip().split()
             binArray = np.array([re.split('[:-]', x) for x in binNames])
             # Extract bin data
@@ -0,0 +1,246 @@
+""" This module is built to concatenate gzip files without recompression. A
+gzip file may contain multiple members, so the concatenation of gzip files
+is itself a valid gzip file and gzip inputs are copied byte for byte. Each
+gzip input is inflated as it is copied, zlib verifying the member headers
+and the CRC32 and ISIZE trailers, and the decompressed data is discarded.
+Only inputs that are not gzip compressed, plain or bzip2 files, are
+compressed, as BGZF, to temporary files. The size of each input then fixes
+its offset in the output file, which is preallocated, and inputs are copied
+to their offsets in a pool of threads, zlib and file operations releasing
+the GIL. The BGZF end of file block is removed from all but the last input,
+so the concatenation of BGZF files remains a BGZF file.
+"""
+import multiprocessing.pool
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import zlib
+from ngs_python.system import pgzip, streamio
+
+def compress_file(path, output, level = 6, chunk_size = 1048576):
+    ''' Function to compress a plain or bzip2 file as BGZF.
+
+    Args:
+        path (str)- Full path to input file.
+        output (str)- Full path to output file.
+        level (int)- zlib compression level between 1 and 9.
+        chunk_size (int)- Number of bytes read at once.
+
+    '''
+    with streamio.streamReader(path, chunk_size = chunk_size) as inFile:
+        with pgzip.parallelGzipWriter(output, 1, level) as outFile:
+            for data in iter(lambda: inFile.read(chunk_size), ''):
+                outFile.write(data)
+
+def copy_range(path, output, offset, length, validate = True,
+        chunk_size = 4194304
+    ):
+    ''' Function to copy the leading bytes of a gzip file to an offset
+    within an existing output file, inflating the copied data to validate
+    it.
+
+    Args:
+        path (str)- Full path to gzip file.
+        output (str)- Full path to output file.
+        offset (int)- Offset within the output file.
+        length (int)- Number of bytes to copy.
+        validate (bool)- Whether to inflate the copied data.
+        chunk_size (int)- Number of bytes read at once.
+
+    Returns:
+        size (int)- Decompressed size of the copied data or None if it was
+            not validated.
+
+    Raises:
+        IOError - If the copied data is not a series of complete gzip
+            members.
+
+    '''
+    size = 0
+    decompressor = None
+    pending = ''
+    with open(path, 'rb') as inFile, open(output, 'r+b') as outFile:
+        outFile.seek(offset)
+        while length:
+            block = inFile.read(min(chunk_size, length))
+            if not block:
+                raise IOError('Unexpected end of file {}'.format(path))
+            outFile.write(block)
+            length -= len(block)
+            block = pending + block
+            pending = ''
+            # Inflate each member in turn
+            while validate and block:
+                if decompressor is None:
+                    # Keep a member header split between reads
+                    if len(block) < 4:
+                        pending = block
+                        break
+                    if not pgzip.is_member_start(block, 0):
+                        raise IOError('Invalid gzip header in {}'.format(
+                            path))
+                    decompressor = zlib.decompressobj(31)
+                try:
+                    size += len(decompressor.decompress(block))
+                except zlib.error as error:
+                    raise IOError('Validation of {} failed: {}'.format(
+                        path, error))
+                block = decompressor.unused_data
+                if block:
+                    decompressor = None
+    if not validate:
+        return(None)
+    if pending or (decompressor is not None and
+            not pgzip.stream_ended(decompressor)):
+        raise IOError('Unexpected end of file {}'.format(path))
+    return(size)
+
+def _copy_range(args):
+    ''' Function to call copy_range with a tuple of arguments '''
+    return(copy_range(*args))
+
+def _compress_file(args):
+    ''' Function to call compress_file with a tuple of arguments '''
+    return(compress_file(*args))
+
+def concatenate_gzip(inputs, output, threads = 4, level = 6,
+        validate = True
+    ):
+    ''' Function to concatenate files, in order, into a gzip file. Gzip
+    inputs are copied without recompression and other inputs compressed as
+    BGZF. The output file is written to a temporary file which replaces the
+    output only if all inputs are copied successfully.
+
+    Args:
+        inputs (list)- Full paths to input files.
+        output (str)- Full path to output file.
+        threads (int)- Number of inputs copied or compressed at once.
+        level (int)- zlib compression level of inputs that are not gzip
+            compressed.
+        validate (bool)- Whether to validate gzip inputs by inflating them.
+
+    Returns:
+        metrics (dict)- Number of gzip inputs copied ('copied'), inputs
+            compressed ('compressed'), bytes written ('size') and, if
+            validated, decompressed bytes of gzip inputs ('decompressed').
+
+    Raises:
+        TypeError - If arguments are of the wrong type.
+        ValueError - If arguments have an unexpected value.
+        IOError - If a gzip input is invalid.
+
+    '''
+    # Check arguments
+    if not isinstance(inputs, (list, tuple)) or not inputs:
+        raise TypeError('inputs must be a non-empty list or tuple')
+    if not isinstance(threads, int):
+        raise TypeError('threads must be integer')
+    if threads < 1:
+        raise ValueError('threads must be >= 1')
+    # Create temporary output and pool
+    directory = os.path.dirname(os.path.abspath(output))
+    handle, temp = tempfile.mkstemp(suffix = '.' + os.path.basename(output),
+        prefix = '.', dir = directory)
+    os.close(handle)
+    compressed = {}
+    pool = multiprocessing.pool.ThreadPool(threads)
+    try:
+        # Compress inputs that are not gzip files
+        for path in inputs:
+            if streamio.detect_compression(path) != 'gzip':
+                handle, compressed[path] = tempfile.mkstemp(suffix = '.gz',
+                    prefix = '.', dir = directory)
+                os.close(handle)
+        pool.map(_compress_file, [(path, compressed[path], level) for path
+            in inputs if path in compressed], 1)
+        # Calculate lengths and offsets of inputs, removing the end of file
+        # block from all but the last input
+        sources = [compressed.get(path, path) for path in inputs]
+        offsets = []
+        lengths = []
+        for count, source in enumerate(sources):
+            length = os.path.getsize(source)
+            if count < len(sources) - 1 and length >= len(pgzip.BGZF_EOF):
+                with open(source, 'rb') as inFile:
+                    inFile.seek(length - len(pgzip.BGZF_EOF))
+                    if inFile.read() == pgzip.BGZF_EOF:
+                        length -= len(pgzip.BGZF_EOF)
+            offsets.append(sum(lengths))
+            lengths.append(length)
+        # Preallocate output and copy inputs to their offsets
+        with open(temp, 'r+b') as outFile:
+            outFile.truncate(sum(lengths))
+        sizes = pool.map(_copy_range, [(source, temp, offset, length,
+            validate and source not in compressed.values()) for source,
+            offset, length in zip(sources, offsets, lengths)], 1)
+        pool.close()
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp, 0o666 & ~umask)
+        os.rename(temp, output)
+    finally:
+        pool.terminate()
+        pool.join()
+        for path in compressed.values() + [temp]:
+            if os.path.exists(path):
+                os.remove(path)
+    # Return metrics
+    metrics = {
+        'copied': len(inputs) - len(compressed),
+        'compressed': len(compressed),
+        'size': sum(lengths)
+    }
+    if validate:
+        metrics['decompressed'] = sum(size for size in sizes if size)
+    return(metrics)
+
+def benchmark(inputs, threads = (1, 2, 4), level = 6):
+    ''' Function to compare the speed of concatenate_gzip with that of
+    decompressing and recompressing the inputs with 'zcat | gzip'.
+
+    Args:
+        inputs (list)- Full paths to gzip files, such as the lane fragments
+            of a sample.
+        threads (tuple)- Thread numbers to test.
+        level (int)- gzip compression level.
+
+    Returns:
+        metrics (dict)- Dictionary where the key is the thread number, or
+            'shell', and the value is the time taken in seconds.
+
+    Raises:
+        ValueError - If decompressed file sizes differ.
+
+    '''
+    directory = tempfile.mkdtemp()
+    metrics = {}
+    sizes = set()
+    try:
+        output = os.path.join(directory, 'output.gz')
+        # Time recompression
+        start = time.time()
+        with open(output, 'wb') as outFile:
+            zcat = subprocess.Popen(['zcat'] + list(inputs),
+                stdout = subprocess.PIPE)
+            compress = subprocess.Popen(['gzip', '-%s' %(level), '-c'],
+                stdin = zcat.stdout, stdout = outFile)
+            zcat.stdout.close()
+            compress.wait()
+            zcat.wait()
+        metrics['shell'] = time.time() - start
+        with streamio.streamReader(output) as inFile:
+            sizes.add(sum(len(data) for data in iter(
+                lambda: inFile.read(1048576), '')))
+        # Time concatenation
+        for number in threads:
+            start = time.time()
+            result = concatenate_gzip(inputs, output, number, level)
+            metrics[number] = time.time() - start
+            sizes.add(result['decompressed'])
+    finally:
+        shutil.rmtree(directory)
+    if len(sizes) != 1:
+        raise ValueError('Decompressed file sizes differ')
+    return(metrics)
@@ -2,6 +2,7 @@
 the 'handle_output' function within a function allows that function to
 return output as a list or to a file or down a multiprocessing pipe.
 """
+from ngs_python.system import streamio
 
 
 class OutputList(object):
@@ -94,20 +95,16 @@ class InputList(object):
 class InputFile(object):
     """ Generates an object to handle the input of a file to a
     function. Object is initialised by opening a file using a supplied
-    file name. If the file name ends with '.gz' it is assumed the file
-    is gzipped. The function 'next' sequentially extracts a line from
-    the file and removes newline characters. Line containing tabs are
+    file name with streamio.open_input, which reads plain, gzipped and
+    bzip2 compressed files. The function 'next' sequentially extracts a
+    line from the file and removes newline characters. Line containing tabs are
     split into a list using the tabs as delimiters. If the line is
     blank the file is closed and an EOFError is raised. The function
     'close' closes the file and returns the file handle.
     """
     
     def __init__(self, filein):
-        if filein.endswith('.gz'):
-            import gzip
-            self.input = gzip.open(filein, 'r')
-        else:
-            self.input = open(filein, 'r')
+        self.input = streamio.open_input(filein)
     
     def next(self):
         data = self.input.readline().strip()
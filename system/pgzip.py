@@ -0,0 +1,495 @@
+""" This module is built to decompress BGZF and multi-member gzip files, and
+write BGZF files, using multiple threads. The compressed file is divided into groups of gzip members
+at member headers; each group is inflated in a thread pool, zlib releasing
+the GIL during decompression, and the groups are returned in file order.
+Candidate member headers are identified from their leading bytes so a header
+may be falsely identified within compressed data. Groups which fail to
+decompress are therefore decompressed sequentially, with the following
+groups, until the end of a member coincides with the start of a group.
+"""
+import gzip
+import multiprocessing.pool
+import struct
+import subprocess
+import time
+import zlib
+
+# Leading bytes of gzip members and the BGZF extra field
+GZIP_MAGIC = '\x1f\x8b\x08'
+BGZF_EXTRA = 'BC\x02\x00'
+# Header, maximum uncompressed size and end of file block of BGZF blocks
+BGZF_HEADER = '\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+BGZF_BLOCK_SIZE = 65280
+BGZF_EOF = BGZF_HEADER + '\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+def is_member_start(data, offset, bgzf = False):
+    ''' Function to determine whether a gzip member header may start at the
+    supplied offset.
+
+    Args:
+        data (str)- Compressed data.
+        offset (int)- Offset within data.
+        bgzf (bool)- Whether the header must contain a BGZF extra field.
+
+    Returns:
+        start (bool)- Whether the offset is a candidate member start.
+
+    '''
+    if data[offset:offset + 3] != GZIP_MAGIC:
+        return(False)
+    # Check reserved flag bits are unset
+    flags = data[offset + 3:offset + 4]
+    if not flags or ord(flags) & 0xe0:
+        return(False)
+    # Check for BGZF extra field
+    if bgzf and data[offset + 12:offset + 16] != BGZF_EXTRA:
+        return(False)
+    return(True)
+
+def is_bgzf(data):
+    ''' Function to determine whether compressed data is BGZF formatted.
+
+    Args:
+        data (str)- Leading bytes of compressed file.
+
+    Returns:
+        bgzf (bool)- Whether the data starts with a BGZF block.
+
+    '''
+    return(is_member_start(data, 0, True) and ord(data[3]) & 0x04 > 0)
+
+def is_multimember(path, size = 4194304):
+    ''' Function to determine whether a gzip file is BGZF formatted or
+    contains multiple gzip members within its leading bytes.
+
+    Args:
+        path (str)- Full path to gzip file.
+        size (int)- Number of leading bytes to search for member headers.
+
+    Returns:
+        multimember (bool)- True if the file can be decompressed in parallel.
+
+    '''
+    with open(path, 'rb') as inFile:
+        data = inFile.read(size)
+    if is_bgzf(data):
+        return(True)
+    offset = data.find(GZIP_MAGIC, 1)
+    while offset != -1:
+        if is_member_start(data, offset):
+            return(True)
+        offset = data.find(GZIP_MAGIC, offset + 1)
+    return(False)
+
+def stream_ended(decompressor):
+    ''' Function to determine whether a decompression object has reached the
+    end of a gzip member.
+
+    Args:
+        decompressor - zlib decompression object.
+
+    Returns:
+        ended (bool)- Whether the end of the member has been reached.
+
+    '''
+    if decompressor.unused_data:
+        return(True)
+    # Data supplied after the end of a member is returned as unused data
+    probe = decompressor.copy()
+    try:
+        probe.decompress(GZIP_MAGIC)
+    except zlib.error:
+        return(False)
+    return(probe.unused_data == GZIP_MAGIC)
+
+def inflate_group(data):
+    ''' Function to decompress a group of complete gzip members.
+
+    Args:
+        data (str)- Compressed data containing one or more gzip members.
+
+    Returns:
+        output (str)- Decompressed data or None if data does not consist
+            of complete gzip members.
+
+    '''
+    output = []
+    try:
+        while data:
+            decompressor = zlib.decompressobj(31)
+            output.append(decompressor.decompress(data))
+            data = decompressor.unused_data
+        if not stream_ended(decompressor):
+            return(None)
+    except zlib.error:
+        return(None)
+    return(''.join(output))
+
+class parallelGzipReader(object):
+    """ Generates a file-like object to read BGZF or multi-member gzip files
+    with decompression performed in a pool of threads. At most threads * 2
+    groups of less than three times group_size compressed bytes are held in
+    memory. Members larger than a group are inflated sequentially.
+    """
+
+    def __init__(self, path, threads = 4, group_size = 1048576):
+        ''' Function to initialise parallelGzipReader object.
+
+        Args:
+            path (str)- Full path to gzip file.
+            threads (int)- Number of decompression threads.
+            group_size (int)- Minimum number of compressed bytes in each
+                group of members.
+
+        Raises:
+            TypeError - If arguments are of the wrong type.
+            ValueError - If arguments have an unexpected value.
+
+        '''
+        # Check arguments
+        if not isinstance(threads, int):
+            raise TypeError('threads must be integer')
+        if threads < 1:
+            raise ValueError('threads must be >= 1')
+        if not isinstance(group_size, int):
+            raise TypeError('group_size must be integer')
+        if group_size < 1:
+            raise ValueError('group_size must be >= 1')
+        # Store arguments and open file
+        self.path = path
+        self.threads = threads
+        self.group_size = group_size
+        self.handle = open(path, 'rb')
+        self.bgzf = is_bgzf(self.handle.read(18))
+        self.handle.seek(0)
+        # Create pool and variables to store data
+        self.pool = multiprocessing.pool.ThreadPool(threads)
+        self.decompressor = None
+        self.blocks = self.__blocks()
+        self.buffer = ''
+        self.position = 0
+
+    def __groups(self):
+        ''' Generator to read the compressed file and return groups of
+        members, each with whether it may be inflated in parallel. Groups
+        end at the last candidate member start in the newly read data. Data
+        reaching twice group_size without a candidate member start is
+        returned to be inflated sequentially, so that large members are not
+        held in memory.
+        '''
+        data = ''
+        while True:
+            block = self.handle.read(self.group_size)
+            if not block:
+                break
+            # Search new data, and any incomplete header preceding it, for
+            # the last candidate member start
+            start = max(1, len(data) - 15)
+            data += block
+            end = data.rfind(GZIP_MAGIC, start)
+            while end >= start and not is_member_start(data, end, self.bgzf):
+                end = data.rfind(GZIP_MAGIC, start, end)
+            if end >= start:
+                yield(data[:end], True)
+                data = data[end:]
+            elif len(data) >= 2 * self.group_size:
+                yield(data, False)
+                data = ''
+        if data:
+            yield(data, True)
+
+    def __inflate(self, data):
+        ''' Function to sequentially decompress data, storing the state of
+        incomplete members.
+
+        Args:
+            data (str)- Compressed data.
+
+        Returns:
+            output (str)- Decompressed data.
+            aligned (bool)- Whether data ended at the end of a member.
+
+        Raises:
+            IOError - If the data cannot be decompressed.
+
+        '''
+        output = []
+        try:
+            while data:
+                if self.decompressor is None:
+                    self.decompressor = zlib.decompressobj(31)
+                output.append(self.decompressor.decompress(data))
+                data = self.decompressor.unused_data
+                if data:
+                    self.decompressor = None
+            aligned = self.decompressor is None or stream_ended(
+                self.decompressor)
+        except zlib.error as error:
+            raise IOError('Decompression of {} failed: {}'.format(
+                self.path, error))
+        if aligned:
+            self.decompressor = None
+        return(''.join(output), aligned)
+
+    def __blocks(self):
+        ''' Generator returning decompressed groups in file order. A window
+        of groups is submitted to the thread pool ahead of the consumer.
+        '''
+        window = []
+        groups = self.__groups()
+        aligned = True
+        while True:
+            # Submit groups to the thread pool
+            while len(window) < self.threads * 2:
+                group = next(groups, None)
+                if group is None:
+                    break
+                data, parallel = group
+                window.append((data, self.pool.apply_async(inflate_group,
+                    (data,)) if parallel else None))
+            if not window:
+                break
+            data, result = window.pop(0)
+            # Return output of parallel decompression
+            if aligned and result is not None:
+                output = result.get()
+                if output is not None:
+                    yield(output)
+                    continue
+            # Decompress sequentially until realigned with groups
+            output, aligned = self.__inflate(data)
+            yield(output)
+        if not aligned:
+            raise IOError('Unexpected end of file {}'.format(self.path))
+
+    def read(self, size = -1):
+        ''' Function to read decompressed data.
+
+        Args:
+            size (int)- Number of bytes to read. If negative all remaining
+                data is returned.
+
+        Returns:
+            data (str)- Decompressed data; an empty string at the end of the
+                file.
+
+        '''
+        parts = [self.buffer[self.position:]]
+        length = len(parts[0])
+        while size < 0 or length < size:
+            try:
+                block = next(self.blocks)
+            except StopIteration:
+                break
+            parts.append(block)
+            length += len(block)
+        data = ''.join(parts)
+        # Store data beyond requested size
+        if 0 <= size < length:
+            self.buffer = data
+            self.position = size
+            return(data[:size])
+        self.buffer = ''
+        self.position = 0
+        return(data)
+
+    def close(self):
+        ''' Function to stop the thread pool and close the file '''
+        self.pool.terminate()
+        self.pool.join()
+        self.handle.close()
+        self.buffer = ''
+        self.position = 0
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def bgzf_compress(data, level = 6):
+    ''' Function to compress data as a series of BGZF blocks. Each block is
+    a complete gzip member holding at most BGZF_BLOCK_SIZE bytes.
+
+    Args:
+        data (str)- Data to compress.
+        level (int)- zlib compression level.
+
+    Returns:
+        compressed (str)- Concatenated BGZF blocks.
+
+    '''
+    blocks = []
+    for start in xrange(0, len(data), BGZF_BLOCK_SIZE):
+        block = data[start:start + BGZF_BLOCK_SIZE]
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        deflate = compressor.compress(block) + compressor.flush()
+        blocks.extend([
+            BGZF_HEADER,
+            struct.pack('<H', len(BGZF_HEADER) + len(deflate) + 9),
+            deflate,
+            struct.pack('<II', zlib.crc32(block) & 0xffffffff, len(block))
+        ])
+    return(''.join(blocks))
+
+class parallelGzipWriter(object):
+    """ Generates a file-like object to write BGZF files with compression
+    performed in a pool of threads. Written data is divided into chunks
+    which are compressed independently and written in order, followed by
+    the BGZF end of file block. The output is a valid multi-member gzip file
+    which may be read by gzip, zlib based tools such as bwa and bowtie2, and
+    in parallel by parallelGzipReader. At most threads * 2 chunks are held
+    in memory. Several writers may share a thread pool, such as the writers
+    of each output of a demultiplexer, in which case the pool is not closed
+    by the writers.
+    """
+
+    def __init__(
+            self, path, threads = 4, level = 6, chunk_size = 1048576,
+            pool = None
+        ):
+        ''' Function to initialise parallelGzipWriter object.
+
+        Args:
+            path (str)- Full path to output file.
+            threads (int)- Number of compression threads.
+            level (int)- zlib compression level between 1 and 9.
+            chunk_size (int)- Number of bytes compressed by each thread.
+            pool - multiprocessing.pool.ThreadPool used for compression. If
+                None a pool of threads threads is created.
+
+        Raises:
+            TypeError - If arguments are of the wrong type.
+            ValueError - If arguments have an unexpected value.
+
+        '''
+        # Check arguments
+        if not isinstance(threads, int):
+            raise TypeError('threads must be integer')
+        if threads < 1:
+            raise ValueError('threads must be >= 1')
+        if not isinstance(level, int):
+            raise TypeError('level must be integer')
+        if not 1 <= level <= 9:
+            raise ValueError('level must be between 1 and 9')
+        if not isinstance(chunk_size, int):
+            raise TypeError('chunk_size must be integer')
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be >= 1')
+        # Store arguments and open file
+        self.path = path
+        self.threads = threads
+        self.level = level
+        self.chunk_size = chunk_size
+        self.handle = open(path, 'wb')
+        # Create pool and variables to store data
+        self.shared = pool is not None
+        if pool is None:
+            pool = multiprocessing.pool.ThreadPool(threads)
+        self.pool = pool
+        self.buffer = []
+        self.length = 0
+        self.window = []
+        self.closed = False
+
+    def __submit(self):
+        ''' Function to submit buffered data for compression and write
+        compressed chunks once the window of chunks is full.
+        '''
+        data = ''.join(self.buffer)
+        self.buffer = []
+        self.length = 0
+        for start in xrange(0, len(data), self.chunk_size):
+            self.window.append(self.pool.apply_async(bgzf_compress,
+                (data[start:start + self.chunk_size], self.level)))
+            while len(self.window) >= self.threads * 2:
+                self.handle.write(self.window.pop(0).get())
+
+    def write(self, data):
+        ''' Function to write data to the file.
+
+        Args:
+            data (str)- Data to write.
+
+        '''
+        self.buffer.append(data)
+        self.length += len(data)
+        if self.length >= self.chunk_size:
+            self.__submit()
+
+    def close(self):
+        ''' Function to compress and write remaining data, write the end of
+        file block and close the file.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.__submit()
+            for result in self.window:
+                self.handle.write(result.get())
+            self.handle.write(BGZF_EOF)
+        finally:
+            self.window = []
+            if not self.shared:
+                self.pool.terminate()
+                self.pool.join()
+            self.handle.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def benchmark(path, threads = (1, 2, 4, 8), group_size = 1048576):
+    ''' Function to measure decompression speed of a BGZF or multi-member gzip
+    file with increasing thread number. Speeds of the 'gzip -dc' command and
+    the python gzip module are reported for comparison.
+
+    Args:
+        path (str)- Full path to gzip file.
+        threads (tuple)- Thread numbers to test.
+        group_size (int)- Minimum number of compressed bytes in each group.
+
+    Returns:
+        metrics (dict)- Dictionary where the key is the thread number, or
+            'shell' and 'python', and the value is decompressed MB/s.
+
+    Raises:
+        ValueError - If decompressed file sizes differ.
+
+    '''
+    metrics = {}
+    sizes = set()
+    # Time shell and python decompression
+    start = time.time()
+    sp = subprocess.Popen(['gzip', '-dc', path], stdout = subprocess.PIPE)
+    size = 0
+    for block in iter(lambda: sp.stdout.read(1048576), ''):
+        size += len(block)
+    sp.wait()
+    metrics['shell'] = size / max(time.time() - start, 1e-9) / 1e6
+    sizes.add(size)
+    start = time.time()
+    with gzip.open(path) as inFile:
+        size = 0
+        for block in iter(lambda: inFile.read(1048576), ''):
+            size += len(block)
+    metrics['python'] = size / max(time.time() - start, 1e-9) / 1e6
+    sizes.add(size)
+    # Time parallel decompression
+    for number in threads:
+        start = time.time()
+        with parallelGzipReader(path, number, group_size) as inFile:
+            size = 0
+            for block in iter(lambda: inFile.read(1048576), ''):
+                size += len(block)
+        metrics[number] = size / max(time.time() - start, 1e-9) / 1e6
+        sizes.add(size)
+    # Check sizes and return data
+    if len(sizes) != 1:
+        raise ValueError('Decompressed sizes differ')
+    return(metrics)
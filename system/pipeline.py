@@ -0,0 +1,219 @@
+""" This module runs pipelines of commands, such as an aligner piped into
+samtools sort, equivalent to 'command1 | command2 > output' but with the
+exit status of every command checked. A failure early in a pipeline, such
+as an aligner running out of memory, would otherwise leave a later command
+to complete successfully with truncated output. Commands are run without
+a shell, unless supplied as strings, each in its own process group so that
+the pipeline, including any shell children, may be killed as a whole. The
+stderr of every command is written to a log file.
+"""
+import os
+import signal
+import subprocess
+import tempfile
+import time
+
+def _preexec():
+    ''' Function run in each child process before the command, restoring
+    the default SIGPIPE handler ignored by python and starting a new
+    process group.
+    '''
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+    os.setsid()
+
+def format_command(command):
+    ''' Function returns a command, as a string or list of arguments, as a
+    string for logs and error messages.
+    '''
+    if isinstance(command, str):
+        return(command)
+    return(' '.join(command))
+
+class commandPipeline(object):
+    ''' Class runs a pipeline of commands in which each command reads the
+    stdout of the previous command. The first command reads from stdin,
+    which may be an open file, None for /dev/null or subprocess.PIPE to
+    write input through the stdin attribute, and the last command writes to
+    stdout, which may be an open file, a path or None to inherit stdout.
+    When used as a context manager, the pipeline is killed if an exception
+    is raised.
+    '''
+
+    def __init__(self, commands, stdin = None, stdout = None, log = None):
+        ''' Function to initialise commandPipeline object and start the
+        commands.
+
+        Args:
+            commands (list)- Commands, each a string run by the shell or a
+                list of arguments.
+            stdin - Input of the first command.
+            stdout - Output of the last command.
+            log (str)- Full path to file in which to write the stderr of
+                the commands.
+
+        Raises:
+            ValueError - If no commands are supplied.
+
+        '''
+        if not commands:
+            raise ValueError('No commands supplied')
+        self.commands = list(commands)
+        self.processes = []
+        self.returncodes = [None] * len(self.commands)
+        self.failed = None
+        self.stdin = None
+        self.stderr = ''
+        self.log = open(log, 'w+') if log else tempfile.TemporaryFile()
+        outFile = open(stdout, 'wb') if isinstance(stdout, str) else stdout
+        devnull = open(os.devnull) if stdin is None else None
+        try:
+            # Start commands, closing the parent copy of each pipe
+            previous = devnull or stdin
+            for number, command in enumerate(self.commands):
+                last = number == len(self.commands) - 1
+                process = subprocess.Popen(command,
+                    shell = isinstance(command, str), stdin = previous,
+                    stdout = outFile if last else subprocess.PIPE,
+                    stderr = self.log, close_fds = True,
+                    preexec_fn = _preexec)
+                self.processes.append(process)
+                if number:
+                    previous.close()
+                previous = process.stdout
+            self.stdin = self.processes[0].stdin
+        except:
+            self.kill()
+            raise
+        finally:
+            if devnull:
+                devnull.close()
+            if isinstance(stdout, str):
+                outFile.close()
+
+    def poll(self):
+        ''' Function to check the status of the commands, killing all
+        commands if any command has failed.
+
+        Returns:
+            returncode (int)- None if any command is running, otherwise the
+                exit status of the first failed command or 0.
+
+        '''
+        for number, process in enumerate(self.processes):
+            if self.returncodes[number] is None:
+                self.returncodes[number] = process.poll()
+                if self.returncodes[number] and self.failed is None:
+                    self.failed = number
+                    self.kill()
+        if None in self.returncodes:
+            return(None)
+        if self.failed is None:
+            return(0)
+        # Report a command killed by a broken pipe only if no later command
+        # failed
+        if self.returncodes[self.failed] == -signal.SIGPIPE:
+            for number, returncode in enumerate(self.returncodes):
+                if returncode and returncode not in (-signal.SIGPIPE,
+                        -signal.SIGTERM):
+                    self.failed = number
+                    break
+        return(self.returncodes[self.failed])
+
+    def wait(self, interval = 0.05):
+        ''' Function to wait for the commands to complete.
+
+        Args:
+            interval (float)- Seconds between checks of the commands.
+
+        Raises:
+            IOError - If any command fails, reporting the first failure and
+                the end of the log.
+
+        '''
+        if self.stdin and not self.stdin.closed:
+            self.stdin.close()
+        while self.poll() is None:
+            time.sleep(interval)
+        self.__close_log()
+        if self.failed is not None:
+            raise IOError(self.message('failed with exit status {}'.format(
+                self.returncodes[self.failed])))
+
+    def message(self, description):
+        ''' Function returns an error message describing the failed, or
+        first, command and including the end of the log.
+        '''
+        command = self.commands[self.failed or 0]
+        return('Command {} {}: {}'.format(format_command(command),
+            description, self.tail()))
+
+    def tail(self, size = 2000):
+        ''' Function returns the end of the log '''
+        if self.log.closed:
+            return(self.stderr)
+        self.log.flush()
+        self.log.seek(0, 2)
+        self.log.seek(max(0, self.log.tell() - size))
+        return(self.log.read().strip())
+
+    def __close_log(self):
+        ''' Function to store the end of the log and close it '''
+        if not self.log.closed:
+            self.stderr = self.tail()
+            self.log.close()
+
+    def kill(self):
+        ''' Function to kill the process groups of running commands, and
+        wait for them to exit.
+        '''
+        for process in self.processes:
+            if process.poll() is None:
+                try:
+                    os.killpg(process.pid, signal.SIGTERM)
+                except OSError:
+                    pass
+        if self.stdin and not self.stdin.closed:
+            try:
+                self.stdin.close()
+            except IOError:
+                pass
+        for number, process in enumerate(self.processes):
+            self.returncodes[number] = process.wait()
+            if self.returncodes[number] and self.failed is None:
+                self.failed = number
+
+    def abort(self):
+        ''' Function to kill the commands and close the log '''
+        self.kill()
+        self.__close_log()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, type, value, traceback):
+        if type is not None:
+            self.abort()
+
+def run_pipeline(commands, stdin = None, stdout = None, log = None):
+    ''' Function to run a pipeline of commands and check that every command
+    completes successfully.
+
+    Args:
+        commands (list)- Commands, each a string run by the shell or a list
+            of arguments.
+        stdin - Open file read by the first command, or None.
+        stdout - Open file or full path to file to which the last command
+            writes, or None.
+        log (str)- Full path to file in which to write the stderr of the
+            commands.
+
+    Returns:
+        returncodes (list)- Exit status of each command.
+
+    Raises:
+        IOError - If any command fails.
+
+    '''
+    with commandPipeline(commands, stdin, stdout, log) as pipeline:
+        pipeline.wait()
+    return(pipeline.returncodes)
@@ -0,0 +1,627 @@
+""" This module is built to stream the contents of plain or compressed
+files. Compression is detected from the leading bytes of the file and the
+file is read, and decompressed, in a background thread which stores a
+bounded number of chunks ahead of the consumer. Memory use is therefore
+fixed by the chunk size and number of chunks irrespective of file size.
+Output files are opened by streamWriter, which compresses files ending in
+'.gz' using a gzip subprocess, python gzip or a pgzip.parallelGzipWriter,
+and may write to a temporary file that replaces the output file only when
+writing completes successfully. Data may also be streamed directly into a
+subprocess, such as an aligner, by a processWriter, avoiding an
+intermediate file.
+"""
+import bz2
+import errno
+import fcntl
+import gzip
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import Queue
+from ngs_python.system import pgzip, pipeline
+
+# Leading bytes of supported compressed files
+MAGIC = (
+    ('\x1f\x8b', 'gzip'),
+    ('BZh', 'bzip2')
+)
+
+def detect_compression(path):
+    ''' Function to identify file compression from the leading bytes of a
+    file.
+
+    Args:
+        path (str)- Full path to file.
+
+    Returns:
+        compression (str)- 'gzip', 'bzip2' or None for uncompressed files.
+
+    '''
+    with open(path, 'rb') as inFile:
+        start = inFile.read(4)
+    for magic, compression in MAGIC:
+        if start.startswith(magic):
+            return(compression)
+    return(None)
+
+
+class streamReader(object):
+    """ Generates a file-like object to read plain, gzip or bzip2
+    compressed files. Chunks of the decompressed file are read in a
+    background thread and stored in a queue holding at most 'buffers'
+    chunks, so at most (buffers + 2) * chunk_size bytes are held in memory.
+    If 'threads' is greater than one then BGZF and multi-member gzip files
+    are decompressed in parallel by a parallelGzipReader object from
+    ngs_python.system.pgzip. Otherwise, or for single-member gzip files, if
+    'shell' is True then gzip files are decompressed by a 'gzip -dc'
+    subprocess, else by the python gzip module. Errors in the background
+    thread, including a non-zero exit status of the subprocess, are raised
+    by the read functions.
+    """
+
+    def __init__(
+            self, path, shell = True, chunk_size = 1048576, buffers = 16,
+            threads = 1
+        ):
+        ''' Function to initialise streamReader object and start the
+        background thread.
+
+        Args:
+            path (str)- Full path to file.
+            shell (bool)- Whether to use a subprocess to decompress gzip
+                files.
+            chunk_size (int)- Number of bytes read in each chunk.
+            buffers (int)- Maximum number of chunks read ahead.
+            threads (int)- Number of threads used to decompress BGZF and
+                multi-member gzip files.
+
+        Raises:
+            TypeError - If arguments are of the wrong type.
+            ValueError - If arguments have an unexpected value.
+
+        '''
+        # Check arguments
+        if not isinstance(chunk_size, int):
+            raise TypeError('chunk_size must be integer')
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be >= 1')
+        if not isinstance(buffers, int):
+            raise TypeError('buffers must be integer')
+        if buffers < 1:
+            raise ValueError('buffers must be >= 1')
+        if not isinstance(threads, int):
+            raise TypeError('threads must be integer')
+        if threads < 1:
+            raise ValueError('threads must be >= 1')
+        # Store arguments and open source
+        self.path = path
+        self.chunk_size = chunk_size
+        self.threads = threads
+        self.compression = detect_compression(path)
+        self.sp = None
+        self.source = self.open_source(shell)
+        # Create variables to store data
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.closed = False
+        # Create queue and start thread
+        self.queue = Queue.Queue(buffers)
+        self.thread = threading.Thread(target = self.__fill_queue)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def open_source(self, shell):
+        ''' Function to open the underlying file handle.
+
+        Args:
+            shell (bool)- Whether to use a subprocess to decompress gzip
+                files.
+
+        Returns:
+            source - File handle from which the decompressed file is read.
+
+        '''
+        if (self.compression == 'gzip' and self.threads > 1 and
+                pgzip.is_multimember(self.path)):
+            return(pgzip.parallelGzipReader(self.path, self.threads))
+        elif self.compression == 'gzip' and shell:
+            self.sp = subprocess.Popen(['gzip', '-dc', self.path],
+                stdout = subprocess.PIPE, bufsize = -1)
+            return(self.sp.stdout)
+        elif self.compression == 'gzip':
+            return(gzip.open(self.path, 'rb'))
+        elif self.compression == 'bzip2':
+            return(bz2.BZ2File(self.path, 'rb'))
+        else:
+            return(open(self.path, 'rb'))
+
+    def __fill_queue(self):
+        ''' Function to read chunks from the source into the queue. An empty
+        string is added to the queue at the end of the file and any raised
+        exception is added to the queue in place of data.
+        '''
+        try:
+            while not self.closed:
+                chunk = self.source.read(self.chunk_size)
+                if not chunk:
+                    break
+                self.queue.put(chunk)
+            # Check exit status of subprocess
+            if self.sp and not self.closed:
+                if self.sp.wait():
+                    raise IOError('Decompression of {} failed'.format(
+                        self.path))
+            self.queue.put('')
+        except Exception as error:
+            self.queue.put(error)
+
+    def __next_chunk(self):
+        ''' Function to return the next chunk from the queue.
+
+        Returns:
+            chunk (str)- Next chunk of data; an empty string at the end of
+                the file.
+
+        Raises:
+            IOError - If the file could not be read.
+
+        '''
+        if self.eof:
+            return('')
+        chunk = self.queue.get()
+        if isinstance(chunk, Exception):
+            self.eof = True
+            raise chunk
+        if not chunk:
+            self.eof = True
+        return(chunk)
+
+    def read(self, size = -1):
+        ''' Function to read data from the file.
+
+        Args:
+            size (int)- Number of bytes to read. If negative all remaining
+                data is returned.
+
+        Returns:
+            data (str)- Data read from file; an empty string at the end of
+                the file.
+
+        '''
+        # Return buffered data without copying the remainder
+        if 0 <= size <= len(self.buffer) - self.position:
+            data = self.buffer[self.position:self.position + size]
+            self.position += size
+            return(data)
+        # Collect buffered data and chunks
+        parts = [self.buffer[self.position:]]
+        length = len(parts[0])
+        while size < 0 or length < size:
+            chunk = self.__next_chunk()
+            if not chunk:
+                break
+            parts.append(chunk)
+            length += len(chunk)
+        data = ''.join(parts)
+        # Store data beyond requested size
+        if 0 <= size < length:
+            self.buffer = data
+            self.position = size
+            return(data[:size])
+        self.buffer = ''
+        self.position = 0
+        return(data)
+
+    def readline(self):
+        ''' Function to read a line from the file.
+
+        Returns:
+            line (str)- Line including the newline character; an empty
+                string at the end of the file.
+
+        '''
+        while True:
+            end = self.buffer.find('\n', self.position)
+            if end != -1:
+                end += 1
+                break
+            chunk = self.__next_chunk()
+            if not chunk:
+                end = len(self.buffer)
+                break
+            self.buffer = self.buffer[self.position:] + chunk
+            self.position = 0
+        line = self.buffer[self.position:end]
+        self.position = end
+        return(line)
+
+    def __iter__(self):
+        ''' Returns lines from the file '''
+        return(self)
+
+    def next(self):
+        ''' Returns next line from the file or raises StopIteration '''
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return(line)
+
+    def close(self):
+        ''' Function to stop the background thread and close the file '''
+        if self.closed:
+            return
+        self.closed = True
+        if self.sp and self.sp.poll() is None:
+            self.sp.terminate()
+        # Empty queue until the background thread completes
+        while self.thread.is_alive():
+            try:
+                self.queue.get(timeout = 0.1)
+            except Queue.Empty:
+                pass
+        self.source.close()
+        if self.sp:
+            self.sp.wait()
+        self.buffer = ''
+        self.position = 0
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+class streamWriter(object):
+    ''' Class generates a file-like object to write plain or gzipped
+    files. Output files ending in '.gz' are compressed using multiple
+    threads as BGZF if threads is greater than 1, otherwise by a gzip
+    subprocess if shell is True or by python gzip. If atomic is True, data
+    is written to a temporary file in the output directory which is renamed
+    to the output file by close, or deleted by abort. When used as a context
+    manager, abort is called if an exception is raised.
+    '''
+
+    def __init__(
+            self, path, shell = True, threads = 1, level = 6, atomic = False
+        ):
+        ''' Function to initialise streamWriter object.
+
+        Args:
+            path (str)- Full path to output file.
+            shell (bool)- Whether to use a gzip subprocess to compress
+                gzipped output.
+            threads (int)- Number of threads used to compress gzipped
+                output.
+            level (int)- Compression level between 1 and 9.
+            atomic (bool)- Whether to write to a temporary file.
+
+        '''
+        self.output = path
+        if atomic:
+            handle, path = tempfile.mkstemp(suffix = '.' +
+                os.path.basename(path), prefix = '.',
+                dir = os.path.dirname(os.path.abspath(path)))
+            os.close(handle)
+        self.path = path
+        self.atomic = atomic
+        self.sp = None
+        self.closed = False
+        if not path.endswith('.gz'):
+            self.handle = open(path, 'w')
+        elif threads > 1:
+            self.handle = pgzip.parallelGzipWriter(path, threads, level)
+        elif shell:
+            with open(path, 'wb') as outFile:
+                self.sp = subprocess.Popen(['gzip', '-%s' %(level), '-c'],
+                    stdin = subprocess.PIPE, stdout = outFile)
+            self.handle = self.sp.stdin
+        else:
+            self.handle = gzip.open(path, 'wb', level)
+
+    def write(self, data):
+        ''' Function to write data to the file '''
+        self.handle.write(data)
+
+    def close(self):
+        ''' Function to close the file and wait for any subprocess.
+
+        Raises:
+            IOError - If the gzip subprocess fails.
+
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        self.handle.close()
+        if self.sp and self.sp.wait():
+            self.__remove()
+            raise IOError('Compression of {} failed'.format(self.output))
+        # Replace output file with temporary file
+        if self.atomic:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(self.path, 0o666 & ~umask)
+            os.rename(self.path, self.output)
+
+    def __remove(self):
+        ''' Function to delete a temporary file '''
+        if self.atomic and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def abort(self):
+        ''' Function to close the file, deleting a temporary file without
+        replacing the output file.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.handle.close()
+            if self.sp:
+                self.sp.wait()
+        finally:
+            self.__remove()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.abort()
+
+class processWriter(object):
+    ''' Class generates a file-like object to stream data into a
+    subprocess, or a pipeline.commandPipeline of subprocesses, through its
+    stdin or through a named pipe for programs that require a file path.
+    The string '{input}' within the command is replaced by '-' or by the
+    path of the named pipe. A copy of the data may be written to a file by
+    a streamWriter. The stderr of the subprocesses is written to a log file
+    and their exit status checked by close, while abort, called if an
+    exception is raised when used as a context manager, kills the
+    subprocesses so that they do not complete with truncated input.
+    '''
+
+    def __init__(
+            self, command, fifo = False, tee = None, shell = True,
+            threads = 1, level = 6, log = None, timeout = 60
+        ):
+        ''' Function to initialise processWriter object and start the
+        subprocesses.
+
+        Args:
+            command - Command as a string, run by the shell, or list of
+                arguments, or a list of such commands forming a pipeline in
+                which the first command reads the data.
+            fifo (bool)- Whether to stream data through a named pipe.
+            tee (str)- Full path to file in which to write a copy of the
+                data, written atomically and compressed if ending '.gz'.
+            shell (bool)- Whether to use a gzip subprocess to compress tee.
+            threads (int)- Number of threads used to compress tee.
+            level (int)- Compression level of tee between 1 and 9.
+            log (str)- Full path to file in which to write the stderr of
+                the subprocesses.
+            timeout (int)- Seconds to wait for the subprocess to open the
+                named pipe. If None, wait while the subprocess is running.
+
+        Raises:
+            IOError - If the subprocess exits before opening the named pipe
+                or fails to open it within timeout seconds.
+
+        '''
+        self.closed = False
+        self.returncode = None
+        self.directory = None
+        self.tee = None
+        # Create named pipe and substitute input path into commands
+        if fifo:
+            self.directory = tempfile.mkdtemp()
+            path = os.path.join(self.directory, 'input')
+            os.mkfifo(path)
+        else:
+            path = '-'
+        if isinstance(command, str) or isinstance(command[0], str):
+            command = [command]
+        commands = [argument.replace('{input}', path) if isinstance(
+            argument, str) else [item.replace('{input}', path) for item in
+            argument] for argument in command[:1]] + list(command[1:])
+        self.command = pipeline.format_command(commands[0])
+        # Open copy before the subprocesses, which must not inherit the
+        # input of any gzip subprocess, and start subprocesses
+        try:
+            if tee:
+                self.tee = streamWriter(tee, shell, threads, level, True)
+            self.pipeline = pipeline.commandPipeline(commands, None if fifo
+                else subprocess.PIPE, None, log)
+        except:
+            if self.tee:
+                self.tee.abort()
+            self.__cleanup()
+            raise
+        try:
+            self.handle = self.__open_fifo(path, timeout) if fifo else \
+                self.pipeline.stdin
+            # Prevent later subprocesses inheriting input of the subprocess
+            flags = fcntl.fcntl(self.handle.fileno(), fcntl.F_GETFD)
+            fcntl.fcntl(self.handle.fileno(), fcntl.F_SETFD,
+                flags | fcntl.FD_CLOEXEC)
+        except:
+            self.abort()
+            raise
+
+    def __open_fifo(self, path, timeout):
+        ''' Function to open the named pipe once the subprocess has opened
+        it for reading, checking that the subprocess is running.
+        '''
+        start = time.time()
+        while True:
+            try:
+                descriptor = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+                break
+            except OSError as error:
+                if error.errno != errno.ENXIO:
+                    raise
+            if self.pipeline.poll() is not None:
+                raise IOError(self.pipeline.message('exited before reading '\
+                    'input'))
+            if timeout is not None and time.time() - start > timeout:
+                raise IOError(self.pipeline.message('did not open input'))
+            time.sleep(0.01)
+        flags = fcntl.fcntl(descriptor, fcntl.F_GETFL)
+        fcntl.fcntl(descriptor, fcntl.F_SETFL, flags & ~os.O_NONBLOCK)
+        return(os.fdopen(descriptor, 'wb', 1048576))
+
+    def __failed(self):
+        ''' Function to wait for subprocesses that stopped reading input
+        and return an IOError reporting their exit status.
+        '''
+        self.abort()
+        return(IOError(self.pipeline.message('stopped reading input with '\
+            'exit status {}'.format(self.returncode))))
+
+    def write(self, data):
+        ''' Function to write data to the subprocess and any copy.
+
+        Raises:
+            IOError - If the subprocess stops reading input.
+
+        '''
+        try:
+            self.handle.write(data)
+        except IOError as error:
+            if error.errno != errno.EPIPE:
+                raise
+            raise self.__failed()
+        if self.tee:
+            self.tee.write(data)
+
+    def close(self):
+        ''' Function to close the input of the subprocesses and wait for
+        them to complete.
+
+        Raises:
+            IOError - If any subprocess fails.
+
+        '''
+        if self.closed:
+            return
+        try:
+            self.handle.close()
+        except IOError as error:
+            if error.errno != errno.EPIPE:
+                self.abort()
+                raise
+            raise self.__failed()
+        try:
+            self.pipeline.wait()
+        except IOError:
+            self.abort()
+            raise
+        self.returncode = 0
+        self.closed = True
+        if self.tee:
+            self.tee.close()
+        self.__cleanup()
+
+    def __cleanup(self):
+        ''' Function to remove the named pipe '''
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors = True)
+
+    def abort(self):
+        ''' Function to kill the subprocesses, deleting any incomplete
+        copy of the data.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if hasattr(self, 'handle'):
+                self.handle.close()
+        except IOError:
+            pass
+        try:
+            self.pipeline.abort()
+            self.returncode = self.pipeline.poll()
+        finally:
+            if self.tee:
+                self.tee.abort()
+            self.__cleanup()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.close()
+        else:
+            self.abort()
+
+def open_input(
+        path, shell = True, chunk_size = 1048576, buffers = 16, threads = 1
+    ):
+    ''' Function to open a plain or compressed file for streaming.
+
+    Args:
+        path (str)- Full path to file.
+        shell (bool)- Whether to use a subprocess to decompress gzip files.
+        chunk_size (int)- Number of bytes read in each chunk.
+        buffers (int)- Maximum number of chunks read ahead.
+        threads (int)- Number of threads used to decompress BGZF and
+            multi-member gzip files.
+
+    Returns:
+        reader - A streamReader object.
+
+    '''
+    return(streamReader(path, shell, chunk_size, buffers, threads))
+
+def open_output(path, shell = True, threads = 1, level = 6, atomic = False):
+    ''' Function to open a plain or gzipped file for writing.
+
+    Args:
+        path (str)- Full path to file.
+        shell (bool)- Whether to use a gzip subprocess to compress gzipped
+            files.
+        threads (int)- Number of threads used to compress gzipped files.
+        level (int)- Compression level between 1 and 9.
+        atomic (bool)- Whether to write to a temporary file that replaces
+            the output file when closed.
+
+    Returns:
+        writer - A streamWriter object.
+
+    '''
+    return(streamWriter(path, shell, threads, level, atomic))
+
+def open_process(
+        command, fifo = False, tee = None, shell = True, threads = 1,
+        level = 6, log = None, timeout = 60
+    ):
+    ''' Function to open a subprocess for streaming input.
+
+    Args:
+        command - Command as a string, run by the shell, or list of
+            arguments, or a list of such commands forming a pipeline, in
+            which '{input}' is replaced by the path of the input.
+        fifo (bool)- Whether to stream data through a named pipe.
+        tee (str)- Full path to file in which to write a copy of the data.
+        shell (bool)- Whether to use a gzip subprocess to compress tee.
+        threads (int)- Number of threads used to compress tee.
+        level (int)- Compression level of tee between 1 and 9.
+        log (str)- Full path to file in which to write the stderr of the
+            subprocess.
+        timeout (int)- Seconds to wait for the subprocess to open the named
+            pipe. If None, wait while the subprocess is running.
+
+    Returns:
+        writer - A processWriter object.
+
+    '''
+    return(processWriter(command, fifo, tee, shell, threads, level, log,
+        timeout))
@@ -0,0 +1,111 @@
+import bz2
+import gzip
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from ngs_python.system import gzconcat, pgzip
+
+class test_gzip_concatenation(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        random.seed(1)
+        self.parts = [''.join(random.choice('ACGT\n') for _ in
+            range(random.randint(0, 30000))) for _ in range(5)]
+        # Create gzip, BGZF, plain and bzip2 inputs
+        self.gzip = os.path.join(self.dir, 'part0.fastq.gz')
+        with gzip.open(self.gzip, 'wb') as outFile:
+            outFile.write(self.parts[0])
+        self.bgzf = []
+        for count in (1, 2):
+            path = os.path.join(self.dir, 'part{}.fastq.gz'.format(count))
+            with pgzip.parallelGzipWriter(path, 2, chunk_size = 5000) as \
+                    outFile:
+                outFile.write(self.parts[count])
+            self.bgzf.append(path)
+        self.plain = os.path.join(self.dir, 'part3.fastq')
+        with open(self.plain, 'w') as outFile:
+            outFile.write(self.parts[3])
+        self.bzip2 = os.path.join(self.dir, 'part4.fastq.bz2')
+        with open(self.bzip2, 'wb') as outFile:
+            outFile.write(bz2.compress(self.parts[4]))
+        self.output = os.path.join(self.dir, 'output.fastq.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read_output(self):
+        with gzip.open(self.output) as inFile:
+            return(inFile.read())
+
+    def test_concatenate(self):
+        inputs = [self.gzip] + self.bgzf + [self.plain, self.bzip2]
+        for threads in (1, 3):
+            metrics = gzconcat.concatenate_gzip(inputs, self.output, threads)
+            self.assertEqual(self.read_output(), ''.join(self.parts))
+            self.assertEqual(metrics['copied'], 3)
+            self.assertEqual(metrics['compressed'], 2)
+            self.assertEqual(metrics['decompressed'],
+                sum(len(part) for part in self.parts[:3]))
+        self.assertEqual(sorted(os.listdir(self.dir)), sorted(
+            os.path.basename(path) for path in inputs + [self.output]))
+
+    def test_bgzf(self):
+        # Gzip inputs are copied without recompression and the end of file
+        # block of all but the last BGZF input removed
+        gzconcat.concatenate_gzip(self.bgzf, self.output, 2)
+        with open(self.bgzf[0], 'rb') as inFile:
+            first = inFile.read()
+        with open(self.bgzf[1], 'rb') as inFile:
+            second = inFile.read()
+        with open(self.output, 'rb') as inFile:
+            self.assertEqual(inFile.read(),
+                first[:-len(pgzip.BGZF_EOF)] + second)
+
+    def test_split_header(self):
+        # Member headers split between reads are validated
+        path = os.path.join(self.dir, 'members.gz')
+        members = []
+        for part in self.parts[:2]:
+            with gzip.open(path, 'wb') as outFile:
+                outFile.write(part)
+            with open(path, 'rb') as inFile:
+                members.append(inFile.read())
+        with open(path, 'wb') as outFile:
+            outFile.write(''.join(members))
+        for chunk_size in (1, 3, len(members[0]) + 1, len(members[0]) + 2,
+                len(members[0]) + 5):
+            with open(self.output, 'wb') as outFile:
+                outFile.truncate(len(''.join(members)))
+            self.assertEqual(gzconcat.copy_range(path, self.output, 0,
+                len(''.join(members)), chunk_size = chunk_size),
+                sum(len(part) for part in self.parts[:2]))
+            self.assertEqual(self.read_output(), ''.join(self.parts[:2]))
+        # Truncated member headers are invalid
+        with open(path, 'ab') as outFile:
+            outFile.write(members[1][:2])
+        self.assertRaises(IOError, gzconcat.copy_range, path, self.output,
+            0, len(''.join(members)) + 2, chunk_size = 3)
+
+    def test_invalid(self):
+        # Create gzip files with a corrupt trailer and trailing data
+        with open(self.gzip, 'rb') as inFile:
+            data = inFile.read()
+        for count, invalid in enumerate((data[:-8] + '\x00' * 8,
+                data[:-3], data + 'trailing')):
+            path = os.path.join(self.dir, 'invalid{}.gz'.format(count))
+            with open(path, 'wb') as outFile:
+                outFile.write(invalid)
+            self.assertRaises(IOError, gzconcat.concatenate_gzip,
+                [self.bgzf[0], path], self.output, 2)
+            self.assertFalse(os.path.exists(self.output))
+            os.remove(path)
+        self.assertEqual(len(os.listdir(self.dir)), 5)
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(
+        test_gzip_concatenation)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,127 @@
+import gzip
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+from ngs_python.system import pgzip, streamio
+
+def gzip_member(data, level = 6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return(compressor.compress(data) + compressor.flush())
+
+def bgzf_block(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    deflate = compressor.compress(data) + compressor.flush()
+    header = '\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00'
+    trailer = struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+    size = struct.pack('<H', len(header) + 2 + len(deflate) + 8 - 1)
+    return(header + size + deflate + trailer)
+
+class test_parallel_gzip(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        random.seed(1)
+        self.parts = [''.join(random.choice('ACGT\n') for _ in
+            range(random.randint(0, 3000))) for _ in range(100)]
+        # Add uncompressed members containing gzip headers
+        self.parts[10] = 'x\x1f\x8b\x08\x00yyy' * 20
+        self.data = ''.join(self.parts)
+        self.multi = os.path.join(self.dir, 'multi.gz')
+        with open(self.multi, 'wb') as outFile:
+            for count, part in enumerate(self.parts):
+                level = 0 if count in (10, 11) else 6
+                outFile.write(gzip_member(part, level))
+        self.bgzf = os.path.join(self.dir, 'bgzf.gz')
+        with open(self.bgzf, 'wb') as outFile:
+            for part in self.parts:
+                outFile.write(bgzf_block(part))
+            outFile.write(bgzf_block(''))
+        self.single = os.path.join(self.dir, 'single.gz')
+        with gzip.open(self.single, 'wb') as outFile:
+            outFile.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_is_multimember(self):
+        self.assertTrue(pgzip.is_multimember(self.multi))
+        self.assertTrue(pgzip.is_multimember(self.bgzf))
+        self.assertFalse(pgzip.is_multimember(self.single))
+        with open(self.bgzf, 'rb') as inFile:
+            self.assertTrue(pgzip.is_bgzf(inFile.read(18)))
+
+    def test_read(self):
+        for path in (self.multi, self.bgzf):
+            for group_size in (1, 100, 5000, 1048576):
+                with pgzip.parallelGzipReader(path, 3, group_size) as reader:
+                    self.assertEqual(reader.read(10), self.data[:10])
+                    self.assertEqual(reader.read(), self.data[10:])
+                    self.assertEqual(reader.read(), '')
+
+    def test_large_member(self):
+        # Members larger than a group are not inflated in parallel
+        large = os.path.join(self.dir, 'large.gz')
+        data = ''.join(random.choice('ACGT\n') for _ in range(200000))
+        sizes = []
+        inflate_group = pgzip.inflate_group
+        def record_group(group):
+            sizes.append(len(group))
+            return(inflate_group(group))
+        pgzip.inflate_group = record_group
+        try:
+            for first in (gzip_member(self.parts[0]),
+                    bgzf_block(self.parts[0])):
+                with open(large, 'wb') as outFile:
+                    outFile.write(first + gzip_member(data) +
+                        gzip_member(self.parts[1]))
+                with pgzip.parallelGzipReader(large, 3, 1000) as reader:
+                    self.assertEqual(reader.read(), self.parts[0] + data +
+                        self.parts[1])
+        finally:
+            pgzip.inflate_group = inflate_group
+        self.assertTrue(sizes)
+        self.assertTrue(max(sizes) < 3000)
+
+    def test_stream_reader(self):
+        for path in (self.multi, self.bgzf, self.single):
+            with streamio.streamReader(path, threads = 2) as reader:
+                self.assertEqual(reader.read(), self.data)
+
+    def test_truncated(self):
+        truncated = os.path.join(self.dir, 'truncated.gz')
+        with open(self.multi, 'rb') as inFile:
+            data = inFile.read()
+        with open(truncated, 'wb') as outFile:
+            outFile.write(data[:-10])
+        reader = pgzip.parallelGzipReader(truncated, 2, 100)
+        self.assertRaises(IOError, reader.read)
+        reader.close()
+
+    def test_writer(self):
+        output = os.path.join(self.dir, 'output.gz')
+        for threads in (1, 3):
+            with pgzip.parallelGzipWriter(
+                    output, threads, 1, chunk_size = 1000
+                ) as writer:
+                for part in self.parts:
+                    writer.write(part)
+            with gzip.open(output) as inFile:
+                self.assertEqual(inFile.read(), self.data)
+            self.assertTrue(pgzip.is_multimember(output))
+            with pgzip.parallelGzipReader(output, 2, 5000) as reader:
+                self.assertEqual(reader.read(), self.data)
+            with open(output, 'rb') as inFile:
+                self.assertTrue(inFile.read().endswith(pgzip.BGZF_EOF))
+
+    def test_writer_level(self):
+        self.assertRaises(ValueError, pgzip.parallelGzipWriter,
+            os.path.join(self.dir, 'output.gz'), 2, 0)
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_parallel_gzip)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,62 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from ngs_python.system import pipeline
+
+class test_command_pipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.input = os.path.join(self.dir, 'input.txt')
+        with open(self.input, 'w') as outFile:
+            for count in range(10000):
+                outFile.write('line{}\n'.format(count % 100))
+        self.output = os.path.join(self.dir, 'output.txt')
+        self.log = os.path.join(self.dir, 'log.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_run(self):
+        with open(self.input) as inFile:
+            self.assertEqual(pipeline.run_pipeline([['sort'], 'uniq -c',
+                ['wc', '-l']], inFile, self.output), [0, 0, 0])
+        with open(self.output) as inFile:
+            self.assertEqual(inFile.read().strip(), '100')
+        # Input written through stdin
+        with pipeline.commandPipeline([['cat'], ['wc', '-c']],
+                subprocess.PIPE, self.output) as commands:
+            commands.stdin.write('data')
+            commands.wait()
+        with open(self.output) as inFile:
+            self.assertEqual(inFile.read().strip(), '4')
+
+    def test_failure(self):
+        # Failure of the first command is reported although the last
+        # command completes successfully
+        with self.assertRaises(IOError) as context:
+            pipeline.run_pipeline(['echo partial; echo no memory >&2; '\
+                'exit 3', ['cat']], stdout = self.output, log = self.log)
+        self.assertEqual(str(context.exception), 'Command echo partial; '\
+            'echo no memory >&2; exit 3 failed with exit status 3: no memory')
+        with open(self.log) as inFile:
+            self.assertEqual(inFile.read(), 'no memory\n')
+        # Running commands are killed when a command fails
+        with self.assertRaises(IOError) as context:
+            pipeline.run_pipeline([['sleep', '60'], 'exit 2'])
+        self.assertIn('exit 2 failed with exit status 2', str(
+            context.exception))
+        # Failure of a later command is reported in place of a broken pipe
+        commands = pipeline.commandPipeline([['yes'], 'head -n 1; exit 5'],
+            stdout = self.output)
+        self.assertRaises(IOError, commands.wait)
+        self.assertEqual(commands.returncodes[1], 5)
+        self.assertEqual(commands.poll(), 5)
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(
+        test_command_pipeline)
+    unittest.TextTestRunner(verbosity=2).run(suite)
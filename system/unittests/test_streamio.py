@@ -0,0 +1,162 @@
+import bz2
+import gzip
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from ngs_python.system import streamio
+
+class test_stream_reader(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.lines = ['line{}\n'.format(count) for count in range(1000)]
+        self.data = ''.join(self.lines) + 'last'
+        # Create plain, gzip and bzip2 files
+        self.plain = os.path.join(self.dir, 'test.txt')
+        with open(self.plain, 'w') as outFile:
+            outFile.write(self.data)
+        self.gzip = os.path.join(self.dir, 'test.txt.gz')
+        with gzip.open(self.gzip, 'w') as outFile:
+            outFile.write(self.data)
+        self.bzip2 = os.path.join(self.dir, 'test.txt.bz2')
+        with bz2.BZ2File(self.bzip2, 'w') as outFile:
+            outFile.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_detect_compression(self):
+        self.assertEqual(streamio.detect_compression(self.plain), None)
+        self.assertEqual(streamio.detect_compression(self.gzip), 'gzip')
+        self.assertEqual(streamio.detect_compression(self.bzip2), 'bzip2')
+
+    def test_read(self):
+        for path in (self.plain, self.gzip, self.bzip2):
+            for shell in (True, False):
+                with streamio.streamReader(
+                        path, shell = shell, chunk_size = 7, buffers = 2
+                    ) as reader:
+                    blocks = []
+                    while True:
+                        block = reader.read(100)
+                        if not block:
+                            break
+                        blocks.append(block)
+                self.assertEqual(''.join(blocks), self.data)
+                self.assertEqual(set(map(len, blocks[:-1])), set([100]))
+
+    def test_readline(self):
+        reader = streamio.streamReader(self.gzip, chunk_size = 5)
+        self.assertEqual(reader.readline(), 'line0\n')
+        self.assertEqual(reader.read(6), 'line1\n')
+        self.assertEqual(list(reader), self.lines[2:] + ['last'])
+        self.assertEqual(reader.readline(), '')
+        reader.close()
+
+    def test_small_reads(self):
+        # Small reads of a large chunk take linear time
+        path = os.path.join(self.dir, 'large.txt')
+        with open(path, 'w') as outFile:
+            outFile.write(self.data * 300)
+        start = time.time()
+        with streamio.streamReader(path, chunk_size = 4194304) as reader:
+            data = ''.join(iter(lambda: reader.read(3), ''))
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(data, self.data * 300)
+
+    def test_early_close(self):
+        reader = streamio.streamReader(self.gzip, chunk_size = 1, buffers = 1)
+        self.assertEqual(reader.readline(), 'line0\n')
+        reader.close()
+        self.assertFalse(reader.thread.is_alive())
+
+    def test_corrupt(self):
+        corrupt = os.path.join(self.dir, 'corrupt.gz')
+        with open(self.gzip, 'rb') as inFile:
+            data = inFile.read()
+        with open(corrupt, 'wb') as outFile:
+            outFile.write(data[:len(data) // 2])
+        for shell in (True, False):
+            reader = streamio.streamReader(corrupt, shell = shell)
+            self.assertRaises(Exception, reader.read)
+            reader.close()
+
+    def test_writer(self):
+        for path, shell, threads in (('out.txt', True, 1),
+                ('out.txt.gz', True, 1), ('out.txt.gz', False, 1),
+                ('out.txt.gz', False, 2)):
+            path = os.path.join(self.dir, path)
+            with streamio.open_output(path, shell, threads, 1) as writer:
+                for line in self.lines:
+                    writer.write(line)
+            self.assertEqual(streamio.detect_compression(path),
+                'gzip' if path.endswith('.gz') else None)
+            with streamio.open_input(path) as reader:
+                self.assertEqual(reader.read(), ''.join(self.lines))
+
+    def test_atomic_writer(self):
+        path = os.path.join(self.dir, 'atomic.txt.gz')
+        with streamio.open_output(path, atomic = True) as writer:
+            writer.write(self.data)
+            self.assertFalse(os.path.exists(path))
+        with streamio.open_input(path) as reader:
+            self.assertEqual(reader.read(), self.data)
+        # Output is unchanged if an exception is raised
+        with self.assertRaises(ValueError):
+            with streamio.open_output(path, atomic = True) as writer:
+                writer.write('other')
+                raise ValueError
+        with streamio.open_input(path) as reader:
+            self.assertEqual(reader.read(), self.data)
+        self.assertEqual(len(os.listdir(self.dir)), 4)
+
+    def test_process_writer(self):
+        output = os.path.join(self.dir, 'output.txt')
+        tee = os.path.join(self.dir, 'tee.txt.gz')
+        for fifo in (False, True):
+            with streamio.open_process('cat {input} > ' + output, fifo,
+                    tee) as writer:
+                for line in self.lines:
+                    writer.write(line)
+            for path in (output, tee):
+                with streamio.open_input(path) as reader:
+                    self.assertEqual(reader.read(), ''.join(self.lines))
+            os.remove(tee)
+        self.assertEqual(writer.returncode, 0)
+
+    def test_process_errors(self):
+        tee = os.path.join(self.dir, 'tee.txt')
+        # Failure of the command and of the process writing input
+        for command, fifo, message in (
+                ('cat > /dev/null; echo failed >&2; exit 3', False,
+                    'failed with exit status 3: failed'),
+                ('head -c 10 > /dev/null', False,
+                    'stopped reading input with exit status 0'),
+                ('exit 4', True, 'exited before reading input'),
+                ('sleep 60', True, 'did not open input')):
+            with self.assertRaises(IOError) as context:
+                with streamio.open_process(command, fifo, tee,
+                        timeout = 0.5) as writer:
+                    for count in range(1000):
+                        writer.write(self.data)
+            self.assertIn(message, str(context.exception))
+            self.assertFalse(os.path.exists(tee))
+        # Without a timeout the named pipe is opened once the subprocess
+        # opens it for reading
+        output = os.path.join(self.dir, 'output.txt')
+        with streamio.open_process('sleep 1; cat {input} > ' + output, True,
+                timeout = None) as writer:
+            writer.write(self.data)
+        with open(output) as inFile:
+            self.assertEqual(inFile.read(), self.data)
+        with self.assertRaises(ValueError):
+            with streamio.open_process(['sleep', '60']) as writer:
+                raise ValueError
+        self.assertEqual(writer.returncode, -15)
+
+if __name__ == '__main__':
+
+    suite = unittest.TestLoader().loadTestsFromTestCase(test_stream_reader)
+    unittest.TextTestRunner(verbosity=2).run(suite)